@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+import logging
+from unittest import mock
+
+from uds.core import consts, types
+from uds.core.util import permissions
+
+from ...utils import rest
+
+logger = logging.getLogger(__name__)
+
+
+class AuthenticatorsTest(rest.test.RESTTestCase):
+    def test_clear_cache(self) -> None:
+        with mock.patch('uds.auths.InternalDB.authenticator.InternalDBAuth.clear_cache') as clear_cache:
+            # Staff members needs management permission over the authenticator
+            self.login(as_admin=False)
+            response = self.client.rest_get(f'authenticators/{self.auth.uuid}/clear_cache')
+            self.assertEqual(response.status_code, 403)
+            clear_cache.assert_not_called()
+
+            permissions.add_user_permission(
+                self.staffs[0], self.auth, types.permissions.PermissionType.MANAGEMENT
+            )
+            response = self.client.rest_get(f'authenticators/{self.auth.uuid}/clear_cache')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), consts.OK)
+            clear_cache.assert_called_once()
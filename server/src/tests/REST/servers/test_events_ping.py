@@ -30,17 +30,14 @@ Author: Adolfo Gómez, dkmaster at dkmon dot com
 """
 import logging
 import random
-import typing
 
+from uds import models
 from uds.core import types, consts
 from uds.core.util.model import sql_stamp
 
 from ...fixtures import servers as servers_fixtures
 from ...utils import rest
 
-if typing.TYPE_CHECKING:
-    from uds import models
-
 logger = logging.getLogger(__name__)
 
 
@@ -102,7 +99,7 @@ class ServerEventsPingTest(rest.test.RESTTestCase):
 
         self.assertEqual(response.status_code, 200)
 
-        server_stats = self.server.properties.get('stats', None)
+        server_stats = models.Server.stats_cache().get(self.server.uuid)
         self.assertIsNotNone(server_stats)
         # Get stats, but clear stamp
         statsResponse = types.servers.ServerStats.from_dict(server_stats, stamp=0)
@@ -130,5 +127,5 @@ class ServerEventsPingTest(rest.test.RESTTestCase):
 
         self.assertEqual(response.status_code, 200)
 
-        server_stats = self.server.properties.get('stats', None)
+        server_stats = models.Server.stats_cache().get(self.server.uuid)
         self.assertIsNone(server_stats)
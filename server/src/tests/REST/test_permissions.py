@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+import logging
+import typing
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from uds import models
+from uds.core import types
+from uds.core.util import permissions
+
+from ..utils import rest
+
+logger = logging.getLogger(__name__)
+
+
+class PermissionsQueriesTest(rest.test.RESTTestCase):
+    """
+    Permissions of listed items are resolved with one query per object type, not per item
+    """
+
+    def _permissions_queries(self, path: str) -> tuple[int, list[typing.Any]]:
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.rest_get(path)
+        self.assertEqual(response.status_code, 200, path)
+        return sum(1 for q in queries if 'uds_permissions' in q['sql']), response.json()
+
+    def test_list_endpoints(self) -> None:
+        user = self.staffs[0]
+        lists: list[tuple[str, type[models.Model]]] = [
+            ('servicespools', models.ServicePool),
+            ('providers', models.Provider),
+            ('transports', models.Transport),
+            ('osmanagers', models.OSManager),
+            ('authenticators', models.Authenticator),
+        ]
+        # Read permission over all but one item of each list
+        for _path, model in lists:
+            for item in list(model.objects.all())[1:]:
+                permissions.add_user_permission(user, item, types.permissions.PermissionType.READ)
+
+        self.login(user)
+        for path, model in lists:
+            count, items = self._permissions_queries(path)
+            self.assertEqual(len(items), model.objects.count() - 1, path)
+            self.assertEqual(count, 1, path)
+
+        # Details (services of a provider) share the permissions loaded by its parent handler
+        provider = self.provider
+        permissions.add_user_permission(user, provider, types.permissions.PermissionType.READ)
+        count, items = self._permissions_queries(f'providers/{provider.uuid}/services')
+        self.assertEqual(len(items), provider.services.count())
+        self.assertEqual(count, 1)
+
+    def test_list_endpoints_admin(self) -> None:
+        self.login()
+        for path in ('servicespools', 'providers', 'transports'):
+            count, _items = self._permissions_queries(path)
+            self.assertEqual(count, 0, path)
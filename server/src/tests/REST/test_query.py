@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+import logging
+import typing
+
+from uds import models
+from uds.core import consts, types
+from uds.core.util import permissions
+
+from ..utils import rest
+
+logger = logging.getLogger(__name__)
+
+
+class QueryTest(rest.test.RESTTestCase):
+    """
+    Sort, filter and pagination of lists
+    """
+
+    def _get(self, path: str, **params: typing.Any) -> tuple[list[dict[str, typing.Any]], typing.Optional[int]]:
+        response = self.client.rest_get(path, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        total = response.get(consts.rest.TOTAL_COUNT_HEADER)
+        return response.json(), int(total) if total is not None else None
+
+    def test_no_query(self) -> None:
+        self.login()
+        items, total = self._get('servicespools/overview')
+        # Nothing changes if no query parameter is present
+        self.assertIsNone(total)
+        self.assertEqual(len(items), models.ServicePool.objects.count())
+
+    def test_sort_and_paginate(self) -> None:
+        self.login()
+        names = sorted((p.name for p in models.ServicePool.objects.all()), reverse=True)
+        page: list[dict[str, typing.Any]] = []
+        for offset in range(0, len(names), 2):
+            items, total = self._get('servicespools/overview', sort='-name', offset=offset, limit=2)
+            self.assertEqual(total, len(names))
+            self.assertLessEqual(len(items), 2)
+            page += items
+        self.assertEqual([i['name'] for i in page], names)
+
+        # Out of range offset returns nothing, but total count
+        items, total = self._get('servicespools/overview', offset=len(names), limit=2)
+        self.assertEqual((items, total), ([], len(names)))
+
+    def test_filter(self) -> None:
+        self.login()
+        pool = models.ServicePool.objects.all()[0]
+        items, total = self._get('servicespools/overview', filter=f'name:{pool.name}')
+        self.assertEqual(total, 1)
+        self.assertEqual(items[0]['id'], pool.uuid)
+
+        items, total = self._get('servicespools/overview', filter=f'name~{pool.name[1:].upper()}')
+        self.assertIn(pool.uuid, [i['id'] for i in items])
+        self.assertEqual(total, len(items))
+
+    def test_invalid_query(self) -> None:
+        self.login()
+        for params in (
+            {'sort': 'not_a_field'},
+            {'filter': 'not_a_field:1'},
+            {'filter': 'invalid filter'},
+            {'limit': 'no_number'},
+        ):
+            response = self.client.rest_get('servicespools/overview', params)
+            self.assertEqual(response.status_code, 400, params)
+
+    def test_only_readable_items(self) -> None:
+        user = self.staffs[0]
+        readable = list(models.ServicePool.objects.all().order_by('name'))[1:]
+        for pool in readable:
+            permissions.add_user_permission(user, pool, types.permissions.PermissionType.READ)
+
+        self.login(user)
+        # Pages are filled with readable items, and total count only includes them
+        items, total = self._get('servicespools/overview', sort='name', limit=len(readable))
+        self.assertEqual(total, len(readable))
+        self.assertEqual([i['id'] for i in items], [p.uuid for p in readable])
+
+    def test_detail(self) -> None:
+        self.login()
+        url = f'authenticators/{self.auth.uuid}/users/overview'
+        items, total = self._get(url, filter='staff_member:1', sort='-name', limit=3)
+        staffs = self.auth.users.filter(staff_member=True).order_by('-name')
+        self.assertEqual(total, staffs.count())
+        self.assertEqual([i['id'] for i in items], [u.uuid for u in staffs[:3]])
+
+        for params in ({'sort': 'password'}, {'filter': 'last_access:yesterday'}):
+            response = self.client.rest_get(url, params)
+            self.assertEqual(response.status_code, 400, params)
+
+        # Detail with no query, unchanged
+        items, total = self._get(url)
+        self.assertIsNone(total)
+        self.assertEqual(len(items), self.auth.users.count())
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+import logging
+import time
+from unittest import mock
+
+from django.conf import settings
+
+from uds.core.util.cache import Cache
+from uds.REST import sessions
+
+from ..utils import rest
+
+logger = logging.getLogger(__name__)
+
+
+class RESTSessionsTest(rest.test.RESTTestCase):
+    def test_session_modes(self) -> None:
+        for mode in ('db', 'cache', 'token'):
+            with mock.patch('uds.core.consts.auth.REST_SESSION_MODE', mode):
+                self.login()
+                response = self.client.rest_get('system/overview')
+                self.assertEqual(response.status_code, 200, mode)
+
+                session = sessions.session_store()(session_key=self.auth_token)
+                self.assertEqual(session['REST']['username'], self.admins[0].name, mode)
+
+                rest.logout(self, self.client)
+                response = self.client.rest_get('system/overview')
+                self.assertEqual(response.status_code, 403, mode)
+
+    def test_cache_session_local(self) -> None:
+        session = sessions.CacheSessionStore()
+        session['REST'] = {'username': 'test'}
+        session.save()
+
+        # Own changes are also notified as invalidations, once applied session is read from local tier
+        Cache.store().check_invalidations(force=True)
+        sessions.CacheSessionStore(session_key=session.session_key).load()
+        with self.assertNumQueries(0):
+            loaded = sessions.CacheSessionStore(session_key=session.session_key)
+            self.assertEqual(loaded['REST'], {'username': 'test'})
+
+        # Other process, loaded from shared tier just once
+        Cache.store().flush_local()
+        for _ in range(4):
+            self.assertIn('REST', sessions.CacheSessionStore(session_key=session.session_key))
+
+        session.delete()
+        self.assertNotIn('REST', sessions.CacheSessionStore(session_key=session.session_key))
+
+    def test_token_session(self) -> None:
+        with mock.patch('uds.core.consts.auth.REST_SESSION_TOKEN_KEYS', ['old key']):
+            session = sessions.TokenSessionStore()
+            session['REST'] = {'username': 'test'}
+            session.save()
+            token = session.session_key or ''
+            self.assertNotIn('test', token)  # Encrypted
+
+            # Validated with no database access (revocations list is kept on cache local tier)
+            self.assertIn('REST', sessions.TokenSessionStore(session_key=token))
+            Cache.store().check_invalidations(force=True)
+            self.assertIn('REST', sessions.TokenSessionStore(session_key=token))
+            with self.assertNumQueries(0):
+                self.assertEqual(sessions.TokenSessionStore(session_key=token)['REST'], {'username': 'test'})
+
+            # Tampered tokens are rejected
+            self.assertNotIn('REST', sessions.TokenSessionStore(session_key=token[:-2] + 'xx'))
+            self.assertNotIn('REST', sessions.TokenSessionStore(session_key='x' + token[1:]))
+
+        # Keys rotation, old key is still accepted but new tokens are created with new one
+        with mock.patch('uds.core.consts.auth.REST_SESSION_TOKEN_KEYS', ['new key', 'old key']):
+            session = sessions.TokenSessionStore(session_key=token)
+            self.assertIn('REST', session)
+            session['REST']['username'] = 'changed'
+            session.save()
+            new_token = session.session_key or ''
+            self.assertNotEqual(new_token, token)
+        with mock.patch('uds.core.consts.auth.REST_SESSION_TOKEN_KEYS', ['new key']):
+            self.assertNotIn('REST', sessions.TokenSessionStore(session_key=token))
+            self.assertEqual(sessions.TokenSessionStore(session_key=new_token)['REST'], {'username': 'changed'})
+
+            # Deleting a session revokes all of its tokens
+            sessions.TokenSessionStore(session_key=new_token).delete()
+            self.assertNotIn('REST', sessions.TokenSessionStore(session_key=new_token))
+        with mock.patch('uds.core.consts.auth.REST_SESSION_TOKEN_KEYS', ['new key', 'old key']):
+            self.assertNotIn('REST', sessions.TokenSessionStore(session_key=token))
+
+    def test_token_session_expires(self) -> None:
+        session = sessions.TokenSessionStore()
+        session['REST'] = {'username': 'test'}
+        session.save()
+        expired = time.time() + settings.SESSION_COOKIE_AGE + 1
+        with mock.patch('django.core.signing.time.time', return_value=expired):
+            self.assertNotIn('REST', sessions.TokenSessionStore(session_key=session.session_key))
+
+    def test_token_session_revoked_after_resign(self) -> None:
+        issued = time.time()
+        age = settings.SESSION_COOKIE_AGE
+        with mock.patch('time.time', return_value=issued):
+            session = sessions.TokenSessionStore()
+            session['REST'] = {'username': 'test'}
+            session.save()
+        # Signed again just before the original token expires, and then logged out
+        with mock.patch('time.time', return_value=issued + age - 10):
+            session = sessions.TokenSessionStore(session_key=session.session_key)
+            session['REST'] = {'username': 'changed'}
+            session.save()
+            token = session.session_key
+            sessions.TokenSessionStore(session_key=token).delete()
+        # Past original issue time + age, other revocations prune the list, but the token is still valid for signing
+        with mock.patch('time.time', return_value=issued + age + 5):
+            sessions.TokenRevocations.revoke('other', time.time() + 60)
+            self.assertNotIn('REST', sessions.TokenSessionStore(session_key=token))
+
+    def test_token_revocations_lock(self) -> None:
+        cache = Cache(sessions.TokenRevocations.cache_owner)
+        cache.add('lock', 'other process', validity=60)
+        with mock.patch('uds.REST.sessions.time.sleep'):
+            with self.assertRaises(TimeoutError):
+                sessions.TokenRevocations.revoke('token', time.time() + 60)
+        # Lock of the other process is kept, and nothing is written without it
+        self.assertEqual(cache.get('lock'), 'other process')
+        self.assertFalse(sessions.TokenRevocations.is_revoked('token'))
+
+        cache.remove('lock')
+        sessions.TokenRevocations.revoke('token', time.time() + 60)
+        self.assertTrue(sessions.TokenRevocations.is_revoked('token'))
+        self.assertIsNone(cache.get('lock'))
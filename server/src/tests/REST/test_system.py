@@ -65,7 +65,36 @@ class SystemTest(rest.test.RESTTestCase):
         self.assertEqual(json['meta_pools'], 0)
         self.assertEqual(json['restrained_services_pools'], 0)
 
-        
+    def test_performance(self) -> None:
+        response = self.client.rest_get('system/performance')
+        self.assertEqual(response.status_code, 403)
+
+        # Staff users are not enough, must be admin
+        self.login(as_admin=False)
+        response = self.client.rest_get('system/performance')
+        self.assertEqual(response.status_code, 403)
+
+        self.login()
+        response = self.client.rest_get('system/performance')
+        self.assertEqual(response.status_code, 200)
+        json = response.json()
+        self.assertIn('cache', json)
+        for key in ('hits', 'misses', 'hit_ratio', 'invalidations', 'build_time', 'render_time'):
+            self.assertIn(key, json['services_cache'])
+        for key in ('requests', 'new_connections', 'reused_connections', 'evicted', 'pools'):
+            self.assertIn(key, json['http_connections'])
+        for key in ('batch_requests', 'single_requests', 'served', 'deferred', 'registered'):
+            self.assertIn(key, json['state_poller'])
+        self.assertIsInstance(json['deferred_deletion'], dict)
+        for key in ('claimed', 'retries', 'misses', 'claim_time'):
+            self.assertIn(key, json['cache_claims'])
+        for key in ('hits', 'misses', 'invalid', 'invalidations', 'size'):
+            self.assertIn(key, json['server_tokens'])
+        for key in ('builds', 'lookups', 'networks', 'segments'):
+            self.assertIn(key, json['networks'])
+        for key in ('builds', 'lookups', 'authenticators', 'groups', 'patterns'):
+            self.assertIn(key, json['groups'])
+
     def test_chart_pool(self) -> None:
         # First, create fixtures for the pool
         DAYS = 30
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+import secrets
+import typing
+from unittest import mock
+
+from django.http import QueryDict
+
+from uds import models
+from uds.core import auths, consts, types
+from uds.core.environment import Environment
+from uds.core.util import fields
+
+from uds.auths.OAuth2 import authenticator as oauth2
+
+from tests.utils.test import UDSTestCase
+from tests.utils.fake_oauth2 import FakeOpenIDProvider, create_key
+
+CLIENT_ID: typing.Final[str] = 'uds-client'
+
+
+def create_authenticator(discovery_url: str = '', public_key: str = '') -> models.Authenticator:
+    instance = oauth2.OAuth2Authenticator(environment=Environment.testing_environment())
+    instance.authorizationEndpoint.value = 'https://idp.uds.test/authorize'
+    instance.clientId.value = CLIENT_ID
+    instance.clientSecret.value = 'secret'
+    instance.scope.value = 'profile'
+    instance.responseType.value = 'openid+token_id'
+    instance.discoveryEndpoint.value = discovery_url
+    instance.publicKey.value = public_key
+    instance.userNameAttr.value = 'preferred_username'
+    instance.groupNameAttr.value = 'groups'
+    instance.realNameAttr.value = 'name'
+    db_auth = models.Authenticator.objects.create(
+        name='oauth2', data_type=oauth2.OAuth2Authenticator.type_type, data=instance.serialize()
+    )
+    db_auth.groups.create(name='staff')
+    return db_auth
+
+
+def login(
+    db_auth: models.Authenticator, id_token: typing.Callable[[str], str]
+) -> types.auth.AuthenticationResult:
+    """
+    Login as the callback view does (a new instance for each request), with the id token returned
+    by id_token for the nonce of the request
+    """
+    instance = typing.cast(oauth2.OAuth2Authenticator, db_auth.get_instance())
+    state, nonce = secrets.token_urlsafe(16), secrets.token_urlsafe(16)
+    instance.cache.put(state, nonce, 3600)
+    post_params = QueryDict('', mutable=True)
+    post_params.update({'state': state, 'id_token': id_token(nonce)})
+    return instance.auth_callback(
+        types.auth.AuthCallbackParams(
+            https=True,
+            host='uds.test',
+            path='/uds/page/auth/callback/oauth2',
+            port='443',
+            get_params=QueryDict(''),
+            post_params=post_params,
+            query_string='',
+        ),
+        auths.GroupsManager(db_auth),
+        mock.Mock(),
+    )
+
+
+CLAIMS: typing.Final[dict[str, typing.Any]] = {
+    'preferred_username': 'john',
+    'name': 'John Doe',
+    'groups': ['staff'],
+}
+
+
+class OAuth2KeysTest(UDSTestCase):
+    def test_keys_cached(self) -> None:
+        with FakeOpenIDProvider() as provider:
+            db_auth = create_authenticator(provider.discovery_url)
+            for _ in range(5):
+                result = login(db_auth, lambda nonce: provider.id_token(CLIENT_ID, nonce, CLAIMS))
+                self.assertEqual(result.success, types.auth.AuthenticationState.SUCCESS)
+                self.assertEqual(result.username, 'john')
+            # Fetched once, next tokens are validated without contacting the provider
+            self.assertEqual((provider.discovery_requests, provider.keys_requests), (1, 1))
+
+            # Tokens for other clients, with other nonce or forged are rejected
+            for id_token in (
+                lambda nonce: provider.id_token('other-client', nonce, CLAIMS),
+                lambda nonce: provider.id_token(CLIENT_ID, 'other-nonce', CLAIMS),
+                lambda nonce: provider.id_token(CLIENT_ID, nonce, CLAIMS, key=create_key('forged')),
+                # Provider key is declared for RS256, so other algorithms are not accepted
+                lambda nonce: provider.id_token(CLIENT_ID, nonce, CLAIMS, algorithm='RS512'),
+                lambda nonce: provider.id_token(CLIENT_ID, nonce, CLAIMS, algorithm='none'),
+            ):
+                self.assertEqual(login(db_auth, id_token), types.auth.FAILED_AUTH)
+            self.assertEqual((provider.discovery_requests, provider.keys_requests), (1, 1))
+
+            # Admins can force fetching them again
+            db_auth.get_instance().clear_cache()
+            login(db_auth, lambda nonce: provider.id_token(CLIENT_ID, nonce, CLAIMS))
+            self.assertEqual((provider.discovery_requests, provider.keys_requests), (2, 2))
+
+    def test_key_rotation(self) -> None:
+        with FakeOpenIDProvider() as provider:
+            db_auth = create_authenticator(provider.discovery_url)
+            login(db_auth, lambda nonce: provider.id_token(CLIENT_ID, nonce, CLAIMS))
+
+            # Provider rotates its keys (some time later), tokens signed with the new one fetch them again
+            provider.keys['key2'] = create_key('key2')
+            with mock.patch.object(consts.auth, 'OAUTH2_KEYS_MIN_REFRESH_INTERVAL', 0):
+                result = login(db_auth, lambda nonce: provider.id_token(CLIENT_ID, nonce, CLAIMS, kid='key2'))
+            self.assertEqual(result.success, types.auth.AuthenticationState.SUCCESS)
+            self.assertEqual(provider.keys_requests, 2)
+
+            # But unknown keys do not fetch them again until some time has passed
+            forged_key = create_key('key3')
+            for _ in range(10):
+                result = login(
+                    db_auth, lambda nonce: provider.id_token(CLIENT_ID, nonce, CLAIMS, kid='key3', key=forged_key)
+                )
+                self.assertEqual(result, types.auth.FAILED_AUTH)
+            self.assertEqual(provider.keys_requests, 2)
+            provider.keys['key3'] = create_key('key3')
+            with mock.patch.object(consts.auth, 'OAUTH2_KEYS_MIN_REFRESH_INTERVAL', 0):
+                result = login(db_auth, lambda nonce: provider.id_token(CLIENT_ID, nonce, CLAIMS, kid='key3'))
+            self.assertEqual(result.success, types.auth.AuthenticationState.SUCCESS)
+            self.assertEqual((provider.discovery_requests, provider.keys_requests), (1, 3))
+
+    def test_provider_down(self) -> None:
+        with FakeOpenIDProvider() as provider:
+            db_auth = create_authenticator(provider.discovery_url)
+            # Keys expire at once
+            with mock.patch.object(consts.auth, 'OAUTH2_KEYS_CACHE_DURATION', 0):
+                login(db_auth, lambda nonce: provider.id_token(CLIENT_ID, nonce, CLAIMS))
+            provider.down = True
+            # Expired keys can't be fetched, so current ones are kept, and not fetched again for a while
+            for _ in range(3):
+                result = login(db_auth, lambda nonce: provider.id_token(CLIENT_ID, nonce, CLAIMS))
+                self.assertEqual(result.success, types.auth.AuthenticationState.SUCCESS)
+            self.assertEqual(provider.keys_requests, 2)
+
+    def test_public_key(self) -> None:
+        provider = FakeOpenIDProvider()  # Not started, provider without discovery
+        provider.server_close()
+        db_auth = create_authenticator(public_key=provider.certificate())
+        with mock.patch.object(
+            oauth2.fields, 'get_certificates_from_field', wraps=fields.get_certificates_from_field
+        ) as get_certificates:
+            for algorithm in ('RS256', 'RS512', 'PS256'):
+                result = login(db_auth, lambda nonce: provider.id_token(CLIENT_ID, nonce, CLAIMS, algorithm=algorithm))
+                self.assertEqual(result.success, types.auth.AuthenticationState.SUCCESS)
+            get_certificates.assert_called_once()  # Parsed once
+        # Unsigned tokens are never accepted
+        result = login(db_auth, lambda nonce: provider.id_token(CLIENT_ID, nonce, CLAIMS, algorithm='none'))
+        self.assertEqual(result, types.auth.FAILED_AUTH)
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+import typing
+from unittest import mock
+
+from django.http import QueryDict
+
+from uds import models
+from uds.core import auths, exceptions, types
+from uds.core.environment import Environment
+
+from uds.auths.SAML import saml
+from uds.auths.SAML.jobs import SAMLMetadataRefresher
+
+from tests.utils.test import UDSTestCase
+from tests.utils.fake_saml import FakeSAMLIdP, create_certificate
+
+SP_ENTITY_ID: typing.Final[str] = 'https://uds.test/uds/page/auth/info/saml'
+ACS_URL: typing.Final[str] = 'https://uds.test/uds/page/auth/callback/saml'
+METADATA_URL: typing.Final[str] = 'https://idp.uds.test/metadata'
+
+
+def create_authenticator(idp_metadata: str) -> models.Authenticator:
+    sp_key, sp_cert = create_certificate('uds.test')
+    instance = saml.SAMLAuthenticator(environment=Environment.testing_environment())
+    instance.private_key.value = sp_key
+    instance.server_certificate.value = sp_cert
+    instance.idp_metadata.value = idp_metadata
+    instance.entity_id.value = SP_ENTITY_ID
+    instance.manage_url.value = ACS_URL
+    instance.attrs_username.value = 'uid'
+    instance.attrs_groupname.value = 'groups'
+    instance.attrs_realname.value = 'cn'
+    db_auth = models.Authenticator.objects.create(
+        name='saml', data_type=saml.SAMLAuthenticator.type_type, data=instance.serialize()
+    )
+    db_auth.groups.create(name='staff')
+    return db_auth
+
+
+def callback_params(saml_response: str) -> types.auth.AuthCallbackParams:
+    post_params = QueryDict('', mutable=True)
+    post_params['SAMLResponse'] = saml_response
+    return types.auth.AuthCallbackParams(
+        https=True,
+        host='uds.test',
+        path='/uds/page/auth/callback/saml',
+        port='443',
+        get_params=QueryDict(''),
+        post_params=post_params,
+        query_string='',
+    )
+
+
+class SAMLSettingsCacheTest(UDSTestCase):
+    idp: FakeSAMLIdP
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.idp = FakeSAMLIdP()
+        saml._settings_cache.clear()
+
+    def acs(
+        self, db_auth: models.Authenticator, idp: typing.Optional[FakeSAMLIdP] = None
+    ) -> tuple[types.auth.AuthenticationResult, auths.GroupsManager]:
+        response = (idp or self.idp).response(
+            SP_ENTITY_ID, ACS_URL, 'john', {'uid': ['john'], 'cn': ['John Doe'], 'groups': ['staff', 'other']}
+        )
+        groups_manager = auths.GroupsManager(db_auth)
+        # A new instance for each request, as the callback view does
+        instance = typing.cast(saml.SAMLAuthenticator, db_auth.get_instance())
+        result = instance.auth_callback(callback_params(response), groups_manager, mock.Mock(session={}))
+        return result, groups_manager
+
+    def test_acs(self) -> None:
+        db_auth = create_authenticator(self.idp.metadata())
+        with mock.patch.object(
+            saml, 'OneLogin_Saml2_Settings', wraps=saml.OneLogin_Saml2_Settings
+        ) as settings_class:
+            for _ in range(3):
+                result, groups_manager = self.acs(db_auth)
+                self.assertEqual(result.success, types.auth.AuthenticationState.SUCCESS)
+                self.assertEqual(result.username, 'john')
+                self.assertTrue(groups_manager.is_valid('staff'))
+            self.assertEqual(settings_class.call_count, 1)  # Parsed once, reused by next requests
+
+            # Configuration changes are seen at once
+            instance = typing.cast(saml.SAMLAuthenticator, db_auth.get_instance())
+            instance.attrs_realname.value = 'uid'
+            db_auth.data = instance.serialize()
+            db_auth.save()
+            self.acs(models.Authenticator.objects.get(id=db_auth.id))
+            self.assertEqual(settings_class.call_count, 2)
+
+        # Responses signed by other keys are rejected
+        other_idp = FakeSAMLIdP()
+        other_idp.private_key, other_idp.certificate = create_certificate('other.uds.test')
+        with self.assertRaises(exceptions.auth.AuthenticatorException):
+            self.acs(db_auth, other_idp)
+
+    def test_metadata_url(self) -> None:
+        db_auth = create_authenticator(METADATA_URL)
+        with mock.patch.object(saml.requests, 'get') as get:
+            get.return_value = mock.Mock(content=self.idp.metadata().encode())
+            for _ in range(3):
+                result, _groups_manager = self.acs(db_auth)
+                self.assertEqual(result.success, types.auth.AuthenticationState.SUCCESS)
+            get.assert_called_once()
+
+            # Idp changes its keys, new metadata is used once refreshed by the job
+            new_idp = FakeSAMLIdP()
+            new_idp.private_key, new_idp.certificate = create_certificate('new.idp.uds.test')
+            get.return_value = mock.Mock(content=new_idp.metadata().encode())
+            with self.assertRaises(exceptions.auth.AuthenticatorException):
+                self.acs(db_auth, new_idp)
+            SAMLMetadataRefresher(Environment.testing_environment()).run()
+            self.assertEqual(get.call_count, 2)
+            result, _groups_manager = self.acs(db_auth, new_idp)
+            self.assertEqual(result.success, types.auth.AuthenticationState.SUCCESS)
+
+            # Invalid metadata (or unreachable idp) does not replace the current one
+            get.return_value = mock.Mock(content=b'<html>Server error</html>')
+            SAMLMetadataRefresher(Environment.testing_environment()).run()
+            get.side_effect = Exception('Connection refused')
+            SAMLMetadataRefresher(Environment.testing_environment()).run()
+            result, _groups_manager = self.acs(db_auth, new_idp)
+            self.assertEqual(result.success, types.auth.AuthenticationState.SUCCESS)
+
+            # Admins can force it
+            get.side_effect = None
+            get.return_value = mock.Mock(content=self.idp.metadata().encode())
+            db_auth.get_instance().clear_cache()
+            result, _groups_manager = self.acs(db_auth)
+            self.assertEqual(result.success, types.auth.AuthenticationState.SUCCESS)
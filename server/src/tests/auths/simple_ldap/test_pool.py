@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+import typing
+from unittest import mock
+
+from uds import models
+from uds.core import auths, types
+from uds.core.environment import Environment
+from uds.core.util import ldaputil
+
+from uds.auths.SimpleLDAP.authenticator import SimpleLDAPAuthenticator
+
+from tests.utils.test import UDSTestCase
+from tests.utils.fake_ldap import FakeLDAPServer
+
+BASE: typing.Final[str] = 'dc=uds,dc=test'
+SERVICE_DN: typing.Final[str] = f'cn=admin,{BASE}'
+
+VALUES: typing.Final[dict[str, typing.Any]] = {
+    'host': 'ldap.uds.test',
+    'port': 389,
+    'use_ssl': False,
+    'username': SERVICE_DN,
+    'password': 'admin',
+    'timeout': 5,
+    'verify_ssl': False,
+    'certificate': '',
+    'ldap_base': BASE,
+    'user_class': 'posixAccount',
+    'user_id_attr': 'uid',
+    'username_attr': 'cn',
+    'group_class': 'posixGroup',
+    'group_id_attr': 'cn',
+    'member_attr': 'memberUid',
+    'mfa_attribute': '',
+}
+
+
+def create_server(users: int = 4) -> FakeLDAPServer:
+    server = FakeLDAPServer()
+    server.add(SERVICE_DN, password='admin', cn='admin')
+    for i in range(users):
+        server.add(
+            f'uid=user{i},ou=people,{BASE}',
+            password=f'pass{i}',
+            objectClass='posixAccount',
+            uid=f'user{i}',
+            cn=f'User {i}',
+        )
+    server.add(
+        f'cn=odd,ou=groups,{BASE}',
+        objectClass='posixGroup',
+        cn='odd',
+        memberUid=[f'user{i}' for i in range(1, users, 2)],
+    )
+    server.add(
+        f'cn=all,ou=groups,{BASE}',
+        objectClass='posixGroup',
+        cn='all',
+        memberUid=[f'user{i}' for i in range(users)],
+    )
+    return server
+
+
+class SimpleLdapPoolTest(UDSTestCase):
+    server: FakeLDAPServer
+    db_auth: models.Authenticator
+    auth: SimpleLDAPAuthenticator
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.server = create_server()
+        patcher = self.server.patched()
+        patcher.__enter__()
+        self.addCleanup(patcher.__exit__, None, None, None)
+
+        instance = SimpleLDAPAuthenticator(environment=Environment.testing_environment(), values=VALUES)
+        self.db_auth = models.Authenticator.objects.create(
+            name='Simple LDAP',
+            data_type=SimpleLDAPAuthenticator.type_type,
+            data=instance.serialize(),
+        )
+        self.db_auth.groups.create(name='odd')
+        self.db_auth.groups.create(name='all')
+        self.auth = typing.cast(SimpleLDAPAuthenticator, self.db_auth.get_instance())
+        self.addCleanup(lambda: self.auth._pool().close())
+
+    def login(self, username: str, password: str) -> tuple[types.auth.AuthenticationResult, list[str]]:
+        groups_manager = auths.GroupsManager(self.db_auth)
+        request = mock.MagicMock()
+        request.ip = '127.0.0.1'
+        request.os.os.name = 'Linux'
+        request.META = {}
+        result = self.auth.authenticate(username, password, groups_manager, request)
+        return result, sorted(g.db_obj().name for g in groups_manager.enumerate_valid_groups())
+
+    def test_login_reuses_connections(self) -> None:
+        result, groups = self.login('user1', 'pass1')
+        self.assertEqual(result, types.auth.SUCCESS_AUTH)
+        self.assertEqual(groups, ['all', 'odd'])
+        # One connection for searchs, other for checking the credentials
+        self.assertEqual(self.server.connections, 2)
+        self.assertEqual(self.server.binds, 2)
+        self.assertEqual(self.server.searchs, 2)  # user and its groups
+
+        for i in range(4):
+            result, groups = self.login(f'user{i}', f'pass{i}')
+            self.assertEqual(result, types.auth.SUCCESS_AUTH)
+            self.assertEqual(groups, ['all', 'odd'] if i % 2 else ['all'])
+
+        # No more connections, one bind per login and searchs only for users not already resolved
+        self.assertEqual(self.server.connections, 2)
+        self.assertEqual(self.server.binds, 6)
+        self.assertEqual(self.server.searchs, 8)
+        self.assertEqual(self.auth._pool().as_dict()['reused'], 11)
+
+    def test_invalid_password(self) -> None:
+        result, _groups = self.login('user2', 'pass1')
+        self.assertEqual(result, types.auth.FAILED_AUTH)
+        result, _groups = self.login('user2', 'pass2')
+        self.assertEqual(result, types.auth.SUCCESS_AUTH)
+        result, _groups = self.login('user2', 'bad')
+        self.assertEqual(result, types.auth.FAILED_AUTH)
+        # Failed attempts do not discard connections
+        self.assertEqual(self.auth._pool().as_dict()['discarded'], 0)
+
+    def test_unknown_user(self) -> None:
+        result, _groups = self.login('nobody', 'pass')
+        self.assertEqual(result, types.auth.FAILED_AUTH)
+        self.assertEqual(self.server.binds, 1)  # Only service connection
+
+    def test_clear_cache(self) -> None:
+        self.login('user0', 'pass0')
+        # Changes on server are not seen until cache expires or is cleared
+        self.server.entries[f'cn=odd,ou=groups,{BASE}']['memberUid'].append('user0')
+        _result, groups = self.login('user0', 'pass0')
+        self.assertEqual(groups, ['all'])
+
+        self.auth.clear_cache()
+        _result, groups = self.login('user0', 'pass0')
+        self.assertEqual(groups, ['all', 'odd'])
+
+    def test_broken_connections(self) -> None:
+        self.login('user0', 'pass0')
+        self.server.break_connections()
+        with mock.patch('uds.core.consts.auth.LDAP_POOL_CHECK_INTERVAL', 0):
+            self.auth.clear_cache()
+            result, groups = self.login('user1', 'pass1')
+        self.assertEqual(result, types.auth.SUCCESS_AUTH)
+        self.assertEqual(groups, ['all', 'odd'])
+        self.assertEqual(self.server.connections, 4)  # Broken ones are replaced
+        self.assertEqual(self.auth._pool().as_dict()['discarded'], 2)
+
+    def test_broken_connection_retried(self) -> None:
+        self.login('user0', 'pass0')
+        self.server.break_connections()  # Not checked yet, so operations fail and are retried
+        self.auth.clear_cache()
+        result, groups = self.login('user1', 'pass1')
+        self.assertEqual(result, types.auth.SUCCESS_AUTH)
+        self.assertEqual(groups, ['all', 'odd'])
+        self.assertEqual(self.server.connections, 4)
+
+    def test_server_down(self) -> None:
+        self.server.down = True
+        result, _groups = self.login('user0', 'pass0')
+        self.assertEqual(result, types.auth.FAILED_AUTH)
+        self.server.down = False
+        result, _groups = self.login('user0', 'pass0')
+        self.assertEqual(result, types.auth.SUCCESS_AUTH)
+
+    def test_pool_replaced_on_changes(self) -> None:
+        pool = self.auth._pool()
+        self.assertIs(pool, self.auth._pool())
+        self.auth.password.value = 'other'
+        self.assertIsNot(pool, self.auth._pool())
+        self.assertIsInstance(self.auth._pool(), ldaputil.ConnectionPool)
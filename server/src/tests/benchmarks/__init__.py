@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2012-2022 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+
+Micro benchmarks. Module names do not match pytest discovery patterns, so they are not run with
+the test suite. Run them explicitly, showing output, i.e.:
+
+    pytest -s src/tests/benchmarks/codec.py
+"""
+import time
+import typing
+import collections.abc
+
+
+def measure(fnc: collections.abc.Callable[[], typing.Any], iterations: int) -> float:
+    """
+    Returns the mean time, in microseconds, of executing fnc
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fnc()
+    return (time.perf_counter() - start) / iterations * 1000000
+
+
+def report(title: str, headers: list[str], rows: list[list[typing.Any]]) -> None:
+    """
+    Prints a simple table with the results
+    """
+    widths = [max(len(str(v)) for v in column) for column in zip(headers, *rows)]
+    print(f'\n{title}')
+    for row in [headers] + rows:
+        print('  '.join(str(v).rjust(w) for v, w in zip(row, widths)))
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+
+Cache claim benchmark: bursts of concurrent assignations against a single pool, claiming the first
+cached user service of the pool (as UserServiceManager used to do, so concurrent requests collide on the
+same row and retry or miss the cache) versus claim_cached_userservice, that skips rows locked by other
+requests (SKIP LOCKED) or, on sqlite, claims one of several candidates taken in random order.
+
+Misses are assignations that found no cached user service while there were enough of them for every request.
+
+Sqlite (used on tests) has no row locks and locks whole tables for concurrent transactions, so statements are
+run in autocommit mode, one at a time, and readers do not lock tables (read_uncommitted). This measures
+the sqlite fallback path, where concurrent requests interleave between selecting and claiming a cached service.
+
+Number of cached user services (and assignations) and concurrent assignations per burst can be set with
+UDS_BENCHMARK_CACHED (default 64) and UDS_BENCHMARK_CONCURRENCY (default 16):
+
+    UDS_BENCHMARK_CONCURRENCY=32 pytest -s src/tests/benchmarks/cache_claim.py
+"""
+import contextlib
+import os
+import statistics
+import threading
+import time
+import typing
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.db import connections, transaction
+from django.test import TransactionTestCase
+
+from uds import models
+from uds.core import types
+from uds.core.managers import userservice
+from uds.core.types.states import State
+
+from ..fixtures import authenticators as authenticators_fixtures
+from ..fixtures import services as services_fixtures
+from . import report
+
+CACHED: typing.Final[int] = int(os.environ.get('UDS_BENCHMARK_CACHED', 64))
+CONCURRENCY: typing.Final[int] = int(os.environ.get('UDS_BENCHMARK_CONCURRENCY', 16))
+
+
+class LegacyClaim:
+    """
+    Cache claim as get_assignation_for_user used to do it
+    """
+
+    retries: int = 0
+    _lock: threading.Lock
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+
+    def _claim(
+        self, service_pool: 'models.ServicePool', user: 'models.User', **filters: typing.Any
+    ) -> typing.Optional['models.UserService']:
+        with transaction.atomic():
+            caches = list(
+                service_pool.cached_users_services()
+                .select_for_update()
+                .filter(cache_level=types.services.CacheLevel.L1, **filters)[:1]
+            )
+            if caches:
+                if (
+                    service_pool.cached_users_services()
+                    .select_for_update()
+                    .filter(user=None, uuid=caches[0].uuid)
+                    .update(user=user, cache_level=0)
+                    == 1
+                ):
+                    return caches[0]
+                with self._lock:
+                    self.retries += 1
+        return None
+
+    def claim(self, service_pool: 'models.ServicePool', user: 'models.User') -> typing.Optional['models.UserService']:
+        return self._claim(service_pool, user, state=State.USABLE, os_state=State.USABLE) or self._claim(
+            service_pool, user, state=State.USABLE
+        )
+
+
+class CacheClaimBenchmark(TransactionTestCase):
+    service_pool: 'models.ServicePool'
+    users: list['models.User']
+
+    def _reset_cache(self) -> None:
+        models.UserService.objects.filter(deployed_service=self.service_pool).update(
+            user=None, cache_level=types.services.CacheLevel.L1
+        )
+
+    def _burst(
+        self,
+        claim: typing.Callable[['models.ServicePool', 'models.User'], typing.Optional['models.UserService']],
+    ) -> tuple[list[float], int]:
+        barrier = threading.Barrier(CONCURRENCY)
+        statements_lock = threading.Lock()
+
+        def _serialized(execute: typing.Callable[..., typing.Any], *args: typing.Any) -> typing.Any:
+            with statements_lock:
+                return execute(*args)
+
+        def _assign(user: 'models.User') -> tuple[float, bool]:
+            try:
+                with connections['default'].cursor() as cursor:  # Readers do not lock tables
+                    cursor.execute('PRAGMA read_uncommitted = 1')
+                with connections['default'].execute_wrapper(_serialized):
+                    barrier.wait()  # All requests of a burst arrive at once
+                    start = time.perf_counter()
+                    claimed = claim(self.service_pool, user)
+                    return time.perf_counter() - start, claimed is not None
+            finally:
+                connections['default'].close()
+
+        latencies: list[float] = []
+        misses = 0
+        with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+            for burst in range(0, CACHED, CONCURRENCY):
+                for latency, claimed in executor.map(_assign, self.users[burst : burst + CONCURRENCY]):
+                    latencies.append(latency)
+                    misses += int(not claimed)
+        return latencies, misses
+
+    def test_cache_claim(self) -> None:
+        auth = authenticators_fixtures.create_db_authenticator()
+        groups = authenticators_fixtures.create_db_groups(auth, 1)
+        self.users = authenticators_fixtures.create_db_users(auth, CACHED, groups=groups)
+        self.service_pool = services_fixtures.create_db_servicepool(
+            services_fixtures.create_db_service(services_fixtures.create_db_provider()), groups=groups
+        )
+        publication = services_fixtures.create_db_publication(self.service_pool)
+        for _ in range(CACHED):
+            services_fixtures.create_db_userservice(self.service_pool, publication, self.users[0])
+
+        manager = userservice.UserServiceManager.manager()
+        stats = userservice.CacheClaimStats.manager()
+
+        def _claim(
+            service_pool: 'models.ServicePool', user: 'models.User'
+        ) -> typing.Optional['models.UserService']:
+            return manager.claim_cached_userservice(
+                service_pool, user, state=State.USABLE, os_state=State.USABLE
+            ) or manager.claim_cached_userservice(service_pool, user, state=State.USABLE)
+
+        results: list[list[typing.Any]] = []
+        for name in ('legacy', 'claim'):
+            self._reset_cache()
+            legacy = LegacyClaim()
+            retries = stats.retries
+            with mock.patch.object(transaction, 'atomic', new=contextlib.nullcontext):
+                latencies, misses = self._burst(legacy.claim if name == 'legacy' else _claim)
+            results.append(
+                [
+                    name,
+                    legacy.retries if name == 'legacy' else stats.retries - retries,
+                    misses,
+                    f'{statistics.median(latencies) * 1000:.2f}',
+                    f'{sorted(latencies)[int(len(latencies) * 0.99) - 1] * 1000:.2f}',
+                ]
+            )
+
+        report(
+            f'Cache claim: {CACHED} cached user services, bursts of {CONCURRENCY} concurrent assignations',
+            ['method', 'retries', 'misses', 'p50 (ms)', 'p99 (ms)'],
+            results,
+        )
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2012-2022 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+import base64
+import codecs
+import dataclasses
+import lzma
+import pickle
+import typing
+from unittest import TestCase
+
+from uds.core import types
+from uds.core.util import autoserializable, codec, serializer
+
+from . import measure, report
+
+ITERATIONS: typing.Final[int] = 2000
+
+
+class SampleUserService(autoserializable.AutoSerializable):
+    name = autoserializable.StringField(default='')
+    vmid = autoserializable.IntegerField(default=0)
+    ip = autoserializable.StringField(default='')
+    mac = autoserializable.StringField(default='')
+    queue = autoserializable.ListField[int]()
+
+
+def _vm_info() -> dict[str, typing.Any]:
+    return {
+        'id': 'vm-1234',
+        'name': 'UDS-Machine-0001',
+        'status': 'running',
+        'node': 'node-01',
+        'cpus': 2,
+        'memory': 4 * 1024 * 1024 * 1024,
+        'uptime': 123456,
+        'networks': [{'mac': '00:11:22:33:44:55', 'ip': '192.168.1.10', 'type': 'virtio'}],
+        'disks': [{'id': f'disk-{i}', 'size': 32 * 1024**3, 'storage': 'local-lvm'} for i in range(2)],
+    }
+
+
+def _vm_list() -> list[dict[str, typing.Any]]:
+    return [_vm_info() | {'id': f'vm-{i}', 'name': f'UDS-Machine-{i:04}'} for i in range(200)]
+
+
+def _server_stats() -> dict[str, typing.Any]:
+    return dataclasses.asdict(
+        types.servers.ServerStats(
+            memused=2 * 1024**3,
+            memtotal=8 * 1024**3,
+            cpuused=0.35,
+            uptime=86400,
+            disks=[types.servers.ServerDiskInfo('/', 10 * 1024**3, 50 * 1024**3)],
+            connections=12,
+            current_users=4,
+            stamp=1700000000.0,
+        )
+    )
+
+
+def _autoserializable_blob() -> bytes:
+    userservice = SampleUserService()
+    userservice.name = 'UDS-Machine-0001'
+    userservice.vmid = 1234
+    userservice.ip = '192.168.1.10'
+    userservice.mac = '00:11:22:33:44:55'
+    userservice.queue = [1, 2, 3, 4]
+    return userservice.marshal()
+
+
+def _legacy_encode(value: typing.Any) -> bytes:
+    """Previous serializer format (pickle + lzma + encryption)"""
+    return serializer.CURRENT_SERIALIZER_VERSION + serializer.SERIALIZERS[serializer.CURRENT_SERIALIZER_VERSION](
+        lzma.compress(pickle.dumps(value))
+    )
+
+
+class CodecBenchmark(TestCase):
+    def test_codec(self) -> None:
+        payloads: list[tuple[str, typing.Any]] = [
+            ('vm info', _vm_info()),
+            ('vm list (200)', _vm_list()),
+            ('server stats', _server_stats()),
+            ('autoserializable', _autoserializable_blob()),
+            ('short string', 'UDS-Machine-0001'),
+        ]
+        rows: list[list[typing.Any]] = []
+        for name, payload in payloads:
+            legacy = _legacy_encode(payload)
+            current = serializer.serialize(payload)
+            raw = codec.encode(payload)
+            rows.append(
+                [
+                    name,
+                    f'{measure(lambda: _legacy_encode(payload), ITERATIONS):.1f}',
+                    f'{measure(lambda: serializer.deserialize(legacy), ITERATIONS):.1f}',
+                    len(legacy),
+                    f'{measure(lambda: serializer.serialize(payload), ITERATIONS):.1f}',
+                    f'{measure(lambda: serializer.deserialize(current), ITERATIONS):.1f}',
+                    len(current),
+                    f'{measure(lambda: codec.encode(payload), ITERATIONS):.1f}',
+                    f'{measure(lambda: codec.decode(raw), ITERATIONS):.1f}',
+                    len(raw),
+                ]
+            )
+            self.assertEqual(serializer.deserialize(current), payload)
+
+        report(
+            'Serializer (times in us, sizes in bytes)',
+            [
+                'payload',
+                'old enc',
+                'old dec',
+                'old size',
+                'new enc',
+                'new dec',
+                'new size',
+                'codec enc',
+                'codec dec',
+                'codec size',
+            ],
+            rows,
+        )
+
+    def test_cache_value(self) -> None:
+        # Cache values are also base64 encoded (previously, using codecs, now base64 module)
+        payload = _vm_info()
+        legacy = codecs.encode(_legacy_encode(payload), 'base64').decode()
+        current = base64.b64encode(serializer.serialize(payload)).decode()
+        report(
+            'Cache value roundtrip (times in us)',
+            ['format', 'encode', 'decode', 'size'],
+            [
+                [
+                    'old',
+                    f'{measure(lambda: codecs.encode(_legacy_encode(payload), "base64").decode(), ITERATIONS):.1f}',
+                    f'{measure(lambda: serializer.deserialize(codecs.decode(legacy.encode(), "base64")), ITERATIONS):.1f}',
+                    len(legacy),
+                ],
+                [
+                    'new',
+                    f'{measure(lambda: base64.b64encode(serializer.serialize(payload)).decode(), ITERATIONS):.1f}',
+                    f'{measure(lambda: serializer.deserialize(base64.b64decode(current.encode())), ITERATIONS):.1f}',
+                    len(current),
+                ],
+            ],
+        )
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+
+Deferred deletion benchmark with simulated providers: time to process a run of the deletion worker
+when one provider is slow, processing every entry sequentially (one provider after another) versus
+the partitioned engine, that runs every provider concurrently with DEFERRED_DELETION_CONCURRENCY
+operations at once on each one, and optionally limited to DEFERRED_DELETION_RATE operations per second.
+
+Latency of providers operations (in milliseconds) can be set with UDS_BENCHMARK_SLOW_LATENCY
+(default 50) and UDS_BENCHMARK_FAST_LATENCY (default 5):
+
+    UDS_BENCHMARK_SLOW_LATENCY=200 pytest -s src/tests/benchmarks/deferred_deletion.py
+"""
+import contextlib
+import datetime
+import os
+import time
+import typing
+from unittest import mock
+
+from django.test import TransactionTestCase
+
+from uds.core.util.model import sql_now
+from uds.core.workers import deferred_deletion
+
+from . import report
+
+SLOW_LATENCY: typing.Final[float] = float(os.environ.get('UDS_BENCHMARK_SLOW_LATENCY', 50)) / 1000
+FAST_LATENCY: typing.Final[float] = float(os.environ.get('UDS_BENCHMARK_FAST_LATENCY', 5)) / 1000
+FAST_PROVIDERS: typing.Final[int] = 3
+
+
+class DeferredDeletionBenchmark(TransactionTestCase):
+    storage: dict[str, dict[str, deferred_deletion.DeletionInfo]]
+    services: dict[str, mock.MagicMock]
+
+    def _service(self, name: str, latency: float) -> mock.MagicMock:
+        def _is_deleted(vmid: str) -> bool:
+            time.sleep(latency)
+            return True
+
+        instance = mock.MagicMock()
+        instance.provider.return_value.get_uuid.return_value = name
+        instance.db_obj.return_value = mock.MagicMock(uuid=name)
+        instance.db_obj.return_value.get_instance.return_value = instance
+        instance.is_deleted.side_effect = _is_deleted
+        return instance
+
+    @contextlib.contextmanager
+    def _environment(self) -> typing.Iterator[None]:
+        self.storage = {deferred_deletion.DELETING_GROUP: {}}
+        self.services = {'slow': self._service('slow', SLOW_LATENCY)}
+        self.services.update({f'fast{i}': self._service(f'fast{i}', FAST_LATENCY) for i in range(FAST_PROVIDERS)})
+        last_check = sql_now() - datetime.timedelta(seconds=deferred_deletion.CHECK_INTERVAL)
+        for name in self.services:
+            for i in range(deferred_deletion.MAX_DELETIONS_PER_PROVIDER):
+                self.storage[deferred_deletion.DELETING_GROUP][f'{name}_vm{i}'] = deferred_deletion.DeletionInfo(
+                    vmid=f'vm{i}', created=last_check, last_check=last_check, service_uuid=name
+                )
+
+        @contextlib.contextmanager
+        def _as_dict(group: str, *args: typing.Any, **kwargs: typing.Any) -> typing.Iterator[dict[str, typing.Any]]:
+            yield self.storage.setdefault(group, {})
+
+        with mock.patch('uds.models.Service.objects') as objs, mock.patch(
+            'uds.core.workers.deferred_deletion.DeferredDeletionWorker.deferred_storage'
+        ) as storage:
+            objs.get.side_effect = lambda uuid: self.services[uuid].db_obj()
+            storage.as_dict.side_effect = _as_dict
+            yield
+
+    def _sequential(self, job: deferred_deletion.DeferredDeletionWorker) -> None:
+        # As entries were processed before partitioning them by provider
+        services, infos = deferred_deletion.DeletionInfo.get_from_storage(deferred_deletion.DELETING_GROUP)
+        for _key, info in infos:
+            job._deleting(services[info.service_uuid], info)  # pyright: ignore[reportPrivateUsage]
+
+    def _measure(self, method: str, concurrency: int, rate: float) -> list[typing.Any]:
+        with self._environment(), mock.patch(
+            'uds.core.consts.system.DEFERRED_DELETION_CONCURRENCY', concurrency
+        ), mock.patch('uds.core.consts.system.DEFERRED_DELETION_RATE', rate), mock.patch.object(
+            deferred_deletion.DeferredDeletionWorker, '_limiters', {}  # New limiters, with current concurrency
+        ):
+            job = deferred_deletion.DeferredDeletionWorker(environment=mock.MagicMock())
+            start = time.perf_counter()
+            if method == 'sequential':
+                self._sequential(job)
+            else:
+                job.process_deleting()
+            elapsed = time.perf_counter() - start
+            processed = sum(service.is_deleted.call_count for service in self.services.values())
+        return [
+            method,
+            concurrency,
+            rate or 'unlimited',
+            processed,
+            f'{elapsed * 1000:.0f}',
+            f'{processed / elapsed:.1f}',
+        ]
+
+    def test_deferred_deletion(self) -> None:
+        report(
+            f'Deferred deletion: 1 provider with {SLOW_LATENCY * 1000:.0f}ms latency, '
+            f'{FAST_PROVIDERS} with {FAST_LATENCY * 1000:.0f}ms',
+            ['method', 'concurrency', 'rate (ops/s)', 'processed', 'run time (ms)', 'deletions/s'],
+            [
+                self._measure('sequential', 1, 0),
+                self._measure('partitioned', 1, 0),
+                self._measure('partitioned', 4, 0),
+                self._measure('partitioned', 4, 50),
+            ],
+        )
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+
+Groups resolution on login: a GroupsManager is created for the authenticator, and the external groups of the user
+are validated against it. Compares the groups manager as it used to be (every group loaded and checked, one by one,
+on each login) with the compiled groups matcher.
+
+Number of groups of the authenticator (a tenth of them patterns), external groups of the user and logins can be set
+with UDS_BENCHMARK_GROUPS (default 1000), UDS_BENCHMARK_MEMBERSHIPS (default 300) and UDS_BENCHMARK_LOGINS (default 5):
+
+    UDS_BENCHMARK_GROUPS=5000 pytest -s src/tests/benchmarks/groups.py
+"""
+import collections.abc
+import os
+import re
+import time
+import typing
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from uds import models
+from uds.core.auths.group import Group
+from uds.core.auths.groups_manager import GroupsManager
+from uds.core.types.states import State
+
+from tests.fixtures import authenticators as authenticators_fixtures
+from tests.utils.test import UDSTestCase
+
+from . import report
+
+GROUPS: typing.Final[int] = int(os.environ.get('UDS_BENCHMARK_GROUPS', 1000))
+MEMBERSHIPS: typing.Final[int] = int(os.environ.get('UDS_BENCHMARK_MEMBERSHIPS', 300))
+LOGINS: typing.Final[int] = int(os.environ.get('UDS_BENCHMARK_LOGINS', 5))
+
+
+class LegacyGroupsManager:
+    """
+    Groups manager as it used to be: every group is loaded (and instantiated) on creation, and each name
+    is checked against every group, compiling patterns on each check
+    """
+
+    def __init__(self, db_authenticator: models.Authenticator) -> None:
+        self._groups: list[tuple[str, bool, models.Group]] = []
+        self._valid: set[int] = set()
+        for g in db_authenticator.groups.filter(state=State.ACTIVE, is_meta=False):
+            Group(g).manager()  # Group used to instantiate its authenticator on creation
+            name = g.name.lower()
+            is_pattern = name.find('pat:') == 0
+            self._groups.append((name[4:] if is_pattern else name, is_pattern, g))
+
+    def validate(self, group_name: typing.Union[str, collections.abc.Iterable[str]]) -> None:
+        if not isinstance(group_name, str):
+            for name in group_name:
+                self.validate(name)
+            return
+        name = group_name.lower()
+        for n, (grp_name, is_pattern, _g) in enumerate(self._groups):
+            if is_pattern:
+                try:
+                    if re.search(grp_name, name, re.IGNORECASE) is not None:
+                        self._valid.add(n)
+                except Exception:
+                    pass
+            elif name.casefold() == grp_name.casefold():
+                self._valid.add(n)
+
+    def valid_ids(self) -> list[int]:
+        return sorted(self._groups[n][2].id for n in self._valid)
+
+
+class GroupsBenchmark(UDSTestCase):
+    def test_groups_resolution(self) -> None:
+        auth = authenticators_fixtures.create_db_authenticator()
+        patterns = GROUPS // 10
+        models.Group.objects.bulk_create(
+            [
+                models.Group(manager=auth, name=f'pat:^dept{i}-(north|south)-[0-9]+$')
+                for i in range(patterns)
+            ]
+            + [models.Group(manager=auth, name=f'Group {i}') for i in range(GROUPS - patterns)]
+        )
+        # Some memberships are known groups, some match patterns, and the most are unknown to uds
+        memberships = [
+            f'group {i * 7}' if i % 3 == 0 else f'DEPT{i}-north-{i}' if i % 3 == 1 else f'external group {i}'
+            for i in range(MEMBERSHIPS)
+        ]
+
+        rows: list[list[typing.Any]] = []
+        for mode in ('group by group', 'compiled matcher'):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                for _ in range(LOGINS):
+                    if mode == 'group by group':
+                        legacy = LegacyGroupsManager(auth)
+                        legacy.validate(memberships)
+                        valid_ids = legacy.valid_ids()
+                    else:
+                        groups_manager = GroupsManager(auth)
+                        groups_manager.validate(memberships)
+                        valid_ids = sorted(groups_manager._valid)
+                elapsed = time.perf_counter() - start
+
+            # Names validation only, on an already created manager
+            start = time.perf_counter()
+            if mode == 'group by group':
+                legacy.validate(memberships)
+            else:
+                groups_manager.validate(memberships)
+            validation = time.perf_counter() - start
+
+            rows.append(
+                [
+                    mode,
+                    f'{elapsed / LOGINS * 1000:.2f}',
+                    f'{validation * 1000:.2f}',
+                    f'{MEMBERSHIPS / validation:.0f}',
+                    f'{len(queries) / LOGINS:.1f}',
+                ]
+            )
+            if mode == 'group by group':
+                expected = valid_ids
+            else:
+                self.assertEqual(valid_ids, expected)
+
+        report(
+            f'Groups resolution ({GROUPS} groups, {patterns} patterns, {MEMBERSHIPS} memberships, {LOGINS} logins)',
+            ['mode', 'ms/login', 'ms/validation', 'names/s', 'queries/login'],
+            rows,
+        )
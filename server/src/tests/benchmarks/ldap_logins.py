@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+
+Logins on a SimpleLDAP authenticator, against the in-process ldap server of tests.utils.fake_ldap. Compares
+the connections opened on every login (as the authenticator used to do) with the connections pool and
+the users/groups cache. Opening a connection costs here a single round trip (no tcp/tls handshake), so
+real servers gain more than shown.
+
+Number of logins, of different users and server latency (seconds per round trip) can be set with
+UDS_BENCHMARK_LOGINS (default 400), UDS_BENCHMARK_USERS (default 50) and UDS_BENCHMARK_LATENCY (default 0.002):
+
+    UDS_BENCHMARK_LATENCY=0.01 pytest -s src/tests/benchmarks/ldap_logins.py
+"""
+import os
+import time
+import typing
+
+from uds import models
+from uds.core import auths, types
+from uds.core.environment import Environment
+from uds.core.util import ldaputil
+
+from uds.auths.SimpleLDAP.authenticator import SimpleLDAPAuthenticator
+
+from tests.utils.test import UDSTestCase
+from tests.auths.simple_ldap.test_pool import VALUES, create_server
+
+from . import report
+
+LOGINS: typing.Final[int] = int(os.environ.get('UDS_BENCHMARK_LOGINS', 400))
+USERS: typing.Final[int] = int(os.environ.get('UDS_BENCHMARK_USERS', 50))
+LATENCY: typing.Final[float] = float(os.environ.get('UDS_BENCHMARK_LATENCY', 0.002))
+
+
+def legacy_login(
+    auth: SimpleLDAPAuthenticator, username: str, password: str, groups_manager: auths.GroupsManager
+) -> None:
+    """
+    Login as SimpleLDAP used to do it, a new connection for searchs and a new one for checking credentials
+    """
+
+    def connect(user: str, passwd: str) -> ldaputil.LDAPObject:
+        return ldaputil.connection(user, passwd, auth.host.as_str(), port=auth.port.as_int())
+
+    con = connect(auth.username.as_str(), auth.password.as_str())
+    user = ldaputil.first(
+        con=con,
+        base=auth.ldap_base.as_str(),
+        objectClass=auth.user_class.as_str(),
+        field=auth.user_id_attr.as_str(),
+        value=username,
+        attributes=[auth.username_attr.as_str(), auth.user_id_attr.as_str()],
+    )
+    if user is None:
+        raise Exception('User not found')
+    connect(user['dn'], password)
+    member_attr = auth.member_attr.as_str()
+    groups_manager.validate(
+        group
+        for d in ldaputil.as_dict(
+            con=con,
+            base=auth.ldap_base.as_str(),
+            ldap_filter=f'(&(objectClass={auth.group_class.as_str()})(|({member_attr}={user["_id"]})({member_attr}={user["dn"]})))',
+            attributes=[auth.group_id_attr.as_str()],
+        )
+        for group in d[auth.group_id_attr.as_str()]
+    )
+
+
+class LdapLoginsBenchmark(UDSTestCase):
+    def test_logins(self) -> None:
+        server = create_server(USERS)
+        instance = SimpleLDAPAuthenticator(environment=Environment.testing_environment(), values=VALUES)
+        db_auth = models.Authenticator.objects.create(
+            name='Simple LDAP', data_type=SimpleLDAPAuthenticator.type_type, data=instance.serialize()
+        )
+        db_auth.groups.create(name='all')
+        db_auth.groups.create(name='odd')
+        auth = typing.cast(SimpleLDAPAuthenticator, db_auth.get_instance())
+
+        request: typing.Any = None  # Not used on successful logins
+        # Same groups manager for every login, so only ldap related work is measured
+        groups_manager = auths.GroupsManager(db_auth)
+        rows: list[list[typing.Any]] = []
+        with server.patched():
+            for mode in ('connection per login', 'pool + cache'):
+                server.reset_counters()
+                server.latency = LATENCY
+                start = time.perf_counter()
+                for i in range(LOGINS):
+                    username, password = f'user{i % USERS}', f'pass{i % USERS}'
+                    if mode == 'connection per login':
+                        legacy_login(auth, username, password, groups_manager)
+                    else:
+                        result = auth.authenticate(username, password, groups_manager, request)
+                        self.assertEqual(result, types.auth.SUCCESS_AUTH)
+                elapsed = time.perf_counter() - start
+                rows.append(
+                    [
+                        mode,
+                        server.connections,
+                        f'{server.binds / LOGINS:.2f}',
+                        f'{server.searchs / LOGINS:.2f}',
+                        f'{elapsed / LOGINS * 1000:.2f}',
+                        f'{LOGINS / elapsed:.0f}',
+                    ]
+                )
+            auth._pool().close()
+
+        report(
+            f'SimpleLDAP logins ({LOGINS} logins of {USERS} users, {LATENCY * 1000:.1f} ms latency)',
+            ['mode', 'connections', 'binds/login', 'searchs/login', 'ms/login', 'logins/s'],
+            rows,
+        )
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+
+Network filtering of transports, as done on each portal services list render (every transport is checked against
+the client ip). Compares the database lookup on every check (as Transport.is_ip_allowed used to do) with the
+compiled networks index. Also shows the "networks of an ip" lookup and the time needed to build the index.
+
+Number of networks, transports and client ips can be set with UDS_BENCHMARK_NETWORKS (default 4000),
+UDS_BENCHMARK_TRANSPORTS (default 1000) and UDS_BENCHMARK_IPS (default 20):
+
+    UDS_BENCHMARK_NETWORKS=20000 pytest -s src/tests/benchmarks/networks.py
+"""
+import os
+import random
+import time
+import typing
+
+from django.db import connection
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from uds import models
+from uds.core import consts
+from uds.core.util import net
+from uds.models.network import NetworksIndex
+
+from . import report
+
+NETWORKS: typing.Final[int] = int(os.environ.get('UDS_BENCHMARK_NETWORKS', 4000))
+TRANSPORTS: typing.Final[int] = int(os.environ.get('UDS_BENCHMARK_TRANSPORTS', 1000))
+IPS: typing.Final[int] = int(os.environ.get('UDS_BENCHMARK_IPS', 20))
+
+
+def legacy_is_ip_allowed(transport: models.Transport, ip: str) -> bool:
+    """
+    Network filtering as Transport.is_ip_allowed used to do it, a database lookup on every call
+    """
+    ip_number, version = net.ip_to_long(ip)
+    exists = transport.networks.filter(
+        start__lte=models.Network.hexlify(ip_number), end__gte=models.Network.hexlify(ip_number), version=version
+    ).exists()
+    return exists if transport.net_filtering == consts.auth.ALLOW else not exists
+
+
+def legacy_networks_for_ip(ip: str) -> list[int]:
+    ip_number, version = net.ip_to_long(ip)
+    hex_value = models.Network.hexlify(ip_number)
+    return list(
+        models.Network.objects.filter(version=version, start__lte=hex_value, end__gte=hex_value).values_list(
+            'id', flat=True
+        )
+    )
+
+
+class NetworksBenchmark(TransactionTestCase):
+    def test_transports_filtering(self) -> None:
+        rnd = random.Random(42)
+        # /24 networks, and some wider ones overlapping them, ipv4 and ipv6
+        networks = models.Network.objects.bulk_create(
+            [
+                models.Network(
+                    name=f'net{i}',
+                    net_string=net_string,
+                    start=models.Network.hexlify(rng.start),
+                    end=models.Network.hexlify(rng.end),
+                    version=rng.version,
+                )
+                for i, net_string in enumerate(
+                    (
+                        f'10.{i // 256 % 256}.{i % 256}.0/24'
+                        if i % 10
+                        else f'10.{i // 256 % 256}.0.0/16' if i % 20 else f'2001:db8:{i:x}::/48'
+                    )
+                    for i in range(NETWORKS)
+                )
+                for rng in [net.network_from_str(net_string)]
+            ]
+        )
+        networks = list(models.Network.objects.all())
+        transports: list[models.Transport] = []
+        for i in range(TRANSPORTS):
+            transport = models.Transport.objects.create(
+                name=f'transport{i}',
+                data_type='RDPTransport',
+                net_filtering=consts.auth.ALLOW if i % 2 else consts.auth.DENY,
+            )
+            transport.networks.add(*rnd.sample(networks, 3))
+            transports.append(transport)
+        ips = [f'10.{rnd.randrange(NETWORKS // 256 + 1)}.{rnd.randrange(256)}.{rnd.randrange(256)}' for _ in range(IPS)]
+
+        index = NetworksIndex.manager()
+        start = time.perf_counter()
+        index.networks_for_ip('10.0.0.1')
+        build_time = time.perf_counter() - start
+
+        rows: list[list[typing.Any]] = []
+        for mode, is_ip_allowed, networks_for_ip in (
+            ('database lookup', legacy_is_ip_allowed, legacy_networks_for_ip),
+            ('networks index', models.Transport.is_ip_allowed, index.networks_for_ip),
+        ):
+            # Queries are counted for a single services list, as the whole run exceeds django queries log
+            with CaptureQueriesContext(connection) as queries:
+                for t in transports:
+                    is_ip_allowed(t, ips[0])
+            start = time.perf_counter()
+            allowed = [[is_ip_allowed(t, ip) for t in transports] for ip in ips]
+            filtering_time = time.perf_counter() - start
+            start = time.perf_counter()
+            for ip in ips:
+                networks_for_ip(ip)
+            lookup_time = time.perf_counter() - start
+            rows.append(
+                [
+                    mode,
+                    f'{filtering_time / IPS * 1000:.2f}',
+                    f'{IPS * TRANSPORTS / filtering_time:.0f}',
+                    f'{lookup_time / IPS * 1000000:.0f}',
+                    len(queries),
+                ]
+            )
+            if mode == 'database lookup':
+                expected = allowed
+            else:
+                self.assertEqual(allowed, expected)
+
+        report(
+            f'Transports network filtering ({NETWORKS} networks, {TRANSPORTS} transports, {IPS} ips)',
+            ['mode', 'ms/services list', 'checks/s', 'us/networks of ip', 'queries/services list'],
+            rows,
+        )
+        print(f'Index build time: {build_time * 1000:.1f} ms, {index}')
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+
+Validation of OpenID id tokens on an OAuth2 authenticator, against the local provider of tests.utils.fake_oauth2.
+Compares fetching discovery document and keys of provider for every token, and parsing the certificates of the
+public key field for every token (as the authenticator used to do), with the keys parsed once and kept in memory.
+Provider is local, so real providers (hundreds of ms away) gain much more than shown.
+
+Number of tokens can be set with UDS_BENCHMARK_TOKENS (default 500):
+
+    UDS_BENCHMARK_TOKENS=2000 pytest -s src/tests/benchmarks/oauth2_tokens.py
+"""
+import os
+import time
+import typing
+from unittest import mock
+
+import jwt
+import requests
+
+from uds.core import consts
+from uds.core.environment import Environment
+from uds.core.util import fields
+
+from uds.auths.OAuth2 import authenticator as oauth2
+
+from tests.utils.test import UDSTestCase
+from tests.utils.fake_oauth2 import FakeOpenIDProvider
+from tests.auths.oauth2.test_keys import CLIENT_ID, CLAIMS
+
+from . import report
+
+TOKENS: typing.Final[int] = int(os.environ.get('UDS_BENCHMARK_TOKENS', 500))
+
+
+def legacy_provider_keys(
+    self: oauth2.OAuth2Authenticator, kid: typing.Optional[str] = None
+) -> list[tuple[typing.Any, list[str]]]:
+    """
+    Keys fetched (and parsed) from the provider for every token
+    """
+    discovery = requests.get(self.discoveryEndpoint.value, timeout=consts.system.COMMS_TIMEOUT).json()
+    jwks = requests.get(discovery['jwks_uri'], timeout=consts.system.COMMS_TIMEOUT).json()
+    return [
+        (key.key, [key.algorithm_name])
+        for key in jwt.PyJWKSet.from_dict(jwks).keys
+        if kid is None or key.key_id == kid
+    ]
+
+
+def legacy_public_keys(
+    self: oauth2.OAuth2Authenticator, kid: typing.Optional[str] = None
+) -> list[tuple[typing.Any, list[str]]]:
+    """
+    Certificates of public key field parsed for every token
+    """
+    return [
+        (cert.public_key(), oauth2.TOKEN_ALGORITHMS) for cert in fields.get_certificates_from_field(self.publicKey)
+    ]
+
+
+def validate(instance: oauth2.OAuth2Authenticator, token: str) -> None:
+    """
+    Validates the token as the authenticator does (see OAuth2Authenticator._process_token_open_id)
+    """
+    header = jwt.get_unverified_header(token)
+    for key, algorithms in instance._get_public_keys(header.get('kid')):
+        jwt.decode(token, key=key, audience=CLIENT_ID, algorithms=algorithms)
+        return
+    raise Exception('No key found')
+
+
+class OAuth2TokensBenchmark(UDSTestCase):
+    def test_tokens(self) -> None:
+        rows: list[list[typing.Any]] = []
+        with FakeOpenIDProvider() as provider:
+            # Tokens are signed before measuring, signing is provider work
+            tokens = [provider.id_token(CLIENT_ID, f'nonce{i}', CLAIMS) for i in range(TOKENS)]
+            for source, legacy in (('discovery', legacy_provider_keys), ('public key', legacy_public_keys)):
+                instance = oauth2.OAuth2Authenticator(environment=Environment.testing_environment())
+                instance.clientId.value = CLIENT_ID
+                if source == 'discovery':
+                    instance.discoveryEndpoint.value = provider.discovery_url
+                else:
+                    instance.publicKey.value = provider.certificate()
+
+                for mode in ('per token', 'cached'):
+                    instance.clear_cache()
+                    provider.reset_counters()
+                    with mock.patch.object(
+                        oauth2.OAuth2Authenticator,
+                        '_get_public_keys',
+                        legacy if mode == 'per token' else oauth2.OAuth2Authenticator._get_public_keys,
+                    ):
+                        start = time.perf_counter()
+                        for token in tokens:
+                            validate(instance, token)
+                        elapsed = time.perf_counter() - start
+                    rows.append(
+                        [
+                            f'{source}, keys parsed {mode}',
+                            provider.discovery_requests + provider.keys_requests,
+                            f'{elapsed / TOKENS * 1000:.3f}',
+                            f'{TOKENS / elapsed:.0f}',
+                        ]
+                    )
+
+        report(
+            f'OAuth2 id tokens validation ({TOKENS} tokens, RS256)',
+            ['mode', 'provider requests', 'ms/token', 'validations/s'],
+            rows,
+        )
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+
+Assigned services list of a large service pool, whole list (no query parameters, as the admin
+currently requests it) against a page of it (limit, offset and sort pushed down to the database).
+
+Pool size can be set with UDS_BENCHMARK_USERSERVICES (default 2000), and number of requests
+of each kind with UDS_BENCHMARK_REQUESTS (default 10):
+
+    UDS_BENCHMARK_USERSERVICES=10000 pytest -s src/tests/benchmarks/rest_pagination.py
+"""
+import os
+import time
+import typing
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from ..fixtures import services as services_fixtures
+from ..utils import rest
+from . import report
+
+USERSERVICES: typing.Final[int] = int(os.environ.get('UDS_BENCHMARK_USERSERVICES', 2000))
+REQUESTS: typing.Final[int] = int(os.environ.get('UDS_BENCHMARK_REQUESTS', 10))
+
+
+class RESTPaginationBenchmark(rest.test.RESTTestCase):
+    def test_assigned_services(self) -> None:
+        pool = self.user_service_managed.deployed_service
+        publication = self.user_service_managed.publication
+        assert publication is not None
+        for i in range(USERSERVICES - 1):
+            services_fixtures.create_db_userservice(pool, publication, self.plain_users[i % len(self.plain_users)])
+
+        self.login()
+        url = f'servicespools/{pool.uuid}/services/overview'
+
+        rows: list[list[typing.Any]] = []
+        for title, params in (
+            ('whole list', {}),
+            ('first page', {'limit': 50, 'sort': '-creation_date'}),
+            ('last page', {'limit': 50, 'offset': USERSERVICES - 50, 'sort': '-creation_date'}),
+            ('filtered page', {'limit': 50, 'filter': 'owner~user', 'sort': 'owner'}),
+        ):
+            size = 0
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                for _ in range(REQUESTS):
+                    response = self.client.rest_get(url, params)
+                    self.assertEqual(response.status_code, 200)
+                    size = len(response.content)
+                elapsed = time.perf_counter() - start
+            rows.append(
+                [
+                    title,
+                    f'{elapsed / REQUESTS * 1000:.1f}',
+                    f'{size / 1024:.1f}',
+                    f'{len(queries) / REQUESTS:.0f}',
+                    response.get('X-Total-Count', '-'),
+                ]
+            )
+
+        report(
+            f'Assigned services of a pool with {USERSERVICES} user services ({REQUESTS} requests each)',
+            ['request', 'ms/request', 'KiB/response', 'queries/request', 'total count'],
+            rows,
+        )
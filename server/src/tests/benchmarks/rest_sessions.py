@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+
+Authenticated REST GET throughput with each REST session mode (consts.auth.REST_SESSION_MODE):
+django database sessions (a session read on every request), uds cache sessions and signed tokens.
+
+Session queries are the ones done on the sessions table or the cache table per request, the rest of
+queries are the ones of the handler itself (user, requested data, ...). Tests database is an in-memory sqlite,
+so every saved query is worth far more on a real (networked) database than the throughput difference shown here.
+
+Number of requests per mode can be set with UDS_BENCHMARK_REQUESTS (default 500):
+
+    UDS_BENCHMARK_REQUESTS=2000 pytest -s src/tests/benchmarks/rest_sessions.py
+"""
+import os
+import time
+import typing
+from unittest import mock
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from uds.core import consts
+
+from ..fixtures import authenticators as authenticators_fixtures
+from ..utils import rest
+from ..utils.test import UDSTransactionTestCase
+from . import report
+
+REQUESTS: typing.Final[int] = int(os.environ.get('UDS_BENCHMARK_REQUESTS', 500))
+
+
+class RESTSessionsBenchmark(UDSTransactionTestCase):
+    def test_authenticated_get(self) -> None:
+        auth = authenticators_fixtures.create_db_authenticator()
+        groups = authenticators_fixtures.create_db_groups(auth, 1)
+        admin = authenticators_fixtures.create_db_users(auth, is_admin=True, groups=groups)[0]
+
+        rows: list[list[typing.Any]] = []
+        for mode in ('db', 'cache', 'token'):
+            with mock.patch('uds.core.consts.auth.REST_SESSION_MODE', mode):
+                token = rest.login(self, self.client, auth_id=auth.uuid, username=admin.name, password=admin.name)[
+                    'token'
+                ]
+                self.client.add_header(consts.auth.AUTH_TOKEN_HEADER, token)
+
+                # Warm up, session is loaded once on this process
+                self.assertEqual(self.client.rest_get('authenticators/types').status_code, 200)
+
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    for _ in range(REQUESTS):
+                        self.client.rest_get('authenticators/types')
+                    elapsed = time.perf_counter() - start
+
+                session_queries = sum(
+                    1 for q in queries if 'django_session' in q['sql'] or 'uds_utility_cache' in q['sql']
+                )
+                rows.append(
+                    [
+                        mode,
+                        f'{REQUESTS / elapsed:.0f}',
+                        f'{len(queries) / REQUESTS:.2f}',
+                        f'{session_queries / REQUESTS:.2f}',
+                    ]
+                )
+                rest.logout(self, self.client)
+
+        report(
+            f'Authenticated REST GET ({REQUESTS} requests per mode)',
+            ['mode', 'requests/s', 'queries/request', 'session queries/request'],
+            rows,
+        )
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+
+SAML assertion consumer service (the authenticator callback), with responses signed by the local idp of
+tests.utils.fake_saml. Compares building the onelogin settings on every request (parsing idp metadata and
+checking certificates, as the authenticator used to do) with the settings cached per authenticator.
+Also shows the cost of loading the idp certificate into the xmlsec signature context, still done by
+python3-saml on every signature validation.
+
+Number of requests can be set with UDS_BENCHMARK_REQUESTS (default 200):
+
+    UDS_BENCHMARK_REQUESTS=1000 pytest -s src/tests/benchmarks/saml_acs.py
+"""
+import contextlib
+import os
+import time
+import typing
+from unittest import mock
+
+import xmlsec
+
+from uds.core import auths, types
+
+from uds.auths.SAML import saml
+
+from tests.utils.test import UDSTestCase
+from tests.utils.fake_saml import FakeSAMLIdP
+from tests.auths.saml.test_settings_cache import (
+    SP_ENTITY_ID,
+    ACS_URL,
+    create_authenticator,
+    callback_params,
+)
+
+from . import report
+
+REQUESTS: typing.Final[int] = int(os.environ.get('UDS_BENCHMARK_REQUESTS', 200))
+
+
+def legacy_onelogin_settings(self: saml.SAMLAuthenticator) -> saml.OneLogin_Saml2_Settings:
+    """
+    Settings as the authenticator used to get them, built from scratch on every request
+    """
+    return saml.OneLogin_Saml2_Settings(settings=self.build_onelogin_settings())
+
+
+class SAMLAcsBenchmark(UDSTestCase):
+    def test_acs(self) -> None:
+        idp = FakeSAMLIdP()
+        db_auth = create_authenticator(idp.metadata())
+        # Responses are signed before measuring, signing is idp work
+        responses = [
+            idp.response(SP_ENTITY_ID, ACS_URL, f'user{i}', {'uid': [f'user{i}'], 'groups': ['staff']})
+            for i in range(REQUESTS)
+        ]
+
+        def acs(response: str) -> None:
+            instance = typing.cast(saml.SAMLAuthenticator, db_auth.get_instance())
+            result = instance.auth_callback(
+                callback_params(response), auths.GroupsManager(db_auth), mock.Mock(session={})
+            )
+            self.assertEqual(result.success, types.auth.AuthenticationState.SUCCESS)
+
+        rows: list[list[typing.Any]] = []
+        for mode in ('settings per request', 'cached settings'):
+            saml._settings_cache.clear()
+            with mock.patch.object(saml, 'OneLogin_Saml2_Settings', wraps=saml.OneLogin_Saml2_Settings) as built:
+                if mode == 'settings per request':
+                    patchers = [
+                        mock.patch.object(saml.SAMLAuthenticator, 'get_onelogin_settings', legacy_onelogin_settings),
+                    ]
+                else:
+                    patchers = []
+                with contextlib.ExitStack() as stack:
+                    for patcher in patchers:
+                        stack.enter_context(patcher)
+                    start = time.perf_counter()
+                    for response in responses:
+                        acs(response)
+                    elapsed = time.perf_counter() - start
+            rows.append(
+                [
+                    mode,
+                    built.call_count,
+                    f'{elapsed / REQUESTS * 1000:.2f}',
+                    f'{REQUESTS / elapsed:.0f}',
+                ]
+            )
+
+        start = time.perf_counter()
+        for _ in range(REQUESTS):
+            xmlsec.SignatureContext().key = xmlsec.Key.from_memory(idp.certificate, xmlsec.KeyFormat.CERT_PEM)
+        key_load = (time.perf_counter() - start) / REQUESTS * 1000
+
+        report(
+            f'SAML assertion consumer service ({REQUESTS} requests)',
+            ['mode', 'settings built', 'ms/request', 'requests/s'],
+            rows,
+        )
+        report(
+            'xmlsec signature context',
+            ['operation', 'ms/request'],
+            [['load idp certificate', f'{key_load:.3f}']],
+        )
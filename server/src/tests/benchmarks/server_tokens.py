@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+
+Tunnel ticket validation throughput: every ticket request of a tunnel (on each connection open and close)
+validates the token of the tunnel. Compares the database lookup on every validation (as Server.validate_token
+used to do) with the in memory token index.
+
+Number of tunnels, validations and threads can be set with UDS_BENCHMARK_TUNNELS (default 8),
+UDS_BENCHMARK_VALIDATIONS (default 20000) and UDS_BENCHMARK_THREADS (default 4):
+
+    UDS_BENCHMARK_VALIDATIONS=100000 pytest -s src/tests/benchmarks/server_tokens.py
+"""
+import os
+import random
+import time
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from uds import models
+from uds.core import types
+from uds.models.servers import ServerTokenIndex, TokenValidationStats
+
+from ..fixtures import servers as servers_fixtures
+from . import report
+
+TUNNELS: typing.Final[int] = int(os.environ.get('UDS_BENCHMARK_TUNNELS', 8))
+VALIDATIONS: typing.Final[int] = int(os.environ.get('UDS_BENCHMARK_VALIDATIONS', 20000))
+THREADS: typing.Final[int] = int(os.environ.get('UDS_BENCHMARK_THREADS', 4))
+
+
+def legacy_validate_token(token: str, serverType: 'types.servers.ServerType') -> bool:
+    """
+    Token validation as Server.validate_token used to do it, a database lookup on every call
+    """
+    try:
+        models.Server.objects.get(token=token, type=serverType.value)
+        return True
+    except models.Server.DoesNotExist:
+        pass
+    return False
+
+
+class ServerTokensBenchmark(TransactionTestCase):
+    def _run(
+        self, validate: typing.Callable[[str, 'types.servers.ServerType'], bool], tokens: list[str]
+    ) -> tuple[float, int]:
+        def _validate(token: str) -> None:
+            if not validate(token, types.servers.ServerType.TUNNEL):
+                raise Exception('Invalid token')
+
+        # Queries are counted on this thread, sequentially, for a sample of the validations
+        with CaptureQueriesContext(connection) as queries:
+            for token in tokens[: VALIDATIONS // 10]:
+                _validate(token)
+        ServerTokenIndex.manager().clear()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=THREADS) as executor:
+            for _ in executor.map(_validate, tokens):
+                pass
+        return time.perf_counter() - start, len(queries)
+
+    def test_tunnel_ticket_validation(self) -> None:
+        tunnels = [
+            servers_fixtures.create_server(type=types.servers.ServerType.TUNNEL) for _ in range(TUNNELS)
+        ]
+        rnd = random.Random(42)
+        tokens = [rnd.choice(tunnels).token for _ in range(VALIDATIONS)]
+
+        ServerTokenIndex.manager().clear()
+        legacy_time, legacy_queries = self._run(legacy_validate_token, tokens)
+        indexed_time, indexed_queries = self._run(models.Server.validate_token, tokens)
+
+        report(
+            f'Tunnel token validations ({TUNNELS} tunnels, {VALIDATIONS} validations, {THREADS} threads)',
+            ['mode', 'validations/s', f'queries per {VALIDATIONS // 10} validations'],
+            [
+                ['database lookup', f'{VALIDATIONS / legacy_time:.0f}', legacy_queries],
+                ['token index', f'{VALIDATIONS / indexed_time:.0f}', indexed_queries],
+            ],
+        )
+        print(TokenValidationStats.manager())
+        self.assertLess(indexed_queries, legacy_queries)
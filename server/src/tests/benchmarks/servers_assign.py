@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2012-2022 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+
+Server assignation load test with simulated servers: stats requested on every assignation while holding
+row locks on all candidate servers (as ServerManager used to do) versus pushed stats snapshot, requesting
+only outdated ones and claiming the selected server with a single conditional update.
+
+Row locks held is the time candidate servers are locked per assignation, that is the time concurrent
+assignations on the same group wait on databases with row locking (sqlite ignores select_for_update).
+
+Number of servers, assignations and simulated stats request latency (ms) can be set with
+UDS_BENCHMARK_SERVERS (default 64), UDS_BENCHMARK_ASSIGNS (default 32) and UDS_BENCHMARK_LATENCY (default 20):
+
+    UDS_BENCHMARK_SERVERS=256 pytest -s src/tests/benchmarks/servers_assign.py
+"""
+import os
+import random
+import statistics
+import time
+import typing
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.db import transaction
+from django.test import TransactionTestCase
+
+from uds import models
+from uds.core import types
+from uds.core.managers import servers
+from uds.core.managers.servers_api import requester
+
+from ..fixtures import servers as servers_fixtures
+from ..fixtures import services as services_fixtures
+from . import report
+
+SERVERS: typing.Final[int] = int(os.environ.get('UDS_BENCHMARK_SERVERS', 64))
+ASSIGNS: typing.Final[int] = int(os.environ.get('UDS_BENCHMARK_ASSIGNS', 32))
+LATENCY: typing.Final[float] = int(os.environ.get('UDS_BENCHMARK_LATENCY', 20)) / 1000
+GB: typing.Final[int] = 1024 * 1024 * 1024
+
+
+def _server_stats(server: 'models.Server', **kwargs: typing.Any) -> 'types.servers.ServerStats':
+    rnd = random.Random(server.uuid)
+    return types.servers.ServerStats(
+        memused=rnd.randrange(1, 15) * GB,
+        memtotal=16 * GB,
+        cpuused=rnd.random(),
+        current_users=rnd.randrange(10),
+        **kwargs,
+    )
+
+
+def _simulated_get(self: requester.ServerApiRequester, method: str, *, minVersion: typing.Any = None) -> typing.Any:
+    # Simulated server, answering stats after LATENCY seconds
+    time.sleep(LATENCY)
+    return _server_stats(self.server).as_dict()
+
+
+def _simulated_post(self: requester.ServerApiRequester, method: str, data: typing.Any, **kwargs: typing.Any) -> typing.Any:
+    return None
+
+
+class LegacyServerStats:
+    """
+    Stats retrieval as ServerManager used to do it, locking every candidate server until
+    the assignation transaction ends
+    """
+
+    lock_held: float = 0
+
+    def get_server_stats(
+        self, serversFltr: typing.Any
+    ) -> list[tuple[typing.Optional['types.servers.ServerStats'], 'models.Server']]:
+        locked_at = time.perf_counter()
+        retrieved_stats: list[tuple[typing.Optional['types.servers.ServerStats'], 'models.Server']] = []
+
+        def _retrieve_stats(server: 'models.Server') -> None:
+            try:
+                retrieved_stats.append((requester.ServerApiRequester(server).get_stats(), server))
+            except Exception:
+                retrieved_stats.append((None, server))
+
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            for server in serversFltr.select_for_update():
+                if server.is_restrained():
+                    continue
+                executor.submit(_retrieve_stats, server)
+
+        # Locks are held until the transaction of the assignation ends, selecting and saving the server is fast
+        self.lock_held += time.perf_counter() - locked_at
+        return retrieved_stats
+
+
+class ServersAssignBenchmark(TransactionTestCase):
+    def _assign(
+        self,
+        manager: 'servers.ServerManager',
+        group: 'models.ServerGroup',
+        userservices: list['models.UserService'],
+        outdated_ratio: float,
+    ) -> tuple[list[float], int]:
+        server_list = list(group.servers.all())
+        rnd = random.Random(42)
+        latencies: list[float] = []
+        with mock.patch.object(
+            requester.ServerApiRequester, 'get', autospec=True, side_effect=_simulated_get
+        ) as get, mock.patch.object(requester.ServerApiRequester, 'post', new=_simulated_post):
+            for userservice in userservices:
+                # Servers push its stats every minute, some of them may be outdated
+                for server in server_list:
+                    if rnd.random() < outdated_ratio:
+                        models.Server.stats_cache().put(server.uuid, _server_stats(server, stamp=1).as_dict())
+                    else:
+                        server.stats = _server_stats(server)
+                start = time.perf_counter()
+                manager.assign(userservice, group, types.services.ServiceType.VDI)
+                latencies.append(time.perf_counter() - start)
+            return latencies, get.call_count
+
+    def test_servers_assign(self) -> None:
+        group = servers_fixtures.create_server_group(
+            type=types.servers.ServerType.SERVER, subtype='bench', num_servers=SERVERS
+        )
+        userservices: list['models.UserService'] = []
+        for _ in range(ASSIGNS):
+            userservices.extend(services_fixtures.create_db_cache_userservices())
+        manager = servers.ServerManager.manager()
+
+        results: list[list[typing.Any]] = []
+        for outdated_ratio in (0, 0.25, 1):
+            for name in ('legacy', 'snapshot'):
+                # Start each pass from scratch
+                for userservice in userservices:
+                    manager.release(userservice, group, unlock=True)
+                legacy = LegacyServerStats()
+                claim_time = 0.0
+
+                def _claim(*args: typing.Any, **kwargs: typing.Any) -> bool:
+                    nonlocal claim_time
+                    start = time.perf_counter()
+                    with transaction.atomic():
+                        claimed = claim_server(*args, **kwargs)
+                    claim_time += time.perf_counter() - start
+                    return claimed
+
+                claim_server = manager.claim_server
+                if name == 'legacy':
+                    patcher = mock.patch.object(manager, 'get_server_stats', new=legacy.get_server_stats)
+                else:
+                    patcher = mock.patch.object(manager, 'claim_server', new=_claim)
+                with patcher:
+                    latencies, requests = self._assign(manager, group, userservices, outdated_ratio)
+
+                lock_held = legacy.lock_held if name == 'legacy' else claim_time
+                results.append(
+                    [
+                        f'{outdated_ratio:.0%}',
+                        name,
+                        requests,
+                        f'{statistics.median(latencies) * 1000:.1f}',
+                        f'{sorted(latencies)[int(len(latencies) * 0.95) - 1] * 1000:.1f}',
+                        f'{lock_held / len(latencies) * 1000:.2f}',
+                    ]
+                )
+
+        report(
+            f'Server assignation: {SERVERS} servers, {ASSIGNS} assignations, {LATENCY * 1000:.0f} ms stats latency',
+            ['outdated', 'method', 'stats requests', 'p50 (ms)', 'p95 (ms)', 'row locks held (ms)'],
+            results,
+        )
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2012-2022 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+
+State polling benchmark with a simulated hypervisor: API requests made to check the state of N concurrent
+deployments, asking for every machine on every check (services without batch_state_polling) versus
+requesting the states of all machines with pending operations with a single list request per
+provider and cycle.
+
+Every check cycle runs the pending checks of all deployments (as UserServiceOpChecker does every
+SUGGESTED_CHECK_INTERVAL seconds). Simulated machines take from 1 to 6 cycles to boot.
+
+Number of deployments can be set with UDS_BENCHMARK_DEPLOYMENTS (default 500):
+
+    UDS_BENCHMARK_DEPLOYMENTS=2000 pytest -s src/tests/benchmarks/state_polling.py
+"""
+import collections
+import os
+import random
+import time
+import typing
+import uuid
+from unittest import mock
+
+from django.test import TransactionTestCase
+
+from uds import models
+from uds.core import consts, environment, types
+from uds.core.services.generics.dynamic import poller
+
+from ..core.services.generics import fixtures
+from . import report
+
+DEPLOYMENTS: typing.Final[int] = int(os.environ.get('UDS_BENCHMARK_DEPLOYMENTS', 500))
+
+
+class SimulatedHypervisor:
+    """
+    Machines of a provider, counting the API requests received
+    """
+
+    requests: collections.Counter[str]
+    running_at: dict[str, int]  # Cycle when the machine will be running
+    cycle: int = 0
+    now: float = 1000.0
+    executing: bool = False  # Requests made by operations executors, not by state checkers
+
+    def __init__(self) -> None:
+        self.requests = collections.Counter()
+        self.running_at = {}
+        self.rnd = random.Random(42)
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def next_cycle(self) -> None:
+        self.cycle += 1
+        self.now += consts.services.SUGGESTED_CHECK_INTERVAL
+
+    def start(self, vmid: str) -> None:
+        self.requests['start'] += 1
+        self.running_at[vmid] = self.cycle + self.rnd.randint(1, 6)
+
+    def get(self, vmid: str) -> bool:
+        self.requests['executor' if self.executing else 'get'] += 1
+        return vmid in self.running_at and self.running_at[vmid] <= self.cycle
+
+    def list(self) -> dict[str, bool]:
+        self.requests['list'] += 1
+        return {vmid: running_at <= self.cycle for vmid, running_at in self.running_at.items()}
+
+
+class SimulatedService(fixtures.DynamicTestingService):
+    hypervisor: SimulatedHypervisor
+
+    def is_running(self, caller_instance: typing.Any, vmid: str) -> bool:
+        return self.hypervisor.get(vmid)
+
+    def start(self, caller_instance: typing.Any, vmid: str) -> None:
+        self.hypervisor.start(vmid)
+
+    def get_running_states(self, vmids: list[str]) -> dict[str, bool]:
+        return self.hypervisor.list()
+
+
+class SimulatedUserService(fixtures.DynamicTestingUserService):
+    def op_create(self) -> None:
+        self._vmid = self.get_uuid()
+
+    def op_start(self) -> None:
+        hypervisor = typing.cast(SimulatedService, self.service()).hypervisor
+        hypervisor.executing = True
+        try:
+            super().op_start()
+        finally:
+            hypervisor.executing = False
+
+
+class StatePollingBenchmark(TransactionTestCase):
+    def _deploy(self, batch: bool) -> list[typing.Any]:
+        hypervisor = SimulatedHypervisor()
+        uuid_ = str(uuid.uuid4())
+        service = SimulatedService(
+            provider=fixtures.create_dynamic_provider(),
+            environment=environment.Environment.private_environment(uuid_),
+            uuid=uuid_,
+        )
+        service.hypervisor = hypervisor
+        service.batch_state_polling = batch
+
+        pending: list[SimulatedUserService] = []
+        for _ in range(DEPLOYMENTS):
+            uuid_ = str(uuid.uuid4())
+            userservice = SimulatedUserService(
+                service=service,
+                environment=environment.Environment.private_environment(uuid_),
+                uuid=uuid_,
+            )
+            userservice.deploy_for_user(models.User())
+            pending.append(userservice)
+
+        with mock.patch.object(poller, 'time', hypervisor):
+            peak = 0
+            check_time = 0.0
+            while pending:
+                hypervisor.next_cycle()
+                before = hypervisor.requests['get'] + hypervisor.requests['list']
+                start = time.perf_counter()
+                pending = [
+                    userservice
+                    for userservice in pending
+                    if userservice.check_state() == types.states.TaskState.RUNNING
+                ]
+                check_time += time.perf_counter() - start
+                peak = max(peak, hypervisor.requests['get'] + hypervisor.requests['list'] - before)
+
+        return [
+            'batch' if batch else 'per machine',
+            hypervisor.cycle,
+            hypervisor.requests['executor'],
+            hypervisor.requests['get'],
+            hypervisor.requests['list'],
+            hypervisor.requests['get'] + hypervisor.requests['list'],
+            peak,
+            f'{check_time / hypervisor.cycle * 1000:.1f}',
+        ]
+
+    def test_state_polling(self) -> None:
+        results = [self._deploy(batch) for batch in (False, True)]
+        report(
+            f'State polling: {DEPLOYMENTS} concurrent deployments on a single provider',
+            [
+                'method',
+                'cycles',
+                'start requests',
+                'single checks',
+                'list checks',
+                'check requests',
+                'peak checks/cycle',
+                'cycle time (ms)',
+            ],
+            results,
+        )
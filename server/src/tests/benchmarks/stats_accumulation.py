@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2012-2022 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+
+Stats accumulation benchmark: time to accumulate one new hour of counters, with a growing amount of
+already accumulated history, versus recomputing the whole history.
+
+Number of synthetic counter rows can be set with UDS_BENCHMARK_ROWS environment variable (default 1000000):
+
+    UDS_BENCHMARK_ROWS=2000000 pytest -s src/tests/benchmarks/stats_accumulation.py
+"""
+import datetime
+import os
+import time
+import typing
+from unittest import mock
+
+from django.db import connection
+from django.test import TransactionTestCase
+
+from uds import models
+from uds.core import types
+from uds.core.managers.stats import StatsManager
+from uds.core.util.model import sql_stamp_seconds
+
+from . import report
+
+ROWS: typing.Final[int] = int(os.environ.get('UDS_BENCHMARK_ROWS', 1000000))
+OWNERS: typing.Final[int] = 50
+COUNTER_TYPES: typing.Final[list[types.stats.CounterType]] = [
+    types.stats.CounterType.ASSIGNED,
+    types.stats.CounterType.INUSE,
+]
+PER_HOUR: typing.Final[int] = 6  # Samples per hour and counter
+ROWS_PER_HOUR: typing.Final[int] = OWNERS * len(COUNTER_TYPES) * PER_HOUR
+
+
+def _create_hours(first_hour: int, hours: int) -> None:
+    rows: list[models.StatsCounters] = []
+    for hour in range(first_hour, first_hour + hours):
+        for owner_id in range(OWNERS):
+            for counter_type in COUNTER_TYPES:
+                for sample in range(PER_HOUR):
+                    rows.append(
+                        models.StatsCounters(
+                            owner_type=types.stats.CounterOwnerType.SERVICEPOOL,
+                            owner_id=owner_id,
+                            counter_type=counter_type,
+                            stamp=hour * 3600 + sample * (3600 // PER_HOUR),
+                            value=owner_id + sample + 1,
+                        )
+                    )
+        if len(rows) >= 20000:
+            models.StatsCounters.objects.bulk_create(rows)
+            rows = []
+    models.StatsCounters.objects.bulk_create(rows)
+
+
+def _timed(fnc: typing.Callable[[], typing.Any]) -> float:
+    start = time.perf_counter()
+    fnc()
+    return time.perf_counter() - start
+
+
+class StatsAccumulationBenchmark(TransactionTestCase):
+    def test_accumulation(self) -> None:
+        manager = StatsManager.manager()
+        hours = ROWS // ROWS_PER_HOUR
+        first_hour = sql_stamp_seconds() // 3600 - hours - 48
+        results: list[list[typing.Any]] = []
+
+        # Two halves of history, to see how times change with history size
+        half = hours // 2
+        loaded = 0
+
+        def now() -> int:  # Simulated clock, just at end of loaded data
+            return (first_hour + loaded) * 3600
+
+        for part in (half, hours - half):
+            _create_hours(first_hour + loaded, part)
+            loaded += part
+            with mock.patch('uds.core.managers.stats.sql_stamp_seconds', now):
+                catch_up = _timed(lambda: manager.acummulate(max_days=100000))
+
+                # One new hour of data, incremental accumulation
+                _create_hours(first_hour + loaded, 1)
+                loaded += 1
+                incremental = _timed(lambda: manager.acummulate(max_days=100000))
+
+            # Full recompute of all history, as a non incremental accumulator would do
+            full = _timed(
+                lambda: manager.backfill(
+                    datetime.datetime.fromtimestamp(first_hour * 3600),
+                    datetime.datetime.fromtimestamp((first_hour + loaded) * 3600),
+                    max_days=100000,
+                )
+            )
+            results.append(
+                [
+                    models.StatsCounters.objects.count(),
+                    f'{catch_up:.2f}',
+                    f'{incremental * 1000:.1f}',
+                    f'{full:.2f}',
+                ]
+            )
+
+        report(
+            f'Stats accumulation on {connection.vendor} ({ROWS_PER_HOUR} new rows per hour)',
+            ['raw rows', 'catch up (s)', 'new hour (ms)', 'full recompute (s)'],
+            results,
+        )
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2012-2022 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+
+Stats ingestion benchmark: rows/second inserting counters and events one by one versus buffered bulk inserts.
+
+Runs against the database configured on settings (sqlite by default). To get the numbers for MySQL or
+PostgreSQL, run it with a settings file whose DATABASES points to a local server of that kind, i.e.:
+
+    pytest -s src/tests/benchmarks/stats_ingestion.py
+"""
+import time
+import typing
+from unittest import mock
+
+from django.db import connection
+from django.test import TransactionTestCase
+
+from uds import models
+from uds.core import types
+from uds.core.managers.stats import StatsManager
+from uds.core.util.bulk_buffer import BulkBuffer
+
+from . import report
+
+ROWS: typing.Final[int] = 5000
+
+
+class StatsIngestionBenchmark(TransactionTestCase):
+    def _ingest(self, manager: StatsManager, buffered: bool) -> float:
+        with mock.patch.object(BulkBuffer, 'enabled', buffered):
+            start = time.perf_counter()
+            for i in range(ROWS):
+                manager.add_counter(
+                    types.stats.CounterOwnerType.SERVICEPOOL, i % 50, types.stats.CounterType.ASSIGNED, i
+                )
+                manager.add_event(
+                    types.stats.EventOwnerType.SERVICEPOOL,
+                    i % 50,
+                    types.stats.EventType.ACCESS,
+                    username='user',
+                    srcip='127.0.0.1',
+                )
+            manager.flush()
+            elapsed = time.perf_counter() - start
+        self.assertEqual(models.StatsCounters.objects.count(), ROWS)
+        self.assertEqual(models.StatsEvents.objects.count(), ROWS)
+        models.StatsCounters.objects.all().delete()
+        models.StatsEvents.objects.all().delete()
+        return ROWS * 2 / elapsed
+
+    def test_ingestion(self) -> None:
+        manager = StatsManager.manager()
+        direct = self._ingest(manager, buffered=False)
+        buffered = self._ingest(manager, buffered=True)
+        report(
+            f'Stats ingestion on {connection.vendor} ({ROWS} counters + {ROWS} events)',
+            ['mode', 'rows/s', 'speedup'],
+            [
+                ['one insert per row', f'{direct:.0f}', '1.0x'],
+                [f'bulk (flush_size={manager.counters_buffer.flush_size})', f'{buffered:.0f}', f'{buffered / direct:.1f}x'],
+            ],
+        )
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2012-2022 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+
+Stats reports aggregation benchmark: one query per interval and pool (as reports used to do) versus
+a single grouped query for all intervals and pools.
+
+Number of synthetic events can be set with UDS_BENCHMARK_EVENTS environment variable (default 200000):
+
+    UDS_BENCHMARK_EVENTS=1000000 pytest -s src/tests/benchmarks/stats_reports.py
+"""
+import os
+import random
+import time
+import typing
+
+from django.db import connection
+from django.db.models import Count
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from uds import models
+from uds.core import types
+from uds.core.managers.stats import StatsManager
+from uds.core.util.stats import aggregation
+
+from . import report
+
+EVENTS: typing.Final[int] = int(os.environ.get('UDS_BENCHMARK_EVENTS', 200000))
+POOLS: typing.Final[int] = 50
+DAYS: typing.Final[int] = 30
+SAMPLING_POINTS: typing.Final[int] = 64
+START: typing.Final[int] = 1704067200  # 2024-01-01
+END: typing.Final[int] = START + DAYS * 24 * 3600
+
+
+def _per_interval(buckets: aggregation.Buckets) -> list[tuple[int, int]]:
+    # As pools performance report did, one query per interval and pool
+    result: list[tuple[int, int]] = []
+    fld = StatsManager.manager().get_event_field_for('username')
+    for pool_id in range(POOLS):
+        for since, to in buckets.intervals():
+            q = (
+                StatsManager.manager()
+                .enumerate_events(
+                    types.stats.EventOwnerType.SERVICEPOOL,
+                    types.stats.EventType.ACCESS,
+                    since=since,
+                    to=to,
+                    owner_id=pool_id,
+                )
+                .values(fld)
+                .annotate(cnt=Count(fld))
+            )
+            result.append((len(q), sum(v['cnt'] for v in q)))
+    return result
+
+
+def _single_pass(buckets: aggregation.Buckets) -> list[tuple[int, int]]:
+    series = aggregation.events_series(
+        types.stats.EventOwnerType.SERVICEPOOL,
+        types.stats.EventType.ACCESS,
+        buckets,
+        range(POOLS),
+        distinct_field=StatsManager.manager().get_event_field_for('username'),
+    )
+    return [pair for pool_id in range(POOLS) for pair in zip(series[pool_id].distinct, series[pool_id].counts)]
+
+
+class StatsReportsBenchmark(TransactionTestCase):
+    def test_reports_aggregation(self) -> None:
+        buckets = aggregation.Buckets.split(START, END, SAMPLING_POINTS)
+        # Intervals used to overlap on its limits, keep events out of them so results can be compared
+        limits = {stamp for interval in buckets.intervals() for stamp in interval}
+        rnd = random.Random(42)
+        rows: list[models.StatsEvents] = []
+        for _ in range(EVENTS):
+            stamp = rnd.randrange(START, END)
+            while stamp in limits:
+                stamp = rnd.randrange(START, END)
+            rows.append(
+                models.StatsEvents(
+                    owner_type=types.stats.EventOwnerType.SERVICEPOOL,
+                    owner_id=rnd.randrange(POOLS),
+                    event_type=types.stats.EventType.ACCESS,
+                    stamp=stamp,
+                    fld1=f'user{rnd.randrange(1000)}',
+                )
+            )
+            if len(rows) >= 20000:
+                models.StatsEvents.objects.bulk_create(rows)
+                rows = []
+        models.StatsEvents.objects.bulk_create(rows)
+
+        results: list[list[typing.Any]] = []
+        values: list[list[tuple[int, int]]] = []
+        for name, fnc in (('per interval', _per_interval), ('single pass', _single_pass)):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                values.append(fnc(buckets))
+                elapsed = time.perf_counter() - start
+            results.append([name, len(queries), f'{elapsed:.3f}'])
+
+        self.assertEqual(values[0], values[1])
+
+        report(
+            f'Pools performance report on {connection.vendor}: {EVENTS} events, {POOLS} pools, '
+            f'{DAYS} days, {SAMPLING_POINTS} intervals',
+            ['method', 'queries', 'time (s)'],
+            results,
+        )
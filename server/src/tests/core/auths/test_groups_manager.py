@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+import logging
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from uds import models
+from uds.core import types
+from uds.core.auths.groups_manager import GroupMatchers, GroupsManager
+
+from ...fixtures import authenticators as authenticators_fixtures
+from ...utils.test import UDSTestCase
+
+logger = logging.getLogger(__name__)
+
+
+class GroupsManagerTest(UDSTestCase):
+    auth: models.Authenticator
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.auth = authenticators_fixtures.create_db_authenticator()
+        for name in (
+            'Admins',
+            'Domain Users',
+            'pat:^sales-.*$',
+            'pat:(a)\\1',  # Backreference, not merged with other patterns
+            'pat:[invalid',  # Invalid, never matches
+        ):
+            self.auth.groups.create(name=name)
+        self.auth.groups.create(name='Disabled', state=types.states.State.BLOCKED)
+
+    def _valid_names(self, groups_manager: GroupsManager) -> list[str]:
+        return sorted(g.db_obj().name for g in groups_manager.enumerate_valid_groups())
+
+    def test_validate(self) -> None:
+        groups_manager = GroupsManager(self.auth)
+        self.assertFalse(groups_manager.has_valid_groups())
+        self.assertEqual(
+            sorted(groups_manager.enumerate_groups_name()),
+            sorted(['Admins', 'Domain Users', 'pat:^sales-.*$', 'pat:(a)\\1', 'pat:[invalid']),
+        )
+
+        groups_manager.validate(['domain users', 'SALES-north', 'other', 'disabled', '[invalid'])
+        self.assertTrue(groups_manager.has_valid_groups())
+        self.assertEqual(self._valid_names(groups_manager), ['Domain Users', 'pat:^sales-.*$'])
+        self.assertTrue(groups_manager.is_valid('DOMAIN USERS'))
+        self.assertTrue(groups_manager.is_valid('sales-south'))  # Matches an already valid pattern
+        self.assertFalse(groups_manager.is_valid('admins'))
+
+        groups_manager.validate('xaay')
+        self.assertEqual(self._valid_names(groups_manager), ['Domain Users', 'pat:(a)\\1', 'pat:^sales-.*$'])
+
+        group = groups_manager.get_group('ADMINS')
+        self.assertIsNotNone(group)
+        self.assertEqual(group.db_obj().name, 'Admins')  # type: ignore
+        self.assertIsNone(groups_manager.get_group('disabled'))
+
+    def test_meta_groups(self) -> None:
+        meta = self.auth.groups.create(name='meta', is_meta=True)
+        meta.groups.set(self.auth.groups.filter(name__in=['Admins', 'Domain Users']))
+        groups_manager = GroupsManager(self.auth)
+        groups_manager.validate('admins')
+        self.assertEqual(self._valid_names(groups_manager), ['Admins'])
+        groups_manager.validate('domain users')
+        self.assertEqual(self._valid_names(groups_manager), ['Admins', 'Domain Users', 'meta'])
+
+    def test_compiled_once(self) -> None:
+        GroupsManager(self.auth)
+        with CaptureQueriesContext(connection) as queries:
+            groups_manager = GroupsManager(self.auth)
+            groups_manager.validate(['admins', 'sales-x'])
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(GroupMatchers.manager().as_dict()['groups'], 5)
+
+    def test_invalidated_on_changes(self) -> None:
+        GroupsManager(self.auth)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.auth.groups.create(name='New group')
+        groups_manager = GroupsManager(self.auth)
+        groups_manager.validate('new group')
+        self.assertEqual(self._valid_names(groups_manager), ['New group'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.auth.groups.filter(name='New group').get().delete()
+        groups_manager = GroupsManager(self.auth)
+        groups_manager.validate('new group')
+        self.assertFalse(groups_manager.has_valid_groups())
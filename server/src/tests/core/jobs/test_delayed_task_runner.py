@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2022 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+import threading
+import time
+from unittest import mock
+
+from django.test import TransactionTestCase
+
+from uds import models
+from uds.core.jobs import delayed_task, delayed_task_runner
+
+executed: list[str] = []
+executed_lock = threading.Lock()
+release = threading.Event()
+
+
+class TestingTask(delayed_task.DelayedTask):
+    name: str
+    blocks: bool
+
+    def __init__(self, name: str, blocks: bool = False) -> None:
+        super().__init__()
+        self.name = name
+        self.blocks = blocks
+
+    def run(self) -> None:
+        if self.blocks:
+            release.wait(10)
+        with executed_lock:
+            executed.append(self.name)
+
+
+class DelayedTaskRunnerTest(TransactionTestCase):
+    runner: delayed_task_runner.DelayedTaskRunner
+
+    def setUp(self) -> None:
+        # Fresh runner and stats for each test (both are singletons)
+        delayed_task_runner.DelayedTaskRunner._instance = None
+        delayed_task_runner.DelayedTaskStats._instance = None
+        self.runner = delayed_task_runner.DelayedTaskRunner.runner()
+        executed.clear()
+        release.clear()
+
+    def tearDown(self) -> None:
+        release.set()
+        executor = delayed_task_runner.DelayedTaskRunner._executor
+        if executor:
+            executor.shutdown(wait=True)
+
+    def wait_executed(self, count: int, timeout: float = 5) -> None:
+        until = time.monotonic() + timeout
+        # Also wait for workers to be released
+        while (len(executed) < count or self.runner._running) and time.monotonic() < until:
+            time.sleep(0.05)
+
+    def test_batch_claim(self) -> None:
+        with mock.patch('uds.core.util.config.GlobalConfig.DELAYED_TASKS_THREADS.as_int', return_value=8):
+            for i in range(5):
+                self.runner.insert(TestingTask(f'task{i}'), 0)
+            self.runner.insert(TestingTask('future'), 3600)
+            time.sleep(0.05)  # Ensure tasks are due
+
+            self.assertEqual(self.runner.execute_delayed_task(), 5)
+            self.wait_executed(5)
+            self.assertEqual(sorted(executed), [f'task{i}' for i in range(5)])
+            # Not due task is kept
+            self.assertEqual(models.DelayedTask.objects.count(), 1)
+
+            stats = delayed_task_runner.DelayedTaskStats.manager()
+            self.assertEqual(stats.claimed, 5)
+            self.assertEqual(stats.executed, 5)
+            self.assertEqual(stats.queue_depth, 1)
+            self.assertEqual(stats.claim_time.count, 1)
+            self.assertEqual(stats.claim_latency.count, 5)
+            self.assertEqual(stats.execution_time.count, 5)
+            # Nothing else is due
+            self.assertEqual(self.runner.execute_delayed_task(), 0)
+
+    def test_claim_bounded_by_free_workers(self) -> None:
+        with mock.patch('uds.core.util.config.GlobalConfig.DELAYED_TASKS_THREADS.as_int', return_value=2):
+            for i in range(5):
+                self.runner.insert(TestingTask(f'task{i}', blocks=True), 0)
+            time.sleep(0.05)  # Ensure tasks are due
+
+            # Only as many tasks as free workers are claimed
+            self.assertEqual(self.runner.execute_delayed_task(), 2)
+            self.assertEqual(self.runner.execute_delayed_task(), 0)
+            self.assertEqual(models.DelayedTask.objects.count(), 3)
+
+            release.set()
+            self.wait_executed(2)
+            self.assertEqual(self.runner.execute_delayed_task(), 2)
+            self.wait_executed(4)
+            self.assertEqual(self.runner.execute_delayed_task(), 1)
+            self.wait_executed(5)
+            self.assertEqual(len(executed), 5)
+
+    def test_insert_wakes_up_runner(self) -> None:
+        delayed_task_runner.DelayedTaskRunner.granularity = 30  # type: ignore
+        try:
+            thread = threading.Thread(target=self.runner.run)
+            thread.start()
+            time.sleep(0.5)  # Let runner reach its wait
+            self.runner.insert(TestingTask('soon'), 0)
+            # Much sooner than granularity
+            self.wait_executed(1, timeout=3)
+            self.assertEqual(executed, ['soon'])
+            self.runner.request_stop()
+            thread.join(5)
+            self.assertFalse(thread.is_alive())
+        finally:
+            delayed_task_runner.DelayedTaskRunner.granularity = 2  # type: ignore
+
+    def test_locked_due_tasks_do_not_spin(self) -> None:
+        self.runner.insert(TestingTask('locked'), 0)
+        time.sleep(0.05)  # Ensure task is due
+
+        # Due task is locked by another server, so it is not returned by the claim
+        with mock.patch.object(
+            models.DelayedTask.objects, 'select_for_update', return_value=models.DelayedTask.objects.none()
+        ):
+            self.assertEqual(self.runner.execute_delayed_task(), 0)
+        # Its (already passed) deadline is not used for waiting
+        self.assertIsNone(delayed_task_runner.DelayedTaskRunner._next_deadline)
+
+        delayed_task_runner.DelayedTaskRunner._wakeup_requested = False  # Set by insert
+        started = time.monotonic()
+        self.runner._wait()
+        self.assertGreaterEqual(time.monotonic() - started, 1)
+
+        # Queue depth is not counted again until interval expires
+        stats = delayed_task_runner.DelayedTaskStats.manager()
+        self.assertEqual(stats.queue_depth, 1)
+        self.runner.insert(TestingTask('future1'), 3600)
+        self.runner.insert(TestingTask('future2'), 3600)
+        self.assertEqual(self.runner.execute_delayed_task(), 1)
+        self.assertEqual(models.DelayedTask.objects.count(), 2)
+        self.assertEqual(stats.queue_depth, 1)
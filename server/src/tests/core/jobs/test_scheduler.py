@@ -30,18 +30,53 @@
 """
 Author: Adolfo Gómez, dkmaster at dkmon dot com
 """
+import datetime
 import threading
+import time
 import typing
 from unittest import mock
 
 from django.test import TransactionTestCase
 
+from uds import models
+from uds.core import consts, jobs
 from uds.core.jobs import scheduler, jobs_factory
+from uds.core.types.states import State
+from uds.core.util.model import sql_now
+
+executed: list[str] = []
+
+
+class TestingJob(jobs.Job):
+    frecuency = 60
+    friendly_name = 'Testing job'
+
+    def run(self) -> None:
+        executed.append(self.env.key)
+
+
+def create_job(name: str, due: bool = True) -> models.Scheduler:
+    jobs.factory().register(name, TestingJob)
+    now = sql_now()
+    return models.Scheduler.objects.create(
+        name=name,
+        frecuency=TestingJob.frecuency,
+        last_execution=now - datetime.timedelta(seconds=120),
+        next_execution=now - datetime.timedelta(seconds=10) if due else now + datetime.timedelta(seconds=60),
+        state=State.FOR_EXECUTE,
+    )
 
 
 class SchedulerTest(TransactionTestCase):
     def setUp(self) -> None:
         scheduler.Scheduler.granularity = 0.1  # type: ignore  # Speed up tests
+        scheduler.SchedulerStats._instance = None
+        executed.clear()
+
+    def wait_finished(self, sch: scheduler.Scheduler) -> None:
+        until = time.monotonic() + 5
+        while sch._running and time.monotonic() < until:
+            time.sleep(0.05)
 
     def test_init_execute_and_shutdown(self) -> None:
         sch = scheduler.Scheduler()
@@ -86,3 +121,62 @@ class SchedulerTest(TransactionTestCase):
             self.assertEqual(left, 0)  # If left is 0, it means that execute_job was called 4 times
             mock_release_own_schedules.assert_called_once()
             mock_ensure_jobs_registered.assert_called_once()
+
+    def test_execute_job_claims_batch(self) -> None:
+        sch = scheduler.Scheduler()
+        for i in range(3):
+            create_job(f'testing_job_{i}')
+        create_job('testing_job_not_due', due=False)
+
+        sch.execute_job()
+        self.wait_finished(sch)
+
+        self.assertEqual(len(executed), 3)
+        stats = scheduler.SchedulerStats.manager()
+        self.assertEqual(stats.claimed, 3)
+        for i in range(3):
+            job = models.Scheduler.objects.get(name=f'testing_job_{i}')
+            # Released, with next execution after frequency plus jitter
+            self.assertEqual(job.state, State.FOR_EXECUTE)
+            self.assertEqual(job.owner_server, '')
+            delay = (job.next_execution - sql_now()).total_seconds()
+            self.assertGreater(delay, TestingJob.frecuency - 2)
+            self.assertLessEqual(
+                delay, TestingJob.frecuency * (1 + consts.system.SCHEDULER_JITTER_RATIO)
+            )
+            timings = stats.jobs[f'testing_job_{i}']
+            self.assertEqual(timings.run_time.count, 1)
+            self.assertEqual(timings.queue_wait.count, 1)
+            self.assertGreaterEqual(timings.queue_wait.min, 10)
+            self.assertEqual(timings.overrun.count, 0)
+
+        # Not due job is not executed
+        self.assertEqual(models.Scheduler.objects.get(name='testing_job_not_due').owner_server, '')
+
+    def test_execute_job_bounded_by_workers(self) -> None:
+        sch = scheduler.Scheduler()
+        for i in range(5):
+            create_job(f'testing_job_{i}')
+
+        with mock.patch.object(consts.system, 'SCHEDULER_WORKERS', 2):
+            with mock.patch.object(sch, '_execute'):  # Jobs will never finish
+                sch.execute_job()
+                self.assertEqual(sch._running, 2)
+                sch.execute_job()
+                self.assertEqual(sch._running, 2)
+        self.assertEqual(models.Scheduler.objects.filter(state=State.RUNNING).count(), 2)
+
+    def test_execute_job_concurrency_limit(self) -> None:
+        sch = scheduler.Scheduler()
+        create_job('testing_job')
+        # Job already running on this server (i.e. its state was reset by other server)
+        sch._running_jobs['testing_job'] = 1
+
+        sch.execute_job()
+        self.assertEqual(models.Scheduler.objects.get(name='testing_job').state, State.FOR_EXECUTE)
+
+        with mock.patch.object(TestingJob, 'max_concurrency', 2):
+            sch._limits['testing_job'] = 2
+            sch.execute_job()
+            self.wait_finished(sch)
+        self.assertEqual(len(executed), 1)
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2012-2022 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+import datetime
+import time
+import typing
+from unittest import mock
+
+from uds import models
+from uds.core import consts
+from uds.core.environment import Environment
+from uds.core.managers.log import LogManager
+from uds.core.types.log import LogObjectType, LogLevel, LogSource
+from uds.core.util.bulk_buffer import BulkBuffer
+from uds.core.workers.log import LogMaintenance
+
+from ...fixtures import authenticators as authenticators_fixtures
+from ...utils.test import UDSTransactionTestCase
+
+
+def _create_logs(owner_type: LogObjectType, owner_id: int, count: int) -> None:
+    now = datetime.datetime.now()
+    models.Log.objects.bulk_create(
+        models.Log(
+            owner_type=owner_type,
+            owner_id=owner_id,
+            created=now + datetime.timedelta(seconds=i),
+            source=LogSource.INTERNAL,
+            level=LogLevel.INFO,
+            data=f'message {i}',
+        )
+        for i in range(count)
+    )
+
+
+class LogManagerTest(UDSTransactionTestCase):
+    background_flushes = True
+
+    def setUp(self) -> None:
+        super().setUp()
+        # New manager for every test, so its background writer is not kept for other tests
+        LogManager._instance = None
+        self.addCleanup(setattr, LogManager, '_instance', None)
+
+    def test_async_writer(self) -> None:
+        manager = LogManager.manager()
+        for i in range(10):
+            manager.log(None, LogLevel.INFO, f'message {i}', LogSource.INTERNAL, 'test')
+        # Not written by caller
+        self.assertEqual(models.Log.objects.count(), 0)
+        self.assertEqual(manager.buffer.pending, 10)
+
+        # But by the background writer
+        until = time.monotonic() + consts.system.LOG_BUFFER_INTERVAL + 5
+        while manager.buffer.pending and time.monotonic() < until:
+            time.sleep(0.05)
+        self.assertEqual(models.Log.objects.count(), 10)
+
+        # Entries queued by this process are visible on get_logs
+        manager.log(None, LogLevel.INFO, 'last message', LogSource.INTERNAL, 'test')
+        logs = manager.get_logs(None)
+        self.assertEqual(len(logs), 11)
+        self.assertEqual(logs[-1]['message'], 'last message')
+
+    def test_trim(self) -> None:
+        manager = LogManager.manager()
+        _create_logs(LogObjectType.USER, 1, 150)
+        _create_logs(LogObjectType.USER, 2, 50)
+
+        self.assertEqual(manager.trim(LogObjectType.USER, 1), 150 - LogObjectType.USER.get_max_elements())
+        self.assertEqual(manager.trim(LogObjectType.USER, 2), 0)
+        self.assertEqual(manager.trim(LogObjectType.USER, 1, 10), LogObjectType.USER.get_max_elements() - 10)
+
+        # Newest ones are kept
+        self.assertEqual(
+            list(models.Log.objects.filter(owner_id=1).order_by('id').values_list('data', flat=True)),
+            [f'message {i}' for i in range(140, 150)],
+        )
+        self.assertEqual(models.Log.objects.filter(owner_id=2).count(), 50)
+        # Unknown owner type, all removed
+        _create_logs(typing.cast(LogObjectType, 99), 3, 5)
+        self.assertEqual(manager.trim(99, 3), 5)
+
+    def test_trim_on_write(self) -> None:
+        manager = LogManager.manager()
+        _create_logs(LogObjectType.SYSLOG, -1, 10)
+        # Written at once, so trim is done on every write
+        with mock.patch.object(BulkBuffer, 'enabled', False), mock.patch.object(
+            LogObjectType, 'get_max_elements', return_value=5
+        ):
+            manager.log(None, LogLevel.INFO, 'message', LogSource.INTERNAL, 'test')
+            self.assertEqual(models.Log.objects.count(), 11)  # Trim interval not elapsed
+            manager._last_trim = time.monotonic() - consts.system.LOG_TRIM_INTERVAL
+            manager.log(None, LogLevel.INFO, 'message', LogSource.INTERNAL, 'test')
+            self.assertEqual(models.Log.objects.count(), 5)
+
+    def test_log_maintenance(self) -> None:
+        _create_logs(LogObjectType.USER, 1, 150)
+        _create_logs(LogObjectType.USER, 2, 50)
+        LogMaintenance(Environment.testing_environment()).run()
+        self.assertEqual(models.Log.objects.filter(owner_id=1).count(), LogObjectType.USER.get_max_elements())
+        self.assertEqual(models.Log.objects.filter(owner_id=2).count(), 50)
+
+    def test_log_maintenance_orphans(self) -> None:
+        user = authenticators_fixtures.create_db_users(authenticators_fixtures.create_db_authenticator())[0]
+        _create_logs(LogObjectType.USER, user.id, 10)
+        _create_logs(LogObjectType.USER, user.id + 1, 10)  # Removed user, written by other process
+        _create_logs(LogObjectType.SYSLOG, -1, 10)
+        # Too recent, owner may not be commited yet
+        LogMaintenance(Environment.testing_environment()).run()
+        self.assertEqual(models.Log.objects.count(), 30)
+
+        models.Log.objects.update(
+            created=datetime.datetime.now() - datetime.timedelta(seconds=consts.system.LOG_ORPHANS_GRACE + 60)
+        )
+        LogMaintenance(Environment.testing_environment()).run()
+        self.assertEqual(models.Log.objects.filter(owner_id=user.id + 1).count(), 0)
+        self.assertEqual(models.Log.objects.count(), 20)
+
+    def test_long_fields_are_truncated(self) -> None:
+        manager = LogManager.manager()
+        manager.log(None, LogLevel.INFO, 'm' * 5000, 's' * 20, 'n' * 100)
+        manager.flush()
+        entry = models.Log.objects.get()
+        self.assertEqual((len(entry.data), len(entry.source), len(entry.name)), (4096, 16, 64))
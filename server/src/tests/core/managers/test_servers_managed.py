@@ -317,3 +317,89 @@ class ServerManagerManagedServersTest(UDSTestCase):
                         serverApiRequester.notify_release.call_count,
                         2 * NUM_REGISTEREDSERVERS,  # No release if all are released already, so no notify_release
                     )
+
+    def test_assign_pushed_stats(self) -> None:
+        # Stats pushed by servers (on ping) are used, so no request is done to servers
+        for server in self.registered_servers_group.servers.all():
+            server.stats = self.server_stats[server.uuid]
+        best_uuid = min(self.server_stats, key=lambda uuid: self.server_stats[uuid].weight())
+        pushed_stats = models.Server.objects.get(uuid=best_uuid).stats
+        if pushed_stats is None:
+            self.fail('Stats not found')
+            return  # For mypy
+
+        with self.create_mock_api_requester() as mockServerApiRequester:
+            assignation = self.assign(self.user_services[0])
+            if assignation is None:
+                self.fail('Assignation returned None')
+                return  # For mypy
+            self.assertEqual(assignation.server_uuid, best_uuid)
+            self.assertEqual(mockServerApiRequester.return_value.get_stats.call_count, 0)
+
+        # The assignation is interpolated on the stored stats, so next assignations will take it into account
+        stats = models.Server.objects.get(uuid=best_uuid).stats
+        if stats is None:
+            self.fail('Stats not found')
+            return  # For mypy
+        self.assertEqual(stats.current_users, pushed_stats.adjust(users_increment=1).current_users)
+
+    def test_assign_outdated_stats(self) -> None:
+        # Only servers with outdated stats are requested
+        servers_list = list(self.registered_servers_group.servers.all())
+        outdated = servers_list[: NUM_REGISTEREDSERVERS // 2]
+        for server in servers_list:
+            server.stats = self.server_stats[server.uuid]
+        for server in outdated:
+            models.Server.stats_cache().put(
+                server.uuid, dataclasses.replace(self.server_stats[server.uuid], stamp=1).as_dict()
+            )
+
+        with self.create_mock_api_requester() as mockServerApiRequester:
+            self.assertIsNotNone(self.assign(self.user_services[0]))
+            self.assertEqual(mockServerApiRequester.return_value.get_stats.call_count, len(outdated))
+            self.assertEqual(
+                {call[0][0].uuid for call in mockServerApiRequester.call_args_list[: len(outdated)]},
+                {server.uuid for server in outdated},
+            )
+
+    def test_assign_claimed_server(self) -> None:
+        for server in self.registered_servers_group.servers.all():
+            server.stats = self.server_stats[server.uuid]
+        by_weight = sorted(self.server_stats, key=lambda uuid: self.server_stats[uuid].weight())
+        now = datetime.datetime.now()
+
+        # Claiming takes the lock only if server is not locked
+        server = models.Server.objects.get(uuid=by_weight[0])
+        self.assertTrue(self.manager.claim_server(server, now, datetime.timedelta(seconds=32)))
+        self.assertFalse(self.manager.claim_server(server, now, datetime.timedelta(seconds=32)))
+        models.Server.objects.filter(uuid=server.uuid).update(locked_until=None)
+
+        # If best server is claimed by other assignation meanwhile, next best one is used
+        with self.create_mock_api_requester():
+            with mock.patch.object(self.manager, 'claim_server', side_effect=[False, True]) as claim_server:
+                assignation = self.assign(self.user_services[0], lock_interval=datetime.timedelta(seconds=32))
+                if assignation is None:
+                    self.fail('Assignation returned None')
+                    return  # For mypy
+                self.assertEqual(claim_server.call_count, 2)
+                self.assertEqual(claim_server.call_args_list[0][0][0].uuid, by_weight[0])
+                self.assertEqual(assignation.server_uuid, by_weight[1])
+
+    def test_assign_restrained(self) -> None:
+        for server in self.registered_servers_group.servers.all():
+            server.stats = self.server_stats[server.uuid]
+        by_weight = sorted(self.server_stats, key=lambda uuid: self.server_stats[uuid].weight())
+        models.Server.objects.get(uuid=by_weight[0]).set_restrained_until(
+            datetime.datetime.now() + datetime.timedelta(seconds=32)
+        )
+        models.Server.objects.get(uuid=by_weight[1]).set_restrained_until(
+            datetime.datetime.now() - datetime.timedelta(seconds=32)
+        )
+        self.assertEqual(models.Server.restrained_uuids(self.all_uuids), {by_weight[0]})
+
+        with self.create_mock_api_requester():
+            assignation = self.assign(self.user_services[0])
+            if assignation is None:
+                self.fail('Assignation returned None')
+                return  # For mypy
+            self.assertEqual(assignation.server_uuid, by_weight[1])
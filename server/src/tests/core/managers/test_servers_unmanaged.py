@@ -93,7 +93,6 @@ class ServerManagerUnmanagedServersTest(UDSTestCase):
     def testAssignAuto(self) -> None:
         with self.createMockApiRequester() as mockServerApiRequester:
             for elementNumber, userService in enumerate(self.user_services[:NUM_REGISTEREDSERVERS]):
-                expected_get_stats_calls = NUM_REGISTEREDSERVERS * (elementNumber + 1)
                 expected_notify_assign_calls = elementNumber * 33  # 32 in loop + 1 in first assign
                 assignation = self.assign(userService)
                 if assignation is None:
@@ -106,10 +105,10 @@ class ServerManagerUnmanagedServersTest(UDSTestCase):
                 # Server locked should be None
                 self.assertIsNone(models.Server.objects.get(uuid=uuid).locked_until)
 
-                # mockServer.get_stats has been called NUM_REGISTEREDSERVERS times
+                # Unmanaged servers has no stats, so they are never requested
                 self.assertEqual(
                     mockServerApiRequester.return_value.get_stats.call_count,
-                    expected_get_stats_calls,
+                    0,
                     f'Error on loop {elementNumber}',
                 )
                 # notify_assign should has been called once for each user service
@@ -146,10 +145,7 @@ class ServerManagerUnmanagedServersTest(UDSTestCase):
                     self.assertTrue(uuid2 in self.all_uuids)
                     self.assertIsNone(models.Server.objects.get(uuid=uuid).locked_until)  # uuid is uuid2
 
-                    # mockServer.get_stats has been called NUM_REGISTEREDSERVERS times, because no new requests has been done
-                    self.assertEqual(
-                        mockServerApiRequester.return_value.get_stats.call_count, expected_get_stats_calls
-                    )
+                    self.assertEqual(mockServerApiRequester.return_value.get_stats.call_count, 0)
                     # notify_assign should has been called twice
                     self.assertEqual(
                         mockServerApiRequester.return_value.notify_assign.call_count,
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+import typing
+from unittest import mock
+
+from uds import models
+from uds.core import types
+from uds.core.managers import userservice
+from uds.core.types.states import State
+
+from ...fixtures import authenticators as authenticators_fixtures
+from ...fixtures import services as services_fixtures
+from ...utils.test import UDSTestCase
+
+NUM_CACHED: typing.Final[int] = 4
+
+
+class UserServiceManagerCacheClaimTest(UDSTestCase):
+    service_pool: 'models.ServicePool'
+    users: list['models.User']
+    cached: list['models.UserService']
+
+    def setUp(self) -> None:
+        super().setUp()
+        auth = authenticators_fixtures.create_db_authenticator()
+        groups = authenticators_fixtures.create_db_groups(auth, 1)
+        self.users = authenticators_fixtures.create_db_users(auth, NUM_CACHED + 1, groups=groups)
+        service = services_fixtures.create_db_service(services_fixtures.create_db_provider())
+        self.service_pool = services_fixtures.create_db_servicepool(
+            service, groups=groups, transports=[services_fixtures.create_db_transport()]
+        )
+        publication = services_fixtures.create_db_publication(self.service_pool)
+        self.cached = [self.create_cached(publication, State.USABLE) for _ in range(NUM_CACHED)]
+
+    def create_cached(
+        self, publication: 'models.ServicePoolPublication', state: str
+    ) -> 'models.UserService':
+        userservice = services_fixtures.create_db_userservice(self.service_pool, publication, self.users[0])
+        userservice.user = None
+        userservice.cache_level = types.services.CacheLevel.L1
+        userservice.state = userservice.os_state = state
+        userservice.save()
+        return userservice
+
+    def test_claims_different_cached_userservices(self) -> None:
+        manager = userservice.UserServiceManager.manager()
+        claimed = [
+            manager.claim_cached_userservice(self.service_pool, user, state=State.USABLE)
+            for user in self.users[:NUM_CACHED]
+        ]
+        self.assertEqual(
+            {item.uuid for item in claimed if item}, {item.uuid for item in self.cached}
+        )
+        for item, user in zip(claimed, self.users):
+            assert item is not None
+            item.refresh_from_db()
+            self.assertEqual(item.user, user)
+            self.assertEqual(item.cache_level, 0)
+
+        # No more cached user services
+        self.assertIsNone(
+            manager.claim_cached_userservice(self.service_pool, self.users[-1], state=State.USABLE)
+        )
+
+    def test_claim_skips_concurrently_claimed(self) -> None:
+        manager = userservice.UserServiceManager.manager()
+        taken: list[str] = []
+
+        # A concurrent assignation claims the first candidate after it was selected by this one
+        def _claim_first(candidates: list['models.UserService']) -> None:
+            taken.append(candidates[0].uuid)
+            models.UserService.objects.filter(uuid=candidates[0].uuid).update(
+                user=self.users[-1], cache_level=0
+            )
+
+        retries = userservice.CacheClaimStats.manager().retries
+        with mock.patch('uds.core.managers.userservice.random.shuffle', side_effect=_claim_first):
+            claimed = manager.claim_cached_userservice(self.service_pool, self.users[0], state=State.USABLE)
+
+        self.assertIsNotNone(claimed)
+        assert claimed is not None
+        self.assertNotEqual(claimed.uuid, taken[0])
+        claimed.refresh_from_db()
+        self.assertEqual(claimed.user, self.users[0])
+        self.assertEqual(userservice.CacheClaimStats.manager().retries, retries + 1)
+
+    def test_claim_filters_state(self) -> None:
+        manager = userservice.UserServiceManager.manager()
+        publication = self.service_pool.publications.first()
+        assert publication is not None
+        preparing = self.create_cached(publication, State.PREPARING)
+        for user in self.users[:NUM_CACHED]:
+            manager.claim_cached_userservice(self.service_pool, user, state=State.USABLE)
+
+        self.assertIsNone(
+            manager.claim_cached_userservice(self.service_pool, self.users[-1], state=State.USABLE)
+        )
+        claimed = manager.claim_cached_userservice(self.service_pool, self.users[-1], state=State.PREPARING)
+        self.assertEqual(claimed, preparing)
+
+    def test_get_assignation_for_user_uses_cache(self) -> None:
+        manager = userservice.UserServiceManager.manager()
+        with mock.patch('uds.core.managers.userservice.events.add_event'):
+            assigned = manager.get_assignation_for_user(self.service_pool, self.users[1])
+
+        self.assertIn(assigned, self.cached)
+        assert assigned is not None
+        assigned.refresh_from_db()
+        self.assertEqual(assigned.user, self.users[1])
+        self.assertEqual(assigned.cache_level, 0)
+        self.assertEqual(self.service_pool.cached_users_services().count(), NUM_CACHED - 1)
+
+    def test_get_assignation_for_user_counts_one_miss(self) -> None:
+        manager = userservice.UserServiceManager.manager()
+        self.service_pool.max_srvs = NUM_CACHED * 2
+        self.service_pool.save()
+        for user in self.users[:NUM_CACHED]:
+            manager.claim_cached_userservice(self.service_pool, user, state=State.USABLE)
+
+        # Several claims are tried (ready and preparing ones) before creating a new one, but it is a single miss
+        misses = userservice.CacheClaimStats.manager().misses
+        with mock.patch('uds.core.managers.userservice.events.add_event'), mock.patch.object(
+            manager, 'create_assigned_for'
+        ) as create_assigned_for:
+            manager.get_assignation_for_user(self.service_pool, self.users[-1])
+        create_assigned_for.assert_called_once_with(self.service_pool, self.users[-1])
+        self.assertEqual(userservice.CacheClaimStats.manager().misses, misses + 1)
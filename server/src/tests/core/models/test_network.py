@@ -30,9 +30,13 @@
 Author: Adolfo Gómez, dkmaster at dkmon dot com
 """
 import logging
+from unittest import mock
 
-from uds.models import Network
+from uds.core import consts
+from uds.models import Network, Transport
+from uds.models.network import NetworksIndex
 
+from ...fixtures import services as services_fixtures
 from ...utils.test import UDSTestCase
 
 NET_IPV4_TEMPLATE = '192.168.{}.0/24'
@@ -73,3 +77,77 @@ class NetworkModelTest(UDSTestCase):
                     self.assertTrue(f'2001:db8:85a3:8d3:13{i:02x}:{r:04x}::' in n, f'2001:db8:85a3:8d3:13{i:02x}:{r:04x}:: is not in {n.net_string}')
                     self.assertTrue(n.contains(f'2001:db8:85a3:8d3:13{i:02x}:{r:04x}:{r:04x}::'), f'2001:db8:85a3:8d3:13{i:02x}:{r:04x}:{r:04x}:: is not in {n.net_string}')
                     self.assertTrue(f'2001:db8:85a3:8d3:13{i:02x}:{r:04x}:{r:04x}::' in n, f'2001:db8:85a3:8d3:13{i:02x}:{r:04x}:{r:04x}:: is not in {n.net_string}')
+
+    def test_networks_index(self) -> None:
+        # Overlapping and nested networks
+        with self.captureOnCommitCallbacks(execute=True):
+            self.nets += [
+                Network.create('all_192', '192.168.0.0/16'),
+                Network.create('range', '192.168.0.200-192.168.30.10'),
+                Network.create('single', '192.168.15.7'),
+            ]
+        index = NetworksIndex.manager()
+        for ip in (
+            '192.168.0.1',
+            '192.168.0.200',
+            '192.168.15.7',
+            '192.168.15.8',
+            '192.168.30.10',
+            '192.168.30.11',
+            '192.169.0.1',
+            '10.0.0.1',
+            '2001:db8:85a3:8d3:130f::1',
+            '2001:db8:85a3:8d3:1310::1',
+            'invalid',
+        ):
+            expected = {n.id for n in self.nets if n.contains(ip)}
+            self.assertEqual(index.networks_for_ip(ip), expected, ip)
+            self.assertEqual({n.id for n in Network.get_networks_for_ip(ip)}, expected, ip)
+
+        # Changes are seen at once
+        with self.captureOnCommitCallbacks(execute=True):
+            self.nets[0].net_string = '10.0.0.0/8'
+            self.nets[0].save()
+        self.assertIn(self.nets[0].id, index.networks_for_ip('10.1.2.3'))
+        self.assertNotIn(self.nets[0].id, index.networks_for_ip('192.168.0.1'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.nets[0].delete()
+        self.assertEqual(index.networks_for_ip('10.1.2.3'), set())
+
+    def test_transport_is_ip_allowed(self) -> None:
+        transport: Transport = services_fixtures.create_db_transport()
+        self.assertTrue(transport.is_ip_allowed('10.0.0.1'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            transport.net_filtering = consts.auth.ALLOW
+            transport.save()
+            transport.networks.add(self.nets[0])  # 192.168.0.0/24
+        self.assertTrue(transport.is_ip_allowed('192.168.0.1'))
+        self.assertFalse(transport.is_ip_allowed('10.0.0.1'))
+
+        transport.net_filtering = consts.auth.DENY
+        self.assertFalse(transport.is_ip_allowed('192.168.0.1'))
+        self.assertTrue(transport.is_ip_allowed('10.0.0.1'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            transport.networks.remove(self.nets[0])
+        self.assertTrue(transport.is_ip_allowed('192.168.0.1'))
+
+    def test_networks_index_invalidations(self) -> None:
+        transport: Transport = services_fixtures.create_db_transport()
+        # Only post_* relation signals, and just once per transaction
+        with mock.patch.object(NetworksIndex, 'invalidate') as invalidate:
+            with self.captureOnCommitCallbacks(execute=True):
+                transport.networks.add(self.nets[0])  # 192.168.0.0/24
+                transport.networks.add(self.nets[2])
+            invalidate.assert_called_once_with()
+
+        index = NetworksIndex.manager()
+        index.invalidate()
+        self.assertTrue(index.transport_contains(transport.id, '192.168.0.1'))
+        # Deleting the transport removes its assignments without m2m signals
+        transport_id = transport.id
+        with self.captureOnCommitCallbacks(execute=True):
+            transport.delete()
+        self.assertFalse(index.transport_contains(transport_id, '192.168.0.1'))
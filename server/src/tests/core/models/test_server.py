@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+import logging
+from unittest import mock
+
+from uds import models
+from uds.core import types
+from uds.models.servers import ServerTokenIndex, TokenValidationStats
+
+from ...fixtures import servers as servers_fixtures
+from ...utils.test import UDSTestCase
+
+logger = logging.getLogger(__name__)
+
+
+class ServerTokenTest(UDSTestCase):
+    server: 'models.Server'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.server = servers_fixtures.create_server(type=types.servers.ServerType.TUNNEL, ip='10.0.0.1')
+        # Stats are per process, so reset them for each test
+        TokenValidationStats.manager().__init__()
+
+    def test_validate_token_uses_index(self) -> None:
+        tunnel = types.servers.ServerType.TUNNEL
+        with self.assertNumQueries(1):
+            for _ in range(10):
+                self.assertTrue(models.Server.validate_token(self.server.token, tunnel))
+
+        stats = TokenValidationStats.manager()
+        self.assertEqual(stats.misses, 1)
+        self.assertEqual(stats.hits, 9)
+        self.assertEqual(ServerTokenIndex.manager().size(), 1)
+
+    def test_validate_token_invalid(self) -> None:
+        # Unknown tokens are not indexed, wrong type is checked against indexed entry
+        self.assertFalse(models.Server.validate_token('invalid', types.servers.ServerType.TUNNEL))
+        self.assertEqual(ServerTokenIndex.manager().size(), 0)
+        self.assertFalse(models.Server.validate_token(self.server.token, types.servers.ServerType.ACTOR))
+        self.assertTrue(
+            models.Server.validate_token(
+                self.server.token, [types.servers.ServerType.ACTOR, types.servers.ServerType.TUNNEL]
+            )
+        )
+        self.assertEqual(TokenValidationStats.manager().invalid, 2)
+
+        request = mock.MagicMock()
+        request.ip = '10.0.0.2'
+        with self.assertRaises(Exception):
+            models.Server.validate_token(self.server.token, types.servers.ServerType.TUNNEL, request=request)
+        request.ip = '10.0.0.1'
+        self.assertTrue(
+            models.Server.validate_token(self.server.token, types.servers.ServerType.TUNNEL, request=request)
+        )
+
+    def test_validate_token_invalidated(self) -> None:
+        tunnel = types.servers.ServerType.TUNNEL
+        token = self.server.token
+        self.assertTrue(models.Server.validate_token(token, tunnel))
+
+        # Changing the server removes it from index, so changes are seen at once
+        self.server.type = types.servers.ServerType.SERVER
+        self.server.save()
+        self.assertEqual(ServerTokenIndex.manager().size(), 0)
+        self.assertFalse(models.Server.validate_token(token, tunnel))
+
+        self.server.delete()
+        self.assertEqual(ServerTokenIndex.manager().size(), 0)
+        self.assertFalse(models.Server.validate_token(token, types.servers.ServerType.SERVER))
+        self.assertEqual(TokenValidationStats.manager().invalidations, 2)
+
+    def test_validate_token_expires(self) -> None:
+        tunnel = types.servers.ServerType.TUNNEL
+        self.assertTrue(models.Server.validate_token(self.server.token, tunnel))
+        with mock.patch('uds.models.servers.time.monotonic', return_value=1e12):
+            with self.assertNumQueries(1):
+                self.assertTrue(models.Server.validate_token(self.server.token, tunnel))
+        self.assertEqual(TokenValidationStats.manager().misses, 2)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+import uuid
+from unittest import mock
+
+from uds import models
+from uds.core import consts, environment, types
+from uds.core.services.generics.dynamic import poller
+from ....utils.test import UDSTestCase
+from ....utils.helpers import limited_iterator
+from . import fixtures
+
+
+class BatchTestingService(fixtures.DynamicTestingService):
+    batch_state_polling = True
+
+    running: dict[str, bool]
+
+    def get_running_states(self, vmids: list[str]) -> dict[str, bool]:
+        self.mock.get_running_states(vmids)
+        return {vmid: self.running.get(vmid, self.machine_running_flag) for vmid in vmids if vmid != 'unlisted'}
+
+
+class Clock:
+    now: float = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+class DynamicPollerTest(UDSTestCase):
+    clock: Clock
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.clock = Clock()
+        patcher = mock.patch.object(poller, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_service(self) -> BatchTestingService:
+        uuid_ = str(uuid.uuid4())
+        service = BatchTestingService(
+            provider=fixtures.create_dynamic_provider(),
+            environment=environment.Environment.private_environment(uuid_),
+            uuid=uuid_,
+        )
+        service.mock.reset_mock()
+        service.machine_running_flag = False
+        service.running = {}
+        return service
+
+    def test_single_request_per_cycle(self) -> None:
+        service = self.create_service()
+        state_poller = poller.StatePoller.manager()
+        vmids = [f'vm-{i}' for i in range(50)]
+        service.running = {vmid: i % 2 == 0 for i, vmid in enumerate(vmids)}
+        for vmid in vmids:
+            state_poller.register(service, vmid)
+
+        self.clock.now += consts.services.SUGGESTED_CHECK_INTERVAL
+        for vmid in vmids:
+            self.assertEqual(state_poller.is_running(service, None, vmid), service.running[vmid])
+
+        service.mock.get_running_states.assert_called_once_with(vmids)
+        service.mock.is_running.assert_not_called()
+
+        # Next cycle, states are requested again
+        self.clock.now += consts.services.SUGGESTED_CHECK_INTERVAL
+        for vmid in vmids:
+            state_poller.is_running(service, None, vmid)
+        self.assertEqual(service.mock.get_running_states.call_count, 2)
+
+    def test_operation_after_request_waits_next_cycle(self) -> None:
+        service = self.create_service()
+        state_poller = poller.StatePoller.manager()
+        state_poller.register(service, 'vm-1')
+        self.clock.now += consts.services.SUGGESTED_CHECK_INTERVAL
+        self.assertFalse(state_poller.is_running(service, None, 'vm-1'))
+
+        # An operation issued after the states were requested, does not use them
+        self.clock.now += 1
+        state_poller.register(service, 'vm-2')
+        service.running['vm-2'] = True
+        self.clock.now += 1
+        self.assertIsNone(state_poller.is_running(service, None, 'vm-2'))
+        service.mock.get_running_states.assert_called_once()
+
+        self.clock.now += consts.services.STATE_POLL_INTERVAL
+        self.assertTrue(state_poller.is_running(service, None, 'vm-2'))
+        self.assertEqual(service.mock.get_running_states.call_count, 2)
+
+    def test_unlisted_machine(self) -> None:
+        service = self.create_service()
+        service.machine_running_flag = True
+        self.assertTrue(poller.StatePoller.manager().is_running(service, None, 'unlisted'))
+        service.mock.get_running_states.assert_called_once_with(['unlisted'])
+        service.mock.is_running.assert_called_once_with(None, 'unlisted')
+
+    def test_no_batch_support(self) -> None:
+        service = fixtures.create_dynamic_service()
+        state_poller = poller.StatePoller.manager()
+        state_poller.register(service, 'vm-1')
+        for _ in range(3):
+            self.assertFalse(state_poller.is_running(service, None, 'vm-1'))
+        self.assertEqual(service.mock.is_running.call_count, 3)
+        self.assertEqual(state_poller._provider_states(service).registrations, {})
+
+    def test_userservice_deploy(self) -> None:
+        service = self.create_service()
+        userservice = fixtures.create_dynamic_userservice(service)
+
+        state = userservice.deploy_for_user(models.User())
+        for _ in limited_iterator(lambda: state != types.states.TaskState.FINISHED, limit=128):
+            self.clock.now += consts.services.SUGGESTED_CHECK_INTERVAL
+            state = userservice.check_state()
+
+        self.assertEqual(state, types.states.TaskState.FINISHED)
+        # Start checker gets the state from the provider list, start operation asks for it directly
+        service.mock.get_running_states.assert_called_with([userservice._vmid])
+        service.mock.is_running.assert_called_once_with(userservice, userservice._vmid)
+        # Once finished, machine is no longer polled
+        self.assertEqual(poller.StatePoller.manager()._provider_states(service).registrations, {})
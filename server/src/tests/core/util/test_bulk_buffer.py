@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2012-2022 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+import time
+from unittest import mock
+
+from django.db import OperationalError, transaction
+
+from uds import models
+from uds.core import types
+from uds.core.managers.stats import StatsManager
+from uds.core.util.bulk_buffer import BulkBuffer, OverflowPolicy
+
+from ...utils.test import UDSTransactionTestCase
+
+
+def _counter(value: int) -> models.StatsCounters:
+    return models.StatsCounters(
+        owner_type=types.stats.CounterOwnerType.SERVICEPOOL,
+        owner_id=1,
+        counter_type=types.stats.CounterType.ASSIGNED,
+        value=value,
+        stamp=value,
+    )
+
+
+class BulkBufferTest(UDSTransactionTestCase):
+    background_flushes = True
+
+    def test_flush_on_size(self) -> None:
+        buffer = BulkBuffer(models.StatsCounters, flush_size=10, flush_interval=60, max_pending=100)
+        for i in range(9):
+            self.assertTrue(buffer.add(_counter(i)))
+        self.assertEqual(models.StatsCounters.objects.count(), 0)
+        self.assertEqual(buffer.pending, 9)
+
+        self.assertTrue(buffer.add(_counter(9)))
+        self.assertEqual(buffer.pending, 0)
+        # Order is kept
+        self.assertEqual(list(models.StatsCounters.objects.order_by('id').values_list('value', flat=True)), list(range(10)))
+        self.assertEqual(buffer.stats.flushes, 1)
+        self.assertEqual(buffer.stats.flushed, 10)
+
+    def test_flush_on_interval(self) -> None:
+        buffer = BulkBuffer(models.StatsCounters, flush_size=100, flush_interval=0.2, max_pending=1000)
+        buffer.add(_counter(1))
+        until = time.monotonic() + 5
+        while not buffer.stats.flushed and time.monotonic() < until:
+            time.sleep(0.05)
+        self.assertEqual(models.StatsCounters.objects.count(), 1)
+
+    def test_flush_all(self) -> None:
+        buffer = BulkBuffer(models.StatsCounters, flush_size=100, flush_interval=60, max_pending=1000)
+        buffer.add(_counter(1))
+        BulkBuffer.flush_all()
+        self.assertEqual(models.StatsCounters.objects.count(), 1)
+
+    def test_not_buffered(self) -> None:
+        buffer = BulkBuffer(models.StatsCounters, flush_size=0, flush_interval=60, max_pending=1000)
+        self.assertTrue(buffer.add(_counter(1)))
+        self.assertEqual(models.StatsCounters.objects.count(), 1)
+
+        with mock.patch.object(BulkBuffer, 'enabled', False):
+            buffer = BulkBuffer(models.StatsCounters, flush_size=10, flush_interval=60, max_pending=1000)
+            self.assertTrue(buffer.add(_counter(2)))
+            self.assertEqual(models.StatsCounters.objects.count(), 2)
+
+    def test_drop_policy(self) -> None:
+        buffer = BulkBuffer(models.StatsCounters, flush_size=2, flush_interval=60, max_pending=4)
+        with mock.patch.object(models.StatsCounters.objects, 'bulk_create', side_effect=OperationalError('db down')):
+            for i in range(4):
+                self.assertTrue(buffer.add(_counter(i)))
+            # Memory cap reached, new rows are discarded
+            self.assertFalse(buffer.add(_counter(4)))
+            self.assertEqual(buffer.pending, 4)
+            self.assertEqual(buffer.stats.dropped, 1)
+            self.assertGreater(buffer.stats.failed_flushes, 0)
+
+        # Once database is back, kept rows are written, in order
+        self.assertEqual(buffer.flush(), 4)
+        self.assertEqual(list(models.StatsCounters.objects.order_by('id').values_list('value', flat=True)), [0, 1, 2, 3])
+
+    def test_bad_row(self) -> None:
+        buffer = BulkBuffer(models.StatsCounters, flush_size=5, flush_interval=60, max_pending=100)
+        rows = [_counter(i) for i in range(5)]
+        rows[2].value = None  # type: ignore  # Not null constraint
+        for row in rows[:4]:
+            buffer.add(row)
+        with mock.patch.object(buffer, 'on_flush') as on_flush:
+            buffer.add(rows[4])
+            # Only the bad row is discarded, and the rest are written (in order)
+            on_flush.assert_called_once_with([rows[0], rows[1], rows[3], rows[4]])
+        self.assertEqual(buffer.pending, 0)
+        self.assertEqual(list(models.StatsCounters.objects.order_by('id').values_list('value', flat=True)), [0, 1, 3, 4])
+        self.assertEqual(buffer.stats.failed_flushes, 1)
+        self.assertEqual(buffer.stats.dropped, 1)
+        self.assertEqual(buffer.stats.flushed, 4)
+
+    def test_block_policy(self) -> None:
+        buffer = BulkBuffer(
+            models.StatsCounters, flush_size=10, flush_interval=60, max_pending=10, policy=OverflowPolicy.BLOCK
+        )
+        with mock.patch.object(models.StatsCounters.objects, 'bulk_create', side_effect=OperationalError('db down')):
+            for i in range(10):
+                self.assertTrue(buffer.add(_counter(i)))
+            self.assertFalse(buffer.add(_counter(10)))  # Caller tried to flush, but failed
+        # Caller flushes by itself when buffer is full
+        self.assertTrue(buffer.add(_counter(10)))
+        self.assertEqual(models.StatsCounters.objects.count(), 10)
+        self.assertEqual(buffer.pending, 1)
+
+    def test_no_flush_in_transaction(self) -> None:
+        buffer = BulkBuffer(models.StatsCounters, flush_size=2, flush_interval=60, max_pending=100)
+        with mock.patch.object(buffer, '_ensure_thread'):
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    buffer.add(_counter(1))
+                    buffer.add(_counter(2))
+                    # Background thread is woken up to flush, caller does not
+                    self.assertTrue(buffer._wakeup.is_set())
+                    self.assertEqual(buffer.pending, 2)
+                    raise RuntimeError('rollback')
+        # Rows are not lost with the caller rollback, nor counted as written
+        self.assertEqual(buffer.stats.flushed, 0)
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(models.StatsCounters.objects.count(), 2)
+
+    def test_stats_manager_is_buffered(self) -> None:
+        # New manager, so its background flusher is not kept for other tests
+        StatsManager._instance = None
+        self.addCleanup(setattr, StatsManager, '_instance', None)
+        manager = StatsManager.manager()
+        with mock.patch.object(manager.counters_buffer, 'flush_size', 100):
+            manager.add_counter(types.stats.CounterOwnerType.SERVICEPOOL, 1, types.stats.CounterType.INUSE, 1)
+            manager.add_event(types.stats.EventOwnerType.SERVICEPOOL, 1, types.stats.EventType.ACCESS, fld1='user')
+            self.assertEqual(models.StatsCounters.objects.count(), 0)
+            manager.flush()
+            self.assertEqual(models.StatsCounters.objects.count(), 1)
+            self.assertEqual(models.StatsEvents.objects.get().fld1, 'user')
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2012-2022 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+import datetime
+import typing
+from unittest import mock
+
+from django.db import transaction
+
+from uds import models
+
+from uds.core.util import cache_backends
+from uds.core.util.cache import Cache
+from uds.core.util.model import sql_now
+
+from ...utils.test import UDSTransactionTestCase
+
+
+def _entry(value: str, validity: int = 60) -> cache_backends.CacheEntry:
+    return cache_backends.CacheEntry(value=value, created=sql_now(), validity=validity)
+
+
+def _value(entry: typing.Optional[cache_backends.CacheEntry]) -> typing.Optional[str]:
+    return entry.value if entry else None
+
+
+class CacheBackendsTest(UDSTransactionTestCase):
+    def test_local_tier_lru(self) -> None:
+        local = cache_backends.LocalCacheTier(max_entries=2)
+        now = sql_now()
+        local.put('owner', 'k1', _entry('v1'))
+        local.put('owner', 'k2', _entry('v2'))
+        # Access k1, so k2 is the least recently used
+        self.assertEqual(_value(local.get('k1', now)), 'v1')
+        local.put('owner', 'k3', _entry('v3'))
+        self.assertIsNone(local.get('k2', now))
+        self.assertIsNotNone(local.get('k3', now))
+        self.assertEqual(local.stats.as_dict(), {'hits': 2, 'misses': 1})
+
+        # Honors validity, and entries without validity are not stored
+        local.put('owner', 'k1', _entry('v1', 1))
+        local.put('owner', 'k4', _entry('v4', 0))
+        self.assertIsNone(local.get('k1', now + datetime.timedelta(seconds=2)))
+        self.assertIsNone(local.get('k4', now))
+
+        local.clear('owner')
+        self.assertEqual(len(local), 0)
+
+    def test_tiered_store(self) -> None:
+        store = cache_backends.TieredCacheStore(
+            cache_backends.DBCacheBackend(), cache_backends.LocalCacheTier(max_entries=16)
+        )
+        store.put('owner', 'key', _entry('value'))
+        # Served from local tier, shared is not touched
+        self.assertEqual(_value(store.get('owner', 'key')), 'value')
+        self.assertEqual(store.stats()['local'], {'hits': 1, 'misses': 0, 'entries': 1})
+        self.assertEqual(store.stats()['db'], {'hits': 0, 'misses': 0})
+
+        assert store.local is not None
+        store.local.clear(None)
+        self.assertEqual(_value(store.get('owner', 'key')), 'value')
+        self.assertEqual(store.stats()['db'], {'hits': 1, 'misses': 0})
+
+        self.assertTrue(store.remove('owner', 'key'))
+        self.assertIsNone(store.get('owner', 'key'))
+        self.assertEqual(store.stats()['db'], {'hits': 1, 'misses': 1})
+
+    def test_cross_process_invalidation(self) -> None:
+        # Two stores sharing the database, as two processes would do
+        stores = [
+            cache_backends.TieredCacheStore(
+                cache_backends.DBCacheBackend(), cache_backends.LocalCacheTier(max_entries=16)
+            )
+            for _ in range(2)
+        ]
+        first, second = stores
+        first.put('owner', 'key', _entry('value'))
+        first.put('owner', 'other', _entry('other'))
+        self.assertEqual(_value(second.get('owner', 'key')), 'value')
+        self.assertEqual(_value(second.get('owner', 'other')), 'other')
+
+        first.put('owner', 'key', _entry('new value'))
+        # Until invalidations are checked, second process keeps its local copy
+        self.assertEqual(_value(second.get('owner', 'key')), 'value')
+        second.check_invalidations(force=True)
+        self.assertEqual(_value(second.get('owner', 'key')), 'new value')
+        # Own invalidations are not applied
+        first.check_invalidations(force=True)
+        self.assertEqual(first.stats()['local']['entries'], 2)
+
+        first.clear('owner')
+        second.check_invalidations(force=True)
+        self.assertIsNone(second.get('owner', 'key'))
+        self.assertIsNone(second.get('owner', 'other'))
+
+    def test_invalidations_published(self) -> None:
+        store = cache_backends.TieredCacheStore(
+            cache_backends.DBCacheBackend(), cache_backends.LocalCacheTier(max_entries=16)
+        )
+
+        def published() -> int:
+            return models.Cache.objects.filter(owner=cache_backends.consts.cache.CACHE_INVALIDATION_OWNER).count()
+
+        # New keys can't be on other processes local tiers
+        store.put('owner', 'key', _entry('value'))
+        store.refresh('owner', 'key')
+        store.add('owner', 'added', _entry('value'))
+        self.assertFalse(store.remove('owner', 'missing'))
+        self.assertEqual(published(), 0)
+        # Replaced or removed ones can
+        store.put('owner', 'key', _entry('new value'))
+        self.assertEqual(published(), 1)
+        store.remove('owner', 'added')
+        self.assertEqual(published(), 2)
+        # Expired ones can't be on local tiers either
+        store.put('owner', 'expired', _entry('value', 1))
+        models.Cache.objects.filter(pk='expired').update(created=sql_now() - datetime.timedelta(seconds=10))
+        store.put('owner', 'expired', _entry('new value'))
+        self.assertEqual(published(), 2)
+
+    def test_failed_invalidation_keeps_transaction(self) -> None:
+        backend = cache_backends.DBCacheBackend()
+        with transaction.atomic():
+            backend.put('owner', 'key', _entry('value'))
+            # Fails on database (duplicated key)
+            with mock.patch.object(
+                models.Cache.objects,
+                'update_or_create',
+                side_effect=lambda **kwargs: models.Cache.objects.create(
+                    key='key', owner='other', value='', created=sql_now(), validity=60
+                ),
+            ):
+                with self.assertLogs(cache_backends.logger, 'WARNING'):
+                    backend.publish_invalidation('owner', 'key')
+            # Transaction is still usable
+            self.assertEqual(_value(backend.get('owner', 'key')), 'value')
+
+    def test_django_backend(self) -> None:
+        backend = cache_backends.DjangoCacheBackend('memory')
+        backend.put('owner', 'key', _entry('value'))
+        backend.put('owner2', 'key2', _entry('value2'))
+        self.assertEqual(_value(backend.get('owner', 'key')), 'value')
+
+        backend.clear('owner')
+        self.assertIsNone(backend.get('owner', 'key'))
+        self.assertEqual(_value(backend.get('owner2', 'key2')), 'value2')
+        backend.clear(None)
+        self.assertIsNone(backend.get('owner2', 'key2'))
+
+        # Invalidations journal, as seen from another process
+        other = cache_backends.DjangoCacheBackend('memory')
+        self.assertEqual(other.fetch_invalidations(), [])
+        backend.publish_invalidation('owner', 'key')
+        backend.publish_invalidation('owner2', '')
+        self.assertEqual(other.fetch_invalidations(), [('owner', 'key'), ('owner2', '')])
+        self.assertEqual(other.fetch_invalidations(), [])
+
+    def test_cache_uses_store(self) -> None:
+        cache = Cache('test_owner')
+        cache.put('key', {'a': 1})
+        self.assertEqual(cache.get('key'), {'a': 1})
+        self.assertIn('db', Cache.stats())
@@ -32,11 +32,15 @@
 Author: Adolfo Gómez, dkmaster at dkmon dot com
 """
 # We use commit/rollback
+import threading
 import typing
 from unittest import mock
 
+from django.db import connection
+
 from ...utils.test import UDSTransactionTestCase
-from uds.core.util.decorators import cached
+from uds.core.util.cache import Cache
+from uds.core.util.decorators import cached, CacheStats
 import time
 
 
@@ -137,4 +141,120 @@ class CacheTest(UDSTransactionTestCase):
         self.assertEqual(cache_key.call_count, TESTS_COUNT+4)
         self.assertEqual(cache_key.call_args[0][0], test)
         self.assertEqual(test.call_count, 4)
-        
\ No newline at end of file
+        
+    def test_cache_decorator_single_flight(self) -> None:
+        call_count = 0
+        started = threading.Event()
+
+        @cached(prefix='test_sf', timeout=10, single_flight=True)
+        def cached_fnc(value: str) -> str:
+            nonlocal call_count
+            call_count += 1
+            started.set()
+            time.sleep(0.5)
+            return value + str(call_count)
+
+        coalesced = CacheStats.manager().coalesced
+        results: list[str] = []
+
+        def caller() -> None:
+            results.append(cached_fnc('test'))
+            connection.close()
+
+        first = threading.Thread(target=caller)
+        first.start()
+        started.wait()
+        # Rest of callers will wait for the first one
+        threads = [threading.Thread(target=caller) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in [first] + threads:
+            thread.join()
+
+        self.assertEqual(call_count, 1)
+        self.assertEqual(results, ['test1'] * 9)
+        self.assertEqual(CacheStats.manager().coalesced - coalesced, 8)
+
+    def test_cache_decorator_single_flight_force(self) -> None:
+        call_count = 0
+        started = threading.Event()
+
+        @cached(prefix='test_sff', timeout=10, single_flight=True)
+        def cached_fnc(value: str) -> str:
+            nonlocal call_count
+            call_count += 1
+            count = call_count
+            started.set()
+            if count == 1:
+                time.sleep(0.5)
+            return value + str(count)
+
+        results: list[str] = []
+
+        def caller() -> None:
+            results.append(cached_fnc('test'))
+            connection.close()
+
+        first = threading.Thread(target=caller)
+        first.start()
+        started.wait()
+        # Forced calls do not join the one in progress, they get a fresh value
+        self.assertEqual(cached_fnc('test', force=True), 'test2')  # type: ignore  # force is a hidden parameter
+        first.join()
+        self.assertEqual(results, ['test1'])
+
+    def test_cache_decorator_stale_while_revalidate(self) -> None:
+        testing_value = 'test'
+        refreshed = threading.Event()
+
+        @cached(prefix='test_swr', timeout=1, stale_while_revalidate=10)
+        def cached_fnc(value: str) -> str:
+            refreshed.set()
+            return testing_value
+
+        self.assertEqual(cached_fnc('test'), 'test')
+        self.assertEqual(cached_fnc('test'), 'test')  # From cache
+
+        testing_value = 'test2'
+        time.sleep(1.1)
+        refreshed.clear()
+        stale = CacheStats.manager().stale
+        # Expired, but stale value is served while refreshing on background
+        self.assertEqual(cached_fnc('test'), 'test')
+        self.assertEqual(CacheStats.manager().stale - stale, 1)
+        self.assertTrue(refreshed.wait(2))
+        time.sleep(0.2)  # Allow background refresh to store the new value
+        self.assertEqual(cached_fnc('test'), 'test2')
+
+    def test_cache_decorator_cluster_wide(self) -> None:
+        call_count = 0
+
+        @cached(prefix='test_cw', timeout=10, cluster_wide=True)
+        def cached_fnc(value: str) -> str:
+            nonlocal call_count
+            call_count += 1
+            return value
+
+        # Simulate other node executing the same call, holding the lock
+        # and storing the result after a while
+        cache = Cache('functionCache')
+        cache_key = 'test_cwtestcached_fnc'  # prefix + value + function name
+        locks = Cache('uds:cached:lock')
+        self.assertTrue(locks.add(cache.owner + ':' + cache_key, True, 10))
+        self.assertFalse(locks.add(cache.owner + ':' + cache_key, True, 10))
+
+        def other_node() -> None:
+            time.sleep(0.5)
+            cache.put(cache_key, 'from other node', 10)
+            connection.close()
+
+        thread = threading.Thread(target=other_node)
+        thread.start()
+        self.assertEqual(cached_fnc('test'), 'from other node')
+        thread.join()
+        self.assertEqual(call_count, 0)
+
+        # Once lock is released, it is executed normally
+        locks.remove(cache.owner + ':' + cache_key)
+        self.assertEqual(cached_fnc('test2'), 'test2')
+        self.assertEqual(call_count, 1)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2012-2022 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+import base64
+import codecs
+import enum
+import lzma
+import pickle
+import typing
+
+from unittest import TestCase
+
+from uds.core.util import codec, serializer, storage
+from uds.core.util.cache import Cache
+
+from ...utils.test import UDSTestCase
+
+
+class SampleEnum(enum.StrEnum):
+    VALUE = 'value'
+
+
+VALUES: typing.Final[list[typing.Any]] = [
+    None,
+    1,
+    2.5,
+    'ñöçóá^(pípè)',
+    b'bytes',
+    [1, 'two', {'three': 3}],
+    (1, 2),
+    {'a': 1, 'b': [1.0, None], 'c': {'d': b'e'}},
+    SampleEnum.VALUE,
+    {'enum': SampleEnum.VALUE},
+]
+
+
+class CodecTest(TestCase):
+    def test_roundtrip(self) -> None:
+        for value in VALUES:
+            decoded = codec.decode(codec.encode(value))
+            self.assertEqual(decoded, value)
+            self.assertEqual(type(decoded), type(value))
+
+    def test_formats(self) -> None:
+        self.assertEqual(codec.encode({'a': 1})[0], codec.MARSHAL)
+        # Subclasses of plain types are not marshalled, so they keep their type
+        self.assertEqual(codec.encode(SampleEnum.VALUE)[0], codec.PICKLE)
+
+        big = {'data': 'x' * codec.COMPRESS_THRESHOLD}
+        encoded = codec.encode(big)
+        self.assertEqual(encoded[0], codec.MARSHAL | codec.COMPRESSED)
+        self.assertLess(len(encoded), codec.COMPRESS_THRESHOLD)
+        self.assertEqual(codec.decode(encoded), big)
+
+        self.assertFalse(codec.is_encoded(pickle.dumps(big)))
+        self.assertFalse(codec.is_encoded(lzma.compress(b'data')))
+        with self.assertRaises(ValueError):
+            codec.decode(pickle.dumps(big))
+
+    def test_serializer_legacy(self) -> None:
+        for value in VALUES:
+            self.assertEqual(serializer.deserialize(serializer.serialize(value)), value)
+            # Previous format, lzma compressed pickle
+            legacy = serializer.CURRENT_SERIALIZER_VERSION + serializer.SERIALIZERS[
+                serializer.CURRENT_SERIALIZER_VERSION
+            ](lzma.compress(pickle.dumps(value)))
+            self.assertEqual(serializer.deserialize(legacy), value)
+
+
+class CodecStorageTest(UDSTestCase):
+    def test_storage_legacy(self) -> None:
+        strg = storage.Storage('codec')
+        strg.put('key', 'value')
+        self.assertEqual(strg.read('key'), 'value')
+        with strg.as_dict() as d:
+            d['dict'] = {'a': 1}
+            self.assertEqual(d['dict'], {'a': 1})
+
+        # Previous format, plain pickle
+        legacy = base64.b64encode(pickle.dumps((storage.MARK, 'key', {'b': 2}))).decode()
+        self.assertEqual(storage._decode_value('dbk', legacy), ('key', {'b': 2}))
+
+    def test_cache_legacy(self) -> None:
+        self.assertEqual(Cache._deserializer(Cache._serializer(VALUES)), VALUES)
+        # Previous cache values were encoded using codecs, that adds new lines
+        legacy = codecs.encode(serializer.serialize(VALUES * 10), 'base64').decode()
+        self.assertIn('\n', legacy)
+        self.assertEqual(Cache._deserializer(legacy), VALUES * 10)
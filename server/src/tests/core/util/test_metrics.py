@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2012-2022 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+from django.test import SimpleTestCase
+
+from uds.core.util.metrics import Histogram
+
+
+class HistogramTest(SimpleTestCase):
+    def test_histogram(self) -> None:
+        histogram = Histogram(buckets=(1, 10, 100))
+        self.assertEqual(histogram.mean, 0.0)
+        self.assertEqual(histogram.percentile(50), 0.0)
+
+        for value in (0.5, 1, 5, 50, 500):
+            histogram.observe(value)
+
+        self.assertEqual(histogram.count, 5)
+        self.assertEqual(histogram.total, 556.5)
+        self.assertEqual(histogram.min, 0.5)
+        self.assertEqual(histogram.max, 500)
+        self.assertEqual(histogram.counts, [2, 1, 1, 1])  # Bounds are inclusive
+        self.assertEqual(histogram.percentile(40), 1)
+        self.assertEqual(histogram.percentile(60), 10)
+        self.assertEqual(histogram.percentile(100), 500)  # Overflow bucket returns max
+        self.assertEqual(histogram.as_dict()['buckets'], {'1': 2, '10': 1, '100': 1, 'inf': 1})
+
+        histogram.reset()
+        self.assertEqual(histogram.count, 0)
+        self.assertEqual(histogram.counts, [0, 0, 0, 0])
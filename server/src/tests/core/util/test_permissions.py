@@ -305,6 +305,39 @@ class PermissionsTest(UDSTestCase):
     def test_group_network_permissions_staff(self) -> None:
         self.do_test_group_permissions(self.network, self.staffs[0])
 
+    def test_permissions_resolver(self) -> None:
+        PermissionType = uds.core.types.permissions.PermissionType
+        user = self.staffs[0]
+        other_pool = services_fixtures.create_db_one_cache_userservice(
+            self.provider, self.users[0], self.groups, 'managed'
+        ).deployed_service
+
+        # Group permission over every pool (no object id), and user permission over one of them
+        permissions.add_group_permission(self.groups[0], models.ServicePool(), PermissionType.READ)
+        permissions.add_user_permission(user, self.servicePool, PermissionType.ALL)
+        permissions.add_user_permission(user, self.network, PermissionType.MANAGEMENT)
+
+        resolver = permissions.PermissionsResolver(user)
+        # A single query per object type, no matter the number of objects
+        with self.assertNumQueries(1):
+            self.assertEqual(resolver.effective_permissions(self.servicePool), PermissionType.ALL)
+            self.assertEqual(resolver.effective_permissions(other_pool), PermissionType.READ)
+            self.assertEqual(resolver.effective_permissions(self.servicePool, for_type=True), PermissionType.READ)
+        with self.assertNumQueries(2):
+            self.assertTrue(resolver.has_access(self.network, PermissionType.MANAGEMENT))
+            self.assertFalse(resolver.has_access(self.network, PermissionType.ALL))
+            self.assertFalse(resolver.has_access(self.provider, PermissionType.READ))
+        # Same results as non batched checks
+        for obj in (self.servicePool, other_pool, self.network, self.provider, self.authenticator):
+            self.assertEqual(resolver.effective_permissions(obj), permissions.effective_permissions(user, obj))
+
+        # Admins need no queries
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                permissions.PermissionsResolver(self.admins[0]).effective_permissions(other_pool),
+                PermissionType.ALL,
+            )
+
     @staticmethod
     def getObjectType(obj: typing.Any) -> int:
         return objtype.ObjectType.from_model(obj).type
@@ -30,6 +30,7 @@
 Author: Adolfo Gómez, dkmaster at dkmon dot com
 """
 import logging
+from unittest import mock
 
 from uds import models
 
@@ -75,4 +76,101 @@ class PropertiesTest(UDSTestCase):
             prop = models.Properties.objects.get(owner_id=us.uuid, owner_type='userservice', key=key)
             self.assertEqual(prop.value, value)
         
-    
\ No newline at end of file
+    
+    def test_load_reads_locally(self) -> None:
+        us = self.user_services[0]
+        with us.properties.buffered() as p:
+            for i in range(5):
+                p[f'key{i}'] = f'value{i}'
+
+        # One query per key read if not loaded
+        with self.assertNumQueries(5):
+            for i in range(5):
+                us.properties.get(f'key{i}')
+
+        p = us.properties
+        with self.assertNumQueries(1):
+            p.load()
+            for i in range(5):
+                self.assertEqual(p[f'key{i}'], f'value{i}')
+            self.assertNotIn('missing', p)
+            self.assertEqual(dict(p), {f'key{i}': f'value{i}' for i in range(5)})
+
+        # Writes are done on database and snapshot
+        p['key0'] = 'changed'
+        del p['key1']
+        with self.assertNumQueries(0):
+            self.assertEqual(p['key0'], 'changed')
+            self.assertNotIn('key1', p)
+        self.assertEqual(us.properties['key0'], 'changed')
+        self.assertNotIn('key1', us.properties)
+
+    def test_buffered_writes(self) -> None:
+        us = self.user_services[0]
+        us.properties['to_delete'] = 'value'
+        us.properties['key0'] = 'old'
+
+        # Without buffering, a query to find the property and another to create or update it, per key
+        with self.assertNumQueries(6):
+            for i in range(3):
+                us.properties[f'unbuffered{i}'] = i
+
+        # Buffered, a single upsert
+        with self.assertNumQueries(1):
+            with us.properties.buffered() as p:
+                for i in range(3):
+                    p[f'key{i}'] = f'value{i}'
+                self.assertEqual(p['key0'], 'value0')  # Buffered values are visible
+
+        # Upsert and delete, on a transaction
+        with self.assertNumQueries(4):
+            with us.properties.buffered() as p:
+                p['key0'] = 'new'
+                del p['to_delete']
+
+        self.assertEqual(
+            dict(models.Properties.objects.filter(owner_id=us.uuid, owner_type='userservice').values_list('key', 'value')),
+            {'key0': 'new', 'key1': 'value1', 'key2': 'value2', 'unbuffered0': 0, 'unbuffered1': 1, 'unbuffered2': 2},
+        )
+
+        # Nothing is written if an exception is raised
+        with self.assertRaises(ValueError):
+            with us.properties.buffered() as p:
+                p['key0'] = 'discarded'
+                raise ValueError()
+        self.assertEqual(us.properties['key0'], 'new')
+
+    def test_prefetch_properties(self) -> None:
+        for i, us in enumerate(self.user_services):
+            with us.properties.buffered() as p:
+                p['ip'] = f'10.0.0.{i}'
+                p['actor_version'] = '4.0.0'
+
+        ips = {us.uuid: f'10.0.0.{i}' for i, us in enumerate(self.user_services)}
+        user_services = list(models.UserService.objects.filter(uuid__in=ips))
+        # Without prefetch, a query per owner and key
+        with self.assertNumQueries(len(user_services) * 2):
+            for us in user_services:
+                us.get_log_ip()
+                us.actor_version
+
+        with self.assertNumQueries(2):  # One for user services, one for all its properties
+            user_services = models.UserService.prefetch_properties(
+                models.UserService.objects.filter(uuid__in=ips)
+            )
+            for us in user_services:
+                self.assertEqual(us.get_log_ip(), ips[us.uuid])
+                self.assertEqual(us.actor_version, '4.0.0')
+                self.assertEqual(dict(us.properties), {'ip': ips[us.uuid], 'actor_version': '4.0.0'})
+
+        # Owners are queried in chunks, so parameters limits of databases are not exceeded
+        with mock.patch('uds.core.util.properties.PREFETCH_CHUNK_SIZE', 2), self.assertNumQueries(
+            1 + (len(ips) + 1) // 2
+        ):
+            for us in models.UserService.prefetch_properties(models.UserService.objects.filter(uuid__in=ips)):
+                self.assertEqual(us.get_log_ip(), ips[us.uuid])
+
+        # Writes on a prefetched object are seen on next reads
+        user_services[0].properties['ip'] = '10.0.1.1'
+        with self.assertNumQueries(0):
+            self.assertEqual(user_services[0].get_log_ip(), '10.0.1.1')
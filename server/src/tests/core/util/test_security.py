@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+import collections
+import datetime
+import http.server
+import ipaddress
+import logging
+import os
+import ssl
+import tempfile
+import threading
+import typing
+import warnings
+from unittest import mock
+
+import requests
+import urllib3
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+from uds.core import consts
+from uds.core.util import security
+
+from ...utils.test import UDSTestCase
+
+logger = logging.getLogger(__name__)
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep alive
+
+    def do_GET(self) -> None:
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'OK')
+
+    def log_message(self, format: str, *args: typing.Any) -> None:
+        pass
+
+
+class SecurityTest(UDSTestCase):
+    server: http.server.ThreadingHTTPServer
+    url: str
+    cert: str
+
+    def setUp(self) -> None:
+        super().setUp()
+        security.HTTPConnectionsPool.manager().clear()
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/'
+
+    def tearDown(self) -> None:
+        security.HTTPConnectionsPool.manager().clear()
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def _use_tls(self, key_cert_password: typing.Optional[tuple[str, str, typing.Optional[str]]] = None) -> None:
+        key, self.cert, password = key_cert_password or security.create_self_signed_cert('127.0.0.1')
+        with tempfile.TemporaryDirectory() as folder:
+            for name, content in (('cert.pem', self.cert), ('key.pem', key)):
+                with open(os.path.join(folder, name), 'w') as f:
+                    f.write(content)
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(
+                os.path.join(folder, 'cert.pem'), os.path.join(folder, 'key.pem'), password=password
+            )
+        self.server.socket = context.wrap_socket(self.server.socket, server_side=True)
+        self.url = self.url.replace('http://', 'https://')
+
+    def test_connections_reused(self) -> None:
+        stats = security.HTTPConnectionsStats.manager()
+        requests_count, new_connections = stats.requests, stats.new_connections
+
+        # Different sessions share the connections
+        for _ in range(2):
+            session = security.secure_requests_session(verify=False)
+            for _ in range(2):
+                self.assertEqual(session.get(self.url).text, 'OK')
+            session.close()  # Does not close pooled connections
+
+        self.assertEqual(stats.requests - requests_count, 4)
+        self.assertEqual(stats.new_connections - new_connections, 1)
+        self.assertEqual(len(security.HTTPConnectionsPool.manager()), 1)
+
+    def test_connections_by_verify(self) -> None:
+        self._use_tls()
+        stats = security.HTTPConnectionsStats.manager()
+        new_connections = stats.new_connections
+
+        # Self signed, only valid if verified with its own certificate
+        with self.assertRaises(requests.exceptions.SSLError):
+            security.secure_requests_session(verify=True).get(self.url)
+        for _ in range(2):
+            self.assertEqual(security.secure_requests_session(cadata=self.cert).get(self.url).text, 'OK')
+            with warnings.catch_warnings():  # Disabled on UDS, but tests turns warnings into errors
+                warnings.simplefilter('ignore', urllib3.exceptions.InsecureRequestWarning)
+                self.assertEqual(security.secure_requests_session(verify=False).get(self.url).text, 'OK')
+
+        # Connections are not shared between different security settings
+        self.assertEqual(len(security.HTTPConnectionsPool.manager()), 3)
+        self.assertEqual(stats.new_connections - new_connections, 3)
+
+        # Contexts are shared
+        self.assertIs(
+            security.shared_client_sslcontext(cadata=self.cert), security.shared_client_sslcontext(cadata=self.cert)
+        )
+        self.assertIsNot(
+            security.shared_client_sslcontext(verify=True), security.shared_client_sslcontext(verify=False)
+        )
+
+    def test_pinned_certificate_only_trusted(self) -> None:
+        # Server certificate issued by a "public" CA, trusted by the default CAs bundle
+        now = datetime.datetime.now(datetime.UTC)
+        ca_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        ca_name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'Public CA')])
+        ca_cert = (
+            x509.CertificateBuilder()
+            .subject_name(ca_name)
+            .issuer_name(ca_name)
+            .public_key(ca_key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now)
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .add_extension(x509.BasicConstraints(ca=True, path_length=None), True)
+            .sign(ca_key, hashes.SHA256())
+        )
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        cert = (
+            x509.CertificateBuilder()
+            .subject_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, '127.0.0.1')]))
+            .issuer_name(ca_name)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now)
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address('127.0.0.1'))]), False)
+            .sign(ca_key, hashes.SHA256())
+        )
+        self._use_tls(
+            (
+                key.private_bytes(
+                    serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+                ).decode(),
+                cert.public_bytes(serialization.Encoding.PEM).decode(),
+                None,
+            )
+        )
+        pinned = security.create_self_signed_cert('127.0.0.1')[1]  # Certificate stored for the server
+
+        with tempfile.NamedTemporaryFile('w', suffix='.pem') as ca_bundle, mock.patch.object(
+            security, '_ssl_contexts', collections.OrderedDict()
+        ), mock.patch('uds.core.util.security.certifi.where', return_value=ca_bundle.name):
+            ca_bundle.write(ca_cert.public_bytes(serialization.Encoding.PEM).decode())
+            ca_bundle.flush()
+
+            self.assertEqual(security.secure_requests_session(verify=True).get(self.url).text, 'OK')
+            # With a pinned certificate, the public CA is not trusted anymore
+            with self.assertRaises(requests.exceptions.SSLError):
+                security.secure_requests_session(cadata=pinned).get(self.url)
+
+    def test_ssl_contexts_bounded(self) -> None:
+        with mock.patch.object(consts.net, 'SSL_CONTEXTS_CACHE_SIZE', 1), mock.patch.object(
+            security, '_ssl_contexts', collections.OrderedDict()
+        ):
+            context = security.shared_client_sslcontext(verify=True)
+            self.assertIs(security.shared_client_sslcontext(verify=True), context)
+            security.shared_client_sslcontext(verify=False)
+            # Least recently used one has been discarded
+            self.assertEqual(len(security._ssl_contexts), 1)
+            self.assertIsNot(security.shared_client_sslcontext(verify=True), context)
+
+    def test_idle_connections_evicted(self) -> None:
+        stats = security.HTTPConnectionsStats.manager()
+        evicted, new_connections = stats.evicted, stats.new_connections
+
+        security.secure_requests_session(verify=False).get(self.url)
+        with mock.patch.object(consts.net, 'HTTP_POOL_IDLE_TIMEOUT', 0):
+            # Pool of the host has been idle for more than 0 seconds, so it is closed
+            security.secure_requests_session(verify=False).get(self.url)
+
+        self.assertEqual(stats.evicted - evicted, 1)
+        self.assertEqual(stats.new_connections - new_connections, 2)
+        self.assertEqual(len(security.HTTPConnectionsPool.manager()), 1)
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2012-2022 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+import datetime
+import random
+import time
+
+from uds import models
+from uds.core import types
+from uds.core.util.stats import aggregation
+from uds.reports.stats import pools_performance, pools_usage_day, usage_by_pool, user_access
+
+from ...fixtures import services as services_fixtures
+from ...utils.test import UDSTestCase
+
+START = int(time.mktime(datetime.date(2024, 3, 1).timetuple()))
+END = int(time.mktime(datetime.date(2024, 3, 3).timetuple()))
+
+
+def _event(owner_type: int, owner_id: int, event_type: int, stamp: int, username: str) -> models.StatsEvents:
+    return models.StatsEvents(
+        owner_type=owner_type,
+        owner_id=owner_id,
+        event_type=event_type,
+        stamp=stamp,
+        fld1=username,
+        fld2='1.2.3.4:5678',
+        fld4=username,
+    )
+
+
+class StatsAggregationTest(UDSTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        random.seed(42)
+        self.events = [
+            _event(
+                types.stats.EventOwnerType.SERVICEPOOL,
+                random.randint(1, 3),
+                types.stats.EventType.ACCESS,
+                random.randint(START, END),
+                f'user{random.randint(0, 9)}',
+            )
+            for _ in range(500)
+        ]
+        # Limits and out of range
+        self.events += [
+            _event(types.stats.EventOwnerType.SERVICEPOOL, 1, types.stats.EventType.ACCESS, stamp, 'limit')
+            for stamp in (START - 1, START, END, END + 1)
+        ]
+        models.StatsEvents.objects.bulk_create(self.events)
+
+    def test_buckets(self) -> None:
+        buckets = aggregation.Buckets.split(0, 100, 8)
+        self.assertEqual(buckets.count, 8)
+        self.assertEqual(buckets.intervals()[0], (0, 12))
+        self.assertEqual(buckets.intervals()[-1], (87, 100))
+        self.assertEqual(buckets.keys()[0], 6)
+        self.assertEqual(buckets.index(8), 7)  # Stamps equal to end belongs to last interval
+
+        buckets = aggregation.Buckets.every(0, 100, 30)
+        self.assertEqual(buckets.count, 4)
+        self.assertEqual(buckets.intervals(), [(0, 30), (30, 60), (60, 90), (90, 100)])
+
+    def test_events_series(self) -> None:
+        # Same user on last interval and at end stamp, must be counted once
+        last = _event(types.stats.EventOwnerType.SERVICEPOOL, 1, types.stats.EventType.ACCESS, END - 1, 'limit')
+        last.save()
+        self.events.append(last)
+        buckets = aggregation.Buckets.split(START, END, 16)
+        with self.assertNumQueries(1):
+            series = aggregation.events_series(
+                types.stats.EventOwnerType.SERVICEPOOL,
+                types.stats.EventType.ACCESS,
+                buckets,
+                [1, 2, 3, 4],
+                distinct_field='fld1',
+            )
+
+        self.assertEqual(set(series), {1, 2, 3, 4})
+        self.assertEqual(series[4].counts, [0] * 16)  # No events, but present
+        for owner_id in (1, 2, 3):
+            counts = [0] * 16
+            users: list[set[str]] = [set() for _ in range(16)]
+            for event in self.events:
+                if event.owner_id == owner_id and START <= event.stamp <= END:
+                    index = min(int((event.stamp - START) // buckets.width), 15)
+                    counts[index] += 1
+                    users[index].add(event.fld4)
+            self.assertEqual(series[owner_id].counts, counts)
+            self.assertEqual(series[owner_id].distinct, [len(i) for i in users])
+
+        self.assertEqual(sum(sum(s.counts) for s in series.values()), 500 + 3)
+
+    def test_total_events_series(self) -> None:
+        buckets = aggregation.Buckets.every(START, END, 3600)
+        with self.assertNumQueries(1):
+            series = aggregation.total_events_series(
+                types.stats.EventOwnerType.SERVICEPOOL, types.stats.EventType.ACCESS, buckets
+            )
+        self.assertEqual(len(series.counts), 48)
+        self.assertEqual(sum(series.counts), 500 + 2)
+        self.assertEqual(series.counts[0], len([e for e in self.events if START <= e.stamp < START + 3600]))
+
+    def test_counters_series(self) -> None:
+        models.StatsCounters.objects.bulk_create(
+            [
+                models.StatsCounters(
+                    owner_type=types.stats.CounterOwnerType.SERVICEPOOL,
+                    owner_id=owner_id,
+                    counter_type=types.stats.CounterType.ASSIGNED,
+                    stamp=START + i * 600,
+                    value=owner_id * 100 + i % 6,  # 6 values per hour, 0 to 5
+                )
+                for owner_id in (1, 2)
+                for i in range(48 * 6)
+            ]
+        )
+        buckets = aggregation.Buckets.every(START, END, 3600)
+        with self.assertNumQueries(1):
+            series = aggregation.counters_series(
+                types.stats.CounterOwnerType.SERVICEPOOL,
+                types.stats.CounterType.ASSIGNED,
+                buckets,
+                [1, 2, 3],
+                use_max=True,
+            )
+        self.assertEqual(series[1], [105] * 48)
+        self.assertEqual(series[2], [205] * 48)
+        self.assertEqual(series[3], [0] * 48)
+
+        series = aggregation.counters_series(
+            types.stats.CounterOwnerType.SERVICEPOOL,
+            types.stats.CounterType.ASSIGNED,
+            buckets,
+            [1],
+        )
+        self.assertEqual(series[1], [102] * 48)  # int(avg(100..105))
+
+
+class StatsReportsTest(UDSTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        service = services_fixtures.create_db_service(services_fixtures.create_db_provider())
+        self.pools = [services_fixtures.create_db_servicepool(service) for _ in range(3)]
+        events: list[models.StatsEvents] = []
+        for n, pool in enumerate(self.pools):
+            for hour in range(48):
+                stamp = START + hour * 3600
+                for user in range(n + 1):
+                    username = f'user{user}'
+                    events += [
+                        _event(
+                            types.stats.EventOwnerType.SERVICEPOOL,
+                            pool.id,
+                            types.stats.EventType.ACCESS,
+                            stamp + 10,
+                            username,
+                        ),
+                        _event(
+                            types.stats.EventOwnerType.SERVICEPOOL,
+                            pool.id,
+                            types.stats.EventType.LOGIN,
+                            stamp + 20,
+                            username,
+                        ),
+                        _event(
+                            types.stats.EventOwnerType.SERVICEPOOL,
+                            pool.id,
+                            types.stats.EventType.LOGOUT,
+                            stamp + 20 + 60 * (user + 1),
+                            username,
+                        ),
+                        _event(
+                            types.stats.EventOwnerType.AUTHENTICATOR,
+                            1,
+                            types.stats.EventType.LOGIN,
+                            stamp + 5,
+                            username,
+                        ),
+                    ]
+        models.StatsEvents.objects.bulk_create(events)
+
+    def test_pools_performance(self) -> None:
+        report = pools_performance.PoolPerformanceReport()
+        report.pools.value = [pool.uuid for pool in self.pools]
+        report.start_date.value = datetime.date(2024, 3, 1)
+        report.end_date.value = datetime.date(2024, 3, 3)
+        report.sampling_points.value = 8
+
+        with self.assertNumQueries(2):  # Pools and events
+            _, pools_data, report_data = report.get_range_data()
+
+        self.assertEqual(len(report_data), 3 * 8)
+        users_by_pool = {str(pool.id): n + 1 for n, pool in enumerate(self.pools)}
+        for pool_data in pools_data:
+            n = users_by_pool[pool_data['pool']] - 1
+            self.assertEqual([v[1] for v in pool_data['dataUsers']], [n + 1] * 8)
+            self.assertEqual([v[1] for v in pool_data['dataAccesses']], [(n + 1) * 6] * 8)
+
+    def test_user_access(self) -> None:
+        report = user_access.StatsReportLogin()
+        report.start_date.value = datetime.date(2024, 3, 1)
+        report.end_date.value = datetime.date(2024, 3, 3)
+        report.sampling_points.value = 4
+
+        with self.assertNumQueries(1):
+            _, data, _ = report.get_range_data()
+        # 6 logins per hour, 12 hours per interval
+        self.assertEqual([v[1] for v in data], [72] * 4)
+
+        with self.assertNumQueries(1):
+            data_week, data_hour, data_week_hour = report.get_week_hourly_data()
+        self.assertEqual(data_hour, [12] * 24)
+        self.assertEqual(data_week[datetime.date(2024, 3, 1).weekday()], 144)
+        self.assertEqual(data_week_hour[datetime.date(2024, 3, 2).weekday()], [6] * 24)
+
+    def test_pools_usage_day(self) -> None:
+        models.StatsCounters.objects.bulk_create(
+            [
+                models.StatsCounters(
+                    owner_type=types.stats.CounterOwnerType.SERVICEPOOL,
+                    owner_id=pool.id,
+                    counter_type=types.stats.CounterType.ASSIGNED,
+                    stamp=START + i * 600,
+                    value=i // 6,  # Hour of the day
+                )
+                for pool in self.pools
+                for i in range(24 * 6)
+            ]
+        )
+        report = pools_usage_day.CountersPoolAssigned()
+        report.pools.value = [pool.uuid for pool in self.pools]
+        report.start_date.value = datetime.date(2024, 3, 1)
+
+        with self.assertNumQueries(2):  # Pools and counters
+            data = report.get_data()
+
+        self.assertEqual([i['uuid'] for i in data], [pool.uuid for pool in self.pools])
+        for item in data:
+            self.assertEqual(item['hours'], list(range(24)))
+
+    def test_usage_by_pool(self) -> None:
+        report = usage_by_pool.UsageByPool()
+        report.pool.value = [pool.uuid for pool in self.pools]
+        report.start_date.value = datetime.date(2024, 3, 1)
+        report.end_date.value = datetime.date(2024, 3, 3)
+
+        with self.assertNumQueries(2):  # Pools and events
+            data, _ = report.get_data()
+
+        self.assertEqual(len(data), 48 * (1 + 2 + 3))
+        for n, pool in enumerate(self.pools):
+            self.assertEqual(len([i for i in data if i['pool'] == pool.uuid]), 48 * (n + 1))
+        # Grouped by pool
+        pools_order = [i['pool'] for i in data]
+        self.assertEqual(pools_order, sorted(pools_order, key=pools_order.index))
+        self.assertEqual({i['time'] for i in data if i['name'] == 'user2'}, {180})
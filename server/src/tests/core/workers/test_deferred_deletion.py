@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+import contextlib
+import datetime
+import threading
+import typing
+from unittest import mock
+
+from uds.core import consts
+from uds.core.util.model import sql_now
+from uds.core.workers import deferred_deletion
+from uds.core.services.generics import exceptions as gen_exceptions
+
+from ...utils.test import UDSTestCase
+
+
+class DeferredDeletionEngineTest(UDSTestCase):
+    services: dict[str, mock.MagicMock]
+    storage: dict[str, dict[str, deferred_deletion.DeletionInfo]]
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.services = {}
+        self.storage = {}
+
+    def add_service(self, provider_uuid: str, service_uuid: str) -> mock.MagicMock:
+        instance = mock.MagicMock()
+        instance.provider.return_value.get_uuid.return_value = provider_uuid
+        instance.db_obj.return_value = mock.MagicMock(uuid=service_uuid)
+        instance.db_obj.return_value.name = service_uuid
+        instance.db_obj.return_value.get_instance.return_value = instance
+        instance.is_deleted.return_value = True
+        self.services[service_uuid] = instance
+        return instance
+
+    def add_entries(
+        self, group: str, service_uuid: str, count: int, **kwargs: typing.Any
+    ) -> list[deferred_deletion.DeletionInfo]:
+        infos: list[deferred_deletion.DeletionInfo] = []
+        last_check = sql_now() - datetime.timedelta(seconds=deferred_deletion.CHECK_INTERVAL)
+        for i in range(count):
+            info = deferred_deletion.DeletionInfo(
+                vmid=f'vm{i}',
+                created=last_check,
+                last_check=last_check,
+                service_uuid=service_uuid,
+                **kwargs,
+            )
+            self.storage.setdefault(group, {})[f'{service_uuid}_vm{i}'] = info
+            infos.append(info)
+        return infos
+
+    def count(self, group: str) -> int:
+        return len(self.storage.get(group, {}))
+
+    @contextlib.contextmanager
+    def patched(self) -> typing.Iterator[None]:
+        @contextlib.contextmanager
+        def _as_dict(
+            group: str, *args: typing.Any, **kwargs: typing.Any
+        ) -> typing.Iterator[dict[str, deferred_deletion.DeletionInfo]]:
+            yield self.storage.setdefault(group, {})
+
+        with mock.patch('uds.models.Service.objects') as objs, mock.patch(
+            'uds.core.workers.deferred_deletion.DeferredDeletionWorker.deferred_storage'
+        ) as storage, mock.patch('uds.core.consts.system.DEFERRED_DELETION_RATE', 0):
+            objs.get.side_effect = lambda uuid: self.services[uuid].db_obj()
+            storage.as_dict.side_effect = _as_dict
+            yield
+
+    def test_entries_per_provider_are_limited(self) -> None:
+        self.add_service('prov_quota_1', 'service1')
+        self.add_service('prov_quota_2', 'service2')
+        self.add_entries(deferred_deletion.DELETING_GROUP, 'service1', 40)
+        self.add_entries(deferred_deletion.DELETING_GROUP, 'service2', 4)
+
+        with self.patched():
+            services, infos = deferred_deletion.DeletionInfo.get_from_storage(deferred_deletion.DELETING_GROUP)
+
+        # The big queue of provider 1 does not take the place of provider 2 entries
+        self.assertEqual(len(services), 2)
+        self.assertEqual(
+            len([1 for _, info in infos if info.service_uuid == 'service1']),
+            deferred_deletion.MAX_DELETIONS_PER_PROVIDER,
+        )
+        self.assertEqual(len([1 for _, info in infos if info.service_uuid == 'service2']), 4)
+        # Not taken entries are kept for next run
+        self.assertEqual(
+            self.count(deferred_deletion.DELETING_GROUP), 40 - deferred_deletion.MAX_DELETIONS_PER_PROVIDER
+        )
+
+    def test_failing_entries_backoff(self) -> None:
+        service = self.add_service('prov_backoff', 'service1')
+        service.is_deleted.side_effect = gen_exceptions.RetryableError('error')
+        (info,) = self.add_entries(deferred_deletion.DELETING_GROUP, 'service1', 1)
+        job = deferred_deletion.DeferredDeletionWorker(environment=mock.MagicMock())
+
+        with self.patched():
+            job.run()
+            self.assertEqual(info.errors, 1)
+            self.assertEqual(self.count(deferred_deletion.DELETING_GROUP), 1)
+
+            # Second error, next check is delayed twice CHECK_INTERVAL
+            info.last_check = sql_now() - datetime.timedelta(seconds=deferred_deletion.CHECK_INTERVAL)
+            job.run()
+            self.assertEqual(info.errors, 2)
+            self.assertEqual(
+                info.next_check() - info.last_check,
+                datetime.timedelta(seconds=deferred_deletion.CHECK_INTERVAL * 2),
+            )
+
+            # Not retried until its backoff expires
+            info.last_check = sql_now() - datetime.timedelta(seconds=deferred_deletion.CHECK_INTERVAL)
+            job.run()
+            self.assertEqual(service.is_deleted.call_count, 2)
+
+            # Backoff never exceeds MAX_CHECK_INTERVAL
+            info.errors = 100
+            self.assertEqual(
+                info.next_check() - info.last_check,
+                datetime.timedelta(seconds=deferred_deletion.MAX_CHECK_INTERVAL),
+            )
+
+            # And once it works, errors are reset
+            info.errors = 2
+            info.last_check = sql_now() - datetime.timedelta(seconds=deferred_deletion.CHECK_INTERVAL * 2)
+            service.is_deleted.side_effect = None
+            service.is_deleted.return_value = False
+            job.run()
+            self.assertEqual(service.is_deleted.call_count, 3)
+            self.assertEqual(info.errors, 0)
+            self.assertEqual(self.count(deferred_deletion.DELETING_GROUP), 1)
+
+    def test_providers_are_processed_concurrently(self) -> None:
+        slow = self.add_service('prov_slow', 'slow_service')
+        fast = self.add_service('prov_fast', 'fast_service')
+        fast_done = threading.Event()
+        fast_calls: list[str] = []
+
+        def _fast_is_deleted(vmid: str) -> bool:
+            fast_calls.append(vmid)
+            if len(fast_calls) == 3:
+                fast_done.set()
+            return True
+
+        # Slow provider does not finish until fast one is done, so it would lock if run sequentially
+        slow.is_deleted.side_effect = lambda vmid: fast_done.wait(10)
+        fast.is_deleted.side_effect = _fast_is_deleted
+        self.add_entries(deferred_deletion.DELETING_GROUP, 'slow_service', 1)
+        self.add_entries(deferred_deletion.DELETING_GROUP, 'fast_service', 3)
+
+        with self.patched():
+            deferred_deletion.DeferredDeletionWorker(environment=mock.MagicMock()).run()
+
+        self.assertTrue(fast_done.is_set())
+        self.assertEqual(self.count(deferred_deletion.DELETING_GROUP), 0)
+
+        stats = deferred_deletion.DeferredDeletionStats.manager().as_dict()
+        self.assertEqual(stats['prov_fast']['completed'], 3)
+        self.assertEqual(stats['prov_slow']['completed'], 1)
+        self.assertEqual(stats['prov_slow']['errors'], 0)
+
+    def test_provider_concurrency_is_limited(self) -> None:
+        service = self.add_service('prov_concurrency', 'service1')
+        self.add_entries(deferred_deletion.TO_DELETE_GROUP, 'service1', 12)
+        lock = threading.Lock()
+        running: list[int] = [0, 0]  # current, max
+
+        def _execute_delete(vmid: str) -> None:
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            threading.Event().wait(0.05)
+            with lock:
+                running[0] -= 1
+
+        service.execute_delete.side_effect = _execute_delete
+
+        with self.patched(), mock.patch('uds.core.consts.system.DEFERRED_DELETION_CONCURRENCY', 2):
+            deferred_deletion.DeferredDeletionWorker(environment=mock.MagicMock()).process_to_delete()
+
+        self.assertEqual(service.execute_delete.call_count, 12)
+        self.assertEqual(running[1], 2)
+        self.assertEqual(self.count(deferred_deletion.DELETING_GROUP), 12)
+
+    def test_provider_workers_do_not_share_instances(self) -> None:
+        service = self.add_service('prov_instances', 'service1')
+        self.add_entries(deferred_deletion.TO_DELETE_GROUP, 'service1', 8)
+        calls: list[tuple[int, int]] = []  # (instance, thread)
+        instances: list[mock.MagicMock] = []
+
+        def _get_instance() -> mock.MagicMock:
+            # First one is loaded with the entries, the rest by the other workers of the provider
+            instance = service if not instances else mock.MagicMock()
+
+            def _execute_delete(vmid: str) -> None:
+                calls.append((id(instance), threading.get_ident()))
+                threading.Event().wait(0.05)
+
+            instance.execute_delete.side_effect = _execute_delete
+            instances.append(instance)
+            return instance
+
+        service.db_obj.return_value.get_instance.side_effect = _get_instance
+
+        with self.patched():
+            deferred_deletion.DeferredDeletionWorker(environment=mock.MagicMock()).process_to_delete()
+
+        self.assertEqual(len(calls), 8)
+        self.assertEqual(len(instances), consts.system.DEFERRED_DELETION_CONCURRENCY)
+        # Every instance is used by a single thread
+        for instance in instances:
+            self.assertEqual(len({thread for used, thread in calls if used == id(instance)}), 1)
+        self.assertEqual(self.count(deferred_deletion.DELETING_GROUP), 8)
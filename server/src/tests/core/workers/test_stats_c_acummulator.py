@@ -31,8 +31,11 @@ Author: Adolfo Gómez, dkmaster at dkmon dot com
 """
 import datetime
 import random
+import typing
+from unittest import mock
 
 from uds import models
+from uds.core.managers.stats import StatsManager
 from uds.core.util.stats import counters
 
 
@@ -151,3 +154,92 @@ class StatsAcummulatorTest(UDSTestCase):
             self.assertEqual(i.v_max, max(x['max'] for x in dd[stamp]))
             self.assertEqual(i.v_min, min(x['min'] for x in dd[stamp]))
             self.assertEqual(i.v_count, sum(x['count'] for x in dd[stamp]))
+
+    def test_stats_accumulator_incremental(self) -> None:
+        optimizer = stats_collector.StatsAccumulator(Environment.testing_environment())
+        manager = StatsManager.manager()
+        optimizer.run()
+        optimizer.run()
+
+        hour_watermark = manager.get_accum_watermark(models.StatsCountersAccum.IntervalType.HOUR)
+        self.assertIsNotNone(hour_watermark)
+        accumulated = set(models.StatsCountersAccum.objects.values_list('id', flat=True))
+        # Hourly and daily stats
+        self.assertEqual(len(accumulated), DAYS * (24 + 1) * NUMBER_OF_POOLS * len(COUNTERS_TYPES))
+
+        # Watermark advances even if there is no data, so no rescans are done
+        optimizer.run()
+        self.assertEqual(
+            manager.get_accum_watermark(models.StatsCountersAccum.IntervalType.HOUR),
+            typing.cast(int, hour_watermark) + (DAYS // 2 + 1) * 24 * 3600,
+        )
+        self.assertEqual(set(models.StatsCountersAccum.objects.values_list('id', flat=True)), accumulated)
+
+        # New data (after watermark) is accumulated, existing accumulated data is not touched
+        new_start = datetime.datetime.fromtimestamp(
+            typing.cast(int, manager.get_accum_watermark(models.StatsCountersAccum.IntervalType.HOUR))
+        )
+        fixtures_stats_counters.create_stats_interval_total(
+            0,
+            COUNTERS_TYPES,
+            new_start,
+            days=1,
+            number_per_hour=NUMBER_PER_HOUR,
+            value=1,
+            owner_type=counters.types.stats.CounterOwnerType.SERVICEPOOL,
+        )
+        optimizer.run()
+        new_hours = models.StatsCountersAccum.objects.exclude(id__in=accumulated).filter(
+            interval_type=models.StatsCountersAccum.IntervalType.HOUR
+        )
+        self.assertEqual(new_hours.count(), 24 * len(COUNTERS_TYPES))
+        for stat in new_hours:
+            self.assertEqual(stat.v_count, NUMBER_PER_HOUR)
+            self.assertEqual(stat.v_sum, NUMBER_PER_HOUR)
+
+    def test_stats_accumulator_late_counters(self) -> None:
+        manager = StatsManager.manager()
+        hour = models.StatsCountersAccum.IntervalType.HOUR
+        boundary = models.StatsCountersAccum.adjust_to_interval(
+            int(START_DATE.timestamp()) + (DAYS + 1) * 24 * 3600, interval_type=hour
+        )
+        with mock.patch('uds.core.managers.stats.sql_stamp_seconds', return_value=boundary + 10):
+            manager.acummulate(max_days=100000)
+
+        # Counter buffered on other process, stamped before last run but written after it
+        models.StatsCounters.objects.create(
+            owner_id=999,
+            owner_type=counters.types.stats.CounterOwnerType.SERVICEPOOL,
+            counter_type=counters.types.stats.CounterType.ASSIGNED,
+            stamp=boundary - 5,
+            value=7,
+        )
+        with mock.patch('uds.core.managers.stats.sql_stamp_seconds', return_value=boundary + 2 * 3600 + 10):
+            manager.acummulate(max_days=100000)
+
+        stat = models.StatsCountersAccum.objects.get(owner_id=999, interval_type=hour)
+        self.assertEqual((stat.stamp, stat.v_count, stat.v_sum), (boundary, 1, 7))
+
+    def test_stats_accumulator_backfill(self) -> None:
+        optimizer = stats_collector.StatsAccumulator(Environment.testing_environment())
+        optimizer.run()
+        optimizer.run()
+        counts = models.StatsCountersAccum.objects.count()
+
+        # Fix raw data of an already accumulated range
+        fix_from = START_DATE + datetime.timedelta(days=1)
+        fix_to = START_DATE + datetime.timedelta(days=2)
+        models.StatsCounters.objects.filter(
+            stamp__gte=int(fix_from.timestamp()), stamp__lt=int(fix_to.timestamp())
+        ).update(value=1)
+
+        StatsManager.manager().backfill(fix_from, fix_to, max_days=1)
+        self.assertEqual(models.StatsCountersAccum.objects.count(), counts)
+
+        for stat in models.StatsCountersAccum.objects.filter(
+            interval_type=models.StatsCountersAccum.IntervalType.HOUR,
+            stamp__gt=int(fix_from.timestamp()),
+            stamp__lte=int(fix_to.timestamp()),
+        ):
+            self.assertEqual(stat.v_sum, NUMBER_PER_HOUR)
+            self.assertEqual(stat.v_max, 1)
@@ -328,7 +328,7 @@ CLIENT_METHODS_INFO: typing.Final[list[AutoSpecMethodInfo]] = [
     # get_task
     AutoSpecMethodInfo(client.ProxmoxClient.get_task, returns=TASK_STATUS),
     # list_machines
-    AutoSpecMethodInfo(client.ProxmoxClient.list_machines, returns=VMS_INFO),
+    AutoSpecMethodInfo(client.ProxmoxClient.list_machines, returns=lambda *args, **kwargs: VMS_INFO),  # pyright: ignore
     # get_machine_pool_info
     AutoSpecMethodInfo(
         client.ProxmoxClient.get_machine_pool_info,
@@ -445,7 +445,8 @@ def patched_provider(
 ) -> typing.Generator[provider.ProxmoxProvider, None, None]:
     client = create_client_mock()
     provider = create_provider(**kwargs)
-    with mock.patch.object(provider, '_api') as api:
+    # Machines states changes between checks, so do not wait for next polling cycle to get them
+    with mock.patch.object(provider, '_api') as api, mock.patch('uds.core.consts.services.STATE_POLL_INTERVAL', 0):
         api.return_value = client
         yield provider
 
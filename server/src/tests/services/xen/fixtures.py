@@ -452,7 +452,10 @@ def patched_provider(
 ) -> typing.Generator[provider.XenProvider, None, None]:
     client = create_client_mock()
     provider = create_provider(**kwargs)
-    with mock.patch('uds.services.Xen.provider.XenProvider._api', new_callable=mock.PropertyMock) as api:
+    # Machines states changes between checks, so do not wait for next polling cycle to get them
+    with mock.patch(
+        'uds.services.Xen.provider.XenProvider._api', new_callable=mock.PropertyMock
+    ) as api, mock.patch('uds.core.consts.services.STATE_POLL_INTERVAL', 0):
         api.return_value = client
         yield provider
 
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+
+In-process stand-in of an ldap server, so ldap authenticators can be tested (and measured) without a real one.
+Counts connections, binds and searchs, and can simulate the latency of a remote server.
+"""
+import contextlib
+import dataclasses
+import re
+import time
+import typing
+import collections.abc
+from unittest import mock
+
+import ldap  # pyright: ignore
+
+_ESCAPED_RE: typing.Final[re.Pattern[str]] = re.compile(r'\\([0-9a-fA-F]{2})')
+
+
+@dataclasses.dataclass
+class FakeLDAPServer:
+    entries: dict[str, dict[str, list[str]]] = dataclasses.field(default_factory=dict)  # dn -> attributes
+    passwords: dict[str, str] = dataclasses.field(default_factory=dict)  # dn -> password
+    latency: float = 0.0  # Seconds spent on every network operation
+    down: bool = False  # Server can't be contacted, and connections opened are broken
+
+    connections: int = 0
+    binds: int = 0
+    searchs: int = 0
+
+    opened: list['FakeLDAPConnection'] = dataclasses.field(default_factory=list)
+
+    def add(self, dn: str, password: typing.Optional[str] = None, **attributes: typing.Union[str, list[str]]) -> None:
+        self.entries[dn] = {k: [v] if isinstance(v, str) else v for k, v in attributes.items()}
+        if password is not None:
+            self.passwords[dn] = password
+
+    def reset_counters(self) -> None:
+        self.connections = self.binds = self.searchs = 0
+
+    def break_connections(self) -> None:
+        """
+        Breaks connections already opened (as if the server had been restarted)
+        """
+        for con in self.opened:
+            con.broken = True
+
+    def initialize(self, uri: str, **kwargs: typing.Any) -> 'FakeLDAPConnection':
+        return FakeLDAPConnection(self)
+
+    @contextlib.contextmanager
+    def patched(self) -> collections.abc.Iterator['FakeLDAPServer']:
+        """
+        Makes ldap connections to be connections to this server
+        """
+        with mock.patch('ldap.initialize', self.initialize):
+            yield self
+
+    def _wait(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        if self.down:
+            raise ldap.SERVER_DOWN({'desc': "Can't contact LDAP server"})  # pyright: ignore
+
+    def matches(self, attributes: dict[str, list[str]], ldap_filter: str) -> bool:
+        """
+        Evaluates the filter (&, | and attribute=value, with trailing * allowed on values) over the attributes
+        """
+
+        def parse(pos: int) -> tuple[bool, int]:
+            # ldap_filter[pos] is '('
+            op = ldap_filter[pos + 1]
+            if op in '&|':
+                results: list[bool] = []
+                pos += 2
+                while ldap_filter[pos] == '(':
+                    result, pos = parse(pos)
+                    results.append(result)
+                return (all(results) if op == '&' else any(results)), pos + 1
+            end = ldap_filter.index(')', pos)
+            name, value = ldap_filter[pos + 1 : end].split('=', 1)
+            value = _ESCAPED_RE.sub(lambda m: chr(int(m.group(1), 16)), value).lower()
+            values = [v.lower() for k, vs in attributes.items() if k.lower() == name.lower() for v in vs]
+            if value.endswith('*'):
+                return any(v.startswith(value[:-1]) for v in values), end + 1
+            return value in values, end + 1
+
+        return parse(0)[0]
+
+
+class FakeLDAPConnection:
+    server: FakeLDAPServer
+    who: typing.Optional[str]
+    broken: bool
+    network_timeout: int
+    protocol_version: int
+
+    def __init__(self, server: FakeLDAPServer) -> None:
+        self.server = server
+        self.who = None
+        self.broken = False
+        server.connections += 1
+        server.opened.append(self)
+
+    def _check(self) -> None:
+        self.server._wait()
+        if self.broken:
+            raise ldap.SERVER_DOWN({'desc': "Can't contact LDAP server"})  # pyright: ignore
+
+    def set_option(self, option: typing.Any, value: typing.Any) -> None:
+        pass
+
+    def simple_bind_s(self, who: str, cred: typing.Union[str, bytes]) -> None:
+        self.server.binds += 1
+        self._check()
+        password = cred.decode() if isinstance(cred, bytes) else cred
+        if who not in self.server.passwords or self.server.passwords[who] != password:
+            self.who = None
+            raise ldap.INVALID_CREDENTIALS({'desc': 'Invalid credentials'})  # pyright: ignore
+        self.who = who
+
+    def whoami_s(self) -> str:
+        self._check()
+        return f'dn:{self.who}' if self.who else ''
+
+    def search_ext_s(
+        self,
+        base: str,
+        scope: int,
+        filterstr: str = '(objectClass=*)',
+        attrlist: typing.Optional[list[str]] = None,
+        sizelimit: int = 0,
+    ) -> list[tuple[str, dict[str, list[bytes]]]]:
+        self.server.searchs += 1
+        self._check()
+        if self.who is None:
+            raise ldap.INSUFFICIENT_ACCESS({'desc': 'Insufficient access'})  # pyright: ignore
+        result: list[tuple[str, dict[str, list[bytes]]]] = []
+        for dn, attributes in self.server.entries.items():
+            if not dn.lower().endswith(base.lower()) or not self.server.matches(attributes, filterstr):
+                continue
+            wanted = {a.lower() for a in attrlist} if attrlist else None
+            result.append(
+                (
+                    dn,
+                    {
+                        k: [v.encode() for v in vs]
+                        for k, vs in attributes.items()
+                        if wanted is None or k.lower() in wanted
+                    },
+                )
+            )
+            if sizelimit and len(result) >= sizelimit:
+                break
+        return result
+
+    def unbind_s(self) -> None:
+        self.who = None
+        self.broken = True
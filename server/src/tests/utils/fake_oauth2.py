@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+
+Local stand-in of an OpenID provider, serving its discovery document and signing keys (jwks) over http, so
+OAuth2 authenticators can be tested (and measured) without a real one. Issues id tokens signed with its keys,
+and counts the requests received.
+"""
+import datetime
+import functools
+import http.server
+import json
+import threading
+import time
+import typing
+
+import jwt
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+
+@functools.lru_cache(maxsize=None)
+def create_key(kid: str) -> rsa.RSAPrivateKey:
+    """
+    Returns a private key for this key id (cached, key generation is slow)
+    """
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+class FakeOpenIDProvider(http.server.ThreadingHTTPServer):
+    keys: dict[str, rsa.RSAPrivateKey]  # Published keys, by key id
+    down: bool  # Provider answers with errors
+
+    discovery_requests: int
+    keys_requests: int
+
+    _thread: threading.Thread
+
+    def __init__(self, kids: typing.Iterable[str] = ('key1',)) -> None:
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.keys = {kid: create_key(kid) for kid in kids}
+        self.down = False
+        self.reset_counters()
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def issuer(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    @property
+    def discovery_url(self) -> str:
+        return self.issuer + '/.well-known/openid-configuration'
+
+    def __enter__(self) -> 'FakeOpenIDProvider':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args: typing.Any) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def reset_counters(self) -> None:
+        self.discovery_requests = self.keys_requests = 0
+
+    def discovery(self) -> dict[str, typing.Any]:
+        return {
+            'issuer': self.issuer,
+            'authorization_endpoint': self.issuer + '/authorize',
+            'token_endpoint': self.issuer + '/token',
+            'jwks_uri': self.issuer + '/jwks',
+            'id_token_signing_alg_values_supported': ['RS256'],
+        }
+
+    def jwks(self) -> dict[str, typing.Any]:
+        return {
+            'keys': [
+                {
+                    **json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(key.public_key())),
+                    'kid': kid,
+                    'use': 'sig',
+                    'alg': 'RS256',
+                }
+                for kid, key in self.keys.items()
+            ]
+        }
+
+    def certificate(self, kid: typing.Optional[str] = None) -> str:
+        """
+        Returns a self signed certificate (PEM) of key with id kid (first key if not provided), as
+        providers without discovery publish them
+        """
+        key = self.keys[kid or next(iter(self.keys))]
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, '127.0.0.1')])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        cert = (
+            x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=365))
+            .sign(key, hashes.SHA256())
+        )
+        return cert.public_bytes(serialization.Encoding.PEM).decode()
+
+    def id_token(
+        self,
+        client_id: str,
+        nonce: str,
+        claims: typing.Mapping[str, typing.Any],
+        kid: typing.Optional[str] = None,
+        key: typing.Optional[rsa.RSAPrivateKey] = None,
+        algorithm: str = 'RS256',
+    ) -> str:
+        """
+        Returns an id token with this claims, signed with key with id kid (first key if not provided),
+        or with key if provided (to forge tokens). Not signed at all if algorithm is 'none'
+        """
+        kid = kid or next(iter(self.keys))
+        now = int(time.time())
+        return jwt.encode(
+            {'iss': self.issuer, 'aud': client_id, 'iat': now, 'exp': now + 300, 'nonce': nonce, **claims},
+            None if algorithm == 'none' else key or self.keys[kid],
+            algorithm=algorithm,
+            headers={'kid': kid},
+        )
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    server: FakeOpenIDProvider
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        # Requests are counted even if provider is down
+        if self.path == '/.well-known/openid-configuration':
+            self.server.discovery_requests += 1
+            data = self.server.discovery()
+        elif self.path == '/jwks':
+            self.server.keys_requests += 1
+            data = self.server.jwks()
+        else:
+            self.send_error(404)
+            return
+        if self.server.down:
+            self.send_error(503)
+            return
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: typing.Any) -> None:  # pylint: disable=redefined-builtin
+        pass  # Not on tests output
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+
+Local stand-in of a SAML identity provider, so SAML authenticators can be tested (and measured) without a real one.
+Provides its metadata, and signed responses for the users and attributes requested.
+"""
+import base64
+import datetime
+import functools
+import secrets
+import typing
+import xml.sax.saxutils
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from onelogin.saml2.constants import OneLogin_Saml2_Constants
+from onelogin.saml2.utils import OneLogin_Saml2_Utils
+
+SAML_TIME_FORMAT: typing.Final[str] = '%Y-%m-%dT%H:%M:%SZ'
+
+
+@functools.lru_cache(maxsize=None)
+def create_certificate(common_name: str) -> tuple[str, str]:
+    """
+    Returns a private key and a self signed certificate for it, both PEM (cached, key generation is slow)
+    """
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=365))
+        .sign(key, hashes.SHA256())
+    )
+    return (
+        key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption(),
+        ).decode(),
+        cert.public_bytes(serialization.Encoding.PEM).decode(),
+    )
+
+
+class FakeSAMLIdP:
+    entity_id: str
+    sso_url: str
+    private_key: str
+    certificate: str
+
+    def __init__(self, entity_id: str = 'https://idp.uds.test/metadata') -> None:
+        self.entity_id = entity_id
+        self.sso_url = entity_id.rsplit('/', 1)[0] + '/sso'
+        self.private_key, self.certificate = create_certificate('idp.uds.test')
+
+    def metadata(self) -> str:
+        cert = ''.join(line for line in self.certificate.splitlines() if not line.startswith('-----'))
+        return f'''<?xml version="1.0"?>
+<md:EntityDescriptor xmlns:md="urn:oasis:names:tc:SAML:2.0:metadata" xmlns:ds="http://www.w3.org/2000/09/xmldsig#" entityID="{self.entity_id}">
+  <md:IDPSSODescriptor protocolSupportEnumeration="urn:oasis:names:tc:SAML:2.0:protocol">
+    <md:KeyDescriptor use="signing">
+      <ds:KeyInfo><ds:X509Data><ds:X509Certificate>{cert}</ds:X509Certificate></ds:X509Data></ds:KeyInfo>
+    </md:KeyDescriptor>
+    <md:SingleLogoutService Binding="urn:oasis:names:tc:SAML:2.0:bindings:HTTP-Redirect" Location="{self.sso_url}/logout"/>
+    <md:NameIDFormat>urn:oasis:names:tc:SAML:1.1:nameid-format:unspecified</md:NameIDFormat>
+    <md:SingleSignOnService Binding="urn:oasis:names:tc:SAML:2.0:bindings:HTTP-Redirect" Location="{self.sso_url}"/>
+  </md:IDPSSODescriptor>
+</md:EntityDescriptor>
+'''
+
+    def response(
+        self,
+        sp_entity_id: str,
+        acs_url: str,
+        username: str,
+        attributes: typing.Mapping[str, list[str]],
+        valid_for: int = 3600,
+    ) -> str:
+        """
+        Returns a signed SAML response (base64 encoded, as posted to the acs url) for the user and attributes
+        """
+        now = datetime.datetime.now(datetime.timezone.utc)
+        issued, not_before, not_after = (
+            t.strftime(SAML_TIME_FORMAT)
+            for t in (now, now - datetime.timedelta(minutes=5), now + datetime.timedelta(seconds=valid_for))
+        )
+        escape = xml.sax.saxutils.escape
+        attributes_xml = ''.join(
+            f'<saml:Attribute Name="{escape(name)}">'
+            + ''.join(f'<saml:AttributeValue>{escape(v)}</saml:AttributeValue>' for v in values)
+            + '</saml:Attribute>'
+            for name, values in attributes.items()
+        )
+        response = f'''<samlp:Response xmlns:samlp="urn:oasis:names:tc:SAML:2.0:protocol" xmlns:saml="urn:oasis:names:tc:SAML:2.0:assertion" ID="_{secrets.token_hex(16)}" Version="2.0" IssueInstant="{issued}" Destination="{acs_url}">
+<saml:Issuer>{self.entity_id}</saml:Issuer>
+<samlp:Status><samlp:StatusCode Value="urn:oasis:names:tc:SAML:2.0:status:Success"/></samlp:Status>
+<saml:Assertion ID="_{secrets.token_hex(16)}" Version="2.0" IssueInstant="{issued}">
+<saml:Issuer>{self.entity_id}</saml:Issuer>
+<saml:Subject>
+<saml:NameID Format="urn:oasis:names:tc:SAML:1.1:nameid-format:unspecified">{escape(username)}</saml:NameID>
+<saml:SubjectConfirmation Method="urn:oasis:names:tc:SAML:2.0:cm:bearer"><saml:SubjectConfirmationData NotOnOrAfter="{not_after}" Recipient="{acs_url}"/></saml:SubjectConfirmation>
+</saml:Subject>
+<saml:Conditions NotBefore="{not_before}" NotOnOrAfter="{not_after}">
+<saml:AudienceRestriction><saml:Audience>{sp_entity_id}</saml:Audience></saml:AudienceRestriction>
+</saml:Conditions>
+<saml:AuthnStatement AuthnInstant="{issued}" SessionIndex="_{secrets.token_hex(8)}">
+<saml:AuthnContext><saml:AuthnContextClassRef>urn:oasis:names:tc:SAML:2.0:ac:classes:Password</saml:AuthnContextClassRef></saml:AuthnContext>
+</saml:AuthnStatement>
+<saml:AttributeStatement>{attributes_xml}</saml:AttributeStatement>
+</saml:Assertion>
+</samlp:Response>'''
+        signed: typing.Any = OneLogin_Saml2_Utils.add_sign(
+            response,
+            self.private_key,
+            self.certificate,
+            sign_algorithm=OneLogin_Saml2_Constants.RSA_SHA256,
+            digest_algorithm=OneLogin_Saml2_Constants.SHA256,
+        )
+        return base64.b64encode(signed if isinstance(signed, bytes) else signed.encode()).decode()
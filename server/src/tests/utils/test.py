@@ -31,12 +31,18 @@ Author: Adolfo Gómez, dkmaster at dkmon dot com
 # pyright: reportUnknownMemberType=false
 import typing
 import logging
+from unittest import mock
 
 from django.test import TestCase, TransactionTestCase
 from django.test.client import Client, AsyncClient  # type: ignore   # Pylance does not know about AsyncClient, but it is there
 from django.http.response import HttpResponse
 from django.conf import settings
+from uds.core.auths.groups_manager import GroupMatchers
 from uds.core.environment import Environment
+from uds.core.util.cache import Cache
+from uds.core.util.bulk_buffer import BulkBuffer
+from uds.models.network import NetworksIndex
+from uds.models.servers import ServerTokenIndex
 
 from uds.core.managers.crypto import CryptoManager
 
@@ -229,6 +235,12 @@ class UDSTestCaseMixin:
     client: UDSClient
     async_client: UDSAsyncClient
 
+    # Buffered rows (i.e. logs and stats) are written when the buffer is flushed by the test code, and discarded
+    # on teardown. Tests that need them on database as soon as they are added disable buffered writes.
+    # Background flushes would write outside of the test transaction, so only enabled on tests that need them
+    buffered_writes: typing.ClassVar[bool] = True
+    background_flushes: typing.ClassVar[bool] = False
+
     @staticmethod
     def add_middleware(middleware: str) -> None:
         if middleware not in settings.MIDDLEWARE:
@@ -242,6 +254,20 @@ class UDSTestCaseMixin:
         except ValueError:
             pass  # Not present
 
+    def _post_teardown(self) -> None:
+        # Buffered rows not flushed by the test are discarded, so they are not written on the next one
+        # (flush lock waits for a background flush in progress, if any, before database is cleaned)
+        for buffer in list(BulkBuffer._buffers):
+            with buffer._flush_lock:
+                buffer._pending.clear()
+        super()._post_teardown()  # pyright: ignore[reportAttributeAccessIssue]
+        # In-process cache tier is not rolled back with database, so clean it between tests
+        Cache.store().flush_local()
+        # Same for server tokens, networks and groups indexes, rollbacks do not trigger deletion signals
+        ServerTokenIndex.manager().clear()
+        NetworksIndex.manager().clear()
+        GroupMatchers.manager().clear()
+
 
 class UDSTestCase(UDSTestCaseMixin, TestCase):  # pyright: ignore   # Overrides superclass client
     @classmethod
@@ -260,7 +286,18 @@ class UDSTransactionTestCase(UDSTestCaseMixin, TransactionTestCase):  # pyright:
         setupClass(cls)
 
 
-# pylint: disable=unused-argument
 def setupClass(cls: typing.Union[type[UDSTestCase], type[UDSTransactionTestCase]]) -> None:
-    # Nothing right now
-    pass
+    patchers = [mock.patch.object(BulkBuffer, 'enabled', cls.buffered_writes)]
+    if not cls.background_flushes:
+        patchers.append(mock.patch.object(BulkBuffer, '_ensure_thread'))
+    for patcher in patchers:
+        patcher.start()
+        cls.addClassCleanup(patcher.stop)
+    # Flusher threads (of long lived buffers, as the log one) started by previous tests must not write on these ones
+    _stop_flushers()
+    cls.addClassCleanup(_stop_flushers)
+
+
+def _stop_flushers() -> None:
+    for buffer in list(BulkBuffer._buffers):
+        buffer._stop_thread()
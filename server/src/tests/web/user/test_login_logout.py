@@ -48,6 +48,8 @@ class WebLoginLogoutTest(test.WEBTestCase):
     Test WEB login and logout
     """
 
+    buffered_writes = False  # Login logs are checked as soon as they are written
+
     def assertInvalidLogin(self, response: 'HttpResponse') -> None:
         # Returns login page with a message on uds.js
         self.assertContains(response, '<svg', status_code=200)
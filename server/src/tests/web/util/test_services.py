@@ -36,9 +36,12 @@ import random
 import typing
 from unittest import mock
 
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
 from uds import models
 from uds.core import consts, types
-from uds.web.util import services
+from uds.web.util import services, services_cache
 
 from ...fixtures import authenticators as fixtures_authenticators
 from ...fixtures import services as fixtures_services
@@ -345,3 +348,101 @@ class TestGetServicesData(UDSTransactionTestCase):
         self.assertEqual([t['priority'] for t in result_services[0]['transports']], [0, 1, 2])
         
         
+
+    def test_services_cache(self) -> None:
+        for _i in range(10):
+            fixtures_services.create_db_cache_userservices(count=1, user=self.user, groups=self.groups)
+        stats = services_cache.ServicesCacheStats.manager()
+        hits, misses = stats.hits, stats.misses
+
+        with CaptureQueriesContext(connection) as first:
+            data = services.get_services_info_dict(self.request)
+        with CaptureQueriesContext(connection) as second:
+            cached_data = services.get_services_info_dict(self.request)
+
+        self.assertEqual(stats.misses - misses, 1)
+        self.assertEqual(stats.hits - hits, 1)
+        self.assertEqual(cached_data, data)
+        self.assertLess(len(second), len(first) // 4)
+
+        # Other user with same groups shares the list
+        other_user = fixtures_authenticators.create_db_users(self.auth, 1, groups=self.groups)[0]
+        self.request.user = other_user
+        other_data = services.get_services_info_dict(self.request)
+        self.assertEqual(stats.hits - hits, 2)
+        self.assertEqual(len(other_data['services']), 10)
+        # But in use info is per user
+        self.assertTrue(all(not s['in_use'] for s in other_data['services']))
+
+    def test_services_cache_in_use(self) -> None:
+        user_service = fixtures_services.create_db_cache_userservices(count=1, user=self.user, groups=self.groups)[0]
+        user_service.in_use = False
+        user_service.save()
+
+        self.assertFalse(services.get_services_info_dict(self.request)['services'][0]['in_use'])
+        user_service.in_use = True
+        user_service.save()
+        # Not invalidated by user service changes, but in use is computed on every request
+        hits = services_cache.ServicesCacheStats.manager().hits
+        self.assertTrue(services.get_services_info_dict(self.request)['services'][0]['in_use'])
+        self.assertEqual(services_cache.ServicesCacheStats.manager().hits - hits, 1)
+
+    def test_services_cache_invalidation(self) -> None:
+        pool = fixtures_services.create_db_cache_userservices(
+            count=1, user=self.user, groups=self.groups
+        )[0].deployed_service
+        self.assertEqual(len(services.get_services_info_dict(self.request)['services']), 1)
+
+        # Pool changes
+        pool.name = 'Changed name'
+        pool.save()
+        self.assertEqual(services.get_services_info_dict(self.request)['services'][0]['name'], 'Changed name')
+
+        # Transport changes
+        transport = pool.transports.first()
+        assert transport is not None
+        pool.transports.remove(transport)
+        self.assertEqual(services.get_services_info_dict(self.request)['services'], [])
+        pool.transports.add(transport)
+        self.assertEqual(len(services.get_services_info_dict(self.request)['services']), 1)
+
+        # Group assignation changes
+        pool.assignedGroups.clear()
+        self.assertEqual(services.get_services_info_dict(self.request)['services'], [])
+
+    def test_services_cache_invalidations_coalesced(self) -> None:
+        pool = fixtures_services.create_db_cache_userservices(
+            count=1, user=self.user, groups=self.groups
+        )[0].deployed_service
+        publication = pool.publications.first()
+        assert publication is not None
+        transport = pool.transports.first()
+        assert transport is not None
+        stats = services_cache.ServicesCacheStats.manager()
+
+        # Runtime updates of fields not used on skeletons (i.e. on every publication check) do not invalidate
+        invalidations = stats.invalidations
+        publication.save(update_fields=['data'])
+        publication.save(update_fields=['state_date'])
+        self.assertEqual(stats.invalidations, invalidations)
+
+        # Relation changes invalidate once (not on pre_* signals)
+        pool.transports.remove(transport)
+        self.assertEqual(stats.invalidations, invalidations + 1)
+
+        # And a lot of changes on a transaction, just once on commit
+        with transaction.atomic():
+            pool.transports.add(transport)
+            pool.name = 'Changed name'
+            pool.save()
+            self.assertEqual(stats.invalidations, invalidations + 1)
+        self.assertEqual(stats.invalidations, invalidations + 2)
+
+    def test_services_cache_disabled(self) -> None:
+        fixtures_services.create_db_cache_userservices(count=1, user=self.user, groups=self.groups)
+        stats = services_cache.ServicesCacheStats.manager()
+        hits, misses = stats.hits, stats.misses
+        with mock.patch.object(consts.cache, 'SERVICES_INFO_CACHE_TIMEOUT', 0):
+            services.get_services_info_dict(self.request)
+            services.get_services_info_dict(self.request)
+        self.assertEqual((stats.hits - hits, stats.misses - misses), (0, 0))
@@ -34,16 +34,16 @@ import logging
 import codecs
 
 from django.contrib.sessions.backends.base import SessionBase
-from django.contrib.sessions.backends.db import SessionStore
 
 from uds.core import consts, types
 from uds.core.util.config import GlobalConfig
 from uds.core.auths.auth import root_user
 from uds.core.util import net
-from uds.models import Authenticator, User
+from uds.models import User
 from uds.core.managers.crypto import CryptoManager
 
 from ..core.exceptions.rest import AccessDenied
+from .sessions import session_store
 
 
 # Not imported at runtime, just for type checking
@@ -87,7 +87,7 @@ class Handler:
     _args: list[str]
     _kwargs: dict[str, typing.Any]  # This are the "path" split by /, that is, the REST invocation arguments
     _headers: dict[str, str]
-    _session: typing.Optional[SessionStore]
+    _session: typing.Optional[SessionBase]
     _auth_token: typing.Optional[str]
     _user: 'User'
 
@@ -123,7 +123,7 @@ class Handler:
         if self.authenticated:  # Only retrieve auth related data on authenticated handlers
             try:
                 self._auth_token = self._request.headers.get(consts.auth.AUTH_TOKEN_HEADER, '')
-                self._session = SessionStore(session_key=self._auth_token)
+                self._session = session_store()(session_key=self._auth_token)
                 if 'REST' not in self._session:
                     raise Exception()  # No valid session, so auth_token is also invalid
             except Exception:  # Couldn't authenticate
@@ -203,7 +203,7 @@ class Handler:
         return self._args
 
     @property
-    def session(self) -> 'SessionStore':
+    def session(self) -> 'SessionBase':
         if self._session is None:
             raise Exception('No session available')
         return self._session
@@ -272,7 +272,7 @@ class Handler:
         :param is_admin: If user is considered admin or not
         :param staf_member: If user is considered staff member or not
         """
-        session = SessionStore()
+        session = session_store()()
         Handler.set_rest_auth(
             session,
             id_auth,
@@ -327,6 +327,10 @@ class Handler:
                     self._session['REST'][key] = value
                 self._session.accessed = True
                 self._session.save()
+                if self._session.session_key != self._auth_token:
+                    # Token sessions get a new token on every change
+                    self._auth_token = self._session.session_key
+                    self.add_header(consts.auth.AUTH_TOKEN_HEADER, typing.cast(str, self._auth_token))
         except Exception:
             logger.exception('Got an exception setting session value %s to %s', key, value)
 
@@ -368,7 +372,7 @@ class Handler:
         ):
             return root_user()
 
-        return Authenticator.objects.get(pk=authId).users.get(name=username)
+        return User.objects.get(manager_id=authId, name=username)
 
     def get_param(self, *names: str) -> str:
         """
@@ -39,7 +39,7 @@ from django.utils.translation import gettext_lazy as _
 from uds.REST.model import ModelHandler
 from uds.core import types
 import uds.core.types.permissions
-from uds.core.util import permissions, ensure
+from uds.core.util import ensure
 from uds.models import Account
 from .accountsusage import AccountsUsage
 
@@ -79,7 +79,7 @@ class Accounts(ModelHandler):
             'tags': [tag.tag for tag in item.tags.all()],
             'comments': item.comments,
             'time_mark': item.time_mark,
-            'permission': permissions.effective_permissions(self._user, item),
+            'permission': self.get_permissions(item),
         }
 
     def get_gui(self, type_: str) -> list[typing.Any]:
@@ -36,7 +36,7 @@ import typing
 from django.utils.translation import gettext as _
 
 from uds.core import exceptions, types
-from uds.core.util import ensure, permissions
+from uds.core.util import ensure
 from uds.core.util.model import process_uuid
 from uds.models import Account, AccountUsage
 from uds.REST.model import DetailHandler
@@ -79,7 +79,7 @@ class AccountsUsage(DetailHandler):  # pylint: disable=too-many-public-methods
     def get_items(self, parent: 'Model', item: typing.Optional[str]) -> types.rest.ManyItemsDictType:
         parent = ensure.is_instance(parent, Account)
         # Check what kind of access do we have to parent provider
-        perm = permissions.effective_permissions(self._user, parent)
+        perm = self.get_permissions(parent)
         try:
             if not item:
                 return [AccountsUsage.usageToDict(k, perm) for k in parent.usages.all()]
@@ -233,10 +233,8 @@ class Test(ActorV3Action):
         try:
             if self._params.get('type') == consts.actor.UNMANAGED:
                 Service.objects.get(token=self._params['token'])
-            else:
-                Server.objects.get(
-                    token=self._params['token'], type=types.servers.ServerType.ACTOR
-                )  # Not assigned, because only needs check
+            elif not Server.validate_token(self._params['token'], types.servers.ServerType.ACTOR):
+                raise Exception('Invalid token')
             clear_failed_ip_counter(self._request)
         except Exception:
             # Increase failed attempts
@@ -513,9 +511,10 @@ class BaseReadyChange(ActorV3Action):
         # Generates a certificate and send it to client.
         privateKey, cert, password = security.create_self_signed_cert(self._params['ip'])
         # Store certificate with userService
-        userService.properties['cert'] = cert
-        userService.properties['priv'] = privateKey
-        userService.properties['priv_passwd'] = password
+        with userService.properties.buffered() as p:
+            p['cert'] = cert
+            p['priv'] = privateKey
+            p['priv_passwd'] = password
 
         return ActorV3Action.actorCertResult(privateKey, cert, password)
 
@@ -727,13 +726,9 @@ class Ticket(ActorV3Action):
     def action(self) -> dict[str, typing.Any]:
         logger.debug('Args: %s,  Params: %s', self._args, self._params)
 
-        try:
-            # Simple check that token exists
-            Server.objects.get(
-                token=self._params['token'], type=types.servers.ServerType.ACTOR
-            )  # Not assigned, because only needs check
-        except Server.DoesNotExist:
-            raise exceptions.rest.BlockAccess() from None  # If too many blocks...
+        # Simple check that token exists
+        if not Server.validate_token(self._params['token'], types.servers.ServerType.ACTOR):
+            raise exceptions.rest.BlockAccess()  # If too many blocks...
 
         try:
             return ActorV3Action.actor_result(TicketStore.get(self._params['ticket'], invalidate=True))
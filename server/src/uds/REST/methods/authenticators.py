@@ -42,7 +42,7 @@ from django.utils.translation import gettext_lazy as _
 from uds.core import auths, consts, exceptions, types
 from uds.core.environment import Environment
 from uds.core.ui import gui
-from uds.core.util import ensure, permissions
+from uds.core.util import ensure
 from uds.core.util.model import process_uuid
 from uds.models import MFA, Authenticator, Network, Tag
 from uds.REST.model import ModelHandler
@@ -62,10 +62,17 @@ logger = logging.getLogger(__name__)
 class Authenticators(ModelHandler):
     model = Authenticator
     # Custom get method "search" that requires authenticator id
-    custom_methods = [('search', True)]
+    custom_methods = [('search', True), ('clear_cache', True)]
     detail = {'users': Users, 'groups': Groups}
     save_fields = ['name', 'comments', 'tags', 'priority', 'small_name', 'mfa_id:_']
 
+    query_fields = {
+        'name': 'name',
+        'comments': 'comments',
+        'priority': 'priority',
+        'small_name': 'small_name',
+    }
+
     table_title = _('Authenticators')
     table_fields = [
         {'numeric_id': {'title': _('Id'), 'visible': True}},
@@ -177,7 +184,7 @@ class Authenticators(ModelHandler):
                     'type': type_.mod_type(),
                     'type_name': type_.mod_name(),
                     'type_info': self.type_as_dict(type_),
-                    'permission': permissions.effective_permissions(self._user, item),
+                    'permission': self.get_permissions(item),
                 }
             )
         return v
@@ -230,6 +237,15 @@ class Authenticators(ModelHandler):
             return [{'id': _('Too many results...'), 'name': _('Refine your query')}]
             # self.invalidResponseException('{}'.format(e))
 
+    def clear_cache(self, item: 'Model') -> str:
+        """
+        Custom method that discards users and groups information cached by an authenticator
+        """
+        item = ensure.is_instance(item, Authenticator)
+        self.ensure_has_access(item, types.permissions.PermissionType.MANAGEMENT)
+        item.get_instance().clear_cache()
+        return consts.OK
+
     def test(self, type_: str) -> typing.Any:
         authType = auths.factory().lookup(type_)
         if not authType:
@@ -38,7 +38,7 @@ from django.db import IntegrityError
 from django.utils.translation import gettext as _
 
 from uds.core import exceptions
-from uds.core.util import ensure, permissions
+from uds.core.util import ensure
 from uds.core.util.model import process_uuid, sql_now
 from uds.models.calendar import Calendar
 from uds.models.calendar_rule import CalendarRule, FrequencyInfo
@@ -81,7 +81,7 @@ class CalendarRules(DetailHandler):  # pylint: disable=too-many-public-methods
     def get_items(self, parent: 'Model', item: typing.Optional[str]) -> typing.Any:
         parent = ensure.is_instance(parent, Calendar)
         # Check what kind of access do we have to parent provider
-        perm = permissions.effective_permissions(self._user, parent)
+        perm = self.get_permissions(parent)
         try:
             if item is None:
                 return [CalendarRules.ruleToDict(k, perm) for k in parent.rules.all()]
@@ -39,7 +39,7 @@ from django.utils.translation import gettext_lazy as _
 from uds.core import types, exceptions
 from uds.core.consts.images import DEFAULT_THUMB_BASE64
 from uds.core.ui import gui
-from uds.core.util import ensure, permissions
+from uds.core.util import ensure
 from uds.core.util.model import process_uuid
 from uds.core.types.states import State
 from uds.models import Image, MetaPool, ServicePoolGroup
@@ -82,6 +82,15 @@ class MetaPools(ModelHandler):
         'transport_grouping',
     ]
 
+    query_fields = {
+        'name': 'name',
+        'short_name': 'short_name',
+        'comments': 'comments',
+        'visible': 'visible',
+        'policy': 'policy',
+        'ha_policy': 'ha_policy',
+    }
+
     table_title = _('Meta Pools')
     table_fields = [
         {'name': {'title': _('Name')}},
@@ -147,7 +156,7 @@ class MetaPools(ModelHandler):
             'visible': item.visible,
             'policy': item.policy,
             'fallbackAccess': item.fallbackAccess,
-            'permission': permissions.effective_permissions(self._user, item),
+            'permission': self.get_permissions(item),
             'calendar_message': item.calendar_message,
             'transport_grouping': item.transport_grouping,
             'ha_policy': item.ha_policy,
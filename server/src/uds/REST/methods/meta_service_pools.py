@@ -162,32 +162,21 @@ class MetaAssignedService(DetailHandler):
 
     def get_items(self, parent: 'Model', item: typing.Optional[str]) -> types.rest.ManyItemsDictType:
         parent = ensure.is_instance(parent, models.MetaPool)
-        def assignedUserServicesForPools() -> (
-            typing.Generator[
-                tuple[models.UserService, typing.Optional[dict[str, typing.Any]]], None, None
-            ]
-        ):
+        def assignedUserServicesForPools() -> typing.Generator[models.UserService, None, None]:
             for m in parent.members.filter(enabled=True):
-                properties: dict[str, typing.Any] = {
-                    k: v
-                    for k, v in models.Properties.objects.filter(
-                        owner_type='userservice',
-                        owner_id__in=m.pool.assigned_user_services().values_list('uuid', flat=True),
-                    ).values_list('key', 'value')
-                }
-                for u in (
+                for u in models.UserService.prefetch_properties(
                     m.pool.assigned_user_services()
                     .filter(state__in=State.VALID_STATES)
                     .prefetch_related('deployed_service', 'publication')
                 ):
-                    yield u, properties.get(u.uuid, {})
+                    yield u
 
         try:
             if not item:  # All items
                 result: dict[str, typing.Any] = {}
 
-                for k, props in assignedUserServicesForPools():
-                    result[k.uuid] = MetaAssignedService.item_as_dict(parent, k, props)
+                for k in assignedUserServicesForPools():
+                    result[k.uuid] = MetaAssignedService.item_as_dict(parent, k, None)  # Properties are already loaded
                 return list(result.values())
 
             return MetaAssignedService.item_as_dict(
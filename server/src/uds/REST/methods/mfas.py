@@ -40,7 +40,7 @@ from django.utils.translation import gettext_lazy as _
 from uds import models
 from uds.core import mfas, types
 from uds.core.environment import Environment
-from uds.core.util import ensure, permissions
+from uds.core.util import ensure
 from uds.REST.model import ModelHandler
 
 if typing.TYPE_CHECKING:
@@ -116,5 +116,5 @@ class MFA(ModelHandler):
             'comments': item.comments,
             'type': type_.mod_type(),
             'type_name': type_.mod_name(),
-            'permission': permissions.effective_permissions(self._user, item),
+            'permission': self.get_permissions(item),
         }
@@ -37,7 +37,7 @@ from django.utils.translation import gettext_lazy as _, gettext
 
 from uds.models import Network
 from uds.core import types
-from uds.core.util import permissions, ensure
+from uds.core.util import ensure
 
 from ..model import ModelHandler
 
@@ -58,6 +58,11 @@ class Networks(ModelHandler):
     model = Network
     save_fields = ['name', 'net_string', 'tags']
 
+    query_fields = {
+        'name': 'name',
+        'net_string': 'net_string',
+    }
+
     table_title = _('Networks')
     table_fields = [
         {
@@ -110,5 +115,5 @@ class Networks(ModelHandler):
             'net_string': item.net_string,
             'transports_count': item.transports.count(),
             'authenticators_count': item.authenticators.count(),
-            'permission': permissions.effective_permissions(self._user, item),
+            'permission': self.get_permissions(item),
         }
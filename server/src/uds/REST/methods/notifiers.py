@@ -40,7 +40,7 @@ from django.utils.translation import gettext_lazy as _
 from uds.core import messaging, types
 from uds.core.environment import Environment
 from uds.core.ui import gui
-from uds.core.util import ensure, permissions
+from uds.core.util import ensure
 from uds.models import LogLevel, Notifier
 from uds.REST.model import ModelHandler
 
@@ -124,5 +124,5 @@ class Notifiers(ModelHandler):
             'comments': item.comments,
             'type': type_.mod_type(),
             'type_name': type_.mod_name(),
-            'permission': permissions.effective_permissions(self._user, item),
+            'permission': self.get_permissions(item),
         }
@@ -38,7 +38,7 @@ from django.utils.translation import gettext, gettext_lazy as _
 
 from uds.core import exceptions, osmanagers, types
 from uds.core.environment import Environment
-from uds.core.util import ensure, permissions
+from uds.core.util import ensure
 from uds.models import OSManager
 from uds.REST.model import ModelHandler
 
@@ -76,7 +76,7 @@ class OsManagers(ModelHandler):
                 type_.servicesType
             ],  # A list for backward compatibility. TODO: To be removed when admin interface is changed
             'comments': osm.comments,
-            'permission': permissions.effective_permissions(self._user, osm),
+            'permission': self.get_permissions(osm),
         }
 
     def item_as_dict(self, item: 'Model') -> types.rest.ItemDictType:
@@ -40,7 +40,7 @@ from django.utils.translation import gettext_lazy as _
 import uds.core.types.permissions
 from uds.core import exceptions, services, types
 from uds.core.environment import Environment
-from uds.core.util import ensure, permissions
+from uds.core.util import ensure
 from uds.core.types.states import State
 from uds.models import Provider, Service, UserService
 from uds.REST.model import ModelHandler
@@ -66,6 +66,12 @@ class Providers(ModelHandler):
 
     save_fields = ['name', 'comments', 'tags']
 
+    query_fields = {
+        'name': 'name',
+        'comments': 'comments',
+        'maintenance_mode': 'maintenance_mode',
+    }
+
     table_title = _('Service providers')
 
     # Table info fields
@@ -109,7 +115,7 @@ class Providers(ModelHandler):
             'type': type_.mod_type(),
             'type_name': type_.mod_name(),
             'comments': item.comments,
-            'permission': permissions.effective_permissions(self._user, item),
+            'permission': self.get_permissions(item),
         }
 
     def validate_delete(self, item: 'Model') -> None:
@@ -136,7 +142,7 @@ class Providers(ModelHandler):
         """
         for s in Service.objects.all():
             try:
-                perm = permissions.effective_permissions(self._user, s)
+                perm = self.get_permissions(s)
                 if perm >= uds.core.types.permissions.PermissionType.READ:
                     yield DetailServices.service_to_dict(s, perm, True)
             except Exception:
@@ -40,6 +40,7 @@ from uds.core import consts, types, ui
 from uds.core.util import net, permissions, ensure
 from uds.core.util.model import sql_now, process_uuid
 from uds.core.exceptions.rest import NotFound, RequestError
+from uds.models.servers import ServerTokenIndex
 from uds.REST.model import DetailHandler, ModelHandler
 
 if typing.TYPE_CHECKING:
@@ -295,6 +296,8 @@ class ServersServers(DetailHandler):
                         mac=mac,
                         stamp=sql_now(),  # Modified now
                     )
+                    # Bulk updates do not emit signals
+                    ServerTokenIndex.manager().invalidate_server(process_uuid(item))
                 except Exception:
                     raise self.invalid_item_response() from None
 
@@ -486,7 +489,7 @@ class ServersGroups(ModelHandler):
             'type_name': types.servers.ServerType(item.type).name.capitalize(),
             'tags': [tag.tag for tag in item.tags.all()],
             'servers_count': item.servers.count(),
-            'permission': permissions.effective_permissions(self._user, item),
+            'permission': self.get_permissions(item),
         }
 
     def delete_item(self, item: 'Model') -> None:
@@ -41,7 +41,7 @@ from uds import models
 
 from uds.core import exceptions, types
 import uds.core.types.permissions
-from uds.core.util import log, permissions, ensure
+from uds.core.util import log, ensure
 from uds.core.util.model import process_uuid
 from uds.core.environment import Environment
 from uds.core.consts.images import DEFAULT_THUMB_BASE64
@@ -115,7 +115,7 @@ class Services(DetailHandler):  # pylint: disable=too-many-public-methods
     def get_items(self, parent: 'Model', item: typing.Optional[str]) -> types.rest.ManyItemsDictType:
         parent = ensure.is_instance(parent, models.Provider)
         # Check what kind of access do we have to parent provider
-        perm = permissions.effective_permissions(self._user, parent)
+        perm = self.get_permissions(parent)
         try:
             if item is None:
                 return [Services.service_to_dict(k, perm) for k in parent.services.all()]
@@ -42,7 +42,7 @@ from uds.core import types, exceptions, consts
 from uds.core.managers.userservice import UserServiceManager
 from uds.core.ui import gui
 from uds.core.consts.images import DEFAULT_THUMB_BASE64
-from uds.core.util import log, permissions, ensure
+from uds.core.util import log, ensure
 from uds.core.util.config import GlobalConfig
 from uds.core.util.model import sql_now, process_uuid
 from uds.core.types.states import State
@@ -102,6 +102,17 @@ class ServicesPools(ModelHandler):
 
     remove_fields = ['osmanager_id', 'service_id']
 
+    query_fields = {
+        'name': 'name',
+        'short_name': 'short_name',
+        'comments': 'comments',
+        'state': 'state',
+        'visible': 'visible',
+        'show_transports': 'show_transports',
+        'user_services_count': 'valid_count',
+        'user_services_in_preparation': 'preparing_count',
+    }
+
     table_title = _('Service Pools')
     table_fields = [
         {'name': {'title': _('Name')}},
@@ -257,7 +268,7 @@ class ServicesPools(ModelHandler):
             val['user_services_in_preparation'] = preparing_count
             val['tags'] = [tag.tag for tag in item.tags.all()]
             val['restrained'] = restrained
-            val['permission'] = permissions.effective_permissions(self._user, item)
+            val['permission'] = self.get_permissions(item)
             val['info'] = Services.service_info(item.service)
             val['pool_group_id'] = poolGroupId
             val['pool_group_name'] = poolGroupName
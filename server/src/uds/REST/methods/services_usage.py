@@ -62,8 +62,7 @@ class ServicesUsage(DetailHandler):
         :param item: item to convert
         :param is_cache: If item is from cache or not
         """
-        with item.properties as p:
-            props = dict(p)
+        props = dict(item.properties)
 
         if item.user is None:
             owner = ''
@@ -104,9 +103,11 @@ class ServicesUsage(DetailHandler):
 
             return [
                 ServicesUsage.item_as_dict(k)
-                for k in userServicesQuery.filter(state=State.USABLE)
-                .order_by('creation_date')
-                .prefetch_related('deployed_service', 'deployed_service__service', 'user', 'user__manager')
+                for k in UserService.prefetch_properties(
+                    userServicesQuery.filter(state=State.USABLE)
+                    .order_by('creation_date')
+                    .prefetch_related('deployed_service', 'deployed_service__service', 'user', 'user__manager')
+                )
             ]
 
         except Exception:
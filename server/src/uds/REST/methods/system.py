@@ -39,12 +39,19 @@ import typing
 
 from uds import models
 from uds.core import exceptions, types
-from uds.core.util import permissions
+from uds.core.auths.groups_manager import GroupMatchers
+from uds.core.managers.userservice import CacheClaimStats
+from uds.core.services.generics.dynamic.poller import StatePollerStats
+from uds.core.util import permissions, security
 from uds.core.util.cache import Cache
 from uds.core.util.model import process_uuid, sql_now
 from uds.core.types.states import State
 from uds.core.util.stats import counters
+from uds.core.workers.deferred_deletion import DeferredDeletionWorker
+from uds.models.network import NetworksIndex
+from uds.models.servers import TokenValidationStats
 from uds.REST import Handler
+from uds.web.util.services_cache import ServicesCacheStats
 
 logger = logging.getLogger(__name__)
 
@@ -113,6 +120,7 @@ class System(Handler):
     {
         'paths': [
             "/system/overview", "Returns a json object with the number of services, service pools, users, etc",
+            "/system/performance", "Returns a json object with the caches counters and times of this server process",
             "/system/stats/assigned", "Returns a chart of assigned services (all pools)",
             "/system/stats/inuse", "Returns a chart of in use services (all pools)",
             "/system/stats/cached", "Returns a chart of cached services (all pools)",
@@ -133,6 +141,7 @@ class System(Handler):
 
     help_paths = [
         ('overview', ''),
+        ('performance', ''),
         ('stats/assigned', ''),
         ('stats/inuse', ''),
         ('stats/cached', ''),
@@ -169,6 +178,20 @@ class System(Handler):
                     'user_services': user_services,
                     'restrained_services_pools': restrained_services_pools,
                 }
+            if self._args[0] == 'performance':  # Caches counters of this process
+                if not self._user.is_admin:
+                    raise exceptions.rest.AccessDenied()
+                return {
+                    'cache': Cache.stats(),
+                    'services_cache': ServicesCacheStats.manager().as_dict(),
+                    'http_connections': security.HTTPConnectionsStats.manager().as_dict(),
+                    'state_poller': StatePollerStats.manager().as_dict(),
+                    'deferred_deletion': DeferredDeletionWorker.report(),
+                    'cache_claims': CacheClaimStats.manager().as_dict(),
+                    'server_tokens': TokenValidationStats.manager().as_dict(),
+                    'networks': NetworksIndex.manager().as_dict(),
+                    'groups': GroupMatchers.manager().as_dict(),
+                }
 
         if len(self.args) in (2, 3):
             # Extract pool if provided
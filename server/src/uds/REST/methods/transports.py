@@ -40,7 +40,7 @@ from django.utils.translation import gettext_lazy as _
 
 from uds.core import consts, transports, types, ui
 from uds.core.environment import Environment
-from uds.core.util import ensure, permissions
+from uds.core.util import ensure
 from uds.models import Network, ServicePool, Transport
 from uds.REST.model import ModelHandler
 
@@ -64,6 +64,14 @@ class Transports(ModelHandler):
         'label',
     ]
 
+    query_fields = {
+        'name': 'name',
+        'comments': 'comments',
+        'priority': 'priority',
+        'label': 'label',
+        'net_filtering': 'net_filtering',
+    }
+
     table_title = _('Transports')
     table_fields = [
         {'priority': {'title': _('Priority'), 'type': 'numeric', 'width': '6em'}},
@@ -168,7 +176,7 @@ class Transports(ModelHandler):
             'type': type_.mod_type(),
             'type_name': type_.mod_name(),
             'protocol': type_.protocol,
-            'permission': permissions.effective_permissions(self._user, item),
+            'permission': self.get_permissions(item),
         }
 
     def pre_save(self, fields: dict[str, typing.Any]) -> None:
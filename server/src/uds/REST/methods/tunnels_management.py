@@ -37,7 +37,7 @@ from django.utils.translation import gettext_lazy as _
 
 import uds.core.types.permissions
 from uds.core import types, consts
-from uds.core.util import permissions, validators, ensure
+from uds.core.util import validators, ensure
 from uds.core.util.model import process_uuid
 from uds import models
 from uds.REST.model import DetailHandler, ModelHandler
@@ -197,7 +197,7 @@ class Tunnels(ModelHandler):
             'tags': [tag.tag for tag in item.tags.all()],
             'transports_count': item.transports.count(),
             'servers_count': item.servers.count(),
-            'permission': permissions.effective_permissions(self._user, item),
+            'permission': self.get_permissions(item),
         }
 
     def pre_save(self, fields: dict[str, typing.Any]) -> None:
@@ -239,7 +239,7 @@ class Tunnels(ModelHandler):
                 'name': i.hostname,
             }
             for i in models.Server.objects.filter(type=types.servers.ServerType.TUNNEL)
-            if permissions.effective_permissions(self._user, i)
+            if self.get_permissions(i)
             >= uds.core.types.permissions.PermissionType.READ
             and i not in allServers
         ]
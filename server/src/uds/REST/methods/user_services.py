@@ -41,7 +41,7 @@ from uds import models
 from uds.core import exceptions, types
 from uds.core.managers.userservice import UserServiceManager
 from uds.core.types.states import State
-from uds.core.util import ensure, log, permissions
+from uds.core.util import ensure, log
 from uds.core.util.model import process_uuid
 from uds.REST.model import DetailHandler
 
@@ -62,6 +62,21 @@ class AssignedService(DetailHandler):
 
     custom_methods = ['reset']
 
+    query_fields = {
+        'unique_id': 'unique_id',
+        'friendly_name': 'friendly_name',
+        'state': 'state',
+        'os_state': 'os_state',
+        'state_date': 'state_date',
+        'creation_date': 'creation_date',
+        'revision': 'publication__revision',
+        'owner': 'user__name',
+        'in_use': 'in_use',
+        'in_use_date': 'in_use_date',
+        'source_host': 'src_hostname',
+        'source_ip': 'src_ip',
+    }
+
     @staticmethod
     def item_as_dict(
         item: models.UserService,
@@ -124,30 +139,22 @@ class AssignedService(DetailHandler):
         # Extract provider
         try:
             if not item:
-                # First, fetch all properties for all assigned services on this pool
-                # We can cache them, because they are going to be readed anyway...
-                properties: dict[str, typing.Any] = collections.defaultdict(dict)
-                for id, key, value in models.Properties.objects.filter(
-                    owner_type='userservice',
-                    owner_id__in=parent.assigned_user_services().values_list('uuid', flat=True),
-                ).values_list('owner_id', 'key', 'value'):
-                    properties[id][key] = value
-
+                # Properties of all assigned services are loaded at once, because they are going to be readed anyway...
                 return [
-                    AssignedService.item_as_dict(k, properties.get(k.uuid, {}))
-                    for k in parent.assigned_user_services()
-                    .all()
-                    .prefetch_related('deployed_service', 'publication', 'user')
+                    AssignedService.item_as_dict(k)
+                    for k in models.UserService.prefetch_properties(
+                        self.query_items(
+                            parent.assigned_user_services()
+                            .all()
+                            .prefetch_related('deployed_service', 'publication', 'user')
+                        )
+                    )
                 ]
             return AssignedService.item_as_dict(
                 parent.assigned_user_services().get(process_uuid(uuid=process_uuid(item))),
-                props={
-                    k: v
-                    for k, v in models.Properties.objects.filter(
-                        owner_type='userservice', owner_id=process_uuid(item)
-                    ).values_list('key', 'value')
-                },
             )
+        except exceptions.rest.RequestError:
+            raise
         except Exception as e:
             logger.exception('get_items')
             raise self.invalid_item_response() from e
@@ -267,6 +274,17 @@ class CachedService(AssignedService):
 
     custom_methods: typing.ClassVar[list[str]] = []  # Remove custom methods from assigned services
 
+    query_fields = {
+        'unique_id': 'unique_id',
+        'friendly_name': 'friendly_name',
+        'state': 'state',
+        'os_state': 'os_state',
+        'state_date': 'state_date',
+        'creation_date': 'creation_date',
+        'revision': 'publication__revision',
+        'cache_level': 'cache_level',
+    }
+
     def get_items(self, parent: 'Model', item: typing.Optional[str]) -> types.rest.ManyItemsDictType:
         parent = ensure.is_instance(parent, models.ServicePool)
         # Extract provider
@@ -274,12 +292,16 @@ class CachedService(AssignedService):
             if not item:
                 return [
                     AssignedService.item_as_dict(k, is_cache=True)
-                    for k in parent.cached_users_services()
-                    .all()
-                    .prefetch_related('deployed_service', 'publication')
+                    for k in models.UserService.prefetch_properties(
+                        self.query_items(
+                            parent.cached_users_services().all().prefetch_related('deployed_service', 'publication')
+                        )
+                    )
                 ]
             cachedService: models.UserService = parent.cached_users_services().get(uuid=process_uuid(item))
             return AssignedService.item_as_dict(cachedService, is_cache=True)
+        except exceptions.rest.RequestError:
+            raise
         except Exception as e:
             logger.exception('get_items')
             raise self.invalid_item_response() from e
@@ -471,7 +493,7 @@ class Publications(DetailHandler):
         changeLog = self._params['changelog'] if 'changelog' in self._params else None
 
         if (
-            permissions.has_access(self._user, parent, uds.core.types.permissions.PermissionType.MANAGEMENT)
+            self.has_access(parent, uds.core.types.permissions.PermissionType.MANAGEMENT)
             is False
         ):
             logger.debug('Management Permission failed for user %s', self._user)
@@ -498,7 +520,7 @@ class Publications(DetailHandler):
         """
         parent = ensure.is_instance(parent, models.ServicePool)
         if (
-            permissions.has_access(self._user, parent, uds.core.types.permissions.PermissionType.MANAGEMENT)
+            self.has_access(parent, uds.core.types.permissions.PermissionType.MANAGEMENT)
             is False
         ):
             logger.debug('Management Permission failed for user %s', self._user)
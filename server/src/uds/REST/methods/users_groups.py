@@ -80,6 +80,16 @@ def get_service_pools_for_groups(
 class Users(DetailHandler):
     custom_methods = ['servicesPools', 'userServices', 'cleanRelated']
 
+    query_fields = {
+        'name': 'name',
+        'real_name': 'real_name',
+        'comments': 'comments',
+        'state': 'state',
+        'staff_member': 'staff_member',
+        'is_admin': 'is_admin',
+        'last_access': 'last_access',
+    }
+
     def get_items(self, parent: 'Model', item: typing.Optional[str]) -> typing.Any:
         parent = ensure.is_instance(parent, Authenticator)
 
@@ -100,7 +110,7 @@ class Users(DetailHandler):
                     uuid_to_id(
                         (
                             i
-                            for i in parent.users.all().values(
+                            for i in self.query_items(parent.users.all()).values(
                                 'uuid',
                                 'name',
                                 'real_name',
@@ -145,6 +155,8 @@ class Users(DetailHandler):
             res['groups'] = [g.db_obj().uuid for g in usr.groups()]
             logger.debug('Item: %s', res)
             return res
+        except exceptions.rest.RequestError:
+            raise
         except Exception as e:
             # User not found
             raise self.invalid_item_response() from e
@@ -331,13 +343,21 @@ class Users(DetailHandler):
 class Groups(DetailHandler):
     custom_methods = ['servicesPools', 'users']
 
+    query_fields = {
+        'name': 'name',
+        'comments': 'comments',
+        'state': 'state',
+        'meta_if_any': 'meta_if_any',
+        'skip_mfa': 'skip_mfa',
+    }
+
     def get_items(self, parent: 'Model', item: typing.Optional[str]) -> types.rest.ManyItemsDictType:
         parent = ensure.is_instance(parent, Authenticator)
         try:
             multi = False
             if item is None:
                 multi = True
-                q = parent.groups.all().order_by('name')
+                q = self.query_items(parent.groups.all().order_by('name'))
             else:
                 q = parent.groups.filter(uuid=process_uuid(item))
             res: list[dict[str, typing.Any]] = []
@@ -363,6 +383,8 @@ class Groups(DetailHandler):
             result = res[0]
             result['pools'] = [v.uuid for v in get_service_pools_for_groups([i])]
             return result
+        except exceptions.rest.RequestError:
+            raise
         except Exception as e:
             logger.error('Group item not found: %s.%s: %s', parent.name, item, e)
             raise self.invalid_item_response() from e
@@ -31,8 +31,10 @@ Author: Adolfo Gómez, dkmaster at dkmon dot com
 """
 # pylint: disable=too-many-public-methods
 
+import collections.abc
 import inspect
 import logging
+import re
 import typing
 
 from django.db import models
@@ -53,6 +55,11 @@ if typing.TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+T = typing.TypeVar('T', bound=models.Model)
+
+# field:value or field~value
+FILTER_RE: typing.Final[re.Pattern[str]] = re.compile(r'^(?P<field>[a-z_]+)(?P<op>[:~])(?P<value>.*)$')
+
 
 # pylint: disable=unused-argument
 class BaseModelHandler(Handler):
@@ -60,6 +67,11 @@ class BaseModelHandler(Handler):
     Base Handler for Master & Detail Handlers
     """
 
+    _permissions: typing.Optional[permissions.PermissionsResolver] = None
+
+    # Fields of items that can be used to sort and filter lists, and the model field they come from
+    query_fields: typing.ClassVar[collections.abc.Mapping[str, str]] = {}
+
     def add_field(
         self, gui: list[typing.Any], field: typing.Union[types.rest.FieldType, list[types.rest.FieldType]]
     ) -> list[typing.Any]:
@@ -249,11 +261,89 @@ class BaseModelHandler(Handler):
         permission: 'types.permissions.PermissionType',
         root: bool = False,
     ) -> None:
-        if not permissions.has_access(self._user, obj, permission, root):
+        if not self.has_access(obj, permission, root):
             raise self.access_denied_response()
 
+    def permissions_resolver(self) -> permissions.PermissionsResolver:
+        """
+        Returns the permissions resolver of this request, so permissions of user are loaded
+        once per object type instead of once per item
+        """
+        if self._permissions is None:
+            self._permissions = permissions.PermissionsResolver(self._user)
+        return self._permissions
+
+    def has_access(
+        self,
+        obj: models.Model,
+        permission: 'types.permissions.PermissionType',
+        root: bool = False,
+    ) -> bool:
+        return self.permissions_resolver().has_access(obj, permission, root)
+
     def get_permissions(self, obj: models.Model, root: bool = False) -> int:
-        return permissions.effective_permissions(self._user, obj, root)
+        return self.permissions_resolver().effective_permissions(obj, root)
+
+    def is_query_requested(self) -> bool:
+        """
+        True if any of the sort, filter, limit or offset parameters is present on request
+        """
+        return any(
+            p in self._params for p in (consts.rest.SORT, consts.rest.FILTER, consts.rest.LIMIT, consts.rest.OFFSET)
+        )
+
+    def query_items(self, query: 'models.QuerySet[T]') -> 'models.QuerySet[T]':
+        """
+        Pushes the sort, filter, limit and offset parameters of the request (if any) down to the query,
+        and adds the total count header to the response. If none is present, query is returned as is.
+
+        Only fields declared on query_fields can be used to sort and filter.
+        """
+        if not self.is_query_requested():
+            return query
+
+        def field(name: str) -> str:
+            if name not in self.query_fields:
+                raise self.invalid_request_response(_('Invalid field: {}').format(name))
+            return self.query_fields[name]
+
+        def as_int(param: str) -> typing.Optional[int]:
+            try:
+                value = self._params.get(param)
+                return None if value is None else max(int(value), 0)
+            except (TypeError, ValueError):
+                raise self.invalid_request_response(_('Invalid value for {}').format(param)) from None
+
+        filters = self._params.get(consts.rest.FILTER, [])
+        for fltr in filters if isinstance(filters, list) else [filters]:
+            match = FILTER_RE.match(str(fltr))
+            if not match:
+                raise self.invalid_request_response(_('Invalid filter: {}').format(fltr))
+            lookup = 'exact' if match.group('op') == ':' else 'icontains'
+            try:
+                query = query.filter(**{f'{field(match.group("field"))}__{lookup}': match.group('value')})
+            except Exception as e:  # Value not valid for field, for example
+                raise self.invalid_request_response(str(e)) from e
+
+        order = [
+            ('-' if name.startswith('-') else '') + field(name.lstrip('-'))
+            for name in str(self._params.get(consts.rest.SORT, '')).split(',')
+            if name
+        ]
+        # If no sort requested, keep the order the list would have without parameters
+        # (models of UDS sort by field names only, so they are kept as names)
+        order = (
+            order
+            or [str(name) for name in query.query.order_by]
+            or [str(name) for name in query.model._meta.ordering or ()]
+        )
+        # Primary key as last sort field, so pages are stable
+        query = query.order_by(*order, 'pk')
+
+        self.add_header(consts.rest.TOTAL_COUNT_HEADER, str(query.count()))
+
+        offset, limit = as_int(consts.rest.OFFSET) or 0, as_int(consts.rest.LIMIT)
+        return query[offset : offset + limit] if limit is not None else query[offset:]
 
     def type_info(self, type_: type['Module']) -> typing.Optional[types.rest.ExtraTypeInfo]:
         """
@@ -300,7 +390,7 @@ class BaseModelHandler(Handler):
         :param fldList: List of required fields
         :return: A dictionary containing all required fields
         """
-        args: dict[str, str] = {}
+        args: dict[str, typing.Optional[str]] = {}
         default: typing.Optional[str]
         try:
             for key in fldList:
@@ -40,6 +40,7 @@ from django.utils.translation import gettext as _
 
 from uds.core import consts
 from uds.core import types
+from uds.core.util import permissions
 from uds.core.util.model import process_uuid
 from uds.REST.utils import rest_result
 
@@ -126,6 +127,17 @@ class DetailHandler(BaseModelHandler):
 
         return consts.rest.NOT_FOUND
 
+    def add_header(self, header: str, value: str) -> None:
+        # Response headers are the ones of parent handler, the one invoked by dispatcher
+        if self._parent is not None:
+            self._parent.add_header(header, value)
+
+    def permissions_resolver(self) -> permissions.PermissionsResolver:
+        # Shared with parent handler, that has already checked the permissions over parent item
+        if self._parent is not None:
+            return self._parent.permissions_resolver()
+        return super().permissions_resolver()
+
     # pylint: disable=too-many-branches,too-many-return-statements
     def get(self) -> typing.Any:
         """
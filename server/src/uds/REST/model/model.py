@@ -42,7 +42,7 @@ from uds.core import consts
 from uds.core import exceptions
 from uds.core import types
 from uds.core.module import Module
-from uds.core.util import log, permissions
+from uds.core.util import log
 from uds.models import ManagedObjectModel, Tag, TaggingMixin
 
 from .base import BaseModelHandler
@@ -200,7 +200,7 @@ class ModelHandler(BaseModelHandler):
             else:
                 requiredPermission = types.permissions.PermissionType.READ
 
-            if permissions.has_access(self._user, item, requiredPermission) is False:
+            if self.has_access(item, requiredPermission) is False:
                 logger.debug(
                     'Permission for user %s does not comply with %s',
                     self._user,
@@ -259,16 +259,15 @@ class ModelHandler(BaseModelHandler):
         if self.model_exclude is not None:
             query = query.exclude(**self.model_exclude)
 
+        if self.is_query_requested():
+            # Not readable items are filtered on database, so pages are complete
+            query = self.query_items(
+                self.permissions_resolver().filter_queryset(query, types.permissions.PermissionType.READ)
+            )
+
         for item in query:
             try:
-                if (
-                    permissions.has_access(
-                        self._user,
-                        item,
-                        types.permissions.PermissionType.READ,
-                    )
-                    is False
-                ):
+                if self.has_access(item, types.permissions.PermissionType.READ) is False:
                     continue
                 if overview:
                     yield self.item_as_dict_overview(item)
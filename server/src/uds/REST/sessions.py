@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+
+Session stores for REST authentication tokens, selected by consts.auth.REST_SESSION_MODE:
+  * db: django database sessions, a database read on every request
+  * cache: sessions stored on uds cache, so once loaded on a process they are read from its local tier
+  * token: the session itself, encrypted and signed, is the auth token. Logouts are kept on a revocation list
+"""
+import json
+import secrets
+import threading
+import time
+import typing
+import logging
+
+from django.contrib.sessions.backends.base import CreateError, SessionBase
+from django.contrib.sessions.backends.db import SessionStore as DBSessionStore
+from django.core import signing
+
+from uds.core import consts
+from uds.core.managers.crypto import CryptoManager
+from uds.core.util.cache import Cache
+
+logger = logging.getLogger(__name__)
+
+
+class RESTSessionBase(SessionBase):
+    """
+    Base for REST session stores, with the django SessionBase private helpers they use typed
+    """
+
+    if typing.TYPE_CHECKING:
+        _session_cache: dict[str, typing.Any]
+
+        def _get_session(self, no_load: bool = False) -> dict[str, typing.Any]: ...
+
+        def _get_new_session_key(self) -> str: ...
+
+
+class CacheSessionStore(RESTSessionBase):
+    """
+    REST sessions stored on uds cache. Changes and deletions are propagated to
+    the local tier of other processes by the cache invalidations
+    """
+
+    cache_owner: typing.ClassVar[str] = 'uds:rest:session'
+
+    _cache: Cache
+
+    def __init__(self, session_key: typing.Optional[str] = None) -> None:
+        super().__init__(session_key)
+        self._cache = Cache(self.cache_owner)
+
+    def load(self) -> dict[str, typing.Any]:
+        data = self._cache.get(self.session_key) if self.session_key else None
+        if data is None:
+            self._session_key = None
+            return {}
+        return data
+
+    def exists(self, session_key: str) -> bool:
+        return self._cache.get(session_key) is not None
+
+    def create(self) -> None:
+        for _ in range(10):
+            self._session_key = self._get_new_session_key()
+            try:
+                self.save(must_create=True)
+            except CreateError:
+                continue
+            self.modified = True
+            return
+        raise RuntimeError('Unable to create a new session key')
+
+    def save(self, must_create: bool = False) -> None:
+        if self.session_key is None:
+            return self.create()
+        data = self._get_session(no_load=must_create)
+        if must_create:
+            if not self._cache.add(self.session_key, data, validity=self.get_expiry_age()):
+                raise CreateError
+        else:
+            self._cache.put(self.session_key, data, validity=self.get_expiry_age())
+
+    def delete(self, session_key: typing.Optional[str] = None) -> None:
+        session_key = session_key or self.session_key
+        if session_key:
+            self._cache.remove(session_key)
+
+    @classmethod
+    def clear_expired(cls) -> None:
+        pass  # Expired entries are purged by cache cleanup
+
+
+class TokenRevocations:
+    """
+    Revoked (logged out) REST session tokens, kept until the tokens expire.
+
+    The whole list is a single cache entry, so checking a token is served from the cache local tier.
+    Revocations done on other processes are seen once the cache invalidations are checked.
+    """
+
+    cache_owner: typing.ClassVar[str] = 'uds:rest:revoked'
+    _lock: typing.ClassVar[threading.Lock] = threading.Lock()
+
+    @staticmethod
+    def _revoked() -> dict[str, float]:
+        cache = Cache(TokenRevocations.cache_owner)
+        revoked = cache.get('list', consts.cache.CACHE_NOT_FOUND)
+        if revoked is consts.cache.CACHE_NOT_FOUND:
+            # Store an empty list, so next checks are also served from local tier
+            cache.add('list', {}, validity=consts.cache.EXTREME_CACHE_TIMEOUT)
+            return {}
+        return typing.cast(dict[str, float], revoked)
+
+    @staticmethod
+    def is_revoked(token_id: str) -> bool:
+        return token_id in TokenRevocations._revoked()
+
+    @staticmethod
+    def revoke(token_id: str, until: float) -> None:
+        """
+        Adds the token to the revocation list
+
+        Raises:
+            TimeoutError: if the list is being updated by other process for too long (so nothing is lost)
+        """
+        cache = Cache(TokenRevocations.cache_owner)
+        owner = secrets.token_hex(16)
+        with TokenRevocations._lock:
+            # Serialize revocations of all processes, so none of them is lost (waits at most a few seconds)
+            for _ in range(50):
+                if cache.add('lock', owner, validity=consts.cache.SHORTEST_CACHE_TIMEOUT):
+                    break
+                time.sleep(0.1)
+            else:
+                raise TimeoutError('Could not lock the token revocations list')
+            try:
+                Cache.store().check_invalidations(force=True)  # So the list updated by others is read
+                now = time.time()
+                revoked = {k: v for k, v in TokenRevocations._revoked().items() if v > now}
+                revoked[token_id] = until
+                cache.put(
+                    'list',
+                    revoked,
+                    validity=max(int(max(revoked.values()) - now), consts.cache.EXTREME_CACHE_TIMEOUT),
+                )
+            finally:
+                # If it has expired meanwhile, it may belong to other process now
+                if cache.get('lock') == owner:
+                    cache.remove('lock')
+
+
+class TokenSessionStore(RESTSessionBase):
+    """
+    Stateless REST sessions. The session key is the session data, encrypted and signed with the first
+    of consts.auth.REST_SESSION_TOKEN_KEYS (the rest are accepted, so keys can be rotated).
+
+    Token expires after session cookie age. Saving a session creates a new token, that keeps the id of the
+    original one, so deleting the session revokes all tokens of it (until the newest one it may have expires).
+    """
+
+    salt: typing.ClassVar[str] = 'uds.REST.sessions.TokenSessionStore'
+
+    _token_id: typing.Optional[str] = None
+    _issued: float = 0
+
+    def _signer(self, key: str) -> signing.TimestampSigner:
+        return signing.TimestampSigner(key=key, salt=self.salt, fallback_keys=[])
+
+    def _decode(self, token: str) -> dict[str, typing.Any]:
+        for key in consts.auth.REST_SESSION_TOKEN_KEYS:
+            try:
+                payload = self._signer(key).unsign(token, max_age=self.get_session_cookie_age())
+            except signing.BadSignature:
+                continue
+            data = json.loads(CryptoManager.manager().symmetric_decrypt(signing.b64_decode(payload.encode()), key))
+            if TokenRevocations.is_revoked(data['i']):
+                break
+            return data
+        raise signing.BadSignature('Invalid or revoked token')
+
+    def load(self) -> dict[str, typing.Any]:
+        try:
+            data = self._decode(self.session_key or '')
+        except Exception:
+            self._session_key = None
+            return {}
+        self._token_id, self._issued = data['i'], data['t']
+        return data['d']
+
+    def exists(self, session_key: str) -> bool:
+        return False
+
+    def create(self) -> None:
+        self.modified = True
+
+    def save(self, must_create: bool = False) -> None:
+        if self._token_id is None:
+            self._token_id, self._issued = secrets.token_urlsafe(12), time.time()
+        key = consts.auth.REST_SESSION_TOKEN_KEYS[0]
+        data = json.dumps(
+            {'i': self._token_id, 't': self._issued, 'd': self._get_session(no_load=must_create)},
+            separators=(',', ':'),
+        )
+        payload = signing.b64_encode(CryptoManager.manager().symmetric_encrypt(data, key)).decode()
+        self._session_key = self._signer(key).sign(payload)
+        self.modified = False
+
+    def delete(self, session_key: typing.Optional[str] = None) -> None:
+        if session_key and session_key != self.session_key:
+            try:
+                data = self._decode(session_key)
+            except Exception:
+                return  # Already invalid
+            token_id = data['i']
+        else:
+            self._get_session()  # Ensure loaded
+            token_id = self._token_id
+            self._session_key = None
+            self._session_cache = {}
+        if token_id:
+            # Tokens of the session may have been signed again up to now, so any of them is valid until now + age
+            TokenRevocations.revoke(token_id, time.time() + self.get_session_cookie_age())
+
+    def cycle_key(self) -> None:
+        self.save()
+
+    @classmethod
+    def clear_expired(cls) -> None:
+        pass  # Nothing stored, revocations expire with the tokens
+
+
+STORES: typing.Final[dict[str, type[SessionBase]]] = {
+    'db': DBSessionStore,
+    'cache': CacheSessionStore,
+    'token': TokenSessionStore,
+}
+
+
+def session_store() -> type[SessionBase]:
+    """
+    Returns the session store class for REST sessions of consts.auth.REST_SESSION_MODE
+    """
+    try:
+        return STORES[consts.auth.REST_SESSION_MODE]
+    except KeyError:
+        logger.error('Invalid REST_SESSION_MODE %s, using db sessions', consts.auth.REST_SESSION_MODE)
+        return DBSessionStore
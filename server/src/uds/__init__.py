@@ -102,6 +102,9 @@ class UDSAppConfig(AppConfig):
         # pylint: disable=unused-import,import-outside-toplevel
         from . import REST
 
+        # pylint: disable=unused-import,import-outside-toplevel
+        from .web.util import services_cache  # Connects the services list cache invalidation signals
+
 
 default_app_config = 'uds.UDSAppConfig'
 
@@ -30,6 +30,7 @@
 """
 Author: Adolfo Gómez, dkmaster at dkmon dot com
 """
+import functools
 import logging
 import hashlib
 import secrets
@@ -50,6 +51,8 @@ from uds.core import auths, consts, exceptions, types
 from uds.core.ui import gui
 from uds.core.util import fields, model, auth as auth_utils
 
+from . import jwks
+
 if typing.TYPE_CHECKING:
     from django.http import HttpRequest
 
@@ -59,6 +62,10 @@ logger = logging.getLogger(__name__)
 PKCE_ALPHABET: typing.Final[str] = string.ascii_letters + string.digits + '-._~'
 # Length of the State parameter
 STATE_LENGTH: typing.Final[int] = 16
+# Algorithms accepted for id tokens verified with public key field certificates (never symmetric ones, nor "none")
+TOKEN_ALGORITHMS: typing.Final[list[str]] = [
+    'RS256', 'RS384', 'RS512', 'PS256', 'PS384', 'PS512', 'ES256', 'ES384', 'ES512', 'EdDSA'
+]
 
 
 @dataclasses.dataclass
@@ -85,6 +92,18 @@ class TokenInfo:
         )
 
 
+@functools.lru_cache(maxsize=32)
+def _public_keys_from_pem(pem: str) -> tuple[typing.Any, ...]:
+    """
+    Public keys of the certificates (PEM) of public key field, parsed only once
+    """
+    if pem == '':
+        return ()
+    return tuple(
+        cert.public_key() for cert in fields.get_certificates_from_field(OAuth2Authenticator.publicKey, pem)
+    )
+
+
 class OAuth2Authenticator(auths.Authenticator):
     """
     This class represents an OAuth2 Authenticator.
@@ -193,6 +212,17 @@ class OAuth2Authenticator(auths.Authenticator):
         tab=types.ui.Tab.ADVANCED,
     )
 
+    discoveryEndpoint = gui.TextField(
+        length=256,
+        label=_('Discovery endpoint'),
+        order=95,
+        tooltip=_(
+            'OpenID discovery document (.well-known/openid-configuration) of provider. Signing keys of provider will be used, along with public key'
+        ),
+        required=False,
+        tab=types.ui.Tab.ADVANCED,
+    )
+
     userNameAttr = gui.TextField(
         length=2048,
         lines=2,
@@ -223,13 +253,25 @@ class OAuth2Authenticator(auths.Authenticator):
         tab=_('Attributes'),
     )
 
-    def _get_public_keys(self) -> list[typing.Any]:  # In fact, any of the PublicKey types
-        # Get certificates in self.publicKey.value, encoded as PEM
-        # Return a list of certificates in DER format
-        if self.publicKey.value.strip() == '':
-            return []
+    def _get_public_keys(
+        self, kid: typing.Optional[str] = None
+    ) -> list[tuple[typing.Any, list[str]]]:  # In fact, any of the PublicKey types
+        """
+        Returns the keys that can have signed a token with this key id (kid), already parsed, with the
+        algorithms accepted for each one (never the one on the token header, that can be forged)
 
-        return [cert.public_key() for cert in fields.get_certificates_from_field(self.publicKey)]
+        Keys of public key field (certificates, that have no key id) are always returned. Keys of provider
+        (if discovery endpoint is set) are fetched only when not known (or expired), see jwks.ProviderKeys
+        """
+        keys: list[tuple[typing.Any, list[str]]] = [
+            (key, TOKEN_ALGORITHMS) for key in _public_keys_from_pem(self.publicKey.value.strip())
+        ]
+        if self.discoveryEndpoint.value.strip():
+            keys.extend(
+                (key.key, [key.algorithm_name])
+                for key in jwks.provider_keys(self.discoveryEndpoint.value.strip()).get(kid)
+            )
+        return keys
 
     def _code_verifier_and_challenge(self) -> tuple[str, str]:
         """Generate a code verifier and a code challenge for PKCE
@@ -407,17 +449,16 @@ class OAuth2Authenticator(auths.Authenticator):
 
         # We may have multiple public keys, try them all
         # (We should only have one, but just in case)
-        for key in self._get_public_keys():
+        for key, algorithms in self._get_public_keys(info.get('kid')):
             logger.debug('Key = %s', key)
             try:
-                payload = jwt.decode(token, key=key, audience=self.clientId.value, algorithms=[info.get('alg', 'RSA256')])  # type: ignore
+                payload = jwt.decode(token_id, key=key, audience=self.clientId.value, algorithms=algorithms)
                 # If reaches here, token is valid, raises jwt.InvalidTokenError otherwise
                 logger.debug('Payload: %s', payload)
                 if payload.get('nonce') != nonce:
                     logger.error('Nonce does not match: %s != %s', payload.get('nonce'), nonce)
-                else:
-                    logger.debug('Payload: %s', payload)
-                    # All is fine, get user & look for groups
+                    return types.auth.FAILED_AUTH
+                # All is fine, get user & look for groups
 
                 # Process attributes from payload
                 return self._process_token(payload, gm)
@@ -458,9 +499,9 @@ class OAuth2Authenticator(auths.Authenticator):
 
         if self.responseType.value == 'openid+token_id':
             # Ensure we have a public key
-            if self.publicKey.value.strip() == '':
+            if self.publicKey.value.strip() == '' and self.discoveryEndpoint.value.strip() == '':
                 raise exceptions.ui.ValidationError(
-                    gettext('Public key is required for "openid+token_id" response type')
+                    gettext('Public key or discovery endpoint is required for "openid+token_id" response type')
                 )
 
         request: 'HttpRequest' = values['_request']
@@ -487,6 +528,11 @@ class OAuth2Authenticator(auths.Authenticator):
                 raise Exception('Invalid response type')
         return auths.SUCCESS_AUTH
 
+    def clear_cache(self) -> None:
+        _public_keys_from_pem.cache_clear()
+        if self.discoveryEndpoint.value.strip():
+            jwks.provider_keys(self.discoveryEndpoint.value.strip()).invalidate()
+
     def logout(
         self,
         request: 'types.requests.ExtendedHttpRequest',  # pylint: disable=unused-argument
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+import logging
+import threading
+import time
+import typing
+
+import jwt
+import requests
+
+from uds.core import consts
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderKeys:
+    """
+    Discovery document and signing keys (jwks) of an OpenID provider, parsed and kept in memory, so tokens
+    are validated without contacting the provider.
+
+    Discovery document is fetched again when older than consts.auth.OAUTH2_DISCOVERY_CACHE_DURATION seconds, and
+    keys when older than consts.auth.OAUTH2_KEYS_CACHE_DURATION seconds or when a token signed with an unknown key
+    is received (providers rotate its keys). Keys are fetched at most once every
+    consts.auth.OAUTH2_KEYS_MIN_REFRESH_INTERVAL seconds, so tokens with forged key ids can't flood the provider.
+    If provider can't be reached, current keys are kept.
+    """
+
+    _discovery_url: str
+    _discovery: dict[str, typing.Any]
+    _discovery_expires: float
+    _keys: dict[str, jwt.PyJWK]  # By key id
+    _keys_expires: float
+    _keys_fetched: float  # Last time keys were fetched (or tried to), for rate limiting
+    _lock: threading.Lock
+
+    # Counters
+    discovery_fetches: int
+    keys_fetches: int
+    hits: int
+    misses: int  # Tokens signed with unknown keys
+
+    def __init__(self, discovery_url: str) -> None:
+        self._discovery_url = discovery_url
+        self._lock = threading.Lock()
+        self.discovery_fetches = self.keys_fetches = self.hits = self.misses = 0
+        self.invalidate()
+
+    @staticmethod
+    def _fetch(url: str) -> dict[str, typing.Any]:
+        response = requests.get(url, timeout=consts.system.COMMS_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+    def _parse_keys(self, jwks: dict[str, typing.Any]) -> dict[str, jwt.PyJWK]:
+        keys: dict[str, jwt.PyJWK] = {}
+        for n, jwk in enumerate(jwks.get('keys', [])):
+            if jwk.get('use', 'sig') != 'sig':  # Encryption keys
+                continue
+            try:
+                keys[jwk.get('kid') or f'#{n}'] = jwt.PyJWK(jwk)
+            except (jwt.PyJWKError, jwt.InvalidKeyError) as e:
+                logger.warning('Ignoring key %s of %s: %s', jwk.get('kid'), self._discovery_url, e)
+        return keys
+
+    def discovery(self) -> dict[str, typing.Any]:
+        """
+        Returns the discovery document of the provider
+
+        Raises:
+            requests.RequestException, ValueError: If it can't be fetched
+        """
+        if time.monotonic() >= self._discovery_expires:
+            discovery = self._fetch(self._discovery_url)
+            self.discovery_fetches += 1
+            self._discovery = discovery
+            self._discovery_expires = time.monotonic() + consts.auth.OAUTH2_DISCOVERY_CACHE_DURATION
+        return self._discovery
+
+    def _refresh_keys(self) -> None:
+        now = time.monotonic()
+        self._keys_fetched = now
+        try:
+            self._keys = self._parse_keys(self._fetch(self.discovery()['jwks_uri']))
+            self.keys_fetches += 1
+            self._keys_expires = now + consts.auth.OAUTH2_KEYS_CACHE_DURATION
+        except Exception as e:
+            logger.warning('Error fetching keys of %s: %s', self._discovery_url, e)
+            self._keys_expires = now + consts.auth.OAUTH2_KEYS_MIN_REFRESH_INTERVAL
+
+    def _must_refresh(self, kid: typing.Optional[str]) -> bool:
+        now = time.monotonic()
+        return now >= self._keys_expires or (
+            kid is not None
+            and kid not in self._keys
+            and now >= self._keys_fetched + consts.auth.OAUTH2_KEYS_MIN_REFRESH_INTERVAL
+        )
+
+    def get(self, kid: typing.Optional[str]) -> list[jwt.PyJWK]:
+        """
+        Returns the keys that can have signed a token, the one with this key id or all if no key id is provided
+        """
+        if self._must_refresh(kid):
+            with self._lock:
+                if self._must_refresh(kid):  # Other thread may have refreshed them meanwhile
+                    self._refresh_keys()
+
+        keys = self._keys
+        if kid is None:
+            return list(keys.values())
+        if kid in keys:
+            self.hits += 1
+            return [keys[kid]]
+        self.misses += 1
+        return []
+
+    def invalidate(self) -> None:
+        """
+        Forgets discovery document and keys, so they are fetched again on next use
+        """
+        self._discovery = {}
+        self._discovery_expires = 0.0
+        self._keys = {}
+        self._keys_expires = 0.0
+        self._keys_fetched = float('-inf')
+
+
+_providers: dict[str, ProviderKeys] = {}  # By discovery url
+_providers_lock = threading.Lock()
+
+
+def provider_keys(discovery_url: str) -> ProviderKeys:
+    """
+    Returns the keys of the provider with this discovery url, shared by all authenticators of this process
+    """
+    with _providers_lock:
+        if discovery_url not in _providers:
+            _providers[discovery_url] = ProviderKeys(discovery_url)
+        return _providers[discovery_url]
@@ -37,7 +37,7 @@ import collections.abc
 
 from django.utils.translation import gettext_noop as _
 
-from uds.core import auths, environment, exceptions, types
+from uds.core import auths, consts, environment, exceptions, types
 from uds.core.auths.auth import log_login
 from uds.core.ui import gui
 from uds.core.util import ensure, ldaputil, auth as auth_utils, fields
@@ -277,10 +277,14 @@ class RegexLdap(auths.Authenticator):
 
         return self._connection
 
-    def _stablish_connection_as(self, username: str, password: str) -> 'ldaputil.LDAPObject':
-        return ldaputil.connection(
-            username,
-            password,
+    def _pool(self) -> ldaputil.ConnectionPool:
+        """
+        Pool of connections of this authenticator, used for everything but testing the connection
+        """
+        return ldaputil.connection_pool(
+            self.get_uuid(),
+            self.username.as_str(),
+            self.password.as_str(),
             self.host.as_str(),
             port=int(self.port.as_int()),
             ssl=self.use_ssl.as_bool(),
@@ -288,6 +292,9 @@ class RegexLdap(auths.Authenticator):
             debug=False,
         )
 
+    def _stablish_connection_as(self, username: str, password: str) -> None:
+        self._pool().bind(username, password)
+
     def _get_user(self, username: str) -> typing.Optional[ldaputil.LDAPResultType]:
         """
         Searchs for the username and returns its LDAP entry
@@ -295,6 +302,10 @@ class RegexLdap(auths.Authenticator):
         @return: None if username is not found, an dictionary of LDAP entry attributes if found.
         @note: Active directory users contains the groups it belongs to in "memberOf" attribute
         """
+        user: typing.Optional[ldaputil.LDAPResultType] = self.cache.get(f'user:{username}')
+        if user is not None:
+            return user
+
         attributes = (
             [self.userid_attr.as_str()]
             + list(auth_utils.get_attributes_regex_field(self.username_attr))
@@ -303,49 +314,55 @@ class RegexLdap(auths.Authenticator):
         if self.mfa_attribute.value:
             attributes = attributes + list(auth_utils.get_attributes_regex_field(self.mfa_attribute))
 
-        user = ldaputil.first(
-            con=self._stablish_connection(),
-            base=self.ldap_base.as_str(),
-            objectClass=self.user_class.as_str(),
-            field=self.userid_attr.as_str(),
-            value=username,
-            attributes=attributes,
-            sizeLimit=LDAP_RESULT_LIMIT,
-        )
-
-        # If user attributes is split, that is, it has more than one "ldap entry", get a second entry filtering by a new attribute
-        # and add result attributes to "main" search.
-        # For example, you can have authentication in an "user" object class and attributes in an "user_attributes" object class.
-        # Note: This is very rare situation, but it ocurrs :)
-        if user and self.alternate_class.value.strip():
-            for usr in ldaputil.as_dict(
-                con=self._stablish_connection(),
+        def search(con: 'ldaputil.LDAPObject') -> typing.Optional[ldaputil.LDAPResultType]:
+            user = ldaputil.first(
+                con=con,
                 base=self.ldap_base.as_str(),
-                ldap_filter=f'(&(objectClass={self.alternate_class.value.strip()})({self.userid_attr.as_str()}={ldaputil.escape(username)}))',
+                objectClass=self.user_class.as_str(),
+                field=self.userid_attr.as_str(),
+                value=username,
                 attributes=attributes,
-                limit=LDAP_RESULT_LIMIT,
-            ):
-                for attr_name in auth_utils.get_attributes_regex_field(self.groupname_attr.as_str()):
-                    v = usr.get(attr_name)
-                    if not v:
-                        continue
-                    norm_attrname = attr_name.lower()
-                    # If already exists the field, check if it is a list to add new elements...
-                    if norm_attrname in usr:
-                        # Convert existing to list, so we can add a new value
-                        if not isinstance(user[norm_attrname], (list, tuple)):
-                            user[norm_attrname] = [user[norm_attrname]]
-
-                        # Convert values to list, if not list
-                        if not isinstance(v, collections.abc.Iterable):
-                            v = [v]
-
-                        # Now append to existing values
-                        for x in typing.cast(typing.Iterable[str], v):
-                            user[norm_attrname].append(x)
-                    else:
-                        user[norm_attrname] = v
+                sizeLimit=LDAP_RESULT_LIMIT,
+            )
 
+            # If user attributes is split, that is, it has more than one "ldap entry", get a second entry filtering by a new attribute
+            # and add result attributes to "main" search.
+            # For example, you can have authentication in an "user" object class and attributes in an "user_attributes" object class.
+            # Note: This is very rare situation, but it ocurrs :)
+            if user and self.alternate_class.value.strip():
+                for usr in ldaputil.as_dict(
+                    con=con,
+                    base=self.ldap_base.as_str(),
+                    ldap_filter=f'(&(objectClass={self.alternate_class.value.strip()})({self.userid_attr.as_str()}={ldaputil.escape(username)}))',
+                    attributes=attributes,
+                    limit=LDAP_RESULT_LIMIT,
+                ):
+                    for attr_name in auth_utils.get_attributes_regex_field(self.groupname_attr.as_str()):
+                        v = usr.get(attr_name)
+                        if not v:
+                            continue
+                        norm_attrname = attr_name.lower()
+                        # If already exists the field, check if it is a list to add new elements...
+                        if norm_attrname in usr:
+                            # Convert existing to list, so we can add a new value
+                            if not isinstance(user[norm_attrname], (list, tuple)):
+                                user[norm_attrname] = [user[norm_attrname]]
+
+                            # Convert values to list, if not list
+                            if not isinstance(v, collections.abc.Iterable):
+                                v = [v]
+
+                            # Now append to existing values
+                            for x in typing.cast(typing.Iterable[str], v):
+                                user[norm_attrname].append(x)
+                        else:
+                            user[norm_attrname] = v
+
+            return user
+
+        user = self._pool().execute(search)
+        if user is not None and consts.auth.LDAP_CACHE_TIMEOUT > 0:
+            self.cache.put(f'user:{username}', user, consts.auth.LDAP_CACHE_TIMEOUT)
         return user
 
     def _get_groups(self, user: ldaputil.LDAPResultType) -> list[str]:
@@ -453,14 +470,21 @@ class RegexLdap(auths.Authenticator):
         groups = self._get_groups(user)
         groups_manager.validate(groups)
 
+    def clear_cache(self) -> None:
+        self.cache.clear()
+
     def search_users(self, pattern: str) -> collections.abc.Iterable[types.auth.SearchResultItem]:
         try:
-            for r in ldaputil.as_dict(
-                con=self._stablish_connection(),
-                base=self.ldap_base.as_str(),
-                ldap_filter=f'(&(&(objectClass={self.user_class.as_str()})({self.userid_attr.as_str()}={ldaputil.escape(pattern)}*)))',
-                attributes=None,  # All attrs
-                limit=LDAP_RESULT_LIMIT,
+            for r in self._pool().execute(
+                lambda con: list(
+                    ldaputil.as_dict(
+                        con=con,
+                        base=self.ldap_base.as_str(),
+                        ldap_filter=f'(&(&(objectClass={self.user_class.as_str()})({self.userid_attr.as_str()}={ldaputil.escape(pattern)}*)))',
+                        attributes=None,  # All attrs
+                        limit=LDAP_RESULT_LIMIT,
+                    )
+                )
             ):
                 logger.debug('Result: %s', r)
                 yield types.auth.SearchResultItem(
@@ -32,3 +32,8 @@ Author: Adolfo Gómez, dkmaster at dkmon dot com
 # pyright: reportUnusedImport=false
 from uds.core import managers
 from .saml import SAMLAuthenticator  # import for registration on space, 
+from .jobs import SAMLMetadataRefresher
+
+# Scheduled task to keep idp metadata updated
+for cls in (SAMLMetadataRefresher,):
+    managers.task_manager().register_job(cls)
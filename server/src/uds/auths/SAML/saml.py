@@ -31,7 +31,9 @@
 Author: Adolfo Gómez, dkmaster at dkmon dot com
 """
 import datetime
+import hashlib
 import logging
+import time
 import typing
 import collections.abc
 import xml.sax  # nosec: used to parse trusted xml provided only by administrators
@@ -60,6 +62,13 @@ if typing.TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+# Settings include a "valid until" date for metadata, so they are renewed from time to time
+SETTINGS_CACHE_DURATION: typing.Final[int] = 3600  # 1 hour
+
+# Parsed onelogin settings of each authenticator of this process, by authenticator uuid:
+# (hash of configuration and idp metadata, valid until, settings)
+_settings_cache: dict[str, tuple[str, float, OneLogin_Saml2_Settings]] = {}
+
 
 def CACHING_KEY_FNC(auth: 'SAMLAuthenticator') -> str:
     return auth.entity_id.as_str()
@@ -467,14 +476,11 @@ class SAMLAuthenticator(auths.Authenticator):
     ) -> dict[str, typing.Any]:
         manage_url_obj = typing.cast('ParseResult', urlparse(self.manage_url.value))
         script_path: str = manage_url_obj.path
+        # Port, if not the default one, is part of host (server_port is deprecated on python3-saml)
         host: str = manage_url_obj.netloc
-        if ':' in host:
-            host, port = host.split(':')
-        else:
-            if manage_url_obj.scheme == 'http':
-                port = '80'
-            else:
-                port = '443'
+        default_port = ':80' if manage_url_obj.scheme == 'http' else ':443'
+        if host.endswith(default_port):
+            host = host[: -len(default_port)]
 
         # If callback parameters are passed, we use them
         if params:
@@ -483,7 +489,6 @@ class SAMLAuthenticator(auths.Authenticator):
                 'https': ['off', 'on'][params.https],
                 'http_host': host,  # params['http_host'],
                 'script_name': script_path,  # params['path_info'],
-                'server_port': port,  # params['server_port'],
                 'get_data': params.get_params.copy(),
                 'post_data': params.post_params.copy(),
                 'lowercase_urlencoding': self.adfs.as_bool(),
@@ -494,36 +499,73 @@ class SAMLAuthenticator(auths.Authenticator):
             'https': 'on' if request.is_secure() else 'off',
             'http_host': host,  # request.META['HTTP_HOST'],
             'script_name': script_path,  # request.META['PATH_INFO'],
-            'server_port': port,  # request.META['SERVER_PORT'],
             'get_data': request.GET.copy(),
             'post_data': request.POST.copy(),
             'lowercase_urlencoding': self.adfs.as_bool(),
             'query_string': request.META['QUERY_STRING'],
         }
 
-    def get_idp_metadata_dict(self) -> dict[str, typing.Any]:
+    def fetch_idp_metadata(self) -> str:
+        """
+        Fetches idp metadata from its url, and stores it on cache if it is valid
+        """
+        try:
+            resp = requests.get(
+                self.idp_metadata.value.split('\n')[0],
+                verify=self.check_https_certificate.as_bool(),
+                timeout=10,
+            )
+            val = resp.content.decode()
+            # Do not replace a good one with an invalid one
+            if 'idp' not in OneLogin_Saml2_IdPMetadataParser.parse(val):
+                raise Exception('No idp descriptor found')
+        except Exception as e:
+            logger.error('Error fetching idp metadata: %s', e)
+            raise exceptions.auth.AuthenticatorException(gettext('Can\'t access idp metadata'))
+        # 10 years, the metadata will be kept until refreshed or edited
+        self.cache.put('idpMetadata', val, 86400 * 365 * 10)
+        return val
+
+    def refresh_idp_metadata(self) -> None:
+        """
+        Fetches again idp metadata, if it is an url. If it can't be fetched, the current one is kept
+        """
         if self.idp_metadata.value.startswith('http'):
-            resp = self.cache.get('idpMetadata')
-            if resp:
-                return resp
-            try:
-                resp = requests.get(
-                    self.idp_metadata.value.split('\n')[0],
-                    verify=self.check_https_certificate.as_bool(),
-                    timeout=10,
-                )
-                val = resp.content.decode()
-                # 10 years, unless edited the metadata will be kept
-                self.cache.put('idpMetadata', val, 86400 * 365 * 10)
-            except Exception as e:
-                logger.error('Error fetching idp metadata: %s', e)
-                raise exceptions.auth.AuthenticatorException(gettext('Can\'t access idp metadata'))
-        else:
-            val = self.idp_metadata.value
+            self.fetch_idp_metadata()
 
-        return OneLogin_Saml2_IdPMetadataParser.parse(val)  # pyright: ignore reportUnknownVariableType
+    def get_idp_metadata(self) -> str:
+        """
+        Returns the idp metadata xml, fetched from its url (and cached) if it is an url
+        """
+        if self.idp_metadata.value.startswith('http'):
+            return self.cache.get('idpMetadata') or self.fetch_idp_metadata()
+        return self.idp_metadata.value
 
-    def build_onelogin_settings(self) -> dict[str, typing.Any]:
+    def get_idp_metadata_dict(self, idp_metadata: typing.Optional[str] = None) -> dict[str, typing.Any]:
+        return OneLogin_Saml2_IdPMetadataParser.parse(  # pyright: ignore reportUnknownVariableType
+            idp_metadata or self.get_idp_metadata()
+        )
+
+    def get_onelogin_settings(self) -> OneLogin_Saml2_Settings:
+        """
+        Returns the onelogin settings of this authenticator. They are built (parsing metadata and loading
+        certificates) only when configuration or idp metadata changes, and reused by next requests
+        """
+        idp_metadata = self.get_idp_metadata()
+        config_hash = hashlib.sha256(
+            repr((sorted(self.get_fields_as_dict().items()), idp_metadata)).encode()
+        ).hexdigest()
+        uuid = self.get_uuid()
+        cached = _settings_cache.get(uuid)
+        if cached and cached[0] == config_hash and cached[1] > time.monotonic():
+            return cached[2]
+
+        settings = OneLogin_Saml2_Settings(settings=self.build_onelogin_settings(idp_metadata))
+        if uuid:  # Not cached for authenticators not saved yet
+            _settings_cache[uuid] = (config_hash, time.monotonic() + SETTINGS_CACHE_DURATION, settings)
+        return settings
+
+    def build_onelogin_settings(self, idp_metadata: typing.Optional[str] = None) -> dict[str, typing.Any]:
         return {
             'strict': True,
             'debug': True,
@@ -541,7 +583,7 @@ class SAMLAuthenticator(auths.Authenticator):
                 'privateKey': self.private_key.value,
                 'NameIDFormat': 'urn:oasis:names:tc:SAML:1.1:nameid-format:unspecified',
             },
-            'idp': self.get_idp_metadata_dict()['idp'],
+            'idp': self.get_idp_metadata_dict(idp_metadata)['idp'],
             'security': {
                 # in days, converted to seconds, this is a duration
                 'metadataCacheDuration': (
@@ -584,7 +626,7 @@ class SAMLAuthenticator(auths.Authenticator):
         timeout=3600,  # 1 hour
     )
     def get_sp_metadata(self) -> str:
-        saml_settings = OneLogin_Saml2_Settings(settings=self.build_onelogin_settings())
+        saml_settings = self.get_onelogin_settings()
         metadata: typing.Any = saml_settings.get_sp_metadata()
         errors: list[typing.Any] = saml_settings.validate_metadata(  # pyright: ignore reportUnknownVariableType
             metadata
@@ -639,8 +681,7 @@ class SAMLAuthenticator(auths.Authenticator):
         # Cleanup session & session cookie
         request.session.flush()
 
-        settings = OneLogin_Saml2_Settings(settings=self.build_onelogin_settings())
-        auth = OneLogin_Saml2_Auth(req, settings)
+        auth = OneLogin_Saml2_Auth(req, self.get_onelogin_settings())
 
         url: str = auth.process_slo(request_id=logout_req_id)  # pyright: ignore reportUnknownVariableType
 
@@ -676,8 +717,7 @@ class SAMLAuthenticator(auths.Authenticator):
             return self.logout_callback(req, typing.cast('ExtendedHttpRequestWithUser', request))
 
         try:
-            settings = OneLogin_Saml2_Settings(settings=self.build_onelogin_settings())
-            auth = OneLogin_Saml2_Auth(req, settings)
+            auth = OneLogin_Saml2_Auth(req, self.get_onelogin_settings())
             auth.process_response()  # pyright: ignore reportUnknownVariableType
         except Exception as e:
             raise exceptions.auth.AuthenticatorException(gettext('Error processing SAML response: ') + str(e))
@@ -769,9 +809,7 @@ class SAMLAuthenticator(auths.Authenticator):
 
         req = self.build_req_from_request(request)
 
-        settings = OneLogin_Saml2_Settings(settings=self.build_onelogin_settings())
-
-        auth = OneLogin_Saml2_Auth(req, settings)
+        auth = OneLogin_Saml2_Auth(req, self.get_onelogin_settings())
 
         saml = request.session.get('SAML', {})
 
@@ -812,10 +850,17 @@ class SAMLAuthenticator(auths.Authenticator):
         We will here compose the saml request and send it via http-redirect
         """
         req = self.build_req_from_request(request)
-        auth = OneLogin_Saml2_Auth(req, self.build_onelogin_settings())
+        auth = OneLogin_Saml2_Auth(req, self.get_onelogin_settings())
 
         return f'window.location="{auth.login()}";'  # pyright: ignore reportUnknownVariableType
 
+    def clear_cache(self) -> None:
+        """
+        Discards parsed settings, and fetches again idp metadata (if it is an url)
+        """
+        _settings_cache.pop(self.get_uuid(), None)
+        self.refresh_idp_metadata()
+
     def remove_user(self, username: str) -> None:
         """
         Clean ups storage data
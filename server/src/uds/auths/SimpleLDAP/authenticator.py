@@ -37,7 +37,7 @@ import ldap  # pyright: ignore  # Needed to import ldap.filter without errors
 import ldap.filter
 from django.utils.translation import gettext_noop as _
 
-from uds.core import auths, environment, types, exceptions
+from uds.core import auths, consts, environment, types, exceptions
 from uds.core.auths.auth import log_login
 from uds.core.ui import gui
 from uds.core.util import ensure, fields, ldaputil, validators
@@ -258,10 +258,14 @@ class SimpleLDAPAuthenticator(auths.Authenticator):
 
         return self._connection
 
-    def _connect_as(self, username: str, password: str) -> typing.Any:
-        return ldaputil.connection(
-            username,
-            password,
+    def _pool(self) -> ldaputil.ConnectionPool:
+        """
+        Pool of connections of this authenticator, used for everything but testing the connection
+        """
+        return ldaputil.connection_pool(
+            self.get_uuid(),
+            self.username.as_str(),
+            self.password.as_str(),
             self.host.as_str(),
             port=self.port.as_int(),
             ssl=self.use_ssl.as_bool(),
@@ -271,6 +275,9 @@ class SimpleLDAPAuthenticator(auths.Authenticator):
             certificate=self.certificate.as_str(),
         )
 
+    def _connect_as(self, username: str, password: str) -> None:
+        self._pool().bind(username, password)
+
     def _get_user(self, username: str) -> typing.Optional[ldaputil.LDAPResultType]:
         """
         Searchs for the username and returns its LDAP entry
@@ -278,19 +285,28 @@ class SimpleLDAPAuthenticator(auths.Authenticator):
         @return: None if username is not found, an dictionary of LDAP entry attributes if found.
         @note: Active directory users contains the groups it belongs to in "memberOf" attribute
         """
+        user: typing.Optional[ldaputil.LDAPResultType] = self.cache.get(f'user:{username}')
+        if user is not None:
+            return user
+
         attributes = self.username_attr.as_str().split(',') + [self.user_id_attr.as_str()]
         if self.mfa_attribute.as_str():
             attributes = attributes + [self.mfa_attribute.as_str()]
 
-        return ldaputil.first(
-            con=self._get_connection(),
-            base=self.ldap_base.as_str(),
-            objectClass=self.user_class.as_str(),
-            field=self.user_id_attr.as_str(),
-            value=username,
-            attributes=attributes,
-            sizeLimit=LDAP_RESULT_LIMIT,
+        user = self._pool().execute(
+            lambda con: ldaputil.first(
+                con=con,
+                base=self.ldap_base.as_str(),
+                objectClass=self.user_class.as_str(),
+                field=self.user_id_attr.as_str(),
+                value=username,
+                attributes=attributes,
+                sizeLimit=LDAP_RESULT_LIMIT,
+            )
         )
+        if user is not None and consts.auth.LDAP_CACHE_TIMEOUT > 0:
+            self.cache.put(f'user:{username}', user, consts.auth.LDAP_CACHE_TIMEOUT)
+        return user
 
     def _get_group(self, groupName: str) -> typing.Optional[ldaputil.LDAPResultType]:
         """
@@ -298,33 +314,44 @@ class SimpleLDAPAuthenticator(auths.Authenticator):
         @param groupName: group name to search, using user provided parameters at configuration to map search entries.
         @return: None if group name is not found, an dictionary of LDAP entry attributes if found.
         """
-        return ldaputil.first(
-            con=self._get_connection(),
-            base=self.ldap_base.as_str(),
-            objectClass=self.group_class.as_str(),
-            field=self.group_id_attr.as_str(),
-            value=groupName,
-            attributes=[self.member_attr.as_str()],
-            sizeLimit=LDAP_RESULT_LIMIT,
+        return self._pool().execute(
+            lambda con: ldaputil.first(
+                con=con,
+                base=self.ldap_base.as_str(),
+                objectClass=self.group_class.as_str(),
+                field=self.group_id_attr.as_str(),
+                value=groupName,
+                attributes=[self.member_attr.as_str()],
+                sizeLimit=LDAP_RESULT_LIMIT,
+            )
         )
 
     def _get_groups(self, user: ldaputil.LDAPResultType) -> list[str]:
+        groups: typing.Optional[list[str]] = self.cache.get(f'groups:{user["dn"]}')
+        if groups is not None:
+            return groups
         try:
-            groups: list[str] = []
+            groups = []
 
             filter_ = f'(&(objectClass={self.group_class.as_str()})(|({self.member_attr.as_str()}={user["_id"]})({self.member_attr.as_str()}={user["dn"]})))'
-            for d in ldaputil.as_dict(
-                con=self._get_connection(),
-                base=self.ldap_base.as_str(),
-                ldap_filter=filter_,
-                attributes=[self.group_id_attr.as_str()],
-                limit=10 * LDAP_RESULT_LIMIT,
+            for d in self._pool().execute(
+                lambda con: list(
+                    ldaputil.as_dict(
+                        con=con,
+                        base=self.ldap_base.as_str(),
+                        ldap_filter=filter_,
+                        attributes=[self.group_id_attr.as_str()],
+                        limit=10 * LDAP_RESULT_LIMIT,
+                    )
+                )
             ):
                 if self.group_id_attr.as_str() in d:
                     for k in d[self.group_id_attr.as_str()]:
                         groups.append(k)
 
             logger.debug('Groups: %s', groups)
+            if consts.auth.LDAP_CACHE_TIMEOUT > 0:
+                self.cache.put(f'groups:{user["dn"]}', groups, consts.auth.LDAP_CACHE_TIMEOUT)
             return groups
 
         except Exception:
@@ -446,18 +473,25 @@ class SimpleLDAPAuthenticator(auths.Authenticator):
             raise exceptions.auth.AuthenticatorException(_('Username not found'))
         groups_manager.validate(self._get_groups(user))
 
+    def clear_cache(self) -> None:
+        self.cache.clear()
+
     def search_users(self, pattern: str) -> collections.abc.Iterable[types.auth.SearchResultItem]:
         try:
             return [
                 types.auth.SearchResultItem(
                     id=r[self.user_id_attr.as_str()][0], name=self._get_user_realname(r)
                 )
-                for r in ldaputil.as_dict(
-                    con=self._get_connection(),
-                    base=self.ldap_base.as_str(),
-                    ldap_filter=f'(&(objectClass={self.user_class.as_str()})({self.user_id_attr.as_str()}={pattern}*))',
-                    attributes=[self.user_id_attr.as_str(), self.username_attr.as_str()],
-                    limit=LDAP_RESULT_LIMIT,
+                for r in self._pool().execute(
+                    lambda con: list(
+                        ldaputil.as_dict(
+                            con=con,
+                            base=self.ldap_base.as_str(),
+                            ldap_filter=f'(&(objectClass={self.user_class.as_str()})({self.user_id_attr.as_str()}={pattern}*))',
+                            attributes=[self.user_id_attr.as_str(), self.username_attr.as_str()],
+                            limit=LDAP_RESULT_LIMIT,
+                        )
+                    )
                 )
             ]
         except Exception as e:
@@ -468,12 +502,16 @@ class SimpleLDAPAuthenticator(auths.Authenticator):
         try:
             return [
                 types.auth.SearchResultItem(id=r[self.group_id_attr.as_str()][0], name=r['description'][0])
-                for r in ldaputil.as_dict(
-                    con=self._get_connection(),
-                    base=self.ldap_base.as_str(),
-                    ldap_filter=f'(&(objectClass={self.group_class.as_str()})({self.group_id_attr.as_str()}={pattern}*))',
-                    attributes=[self.group_id_attr.as_str(), 'memberOf', 'description'],
-                    limit=LDAP_RESULT_LIMIT,
+                for r in self._pool().execute(
+                    lambda con: list(
+                        ldaputil.as_dict(
+                            con=con,
+                            base=self.ldap_base.as_str(),
+                            ldap_filter=f'(&(objectClass={self.group_class.as_str()})({self.group_id_attr.as_str()}={pattern}*))',
+                            attributes=[self.group_id_attr.as_str(), 'memberOf', 'description'],
+                            limit=LDAP_RESULT_LIMIT,
+                        )
+                    )
                 )
             ]
         except Exception as e:
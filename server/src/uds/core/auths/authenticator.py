@@ -520,6 +520,15 @@ class Authenticator(Module):
         """
         raise NotImplementedError
 
+    def clear_cache(self) -> None:
+        """
+        Invoked from the administration interface to discard any information about users and groups
+        the authenticator keeps cached, so it is read again from its source.
+
+        Default implementation does nothing.
+        """
+        pass
+
     def get_javascript(self, request: 'ExtendedHttpRequest') -> typing.Optional[str]:
         """
         If you override this method, and returns something different of None,
@@ -50,18 +50,21 @@ class Group:
     It's only constructor expect a database group as parameter.
     """
     _db_group: 'models.Group'
+    _cached_manager: typing.Optional['AuthenticatorInstance']
 
     def __init__(self, db_group: 'models.Group'):
         """
         Initializes internal data
         """
-        self._cached_manager = db_group.get_manager()
+        self._cached_manager = None  # Instantiated on first use, most groups never need it
         self._db_group = db_group
 
     def manager(self) -> 'AuthenticatorInstance':
         """
         Returns the database authenticator associated with this group
         """
+        if self._cached_manager is None:
+            self._cached_manager = self._db_group.get_manager()
         return self._cached_manager
 
     def db_obj(self) -> 'models.Group':
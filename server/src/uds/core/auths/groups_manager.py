@@ -34,32 +34,190 @@ import collections.abc
 import dataclasses
 import logging
 import re
+import threading
+import time
 import typing
 
+from uds.core import consts
 from uds.core.types.states import State
+from uds.core.util import singleton
 
 from .group import Group
 
 if typing.TYPE_CHECKING:
     from uds.models import Authenticator as DBAuthenticator
+    from uds.core.util.cache import Cache
 
 logger = logging.getLogger(__name__)
 
+# Patterns with backreferences can't be merged with others (group numbers would change)
+_BACKREFERENCE_RE: typing.Final[re.Pattern[str]] = re.compile(r'\\[1-9]|\(\?P=')
+
+
 @dataclasses.dataclass(frozen=True)
-class _LocalGrp:
-    name: str
-    group: 'Group'
-    is_valid: bool = False
-    is_pattern: bool = False
+class _CompiledGroups:
+    """
+    Active (non meta) groups of an authenticator, ready to match external group names against them.
 
-    def matches(self, name: str) -> bool:
+    Plain names are looked up on a dict, and patterns ("pat:" groups) are merged on a single regular expression
+    that discards at once the names not matched by any of them. Only names matched by the merged one are
+    checked against each pattern, to know which groups they belong to.
+    """
+
+    generation: str
+    names: dict[int, str]  # Group id -> name, as stored on database
+    exact: dict[str, tuple[int, ...]]  # Casefolded name -> group ids
+    patterns: tuple[tuple[re.Pattern[str], int], ...]  # (pattern, group id), all valid patterns
+    merged: typing.Optional[re.Pattern[str]]  # Alternation of all patterns without backreferences
+    unmerged: tuple[tuple[re.Pattern[str], int], ...]  # Patterns that must be checked on every name
+
+    @staticmethod
+    def build(generation: str, groups: collections.abc.Iterable[tuple[int, str]]) -> '_CompiledGroups':
+        names: dict[int, str] = {}
+        exact: dict[str, tuple[int, ...]] = {}
+        patterns: list[tuple[re.Pattern[str], int]] = []
+        mergeable: list[str] = []
+        unmerged: list[tuple[re.Pattern[str], int]] = []
+        for group_id, name in groups:
+            names[group_id] = name
+            name = name.lower()
+            if name.startswith('pat:'):
+                try:
+                    pattern = re.compile(name[4:], re.IGNORECASE)
+                except re.error:
+                    logger.exception('Exception in RE')
+                    continue
+                patterns.append((pattern, group_id))
+                if _BACKREFERENCE_RE.search(pattern.pattern):
+                    unmerged.append((pattern, group_id))
+                else:
+                    mergeable.append(f'(?:{pattern.pattern})')
+            else:
+                key = name.casefold()
+                exact[key] = exact.get(key, ()) + (group_id,)
+
+        merged: typing.Optional[re.Pattern[str]] = None
+        if mergeable:
+            try:
+                merged = re.compile('|'.join(mergeable), re.IGNORECASE)
+            except re.error:  # i.e. global flags not at start of a pattern, so check them one by one
+                unmerged = patterns
+
+        return _CompiledGroups(
+            generation=generation,
+            names=names,
+            exact=exact,
+            patterns=tuple(patterns),
+            merged=merged,
+            unmerged=tuple(unmerged),
+        )
+
+    def match(self, group_name: str) -> list[int]:
         """
-        Checks if this group name is equal to the provided name (case)
+        Returns the ids of the groups that group_name matches
         """
-        return name.casefold() == self.name.casefold()
-    
-    def replace(self, **kwargs: typing.Any) -> '_LocalGrp':
-        return dataclasses.replace(self, **kwargs)
+        name = group_name.lower()
+        result = list(self.exact.get(name.casefold(), ()))
+        if self.merged is not None and self.merged.search(name) is not None:
+            result.extend(group_id for pattern, group_id in self.patterns if pattern.search(name) is not None)
+        elif self.unmerged:
+            result.extend(group_id for pattern, group_id in self.unmerged if pattern.search(name) is not None)
+        return result
+
+
+_EMPTY: typing.Final[_CompiledGroups] = _CompiledGroups.build('', ())
+
+
+class GroupMatchers(metaclass=singleton.Singleton):
+    """
+    Compiled groups of each authenticator of this process, so logins do not need to load (and check one by one)
+    every group of the authenticator.
+
+    Rebuilt when groups of the authenticator change on any process (a new generation is stored on cache,
+    checked by other processes as often as the cache itself checks for invalidations).
+    """
+
+    _compiled: dict[int, tuple[_CompiledGroups, float]]  # Authenticator id -> (groups, next generation check)
+    _lock: threading.Lock
+
+    builds: int
+    lookups: int
+
+    def __init__(self) -> None:
+        self._compiled = {}
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.lookups = 0
+
+    @staticmethod
+    def manager() -> 'GroupMatchers':
+        return GroupMatchers()
+
+    @staticmethod
+    def _generation() -> 'Cache':
+        from uds.core.util.cache import Cache  # Avoid circular import
+
+        return Cache('uds:groups:generation')
+
+    def _build(self, authenticator_id: int, generation: str) -> _CompiledGroups:
+        from uds.models import Group as DBGroup  # pylint: disable=import-outside-toplevel
+
+        self.builds += 1
+        return _CompiledGroups.build(
+            generation,
+            DBGroup.objects.filter(manager_id=authenticator_id, state=State.ACTIVE, is_meta=False).values_list(
+                'id', 'name'
+            ),
+        )
+
+    def get(self, authenticator_id: int) -> _CompiledGroups:
+        """
+        Returns the compiled groups of the authenticator
+        """
+        self.lookups += 1
+        now = time.monotonic()
+        compiled, next_check = self._compiled.get(authenticator_id, (None, 0.0))
+        if compiled is not None and now < next_check:
+            return compiled
+
+        cache = GroupMatchers._generation()
+        generation = cache.get(str(authenticator_id))
+        if generation is None:
+            generation = str(time.time_ns())
+            cache.put(str(authenticator_id), generation, consts.cache.EXTREME_CACHE_TIMEOUT)
+
+        if compiled is None or compiled.generation != generation:
+            with self._lock:
+                compiled = self._compiled.get(authenticator_id, (None, 0.0))[0]
+                if compiled is None or compiled.generation != generation:
+                    compiled = self._build(authenticator_id, generation)
+        self._compiled[authenticator_id] = (compiled, now + consts.cache.CACHE_INVALIDATION_INTERVAL)
+        return compiled
+
+    def invalidate(self, authenticator_id: int) -> None:
+        """
+        Makes every process rebuild the groups of this authenticator on next use
+        """
+        GroupMatchers._generation().put(
+            str(authenticator_id), str(time.time_ns()), consts.cache.EXTREME_CACHE_TIMEOUT
+        )
+        self._compiled.pop(authenticator_id, None)  # This process sees it at once
+
+    def clear(self) -> None:
+        self._compiled = {}
+
+    def as_dict(self) -> dict[str, int]:
+        compiled = [c for c, _ in list(self._compiled.values())]
+        return {
+            'builds': self.builds,
+            'lookups': self.lookups,
+            'authenticators': len(compiled),
+            'groups': sum(len(c.names) for c in compiled),
+            'patterns': sum(len(c.patterns) for c in compiled),
+        }
+
+    def __str__(self) -> str:
+        return f'GroupMatchers: {self.as_dict()}'
 
 
 class GroupsManager:
@@ -82,7 +240,8 @@ class GroupsManager:
     Managed groups names are compared using case insensitive comparison.
     """
 
-    _groups: list[_LocalGrp]
+    _groups: _CompiledGroups
+    _valid: set[int]  # Ids of the groups marked as valid
 
     def __init__(self, dbAuthenticator: 'DBAuthenticator'):
         """
@@ -92,46 +251,16 @@ class GroupsManager:
         """
         self._dbAuthenticator = dbAuthenticator
         # We just get active groups, inactive aren't visible to this class
-        self._groups = []
-        if (
-            dbAuthenticator.id
-        ):  # If "fake" authenticator (that is, root user with no authenticator in fact)
-            for g in dbAuthenticator.groups.filter(state=State.ACTIVE, is_meta=False):
-                name = g.name.lower()
-                isPattern = name.find('pat:') == 0  # Is a pattern?
-                self._groups.append(
-                    _LocalGrp(
-                        name=name[4:] if isPattern else name,
-                        group=Group(g),
-                        is_pattern=isPattern,
-                    )
-                )
-
-    def _indexes_for_mached_groups(self, group_name: str) -> typing.Generator[int, None, None]:
-        """
-        Returns true if this groups manager contains the specified group name (string)
-        """
-        name = group_name.lower()
-        for n, grp in enumerate(self._groups):
-            if grp.is_pattern:
-                logger.debug('Group is a pattern: %s', grp)
-                try:
-                    logger.debug('Match: %s->%s', grp.name, name)
-                    if re.search(grp.name, name, re.IGNORECASE) is not None:
-                        yield n
-                except Exception:
-                    logger.exception('Exception in RE')
-            else:
-                if grp.matches(name):  # If group name matches
-                    yield n
+        # If "fake" authenticator (that is, root user with no authenticator in fact), no groups at all
+        self._groups = GroupMatchers.manager().get(dbAuthenticator.id) if dbAuthenticator.id else _EMPTY
+        self._valid = set()
 
     def enumerate_groups_name(self) -> typing.Generator[str, None, None]:
         """
         Return all groups names managed by this groups manager. The names are returned
         as where inserted inside Database (most probably using administration interface)
         """
-        for g in self._groups:
-            yield g.group.db_obj().name
+        yield from self._groups.names.values()
 
     def enumerate_valid_groups(self) -> typing.Generator['Group', None, None]:
         """Returns the list of valid groups for this groups manager.
@@ -139,11 +268,10 @@ class GroupsManager:
         from uds.models import \
             Group as DBGroup  # pylint: disable=import-outside-toplevel
 
-        valid_id_list: list[int] = []
-        for group in self._groups:
-            if group.is_valid:
-                valid_id_list.append(group.group.db_obj().id)
-                yield group.group
+        valid_id_list: list[int] = sorted(self._valid)
+        if valid_id_list:
+            for db_group in DBGroup.objects.filter(id__in=valid_id_list, state=State.ACTIVE):
+                yield Group(db_group)
 
         # Now, get metagroups and also return them
         for db_group in DBGroup.objects.filter(
@@ -165,16 +293,21 @@ class GroupsManager:
         Checks if this groups manager has at least one group that has been
         validated (using :py:meth:.validate)
         """
-        return any(g.is_valid for g in self._groups)
+        return bool(self._valid)
 
     def get_group(self, group_name: str) -> typing.Optional[Group]:
         """
         If this groups manager contains that group manager, it returns the
         :py:class:uds.core.auths.group.Group  representing that group name.
         """
-        for group in self._groups:
-            if group.matches(group_name):
-                return group.group
+        from uds.models import \
+            Group as DBGroup  # pylint: disable=import-outside-toplevel
+
+        name = group_name.casefold()
+        for group_id, db_name in self._groups.names.items():
+            db_name = db_name.lower()
+            if (db_name[4:] if db_name.startswith('pat:') else db_name).casefold() == name:
+                return Group(DBGroup.objects.get(id=group_id))
 
         return None
 
@@ -189,22 +322,17 @@ class GroupsManager:
         Returns nothing, it changes the groups this groups contains attributes,
         so they reflect the known groups that are considered valid.
         """
-        if not isinstance(group_name, str):
-            for name in group_name:
-                self.validate(name)
-        else:
-            for index in self._indexes_for_mached_groups(group_name):
-                self._groups[index] = self._groups[index].replace(is_valid=True)
+        if isinstance(group_name, str):
+            group_name = (group_name,)
+        for name in group_name:
+            self._valid.update(self._groups.match(name))
 
     def is_valid(self, group_name: str) -> bool:
         """
         Checks if this group name is marked as valid inside this groups manager.
         Returns True if group name is marked as valid, False if it isn't.
         """
-        for n in self._indexes_for_mached_groups(group_name):
-            if self._groups[n].is_valid:
-                return True
-        return False
+        return any(group_id in self._valid for group_id in self._groups.match(group_name))
 
     def __str__(self) -> str:
-        return f'Groupsmanager: {self._groups}'
+        return f'Groupsmanager: {[(self._groups.names[i], i in self._valid) for i in self._groups.names]}'
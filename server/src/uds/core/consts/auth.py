@@ -32,6 +32,8 @@ Author: Adolfo Gómez, dkmaster at dkmon dot com
 """
 import typing
 
+from django.conf import settings
+
 # Constants for Visibility
 VISIBLE: typing.Final[str] = 'v'
 HIDDEN: typing.Final[str] = 'h'
@@ -66,3 +68,24 @@ SESSION_IP_KEY: typing.Final[str] = 'session_ip'
 # Cookie length and root "fake" id
 UDS_COOKIE_LENGTH: typing.Final[int] = 48
 ROOT_ID: typing.Final[int] = -20091204  # Any negative number will do the trick
+
+# REST sessions storage (see uds.REST.sessions). Can be "db" (django database sessions, default),
+# "cache" (uds cache, served from its in-process tier) or "token" (signed and encrypted token, not stored at all)
+REST_SESSION_MODE: typing.Final[str] = getattr(settings, 'REST_SESSION_MODE', 'db')
+# Keys used by "token" mode. First one signs and encrypts new tokens, the rest are still accepted (key rotation)
+REST_SESSION_TOKEN_KEYS: typing.Final[list[str]] = list(
+    getattr(settings, 'REST_SESSION_TOKEN_KEYS', None) or [settings.SECRET_KEY]
+)
+
+# Ldap authenticators keep their connections on a pool. Max connections per authenticator (and process), and seconds
+# a connection can be idle before checking it still works when reused
+LDAP_POOL_SIZE: typing.Final[int] = int(getattr(settings, 'LDAP_POOL_SIZE', 8))
+LDAP_POOL_CHECK_INTERVAL: typing.Final[int] = 30
+# Seconds users (and its groups) found on ldap are cached, so repeated logins do not search them again (0 disables it)
+LDAP_CACHE_TIMEOUT: typing.Final[int] = int(getattr(settings, 'LDAP_CACHE_TIMEOUT', 300))
+
+# OAuth2 authenticators keep discovery documents and signing keys of its OpenID providers in memory. Seconds they are
+# kept before fetching them again, and min seconds between keys fetches (tokens signed with unknown keys fetch them)
+OAUTH2_DISCOVERY_CACHE_DURATION: typing.Final[int] = 86400
+OAUTH2_KEYS_CACHE_DURATION: typing.Final[int] = 3600
+OAUTH2_KEYS_MIN_REFRESH_INTERVAL: typing.Final[int] = 60
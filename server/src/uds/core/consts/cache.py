@@ -32,6 +32,8 @@ Author: Adolfo Gómez, dkmaster at dkmon dot com
 """
 import typing
 
+from django.conf import settings
+
 
 # Default timeouts, in seconds
 BASE_CACHE_TIMEOUT: typing.Final[int] = 3  # 3 seconds
@@ -45,3 +47,30 @@ SHORTEST_CACHE_TIMEOUT: typing.Final[int] = BASE_CACHE_TIMEOUT  # 3 seconds
 # Used to mark a cache as not found
 # use "cache.get(..., default=CACHE_NOT_FOUND)" to check if a cache is non existing instead of real None value
 CACHE_NOT_FOUND: typing.Final[object] = object()
+
+# Single flight mode of @cached decorator
+# Max time a caller waits for the result of the same call made by other caller (thread or node)
+# If exceeded, the caller will execute the function by itself
+SINGLE_FLIGHT_WAIT_TIMEOUT: typing.Final[int] = 30
+# Interval between checks for the result of a call being executed by other node
+SINGLE_FLIGHT_POLL_INTERVAL: typing.Final[float] = 0.2
+
+# Tiered cache configuration (uds.core.util.cache_backends)
+# Shared tier used by uds.core.util.cache.Cache. Can be "db" (default, uses uds_utility_cache table)
+# or "django", that uses the django cache framework alias provided by CACHE_DJANGO_ALIAS setting
+# (i.e. memcached, also over a local unix socket using "unix:/path/to/socket" as LOCATION)
+CACHE_SHARED_BACKEND: typing.Final[str] = getattr(settings, 'CACHE_SHARED_BACKEND', 'db')
+CACHE_DJANGO_ALIAS: typing.Final[str] = getattr(settings, 'CACHE_DJANGO_ALIAS', 'memory')
+# Max number of entries on the in-process (local) tier. 0 disables the local tier
+CACHE_LOCAL_MAX_ENTRIES: typing.Final[int] = int(getattr(settings, 'CACHE_LOCAL_MAX_ENTRIES', 4096))
+# Local tier checks for invalidations done by other processes at most every this seconds
+CACHE_INVALIDATION_INTERVAL: typing.Final[float] = float(getattr(settings, 'CACHE_INVALIDATION_INTERVAL', 1.0))
+# Time the invalidation notices are kept on the shared tier. A process that has not checked
+# invalidations for longer than this will flush its local tier completely
+CACHE_INVALIDATION_RETENTION: typing.Final[int] = 60
+# Owner used for invalidation notices on the shared tier
+CACHE_INVALIDATION_OWNER: typing.Final[str] = 'uds:cache:invalidations'
+
+# Portal services list: the part of the list that is common to all users with same groups, os and networks
+# (pools, transports, groups, ...) is cached for this seconds, or until any related model changes. 0 disables it
+SERVICES_INFO_CACHE_TIMEOUT: typing.Final[int] = int(getattr(settings, 'SERVICES_INFO_CACHE_TIMEOUT', 300))
@@ -32,10 +32,19 @@ Author: Adolfo Gómez, dkmaster at dkmon dot com
 """
 import typing
 
+from django.conf import settings
+
 # Request related timeouts, etc..
 DEFAULT_REQUEST_TIMEOUT: typing.Final[int] = 20  # In seconds
 DEFAULT_CONNECT_TIMEOUT: typing.Final[int] = 4   # In seconds
 
+# Outbound HTTP connections are pooled by host (see uds.core.util.security.HTTPConnectionsPool)
+# Max connections kept alive per host, and seconds a host pool can be idle before being closed
+HTTP_POOL_MAXSIZE: typing.Final[int] = int(getattr(settings, 'HTTP_POOL_MAXSIZE', 10))
+HTTP_POOL_IDLE_TIMEOUT: typing.Final[int] = int(getattr(settings, 'HTTP_POOL_IDLE_TIMEOUT', 120))
+# Max client SSL contexts (one per set of trusted certificates) kept for reuse
+SSL_CONTEXTS_CACHE_SIZE: typing.Final[int] = int(getattr(settings, 'SSL_CONTEXTS_CACHE_SIZE', 32))
+
 # Default UDS Registerd Server listen port
 SERVER_DEFAULT_LISTEN_PORT: typing.Final[int] = 43910
 
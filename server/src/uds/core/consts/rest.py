@@ -41,6 +41,17 @@ LOG: typing.Final[str] = 'log'
 
 SYSTEM: typing.Final[str] = 'system'  # Defined on system class, here for reference
 
+# Optional query parameters of lists (overviews and details). If none present, whole lists are returned
+# * sort: comma separated fields, prefixed with "-" for descending order (i.e. "-state_date,name")
+# * filter: "field:value" (same value) or "field~value" (contains value), can be repeated
+# * limit and offset: page of the (sorted and filtered) list
+SORT: typing.Final[str] = 'sort'
+FILTER: typing.Final[str] = 'filter'
+LIMIT: typing.Final[str] = 'limit'
+OFFSET: typing.Final[str] = 'offset'
+# Response header with the number of items of the sorted and filtered list, before applying limit and offset
+TOTAL_COUNT_HEADER: typing.Final[str] = 'X-Total-Count'
+
 
 class _NotFound:
     pass
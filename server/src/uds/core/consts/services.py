@@ -38,4 +38,12 @@ MAX_STATE_CHECKS: typing.Final[int] = 32  # Max number of state checks before gi
 
 PUB_SUGGESTED_CHECK_INTERVAL: typing.Final[int] = 30  # In seconds
 PUB_MAX_RETRIES: typing.Final[int] = 7 * 24 * 60 // PUB_SUGGESTED_CHECK_INTERVAL  # 7 days
-PUB_MAX_STATE_CHECKS: typing.Final[int] = 7200 // PUB_SUGGESTED_CHECK_INTERVAL  # 2 hours for a single state at most
\ No newline at end of file
+PUB_MAX_STATE_CHECKS: typing.Final[int] = 7200 // PUB_SUGGESTED_CHECK_INTERVAL  # 2 hours for a single state at most
+
+# Machines with pending operations of services supporting it are polled in batch, one request per provider and interval
+STATE_POLL_INTERVAL: typing.Final[int] = SUGGESTED_CHECK_INTERVAL // 2  # In seconds
+STATE_POLL_FORGET_AFTER: typing.Final[int] = 3600  # Machines not checked for this time are no longer polled
+
+# On databases without SKIP LOCKED support, cached user services are claimed from this many candidates
+# (in random order), so concurrent assignations on same pool do not try to claim the same one
+CACHE_CLAIM_CANDIDATES: typing.Final[int] = 8
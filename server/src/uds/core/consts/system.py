@@ -77,3 +77,57 @@ UDS_ACTION_SCHEME: typing.Final[str] = 'udsa://'
 # Max sequence number for generators
 MAX_SEQ: typing.Final[int] = 1000000000000000
 
+
+# Delayed tasks runner
+# Max number of due delayed tasks claimed on a single query
+DELAYED_TASKS_BATCH_SIZE: typing.Final[int] = int(getattr(settings, 'DELAYED_TASKS_BATCH_SIZE', 32))
+
+# Scheduler
+# Size of the pool of workers that executes scheduled jobs on every server
+SCHEDULER_WORKERS: typing.Final[int] = int(getattr(settings, 'SCHEDULER_WORKERS', 16))
+# Max number of due jobs claimed on a single query
+SCHEDULER_BATCH_SIZE: typing.Final[int] = int(getattr(settings, 'SCHEDULER_BATCH_SIZE', 8))
+# Next execution of a job is delayed a random time of up to this ratio of its frequency
+# (but no more than SCHEDULER_MAX_JITTER seconds), so servers do not run jobs in lockstep
+SCHEDULER_JITTER_RATIO: typing.Final[float] = 0.05
+SCHEDULER_MAX_JITTER: typing.Final[int] = 30
+
+# Metrics of scheduler and delayed tasks runner are logged by task manager every this seconds
+TASKS_STATS_INTERVAL: typing.Final[int] = 300
+
+# Stats (counters and events) are buffered in memory and inserted in bulk when this number of
+# rows are pending, or every STATS_BUFFER_INTERVAL seconds. 0 disables buffering (one insert per row)
+STATS_BUFFER_SIZE: typing.Final[int] = int(getattr(settings, 'STATS_BUFFER_SIZE', 256))
+STATS_BUFFER_INTERVAL: typing.Final[float] = float(getattr(settings, 'STATS_BUFFER_INTERVAL', 5))
+# Max rows kept in memory (per buffer) if database is not accepting them. Once reached, new rows are
+# dropped ("drop" policy) or the caller waits for them to be written ("block" policy)
+STATS_BUFFER_MAX_PENDING: typing.Final[int] = int(getattr(settings, 'STATS_BUFFER_MAX_PENDING', 10000))
+STATS_BUFFER_POLICY: typing.Final[str] = getattr(settings, 'STATS_BUFFER_POLICY', 'drop')
+# Raw counters newer than this (in seconds) are not accumulated yet, because other processes may still have
+# them on their buffers (up to STATS_BUFFER_INTERVAL, or longer if database was not accepting writes)
+STATS_ACCUM_GRACE: typing.Final[int] = int(getattr(settings, 'STATS_ACCUM_GRACE', STATS_BUFFER_INTERVAL + 3600))
+
+# Logs (uds.core.managers.log) are written asynchronously, in bulk, every LOG_BUFFER_SIZE entries
+# or LOG_BUFFER_INTERVAL seconds. 0 size disables buffering (logs are written synchronously)
+LOG_BUFFER_SIZE: typing.Final[int] = int(getattr(settings, 'LOG_BUFFER_SIZE', 128))
+LOG_BUFFER_INTERVAL: typing.Final[float] = float(getattr(settings, 'LOG_BUFFER_INTERVAL', 1))
+LOG_BUFFER_MAX_PENDING: typing.Final[int] = int(getattr(settings, 'LOG_BUFFER_MAX_PENDING', 10000))
+# Owners with new logs are trimmed to its max elements at most every this seconds
+LOG_TRIM_INTERVAL: typing.Final[int] = 60
+# Logs of removed owners are purged by log maintenance once older than this (in seconds), as other processes
+# may still have queued entries for them when they were cleared
+LOG_ORPHANS_GRACE: typing.Final[int] = int(getattr(settings, 'LOG_ORPHANS_GRACE', 3600))
+
+# Servers push their stats on every ping. Servers without fresh stats (see types.servers.ServerStats.is_valid)
+# are requested, on assignations, by a pool of this size
+SERVER_STATS_WORKERS: typing.Final[int] = int(getattr(settings, 'SERVER_STATS_WORKERS', 10))
+
+# Deferred deletion (uds.core.workers.deferred_deletion) processes the machines of every provider concurrently.
+# Max operations running at once on a provider, and max operations per second on it (0 is unlimited)
+DEFERRED_DELETION_CONCURRENCY: typing.Final[int] = int(getattr(settings, 'DEFERRED_DELETION_CONCURRENCY', 4))
+DEFERRED_DELETION_RATE: typing.Final[float] = float(getattr(settings, 'DEFERRED_DELETION_RATE', 10))
+
+# Valid server tokens (tunnels, actors, ...) are kept in memory for this seconds, so they are validated without
+# database lookups. Changes made on other processes are seen once expired. Max number of indexed tokens
+SERVER_TOKEN_INDEX_TTL: typing.Final[int] = 30
+SERVER_TOKEN_INDEX_MAX_SIZE: typing.Final[int] = 16384
@@ -32,17 +32,21 @@ import base64
 import time
 import pickle  # nosec: pickle is safe here
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from socket import gethostname
-from datetime import timedelta
+from datetime import datetime, timedelta
 import logging
 import typing
 
-from django.db import connections
+from django.db import connection, connections
 from django.db import transaction, OperationalError
 from django.db.models import Q
 
 from uds.models import DelayedTask as DBDelayedTask
+from uds.core import consts
 from uds.core.util.model import sql_now
+from uds.core.util.config import GlobalConfig
+from uds.core.util.metrics import Histogram
 from uds.core.environment import Environment
 from uds.core.util import singleton
 
@@ -50,44 +54,109 @@ from .delayed_task import DelayedTask
 
 logger = logging.getLogger(__name__)
 
+# Minimum time the runner waits when the next deadline has already passed
+MIN_WAIT: typing.Final[float] = 0.1
+# Counting pending tasks needs a full table scan, so queue depth is updated at most every this seconds
+QUEUE_DEPTH_INTERVAL: typing.Final[int] = 30
 
-class DelayedTaskThread(threading.Thread):
+
+class DelayedTaskStats(metaclass=singleton.Singleton):
     """
-    Class responsible of executing a delayed task in its own thread
+    Metrics of the delayed task runner of this process
     """
 
-    __slots__ = ('_task_instance',)
+    __slots__ = (
+        'start_time',
+        'queue_depth',
+        'claimed',
+        'executed',
+        'failed',
+        'claim_time',
+        'claim_latency',
+        'execution_time',
+    )
 
-    _task_instance: DelayedTask
+    start_time: float
+    queue_depth: int  # Delayed tasks pending on database (for all servers), updated every QUEUE_DEPTH_INTERVAL
+    claimed: int
+    executed: int
+    failed: int
+    claim_time: Histogram  # Time spent on claiming a batch of tasks
+    claim_latency: Histogram  # Time elapsed since a task was due until it is claimed
+    execution_time: Histogram
 
-    def __init__(self, task_instance: DelayedTask) -> None:
-        super().__init__()
-        self._task_instance = task_instance
+    def __init__(self) -> None:
+        self.start_time = time.time()
+        self.queue_depth = 0
+        self.claimed = 0
+        self.executed = 0
+        self.failed = 0
+        self.claim_time = Histogram()
+        self.claim_latency = Histogram()
+        self.execution_time = Histogram()
 
-    def run(self) -> None:
-        try:
-            self._task_instance.execute()
-        except Exception as e:
-            logger.exception("Exception in thread %s: %s", e.__class__, e)
-        finally:
-            # This is run on a different thread, so we ensure the connection is closed
-            connections['default'].close()
+    @property
+    def uptime(self) -> float:
+        return time.time() - self.start_time
+
+    def as_dict(self) -> dict[str, typing.Any]:
+        return {
+            'uptime': self.uptime,
+            'queue_depth': self.queue_depth,
+            'claimed': self.claimed,
+            'executed': self.executed,
+            'failed': self.failed,
+            'claim_time': self.claim_time.as_dict(),
+            'claim_latency': self.claim_latency.as_dict(),
+            'execution_time': self.execution_time.as_dict(),
+        }
+
+    def __str__(self) -> str:
+        return (
+            f'DelayedTaskStats: queue_depth={self.queue_depth}, claimed={self.claimed}, '
+            f'executed={self.executed}, failed={self.failed}, claim_time=({self.claim_time}), '
+            f'claim_latency=({self.claim_latency}), execution_time=({self.execution_time})'
+        )
+
+    @staticmethod
+    def manager() -> 'DelayedTaskStats':
+        return DelayedTaskStats()
 
 
 class DelayedTaskRunner(metaclass=singleton.Singleton):
     """
     Delayed task runner class
+
+    Due tasks are claimed in batches (using SKIP LOCKED if database supports it, so several
+    servers can claim tasks concurrently without waiting for each other) and executed on a
+    bounded pool of workers. The runner sleeps until the next known deadline (at most "granularity"
+    seconds), and is woken up early if a sooner task is inserted from this process.
     """
 
     __slots__ = ()
 
-    granularity: typing.ClassVar[int] = 2  # we check for delayed tasks every "granularity" seconds
+    granularity: typing.ClassVar[int] = 2  # we check for delayed tasks at least every "granularity" seconds
     _hostname: typing.ClassVar[str]  # "Our" hostname
     _keep_running: typing.ClassVar[bool]  # If we should keep it running
 
+    _wakeup: typing.ClassVar[threading.Condition]  # Protects all "state" below
+    _wakeup_requested: typing.ClassVar[bool]
+    _next_deadline: typing.ClassVar[typing.Optional[datetime]]  # Earliest known execution time pending
+    _executor: typing.ClassVar[typing.Optional[ThreadPoolExecutor]]
+    _workers: typing.ClassVar[int]
+    _running: typing.ClassVar[int]  # Tasks being executed (or waiting for a worker) right now
+    _next_depth_check: typing.ClassVar[float]
+
     def __init__(self) -> None:
         DelayedTaskRunner._hostname = gethostname()
         DelayedTaskRunner._keep_running = True
+        DelayedTaskRunner._wakeup = threading.Condition()
+        DelayedTaskRunner._wakeup_requested = False
+        DelayedTaskRunner._next_deadline = None
+        DelayedTaskRunner._executor = None
+        DelayedTaskRunner._workers = 0
+        DelayedTaskRunner._running = 0
+        DelayedTaskRunner._next_depth_check = 0.0
         logger.debug("Initialized delayed task runner for host %s", DelayedTaskRunner._hostname)
 
     def request_stop(self) -> None:
@@ -95,7 +164,9 @@ class DelayedTaskRunner(metaclass=singleton.Singleton):
         Invoke this whenever you want to terminate the delayed task runner thread
         It will mark the thread to "stop" ASAP
         """
-        DelayedTaskRunner._keep_running = False
+        with DelayedTaskRunner._wakeup:
+            DelayedTaskRunner._keep_running = False
+            DelayedTaskRunner._wakeup.notify_all()
 
     @staticmethod
     def runner() -> 'DelayedTaskRunner':
@@ -106,41 +177,142 @@ class DelayedTaskRunner(metaclass=singleton.Singleton):
         """
         return DelayedTaskRunner()
 
-    def execute_delayed_task(self) -> None:
+    def _ensure_executor(self) -> ThreadPoolExecutor:
+        with DelayedTaskRunner._wakeup:
+            if DelayedTaskRunner._executor is None:
+                DelayedTaskRunner._workers = max(1, GlobalConfig.DELAYED_TASKS_THREADS.as_int())
+                DelayedTaskRunner._executor = ThreadPoolExecutor(
+                    max_workers=DelayedTaskRunner._workers, thread_name_prefix='DelayedTask'
+                )
+            return DelayedTaskRunner._executor
+
+    def _free_workers(self) -> int:
+        with DelayedTaskRunner._wakeup:
+            return max(0, DelayedTaskRunner._workers - DelayedTaskRunner._running)
+
+    def _claim(self, limit: int) -> list[DelayedTask]:
+        """
+        Claims (and removes from database) up to "limit" due tasks, returning its instances
+        """
+        stats = DelayedTaskStats.manager()
         now = sql_now()
-        filt = Q(execution_time__lt=now) | Q(insert_date__gt=now + timedelta(seconds=30))
         # If next execution is before now or last execution is in the future (clock changed on this server, we take that task as executable)
+        filt = Q(execution_time__lt=now) | Q(insert_date__gt=now + timedelta(seconds=30))
+        skip_locked: bool = connection.features.has_select_for_update_skip_locked
+        started = time.monotonic()
+        with transaction.atomic():  # Encloses
+            tasks: list[DBDelayedTask] = list(
+                DBDelayedTask.objects.select_for_update(skip_locked=skip_locked)
+                .filter(filt)
+                .order_by('execution_time')[:limit]
+            )
+            if tasks:
+                DBDelayedTask.objects.filter(pk__in=[task.pk for task in tasks]).delete()
+        stats.claim_time.observe(time.monotonic() - started)
+
+        # If a full batch has been claimed, there may be more due tasks, and runner will claim again at once
+        if len(tasks) < limit:
+            # Earliest pending task, using execution_time index
+            next_deadline: typing.Optional[datetime] = (
+                DBDelayedTask.objects.order_by('execution_time').values_list('execution_time', flat=True).first()
+            )
+            # Due but not claimed, so locked by other servers. Unknown deadline, runner will wait as usual
+            if next_deadline is not None and next_deadline < now:
+                next_deadline = None
+            with DelayedTaskRunner._wakeup:
+                DelayedTaskRunner._next_deadline = next_deadline
+
+        if time.monotonic() >= DelayedTaskRunner._next_depth_check:
+            DelayedTaskRunner._next_depth_check = time.monotonic() + QUEUE_DEPTH_INTERVAL
+            stats.queue_depth = DBDelayedTask.objects.count()
+
+        instances: list[DelayedTask] = []
+        for task in tasks:
+            stats.claimed += 1
+            stats.claim_latency.observe(max(0.0, (now - task.execution_time).total_seconds()))
+            if task.insert_date > now + timedelta(seconds=30):
+                logger.warning('Executed %s due to insert_date being in the future!', task.type)
+            try:
+                task_instance = pickle.loads(base64.b64decode(task.instance.encode()))  # nosec: controlled pickle
+            except Exception:
+                # Note that is task instance can't be loaded, this task will not be run
+                logger.exception('Loading delayed task %s', task.type)
+                continue
+            if task_instance:
+                # Re-create environment data
+                task_instance.env = Environment.type_environment(task_instance.__class__)
+                instances.append(task_instance)
+        return instances
+
+    def _execute(self, task_instance: DelayedTask) -> None:
+        """
+        Executed on a worker of the pool
+        """
+        stats = DelayedTaskStats.manager()
+        started = time.monotonic()
+        try:
+            task_instance.execute()
+            stats.executed += 1
+        except Exception as e:
+            stats.failed += 1
+            logger.exception("Exception in delayed task %s: %s", e.__class__, e)
+        finally:
+            stats.execution_time.observe(time.monotonic() - started)
+            # This is run on a different thread, so we ensure the connection is closed
+            connections['default'].close()
+            with DelayedTaskRunner._wakeup:
+                DelayedTaskRunner._running -= 1
+                # If all workers were busy, runner may be waiting for a free one
+                if DelayedTaskRunner._running == DelayedTaskRunner._workers - 1:
+                    DelayedTaskRunner._wakeup_requested = True
+                    DelayedTaskRunner._wakeup.notify_all()
+
+    def execute_delayed_task(self) -> int:
+        """
+        Claims as many due tasks as free workers we have (up to DELAYED_TASKS_BATCH_SIZE) and
+        dispatches them to the workers pool.
+
+        Returns:
+            Number of tasks dispatched
+        """
+        executor = self._ensure_executor()
+        limit = min(self._free_workers(), consts.system.DELAYED_TASKS_BATCH_SIZE)
+        if limit == 0:
+            return 0  # All workers are busy, will be woken up when any of them finishes
         try:
-            with transaction.atomic():  # Encloses
-                # Throws exception if no delayed task is avilable
-                task: DBDelayedTask = (
-                    DBDelayedTask.objects.select_for_update()
-                    .filter(filt)
-                    .order_by('execution_time')[0]
-                )  # @UndefinedVariable
-                if task.insert_date > now + timedelta(seconds=30):
-                    logger.warning('Executed %s due to insert_date being in the future!', task.type)
-                task_instance_dump = base64.b64decode(task.instance.encode())
-                task.delete()
-            task_instance = pickle.loads(task_instance_dump)  # nosec: controlled pickle
-        except IndexError:
-            return  # No problem, there is no waiting delayed task
+            task_instances = self._claim(limit)
         except OperationalError:
             logger.info('Retrying delayed task')
-            return
+            return 0
         except Exception:
             # Transaction have been rolled back using the "with atomic", so here just return
-            # Note that is taskInstance can't be loaded, this task will not be run
-            logger.exception('Obtainint one task for execution')
-            return
+            logger.exception('Obtainint tasks for execution')
+            return 0
 
-        if task_instance:
-            logger.debug('Executing delayedTask:>%s<', task)
-            # Re-create environment data
-            task_instance.env = Environment.type_environment(task_instance.__class__)
-            DelayedTaskThread(task_instance).start()
+        for task_instance in task_instances:
+            logger.debug('Executing delayedTask:>%s<', task_instance)
+            with DelayedTaskRunner._wakeup:
+                DelayedTaskRunner._running += 1
+            executor.submit(self._execute, task_instance)
+        return len(task_instances)
 
-    def _insert(self, instance: DelayedTask, delay: int, tag: str) -> None:
+    def _wait(self, timeout: typing.Optional[float] = None) -> None:
+        """
+        Waits until next known deadline (or, at most, granularity seconds), or until woken up
+        """
+        with DelayedTaskRunner._wakeup:
+            if timeout is None:
+                timeout = float(self.granularity)
+                if DelayedTaskRunner._next_deadline is not None and self._free_workers() > 0:
+                    # Deadline can only be in the past if it has passed since the last claim (that refreshes it)
+                    timeout = max(
+                        MIN_WAIT, min(timeout, (DelayedTaskRunner._next_deadline - sql_now()).total_seconds())
+                    )
+            if DelayedTaskRunner._keep_running and not DelayedTaskRunner._wakeup_requested and timeout > 0:
+                DelayedTaskRunner._wakeup.wait(timeout)
+            DelayedTaskRunner._wakeup_requested = False
+
+    def _insert(self, instance: DelayedTask, delay: int, tag: str) -> datetime:
         now = sql_now()
         exec_time = now + timedelta(seconds=delay)
         cls = instance.__class__
@@ -168,13 +340,27 @@ class DelayedTaskRunner(metaclass=singleton.Singleton):
             execution_time=exec_time,
             tag=tag,
         )
+        return exec_time
+
+    def _notify_inserted(self, exec_time: datetime) -> None:
+        """
+        Wakes up the runner if the inserted task is due before the next known deadline
+        Only tasks inserted from this process can wake up the runner, the rest will be
+        found at most "granularity" seconds later.
+        """
+        with DelayedTaskRunner._wakeup:
+            if DelayedTaskRunner._next_deadline is None or exec_time < DelayedTaskRunner._next_deadline:
+                DelayedTaskRunner._next_deadline = exec_time
+                DelayedTaskRunner._wakeup_requested = True
+                DelayedTaskRunner._wakeup.notify_all()
 
     def insert(self, instance: DelayedTask, delay: int, tag: str = '') -> bool:
         retries = 3
         while retries > 0:
             retries -= 1
             try:
-                self._insert(instance, delay, tag)
+                exec_time = self._insert(instance, delay, tag)
+                self._notify_inserted(exec_time)
                 break
             except Exception as e:
                 logger.info('Exception inserting a delayed task %s: %s', e.__class__, e)
@@ -212,12 +398,20 @@ class DelayedTaskRunner(metaclass=singleton.Singleton):
         logger.debug("At loop")
         while DelayedTaskRunner._keep_running:
             try:
-                time.sleep(self.granularity)
-                self.execute_delayed_task()
+                # If a full batch has been claimed, there may be more due tasks waiting
+                if self.execute_delayed_task() < consts.system.DELAYED_TASKS_BATCH_SIZE:
+                    self._wait()
             except Exception as e:
                 logger.error('Unexpected exception at run loop %s: %s', e.__class__, e)
                 try:
                     connections['default'].close()
                 except Exception:
                     logger.exception('Exception clossing connection at delayed task')
+                self._wait(self.granularity)
+
+        with DelayedTaskRunner._wakeup:
+            executor, DelayedTaskRunner._executor = DelayedTaskRunner._executor, None
+        if executor:
+            logger.info('Waiting for running delayed tasks to finish')
+            executor.shutdown(wait=True)
         logger.info('Exiting DelayedTask Runner because stop has been requested')
@@ -49,6 +49,9 @@ class Job(Environmentable):
         typing.Optional[Config.Value]
     ] = None  # If we use a configuration variable from DB, we need to update the frecuency asap, but not before app is ready
     friendly_name: typing.ClassVar[str] = 'Unknown'
+    # Max number of instances of this job running at once on a server. A job is marked as running on database
+    # while executing, but if its state is reset (i.e. by another server restarting) it could be claimed again
+    max_concurrency: typing.ClassVar[int] = 1
 
     @classmethod
     def setup(cls: type['Job']) -> None:
@@ -30,18 +30,24 @@
 """
 Author: Adolfo Gómez, dkmaster at dkmon dot com
 """
+import collections
 import typing
 import platform
+import random
 import threading
 import time
 import logging
-from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
-from django.db import transaction, DatabaseError, connections
+from django.db import transaction, DatabaseError, connection, connections
 from django.db.models import Q
 
 from uds.models import Scheduler as DBScheduler
+from uds.core import consts
 from uds.core.util.model import sql_now
+from uds.core.util.metrics import Histogram
+from uds.core.util import singleton
 from uds.core.types.states import State
 from .jobs_factory import JobsFactory
 
@@ -52,30 +58,127 @@ if typing.TYPE_CHECKING:
     from .job import Job
 
 
-class JobThread(threading.Thread):
+class JobTimings:
     """
-    Class responsible of executing one job.
+    Timings of a scheduled job on this server
+    """
+
+    __slots__ = ('queue_wait', 'run_time', 'overrun')
+
+    queue_wait: Histogram  # Time elapsed since job was due until it started running
+    run_time: Histogram
+    overrun: Histogram  # Time the job run exceeded its frequency (only for runs that exceeded it)
+
+    def __init__(self) -> None:
+        self.queue_wait = Histogram()
+        self.run_time = Histogram()
+        self.overrun = Histogram()
+
+    def as_dict(self) -> dict[str, typing.Any]:
+        return {
+            'queue_wait': self.queue_wait.as_dict(),
+            'run_time': self.run_time.as_dict(),
+            'overrun': self.overrun.as_dict(),
+        }
+
+
+class SchedulerStats(metaclass=singleton.Singleton):
+    """
+    Metrics of the scheduler of this process, per job
+    """
+
+    __slots__ = ('start_time', 'claimed', 'jobs', '_lock')
+
+    start_time: float
+    claimed: int
+    jobs: dict[str, JobTimings]
+    _lock: threading.Lock
+
+    def __init__(self) -> None:
+        self.start_time = time.time()
+        self.claimed = 0
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def job(self, name: str) -> JobTimings:
+        with self._lock:
+            if name not in self.jobs:
+                self.jobs[name] = JobTimings()
+            return self.jobs[name]
+
+    @property
+    def uptime(self) -> float:
+        return time.time() - self.start_time
+
+    def as_dict(self) -> dict[str, typing.Any]:
+        with self._lock:
+            jobs = dict(self.jobs)
+        return {
+            'uptime': self.uptime,
+            'claimed': self.claimed,
+            'jobs': {name: timings.as_dict() for name, timings in jobs.items()},
+        }
+
+    def __str__(self) -> str:
+        with self._lock:
+            jobs = dict(self.jobs)
+        return f'SchedulerStats: claimed={self.claimed}, ' + ', '.join(
+            f'{name}=(run_time=({timings.run_time}), queue_wait_max={timings.queue_wait.max:.2f}, overruns={timings.overrun.count})'
+            for name, timings in jobs.items()
+        )
+
+    @staticmethod
+    def manager() -> 'SchedulerStats':
+        return SchedulerStats()
+
+
+def jitter(frequency: int) -> float:
+    """
+    Returns a random delay (in seconds) to be added to the next execution of a job
+    with the provided frequency
+    """
+    return random.uniform(  # nosec: not used for security
+        0, min(frequency * consts.system.SCHEDULER_JITTER_RATIO, consts.system.SCHEDULER_MAX_JITTER)
+    )
+
+
+class JobExecution:
+    """
+    Class responsible of executing one job, on a worker of the scheduler pool.
     This class:
       Ensures that the job is executed in a controlled way (any exception will be catch & processed)
       Ensures that the scheduler db entry is released after run
+      Keeps the timings of the job
     """
 
+    __slots__ = ('_job_instance', '_db_job_id', '_name', '_freq', '_due')
+
     _job_instance: 'Job'
     _db_job_id: int
+    _name: str
     _freq: int
+    _due: datetime
 
-    def __init__(self, jobInstance: 'Job', dbJob: DBScheduler) -> None:
-        super().__init__()
-        self._job_instance = jobInstance
-        self._db_job_id = dbJob.id
-        self._freq = dbJob.frecuency
+    def __init__(self, job_instance: 'Job', db_job: DBScheduler, due: datetime) -> None:
+        self._job_instance = job_instance
+        self._db_job_id = db_job.id
+        self._name = db_job.name
+        self._freq = db_job.frecuency
+        self._due = due
 
     def run(self) -> None:
+        timings = SchedulerStats.manager().job(self._name)
+        timings.queue_wait.observe(max(0.0, (sql_now() - self._due).total_seconds()))
+        started = time.monotonic()
         try:
             self._job_instance.execute()
         except Exception:
             logger.warning("Exception executing job %s", self._db_job_id)
         finally:
+            run_time = time.monotonic() - started
+            timings.run_time.observe(run_time)
+            if run_time > self._freq:
+                timings.overrun.observe(run_time - self._freq)
             self._job_finished()
 
     def _job_finished(self) -> None:
@@ -107,15 +210,19 @@ class JobThread(threading.Thread):
             DBScheduler.objects.select_for_update().filter(id=self._db_job_id).update(
                 state=State.FOR_EXECUTE,
                 owner_server='',
-                next_execution=sql_now() + timedelta(seconds=self._freq),
+                next_execution=sql_now() + timedelta(seconds=self._freq + jitter(self._freq)),
             )
 
 
 class Scheduler:
     """
     Class responsible of maintain/execute scheduled jobs
+
+    Due jobs are claimed in batches (using SKIP LOCKED if database supports it, so several servers
+    can claim jobs concurrently without waiting for each other) and executed on a fixed size pool
+    of workers, shared by all scheduler threads of this server.
     """
-    
+
     # We check for scheduled operations every THIS seconds
     granularity: typing.Final[int] = 2
 
@@ -124,9 +231,24 @@ class Scheduler:
     _hostname: str
     _keep_running: bool
 
+    _lock: threading.Lock  # Protects all "state" below
+    _executor: typing.Optional[ThreadPoolExecutor]
+    _workers: int
+    _running: int  # Jobs being executed (or reserved for being executed) right now
+    _running_jobs: collections.Counter[str]  # Number of running instances of every job on this server
+    _limits: dict[str, int]  # Concurrency limit of the jobs that have been started on this server
+    _loops: int  # Number of threads running the scheduler loop
+
     def __init__(self) -> None:
         self._hostname = platform.node()
         self._keep_running = True
+        self._lock = threading.Lock()
+        self._executor = None
+        self._workers = 0
+        self._running = 0
+        self._running_jobs = collections.Counter()
+        self._limits = {}
+        self._loops = 0
         logger.info('Initialized scheduler for host "%s"', self._hostname)
 
     @staticmethod
@@ -144,45 +266,90 @@ class Scheduler:
         """
         self._keep_running = False
 
+    def _ensure_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._workers = max(1, consts.system.SCHEDULER_WORKERS)
+                self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='Job')
+            return self._executor
+
+    def _reserve(self, count: int) -> int:
+        """
+        Reserves up to count workers, returning the number of reserved ones
+        """
+        with self._lock:
+            reserved = max(0, min(count, self._workers - self._running))
+            self._running += reserved
+            return reserved
+
+    def _release(self, count: int) -> None:
+        with self._lock:
+            self._running -= count
+
+    def _saturated_jobs(self) -> list[str]:
+        """
+        Returns the jobs that have reached its concurrency limit on this server
+        """
+        with self._lock:
+            return [name for name, count in self._running_jobs.items() if count >= self._limits.get(name, 1)]
+
+    def _execute(self, execution: JobExecution, name: str) -> None:
+        try:
+            execution.run()
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._running_jobs[name] -= 1
+                if self._running_jobs[name] <= 0:
+                    del self._running_jobs[name]
+
     def execute_job(self) -> None:
         """
-        Looks for the best waiting job and executes it
+        Looks for the best waiting jobs and executes them
         """
-        jobInstance = None
+        executor = self._ensure_executor()
+        reserved = self._reserve(consts.system.SCHEDULER_BATCH_SIZE)
+        if reserved == 0:
+            return  # All workers are busy
+        started = 0
         try:
             now = sql_now()  # Datetimes are based on database server times
-            fltr = Q(state=State.FOR_EXECUTE) & (
-                Q(last_execution__gt=now) | Q(next_execution__lt=now)
-            )
+            fltr = Q(state=State.FOR_EXECUTE) & (Q(last_execution__gt=now) | Q(next_execution__lt=now))
+            skip_locked: bool = connection.features.has_select_for_update_skip_locked
             with transaction.atomic():
                 # If next execution is before now or last execution is in the future (clock changed on this server, we take that task as executable)
                 # This params are all set inside fltr (look at __init__)
-                job: DBScheduler = (
-                    DBScheduler.objects.select_for_update()
+                db_jobs: list[DBScheduler] = list(
+                    DBScheduler.objects.select_for_update(skip_locked=skip_locked)
                     .filter(fltr)
-                    .order_by('next_execution')[0]
+                    .exclude(name__in=self._saturated_jobs())
+                    .order_by('next_execution')[:reserved]
                 )
+                if db_jobs:
+                    DBScheduler.objects.filter(id__in=[job.id for job in db_jobs]).update(
+                        state=State.RUNNING, owner_server=self._hostname, last_execution=now
+                    )
+
+            SchedulerStats.manager().claimed += len(db_jobs)
+            for job in db_jobs:
                 if job.last_execution > now:
                     logger.warning(
                         'EXecuted %s due to last_execution being in the future!',
                         job.name,
                     )
-                job.state = State.RUNNING
-                job.owner_server = self._hostname
-                job.last_execution = now
-                job.save(update_fields=['state', 'owner_server', 'last_execution'])
-
-            jobInstance = job.get_instance()
-
-            if jobInstance is None:
-                logger.error('Job instance can\'t be resolved for %s, removing it', job)
-                job.delete()
-                return
-            logger.debug('Executing job:>%s<', job.name)
-            JobThread(jobInstance, job).start()  # Do not instatiate thread, just run it
-        except IndexError:
-            # Do nothing, there is no jobs for execution
-            return
+                job_instance = job.get_instance()
+
+                if job_instance is None:
+                    logger.error('Job instance can\'t be resolved for %s, removing it', job)
+                    job.delete()
+                    continue
+
+                logger.debug('Executing job:>%s<', job.name)
+                with self._lock:
+                    self._limits[job.name] = job_instance.max_concurrency
+                    self._running_jobs[job.name] += 1
+                started += 1
+                executor.submit(self._execute, JobExecution(job_instance, job, min(job.next_execution, now)), job.name)
         except DatabaseError as e:
             # Whis will happen whenever a connection error or a deadlock error happens
             # This in fact means that we have to retry operation, and retry will happen on main loop
@@ -192,6 +359,8 @@ class Scheduler:
             raise DatabaseError(
                 f'Database access problems. Retrying connection ({e})'
             ) from e
+        finally:
+            self._release(reserved - started)
 
     @staticmethod
     def release_own_schedules() -> None:
@@ -224,9 +393,12 @@ class Scheduler:
         logger.debug('Run Scheduler thread')
         JobsFactory().ensure_jobs_registered()
         logger.debug("At loop")
+        with self._lock:
+            self._loops += 1
         while self._keep_running:
             try:
-                time.sleep(self.granularity)
+                # Randomize a bit the interval, so servers (and threads) do not query in lockstep
+                time.sleep(self.granularity * random.uniform(0.75, 1.25))  # nosec: not used for security
                 self.execute_job()
             except Exception as e:
                 # This can happen often on sqlite, and this is not problem at all as we recover it.
@@ -240,4 +412,13 @@ class Scheduler:
                 except Exception:
                     logger.exception('Exception clossing connection at delayed task')
         logger.info('Exiting Scheduler because stop has been requested')
+        # Last loop waits for running jobs before releasing schedules
+        with self._lock:
+            self._loops -= 1
+            executor = self._executor if self._loops == 0 else None
+            if executor:
+                self._executor = None
+        if executor:
+            logger.info('Waiting for running jobs to finish')
+            executor.shutdown(wait=True)
         self.release_own_schedules()
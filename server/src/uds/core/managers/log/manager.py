@@ -30,10 +30,15 @@
 Author: Adolfo Gómez, dkmaster at dkmon dot com
 """
 # import traceback
+import datetime
+import threading
+import time
 import typing
 import logging
 
+from uds.core import consts
 from uds.core.util import singleton
+from uds.core.util.bulk_buffer import BulkBuffer
 from uds.core.util.model import sql_now
 from uds.models.log import Log
 # from uds.core.workers.log
@@ -49,11 +54,104 @@ logger = logging.getLogger(__name__)
 class LogManager(metaclass=singleton.Singleton):
     """
     Manager for logging (at database) events
+
+    Entries are queued and written in bulk by a background thread (look at uds.core.util.bulk_buffer),
+    so logging does not add database latency to the caller. Owners that receive new entries are
+    trimmed to its max elements periodically, with a single delete per owner.
     """
+
+    buffer: BulkBuffer[Log]
+    _lock: threading.Lock
+    _written_owners: set[tuple[int, int]]  # (owner_type, owner_id) with new entries since last trim
+    _last_trim: float
+
+    def __init__(self) -> None:
+        self.buffer = BulkBuffer(
+            Log,
+            flush_size=consts.system.LOG_BUFFER_SIZE,
+            flush_interval=consts.system.LOG_BUFFER_INTERVAL,
+            max_pending=consts.system.LOG_BUFFER_MAX_PENDING,
+            asynchronous=True,
+            on_flush=self._written,
+        )
+        self._lock = threading.Lock()
+        self._written_owners = set()
+        self._last_trim = time.monotonic()
+
     @staticmethod
     def manager() -> 'LogManager':
         return LogManager()  # Singleton pattern will return always the same instance
 
+    def _written(self, entries: list[Log]) -> None:
+        """
+        Invoked after entries have been written. Trims the owners of the entries if trim interval has elapsed
+        """
+        with self._lock:
+            self._written_owners.update((entry.owner_type, entry.owner_id) for entry in entries)
+            if time.monotonic() - self._last_trim < consts.system.LOG_TRIM_INTERVAL:
+                return
+            owners, self._written_owners = self._written_owners, set()
+            self._last_trim = time.monotonic()
+
+        for owner_type, owner_id in owners:
+            try:
+                self.trim(owner_type, owner_id)
+            except Exception as e:
+                logger.error('Error trimming logs of %s.%s: %s', owner_type, owner_id, e)
+
+    def trim(self, owner_type: int, owner_id: int, max_elements: typing.Optional[int] = None) -> int:
+        """
+        Removes the oldest logs of an owner, keeping at most max_elements (default is the max for owner type)
+        Uses a single ranged delete.
+
+        Returns:
+            Number of removed entries
+        """
+        logs = Log.objects.filter(owner_id=owner_id, owner_type=owner_type)
+        if max_elements is None:
+            try:
+                max_elements = LogObjectType(owner_type).get_max_elements()
+            except ValueError:
+                # If we do not know the owner type, we will delete all logs for this owner
+                return logs.delete()[0]
+
+        if max_elements <= 0:  # Negative (or zero) max elements means "unlimited"
+            return 0
+
+        # Newest entry that exceeds max_elements, if any
+        cutoff = list(logs.order_by('-id').values_list('id', flat=True)[max_elements : max_elements + 1])
+        if not cutoff:
+            return 0
+        return logs.filter(id__lte=cutoff[0]).delete()[0]
+
+    def clear_orphans(self) -> int:
+        """
+        Removes the logs whose owner does not exists anymore. clear_logs can only discard the entries queued
+        by this process, so entries queued by others for a removed owner are written after it.
+        Only entries older than LOG_ORPHANS_GRACE are considered, so owners not commited yet are not affected.
+
+        Returns:
+            Number of removed entries
+        """
+        older = sql_now() - datetime.timedelta(seconds=consts.system.LOG_ORPHANS_GRACE)
+        removed = 0
+        for owner_type in LogObjectType:
+            model = owner_type.get_model()
+            if model is None:
+                continue
+            removed += (
+                Log.objects.filter(owner_type=owner_type, created__lt=older)
+                .exclude(owner_id__in=model.objects.values('id'))
+                .delete()[0]
+            )
+        return removed
+
+    def flush(self) -> None:
+        """
+        Writes all queued entries to database
+        """
+        self.buffer.flush()
+
     def _log(
         self,
         owner_type: LogObjectType,
@@ -66,12 +164,14 @@ class LogManager(metaclass=singleton.Singleton):
         """
         Logs a message associated to owner
         """
-        # Ensure message fits on space
+        # Ensure message, source and name fit on its fields
         message = str(message)[:4096]
+        source = str(source)[:16]
+        logName = str(logName)[:64]
 
-        # now, we add new log
-        try:
-            Log.objects.create(
+        # now, we queue new log
+        self.buffer.add(
+            Log(
                 owner_type=owner_type.value,
                 owner_id=owner_id,
                 created=sql_now(),
@@ -80,9 +180,7 @@ class LogManager(metaclass=singleton.Singleton):
                 data=message,
                 name=logName,
             )
-        except Exception:  # nosec
-            # Some objects will not get logged, such as System administrator objects, but this is fine
-            pass
+        )
 
     def _get_logs(
         self, owner_type: LogObjectType, owner_id: int, limit: int
@@ -90,6 +188,7 @@ class LogManager(metaclass=singleton.Singleton):
         """
         Get all logs associated with an user service, ordered by date
         """
+        self.buffer.flush()  # Ensure entries queued by this process are included
         qs = Log.objects.filter(owner_id=owner_id, owner_type=owner_type.value)
         return [
             {'date': x.created, 'level': x.level, 'source': x.source, 'message': x.data}
@@ -100,6 +199,7 @@ class LogManager(metaclass=singleton.Singleton):
         """
         Clears ALL logs related to user service
         """
+        self.buffer.flush()  # Ensure no queued entry of this process is written after clearing (see clear_orphans)
         Log.objects.filter(owner_id=owner_id, owner_type=owner_type).delete()
 
     def log(
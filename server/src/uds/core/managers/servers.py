@@ -33,12 +33,12 @@ import logging
 import typing
 from concurrent.futures import ThreadPoolExecutor
 
-from django.db import transaction
+from django.db import connections, transaction
 from django.db.models import Q
 from django.utils.translation import gettext as _
 
 from uds import models
-from uds.core import exceptions, types
+from uds.core import consts, exceptions, types
 from uds.core.util import model as model_utils
 from uds.core.util import singleton
 from uds.core.util.storage import StorageAccess, Storage
@@ -60,6 +60,10 @@ class ServerManager(metaclass=singleton.Singleton):
 
     # Singleton, can initialize here
     last_counters_clean: datetime.datetime = datetime.datetime.now()
+    # Used to request stats of servers that has not pushed them recently
+    stats_executor: ThreadPoolExecutor = ThreadPoolExecutor(
+        max_workers=consts.system.SERVER_STATS_WORKERS, thread_name_prefix='uds-server-stats'
+    )
 
     @staticmethod
     def manager() -> 'ServerManager':
@@ -106,27 +110,64 @@ class ServerManager(metaclass=singleton.Singleton):
     ) -> list[tuple[typing.Optional['types.servers.ServerStats'], 'models.Server']]:
         """
         Returns a list of stats for a list of servers
+
+        Stats are the ones pushed by the servers on every ping (see servers_api.events.process_ping),
+        so only servers without fresh stats are requested (in parallel). Unmanaged servers has no stats at all.
+        No locks are taken on servers, the selected one is claimed later (see claim_server)
         """
-        # Paralelize stats retrieval
         retrieved_stats: list[tuple[typing.Optional['types.servers.ServerStats'], 'models.Server']] = []
+        outdated: list['models.Server'] = []
 
-        def _retrieve_stats(server: 'models.Server') -> None:
+        servers = list(serversFltr)
+        restrained = models.Server.restrained_uuids(server.uuid for server in servers)
+        for server in servers:
+            if server.uuid in restrained:
+                continue  # Skip restrained servers
+            if server.type == types.servers.ServerType.UNMANAGED:
+                retrieved_stats.append((None, server))
+                continue
+            stats = server.stats
+            if stats and stats.is_valid:
+                retrieved_stats.append((stats, server))
+            else:
+                outdated.append(server)
+
+        def _retrieve_stats(server: 'models.Server') -> typing.Optional['types.servers.ServerStats']:
             try:
-                retrieved_stats.append(
-                    (requester.ServerApiRequester(server).get_stats(), server)
-                )  # Store stats for later use
+                return requester.ServerApiRequester(server).get_stats()  # Stores them for next assignations
             except Exception:
-                retrieved_stats.append((None, server))
+                return None
+            finally:
+                # Executed on its own thread, so we ensure the connection is released
+                connections['default'].close()
 
-        # Retrieve, in parallel, stats for all servers (not restrained)
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            for server in serversFltr.select_for_update():
-                if server.is_restrained():
-                    continue  # Skip restrained servers
-                executor.submit(_retrieve_stats, server)
+        # Retrieve, in parallel, stats for servers without fresh stats
+        futures = [(self.stats_executor.submit(_retrieve_stats, server), server) for server in outdated]
+        for future, server in futures:
+            retrieved_stats.append((future.result(), server))
 
         return retrieved_stats
 
+    def claim_server(
+        self,
+        server: 'models.Server',
+        now: datetime.datetime,
+        lock_interval: typing.Optional[datetime.timedelta] = None,
+    ) -> bool:
+        """
+        Locks the server (or clears its outdated lock if no lock_interval is provided) only if it is not
+        locked by other assignation right now. Atomic, so no row locks are needed while selecting the server
+
+        Returns:
+            True if the server has been claimed, False if it was locked meanwhile
+        """
+        return (
+            models.Server.objects.filter(Q(locked_until=None) | Q(locked_until__lte=now), uuid=server.uuid).update(
+                locked_until=now + lock_interval if lock_interval else None
+            )
+            == 1
+        )
+
     def _find_best_server(
         self,
         userservice: 'models.UserService',
@@ -258,21 +299,23 @@ class ServerManager(metaclass=singleton.Singleton):
                         self.increment_unmanaged_usage(info.server_uuid, only_if_exists=True)
                 # If no existing assignation, check for a new one
                 if info is None:
-                    try:
-                        with transaction.atomic():
+                    candidates_excluded = set(excluded_servers_uuids)
+                    while info is None:
+                        try:
                             best = self._find_best_server(
                                 userservice=userservice,
                                 server_group=server_group,
                                 now=now,
                                 min_memory_mb=min_memory_mb,
-                                excluded_servers_uuids=excluded_servers_uuids,
+                                excluded_servers_uuids=candidates_excluded,
                             )
+                        except exceptions.UDSException:  # No more servers
+                            return None
 
+                        if self.claim_server(best[0], now, lock_interval):
                             info = types.servers.ServerCounter(best[0].uuid, 0)
-                            best[0].locked_until = now + lock_interval if lock_interval else None
-                            best[0].save(update_fields=['locked_until'])
-                    except exceptions.UDSException:  # No more servers
-                        return None
+                        else:  # Locked by a concurrent assignation, look for another one
+                            candidates_excluded.add(best[0].uuid)
                 elif lock_interval:  # If lockTime is set, update it
                     models.Server.objects.filter(uuid=info.server_uuid).update(locked_until=now + lock_interval)
 
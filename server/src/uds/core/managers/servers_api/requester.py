@@ -29,9 +29,7 @@
 Author: Adolfo Gómez, dkmaster at dkmon dot com
 """
 import datetime
-import os
 import hashlib
-import tempfile
 import contextlib
 import logging
 import typing
@@ -91,15 +89,12 @@ class ServerApiRequester:
         Sets up the request for the server
         """
         minVersion = minVersion or consts.system.MIN_SERVER_VERSION
-        # If server has a cert, save it to a file
-        verify: typing.Union[str, bool] = False
         try:
+            # If server has a cert, verify the server with it. Connections are pooled by host and cert
             if self.server.certificate:
-                # Generate temp file, and delete it after
-                with tempfile.NamedTemporaryFile('w', delete=False) as f:
-                    f.write(self.server.certificate)  # Save cert
-                    verify = f.name
-            session = security.secure_requests_session(verify=verify)
+                session = security.secure_requests_session(cadata=self.server.certificate)
+            else:
+                session = security.secure_requests_session(verify=False)
             # Setup headers
             session.headers.update(
                 {
@@ -119,11 +114,6 @@ class ServerApiRequester:
             yield session
         finally:
             session.close()
-            if isinstance(verify, str):
-                try:
-                    os.unlink(verify)
-                except Exception:
-                    logger.error('Error removing temp file %s', verify)
 
     def get_comms_endpoint(self, method: str, minVersion: typing.Optional[str]) -> typing.Optional[str]:
         """
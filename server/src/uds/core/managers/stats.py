@@ -36,8 +36,12 @@ import logging
 import time
 import typing
 
-from uds.core import types
+from django.db import transaction
+
+from uds.core import consts, types
 from uds.core.util import singleton
+from uds.core.util.storage import Storage
+from uds.core.util.bulk_buffer import BulkBuffer, OverflowPolicy
 from uds.core.util.config import GlobalConfig
 from uds.core.util.model import sql_now, sql_stamp_seconds
 from uds.models import StatsCounters, StatsCountersAccum, StatsEvents
@@ -75,11 +79,48 @@ class StatsManager(metaclass=singleton.Singleton):
     Right now, we are going to provide an interface to "counter stats", that is, statistics
     that has counters (such as how many users is at a time active at platform, how many services
     are assigned, are in use, in cache, etc...
+
+    Counters and events are not inserted one by one, but buffered and inserted in bulk (look at
+    uds.core.util.bulk_buffer). Use "flush" if they must be visible on database right now.
     """
+
+    counters_buffer: BulkBuffer[StatsCounters]
+    events_buffer: BulkBuffer[StatsEvents]
+
+    def __init__(self) -> None:
+        policy = OverflowPolicy(consts.system.STATS_BUFFER_POLICY)
+        self.counters_buffer = BulkBuffer(
+            StatsCounters,
+            flush_size=consts.system.STATS_BUFFER_SIZE,
+            flush_interval=consts.system.STATS_BUFFER_INTERVAL,
+            max_pending=consts.system.STATS_BUFFER_MAX_PENDING,
+            policy=policy,
+        )
+        self.events_buffer = BulkBuffer(
+            StatsEvents,
+            flush_size=consts.system.STATS_BUFFER_SIZE,
+            flush_interval=consts.system.STATS_BUFFER_INTERVAL,
+            max_pending=consts.system.STATS_BUFFER_MAX_PENDING,
+            policy=policy,
+        )
+
     @staticmethod
     def manager() -> 'StatsManager':
         return StatsManager()  # Singleton pattern will return always the same instance
 
+    def flush(self) -> None:
+        """
+        Writes all buffered counters and events to database
+        """
+        self.counters_buffer.flush()
+        self.events_buffer.flush()
+
+    def stats(self) -> dict[str, typing.Any]:
+        return {
+            'counters': self.counters_buffer.stats.as_dict(),
+            'events': self.events_buffer.stats.as_dict(),
+        }
+
     def _do_maintanance(
         self,
         model: type[typing.Union['StatsCounters', 'StatsEvents', 'StatsCountersAccum']],
@@ -120,18 +161,15 @@ class StatsManager(metaclass=singleton.Singleton):
         # To Unix epoch
         stampInt = int(time.mktime(stamp.timetuple()))  # pylint: disable=maybe-no-member
 
-        try:
-            StatsCounters.objects.create(
+        return self.counters_buffer.add(
+            StatsCounters(
                 owner_type=owner_type,
                 owner_id=owner_id,
                 counter_type=counterType,
                 value=counterValue,
                 stamp=stampInt,
             )
-            return True
-        except Exception:
-            logger.error('Exception handling counter stats saving (maybe database is full?)')
-        return False
+        )
 
     def enumerate_counters(
         self,
@@ -284,17 +322,18 @@ class StatsManager(metaclass=singleton.Singleton):
             fld3 = get_kwarg('fld3')
             fld4 = get_kwarg('fld4')
 
-            StatsEvents.objects.create(
-                owner_type=owner_type,
-                owner_id=owner_id,
-                event_type=event_type,
-                stamp=stamp,
-                fld1=fld1,
-                fld2=fld2,
-                fld3=fld3,
-                fld4=fld4,
+            return self.events_buffer.add(
+                StatsEvents(
+                    owner_type=owner_type,
+                    owner_id=owner_id,
+                    event_type=event_type,
+                    stamp=stamp,
+                    fld1=fld1,
+                    fld2=fld2,
+                    fld3=fld3,
+                    fld4=fld4,
+                )
             )
-            return True
         except Exception:
             logger.exception('Exception handling event stats saving (maybe database is full?)')
         return False
@@ -326,6 +365,7 @@ class StatsManager(metaclass=singleton.Singleton):
     def tail_events(
         self, *, starting_id: typing.Optional[str] = None, number: typing.Optional[int] = None
     ) -> 'models.QuerySet[StatsEvents]':
+        self.events_buffer.flush()
         # If number is not specified, we return five last events
         number = number or 5
         if starting_id:
@@ -339,6 +379,95 @@ class StatsManager(metaclass=singleton.Singleton):
 
         self._do_maintanance(StatsEvents)
 
+    def _accum_storage(self) -> Storage:
+        return Storage('uds.stats.accum')
+
+    def get_accum_watermark(self, interval_type: StatsCountersAccum.IntervalType) -> typing.Optional[int]:
+        """
+        Returns the stamp until data has been accumulated (exclusive) for an interval type,
+        or None if there is no data at all to be accumulated.
+        """
+        watermark = self._accum_storage().read_string(interval_type.name)
+        if watermark:
+            return int(watermark)
+
+        # No watermark stored (first run, or upgraded from a version without them), get it from data
+        # Accumulated records are stamped at the end of its interval
+        last: typing.Optional[int] = (
+            StatsCountersAccum.objects.filter(interval_type=interval_type)
+            .order_by('-stamp')
+            .values_list('stamp', flat=True)
+            .first()
+        )
+        if last is None:
+            # Start from first record of the data source
+            source = (
+                StatsCounters.objects.all()
+                if interval_type == StatsCountersAccum.IntervalType.HOUR
+                else StatsCountersAccum.objects.filter(interval_type=interval_type.prev())
+            )
+            last = source.order_by('stamp').values_list('stamp', flat=True).first()
+        if last is None:
+            return None
+        return StatsCountersAccum.adjust_to_interval(last, interval_type=interval_type)
+
     def acummulate(self, max_days: int = 7) -> None:
-        for interval in StatsCountersAccum.IntervalType:
-            StatsCountersAccum.acummulate(interval, max_days)
+        """
+        Incrementally accumulates counters, from the last accumulated stamp (watermark) of every
+        interval type, processing at most max_days of data for each one.
+
+        HOUR intervals are computed from raw counters, DAY intervals are rolled up from HOUR ones
+        (and never beyond the HOUR watermark, so they are computed with complete data)
+        """
+        self.counters_buffer.flush()  # Ensure pending counters are accumulated
+        storage = self._accum_storage()
+        until: typing.Optional[int] = None  # Watermark of the previous interval type, if any
+        # Counters still buffered on other processes will be written with its original stamp
+        now = sql_stamp_seconds() - consts.system.STATS_ACCUM_GRACE
+        for interval_type in StatsCountersAccum.IntervalType:  # HOUR, then DAY
+            start = self.get_accum_watermark(interval_type)
+            if start is None:  # Nothing to accumulate
+                return
+
+            # Up to now (or previous interval watermark), adjusted to interval so we dont have "leftovers"
+            end = StatsCountersAccum.adjust_to_interval(
+                min(until, now) if until is not None else now,
+                interval_type=interval_type,
+            )
+            # Bounded chunks, to avoid having a huge query that will take a lot of time
+            end = min(end, start + max_days * 24 * 3600)
+            end = StatsCountersAccum.adjust_to_interval(end, interval_type=interval_type)
+            if end > start:
+                with transaction.atomic():
+                    StatsCountersAccum.acummulate_range(interval_type, start, end)
+                    storage.put(interval_type.name, str(end))
+            # Records are stamped at the end of its interval, so records of next interval type can be
+            # accumulated up to (not included) our watermark plus one interval
+            until = max(end, start) + interval_type.seconds()
+
+    def backfill(self, since: datetime.datetime, to: datetime.datetime, max_days: int = 7) -> None:
+        """
+        Recomputes accumulated counters of an already accumulated range (i.e. after importing or fixing
+        raw counters), in chunks of at most max_days, each one on its own transaction.
+        """
+        self.counters_buffer.flush()
+        for interval_type in StatsCountersAccum.IntervalType:  # HOUR, then DAY
+            watermark = self.get_accum_watermark(interval_type)
+            if watermark is None:
+                return
+            # Only already accumulated ranges, the rest will be processed by acummulate
+            start = StatsCountersAccum.adjust_to_interval(int(since.timestamp()), interval_type=interval_type)
+            end = min(
+                StatsCountersAccum.adjust_to_interval(int(to.timestamp()), interval_type=interval_type), watermark
+            )
+            chunk = max(max_days * 24 * 3600, interval_type.seconds())
+            while start < end:
+                chunk_end = min(start + chunk, end)
+                logger.info('Backfilling %s stats from %s to %s', interval_type.name, start, chunk_end)
+                with transaction.atomic():
+                    # Accumulated records are stamped at the end of its interval
+                    StatsCountersAccum.objects.filter(
+                        interval_type=interval_type, stamp__gt=start, stamp__lte=chunk_end
+                    ).delete()
+                    StatsCountersAccum.acummulate_range(interval_type, start, chunk_end)
+                start = chunk_end
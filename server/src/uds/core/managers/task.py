@@ -36,10 +36,12 @@ import logging
 import typing
 
 from django.db import connection
-from uds.core.jobs.scheduler import Scheduler
-from uds.core.jobs.delayed_task_runner import DelayedTaskRunner
-from uds.core import jobs
+from uds.core.jobs.scheduler import Scheduler, SchedulerStats
+from uds.core.jobs.delayed_task_runner import DelayedTaskRunner, DelayedTaskStats
+from uds.core.workers.deferred_deletion import DeferredDeletionStats
+from uds.core import jobs, consts
 from uds.core.util.config import GlobalConfig
+from uds.core.util.bulk_buffer import BulkBuffer
 from uds.core.util import singleton
 
 logger = logging.getLogger(__name__)
@@ -96,6 +98,21 @@ class TaskManager(metaclass=singleton.Singleton):
         logger.info("Caught term signal, finishing task manager")
         TaskManager.manager().keep_running = False
 
+    @staticmethod
+    def stats() -> dict[str, typing.Any]:
+        """
+        Returns the metrics of the scheduler and delayed task runner of this process
+        """
+        return {
+            'scheduler': SchedulerStats.manager().as_dict(),
+            'delayed_tasks': DelayedTaskStats.manager().as_dict(),
+        }
+
+    def log_stats(self) -> None:
+        logger.info('%s', SchedulerStats.manager())
+        logger.info('%s', DelayedTaskStats.manager())
+        logger.info('%s', DeferredDeletionStats.manager())
+
     def register_job(self, job_type: type[jobs.Job]) -> None:
         job_name = job_type.friendly_name
         jobs.factory().register(job_name, job_type)
@@ -130,7 +147,10 @@ class TaskManager(metaclass=singleton.Singleton):
         noDelayedTasks: int = GlobalConfig.DELAYED_TASKS_THREADS.as_int()
 
         logger.info(
-            'Starting %s schedulers and %s task executors', noSchedulers, noDelayedTasks
+            'Starting %s schedulers with %s workers and a delayed task runner with %s workers',
+            noSchedulers,
+            consts.system.SCHEDULER_WORKERS,
+            noDelayedTasks,
         )
 
         signal.signal(signal.SIGTERM, TaskManager.sig_term)
@@ -143,11 +163,10 @@ class TaskManager(metaclass=singleton.Singleton):
             self.threads.append(thread)
             time.sleep(0.5)  # Wait a bit before next scheduler is started
 
-        for _ in range(noDelayedTasks):
-            thread = DelayedTaskThread()
-            thread.start()
-            self.threads.append(thread)
-            time.sleep(0.5)  # Wait a bit before next delayed task runner is started
+        # Delayed task runner dispatches tasks to its own pool of DELAYED_TASKS_THREADS workers
+        thread = DelayedTaskThread()
+        thread.start()
+        self.threads.append(thread)
 
         # Add any other tasks (Such as message processor)
         self.add_other_tasks()
@@ -158,10 +177,18 @@ class TaskManager(metaclass=singleton.Singleton):
         # Remote.on()
 
         # gc.set_debug(gc.DEBUG_LEAK)
+        last_stats = time.monotonic()
         while self.keep_running:
             time.sleep(1)
+            if time.monotonic() - last_stats >= consts.system.TASKS_STATS_INTERVAL:
+                last_stats = time.monotonic()
+                self.log_stats()
 
+        self.log_stats()
         for thread in self.threads:
             thread.request_stop()
 
+        # Write any buffered data (i.e. stats) before exiting
+        BulkBuffer.flush_all()
+
         # The join of threads will happen before termination, so its fine to just return here
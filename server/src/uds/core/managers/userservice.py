@@ -33,9 +33,11 @@ Author: Adolfo Gómez, dkmaster at dkmon dot com
 import logging
 import operator
 import random
+import threading
+import time
 import typing
 
-from django.db import transaction
+from django.db import connection, transaction
 from django.db.models import Q
 from django.utils.translation import gettext as _
 
@@ -50,6 +52,7 @@ from uds.core.services.exceptions import (
 )
 from uds.core.util import log, singleton
 from uds.core.util.decorators import cached
+from uds.core.util.metrics import Histogram
 from uds.core.util.model import sql_now
 from uds.core.types.states import State
 from uds.core.util.stats import events
@@ -66,6 +69,45 @@ trace_logger = logging.getLogger('traceLog')
 operations_logger = logging.getLogger('operationsLog')
 
 
+class CacheClaimStats(metaclass=singleton.Singleton):
+    """
+    Metrics of the cached user services claimed on assignations by this process
+    """
+
+    claimed: int
+    retries: int  # Candidates already claimed by a concurrent assignation when trying to claim them
+    misses: int  # Assignations not finding any available cached user service (counted once per assignation)
+    claim_time: Histogram
+    _lock: threading.Lock
+
+    def __init__(self) -> None:
+        self.claimed = 0
+        self.retries = 0
+        self.misses = 0
+        self.claim_time = Histogram()
+        self._lock = threading.Lock()
+
+    def record(self, *, claimed: int = 0, retries: int = 0, misses: int = 0) -> None:
+        with self._lock:
+            self.claimed += claimed
+            self.retries += retries
+            self.misses += misses
+
+    def as_dict(self) -> dict[str, typing.Any]:
+        with self._lock:
+            counters = {'claimed': self.claimed, 'retries': self.retries, 'misses': self.misses}
+        return counters | {'claim_time': self.claim_time.as_dict()}
+
+    def __str__(self) -> str:
+        with self._lock:
+            counters = f'claimed={self.claimed}, retries={self.retries}, misses={self.misses}'
+        return f'CacheClaimStats: {counters}, claim_time=({self.claim_time})'
+
+    @staticmethod
+    def manager() -> 'CacheClaimStats':
+        return CacheClaimStats()
+
+
 class UserServiceManager(metaclass=singleton.Singleton):
 
     @staticmethod
@@ -371,6 +413,41 @@ class UserServiceManager(metaclass=singleton.Singleton):
             return existing.first()
         return None
 
+    def claim_cached_userservice(
+        self, service_pool: ServicePool, user: User, **filters: typing.Any
+    ) -> typing.Optional[UserService]:
+        """
+        Reserves for user a L1 cached user service of the pool matching filters, if any available
+
+        Rows locked by concurrent assignations are skipped (SELECT ... FOR UPDATE SKIP LOCKED), so every
+        request gets a different cached user service instead of waiting for the same one. On databases without
+        SKIP LOCKED (sqlite), some candidates are taken in random order and claimed with a conditional update,
+        trying the next one if a concurrent request claimed it first.
+        """
+        stats = CacheClaimStats.manager()
+        started = time.monotonic()
+        candidates_qs = service_pool.cached_users_services().filter(
+            cache_level=types.services.CacheLevel.L1, **filters
+        )
+        try:
+            with transaction.atomic():
+                if connection.features.has_select_for_update_skip_locked:
+                    candidates = list(candidates_qs.select_for_update(skip_locked=True)[:1])
+                else:
+                    candidates = list(candidates_qs[: consts.services.CACHE_CLAIM_CANDIDATES])
+                    random.shuffle(candidates)
+
+                for candidate in candidates:
+                    # Ensure element is reserved correctly on DB
+                    if candidates_qs.filter(user=None, uuid=candidate.uuid).update(user=user, cache_level=0) == 1:
+                        stats.record(claimed=1)
+                        return candidate
+                    stats.record(retries=1)
+        finally:
+            stats.claim_time.observe(time.monotonic() - started)
+
+        return None
+
     def get_assignation_for_user(
         self, service_pool: ServicePool, user: User
     ) -> typing.Optional[UserService]:  # pylint: disable=too-many-branches
@@ -386,56 +463,11 @@ class UserServiceManager(metaclass=singleton.Singleton):
         if service_pool.is_restrained():
             raise InvalidServiceException(_('The requested service is restrained'))
 
-        cache: typing.Optional[UserService] = None
         # Now try to locate 1 from cache already "ready" (must be usable and at level 1)
-        with transaction.atomic():
-            caches = typing.cast(
-                list[UserService],
-                service_pool.cached_users_services()
-                .select_for_update()
-                .filter(
-                    cache_level=types.services.CacheLevel.L1,
-                    state=State.USABLE,
-                    os_state=State.USABLE,
-                )[:1],
-            )
-            if caches:
-                cache = caches[0]
-                # Ensure element is reserved correctly on DB
-                if (
-                    service_pool.cached_users_services()
-                    .select_for_update()
-                    .filter(user=None, uuid=cache.uuid)
-                    .update(user=user, cache_level=0)
-                    != 1
-                ):
-                    cache = None
-            else:
-                cache = None
+        cache = self.claim_cached_userservice(
+            service_pool, user, state=State.USABLE, os_state=State.USABLE
+        ) or self.claim_cached_userservice(service_pool, user, state=State.USABLE)
 
-        # Out of previous atomic
-        if not cache:
-            with transaction.atomic():
-                caches = typing.cast(
-                    list[UserService],
-                    service_pool.cached_users_services()
-                    .select_for_update()
-                    .filter(cache_level=types.services.CacheLevel.L1, state=State.USABLE)[:1],
-                )
-                if caches:  # If there is a cache, we will use it
-                    cache = caches[0]
-                    if (
-                        service_pool.cached_users_services()
-                        .select_for_update()
-                        .filter(user=None, uuid=cache.uuid)
-                        .update(user=user, cache_level=0)
-                        != 1
-                    ):
-                        cache = None
-                else:
-                    cache = None
-
-        # Out of atomic transaction
         if cache:
             # Early assign
             cache.assign_to(user)
@@ -458,26 +490,8 @@ class UserServiceManager(metaclass=singleton.Singleton):
         # Cache missed
 
         # Now find if there is a preparing one
-        with transaction.atomic():
-            caches = list(
-                service_pool.cached_users_services()
-                .select_for_update()
-                .filter(cache_level=types.services.CacheLevel.L1, state=State.PREPARING)[:1]
-            )
-            if caches:  # If there is a cache, we will use it
-                cache = caches[0]
-                if (
-                    service_pool.cached_users_services()
-                    .select_for_update()
-                    .filter(user=None, uuid=cache.uuid)
-                    .update(user=user, cache_level=0)
-                    != 1
-                ):
-                    cache = None
-            else:
-                cache = None
+        cache = self.claim_cached_userservice(service_pool, user, state=State.PREPARING)
 
-        # Out of atomic transaction
         if cache:
             cache.assign_to(user)
 
@@ -496,6 +510,9 @@ class UserServiceManager(metaclass=singleton.Singleton):
             )
             return cache
 
+        # No cached user service available for this assignation (ready or preparing)
+        CacheClaimStats.manager().record(misses=1)
+
         # Can't assign directly from L2 cache... so we check if we can create e new service in the limits requested
         serviceType = service_pool.service.get_type()
         if serviceType.uses_cache:
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+import dataclasses
+import logging
+import threading
+import time
+import typing
+
+from uds.core import consts
+from uds.core.util import singleton
+
+# Not imported at runtime, just for type checking
+if typing.TYPE_CHECKING:
+    from .service import DynamicService
+    from .userservice import DynamicUserService
+    from .publication import DynamicPublication
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class _Registration:
+    registered: float  # When the operation was issued, states obtained before this are not valid
+    last_seen: float
+
+
+@dataclasses.dataclass
+class _ProviderStates:
+    lock: threading.Lock = dataclasses.field(default_factory=threading.Lock)
+    registrations: dict[str, _Registration] = dataclasses.field(default_factory=dict)
+    states: dict[str, bool] = dataclasses.field(default_factory=dict)
+    stamp: float = float('-inf')  # When the states where requested
+
+
+class StatePollerStats(metaclass=singleton.Singleton):
+    """
+    Counters of the machine states requests made by the state poller of this process
+    """
+
+    batch_requests: int  # List requests made to providers
+    single_requests: int  # Requests made for a single machine
+    served: int  # States served from a batch request
+    deferred: int  # Checks delayed to next cycle because no valid state was available yet
+
+    def __init__(self) -> None:
+        self.batch_requests = 0
+        self.single_requests = 0
+        self.served = 0
+        self.deferred = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return {
+            'batch_requests': self.batch_requests,
+            'single_requests': self.single_requests,
+            'served': self.served,
+            'deferred': self.deferred,
+            'registered': StatePoller.manager().registered(),
+        }
+
+    def __str__(self) -> str:
+        return (
+            f'StatePollerStats: batch={self.batch_requests}, single={self.single_requests}, '
+            f'served={self.served}, deferred={self.deferred}'
+        )
+
+    @staticmethod
+    def manager() -> 'StatePollerStats':
+        return StatePollerStats()
+
+
+class StatePoller(metaclass=singleton.Singleton):
+    """
+    Keeps the machines with pending operations of dynamic services, grouped by provider, so
+    their running state is obtained with a single list request per provider and cycle
+    (see consts.services.STATE_POLL_INTERVAL) instead of one request per machine and check.
+
+    Only services with batch_state_polling set are polled in batch, the rest are asked directly.
+    """
+
+    _providers: dict[str, _ProviderStates]
+    _lock: threading.Lock
+
+    def __init__(self) -> None:
+        self._providers = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def manager() -> 'StatePoller':
+        return StatePoller()
+
+    def _provider_states(self, service: 'DynamicService') -> _ProviderStates:
+        with self._lock:
+            return self._providers.setdefault(service.provider().get_uuid(), _ProviderStates())
+
+    def register(self, service: 'DynamicService', vmid: str) -> None:
+        """
+        Registers an operation issued on a machine, so its state will be requested on next cycle
+        """
+        if not service.batch_state_polling or not vmid:
+            return
+        entry = self._provider_states(service)
+        now = time.monotonic()
+        with entry.lock:
+            entry.registrations[vmid] = _Registration(registered=now, last_seen=now)
+
+    def unregister(self, service: 'DynamicService', vmid: str) -> None:
+        """
+        Removes a machine with no pending operations
+        """
+        if not service.batch_state_polling or not vmid:
+            return
+        entry = self._provider_states(service)
+        with entry.lock:
+            entry.registrations.pop(vmid, None)
+            entry.states.pop(vmid, None)
+
+    def registered(self) -> int:
+        with self._lock:
+            providers = list(self._providers.values())
+        return sum(len(entry.registrations) for entry in providers)
+
+    def is_running(
+        self,
+        service: 'DynamicService',
+        caller_instance: typing.Optional['DynamicUserService | DynamicPublication'],
+        vmid: str,
+    ) -> typing.Optional[bool]:
+        """
+        Returns if the machine is running, using the last list of states of its provider.
+
+        Returns None if the state obtained on last list request is older than the last operation
+        issued on the machine and the provider has already been asked in current cycle, so the check
+        must be retried later.
+        """
+        stats = StatePollerStats.manager()
+        if not service.batch_state_polling:
+            stats.single_requests += 1
+            return service.is_running(caller_instance, vmid)
+
+        entry = self._provider_states(service)
+        # Lock is kept while requesting, so concurrent checkers of same provider wait for a single request
+        with entry.lock:
+            now = time.monotonic()
+            registration = entry.registrations.setdefault(vmid, _Registration(registered=now, last_seen=now))
+            registration.last_seen = now
+
+            if now - entry.stamp >= consts.services.STATE_POLL_INTERVAL:
+                self._refresh(service, entry, now)
+            elif entry.stamp < registration.registered:
+                # States were requested before the operation was issued, wait for next cycle
+                stats.deferred += 1
+                return None
+
+            if vmid in entry.states:
+                stats.served += 1
+                return entry.states[vmid]
+
+        # Not listed by provider (i.e. just created), ask for it directly
+        stats.single_requests += 1
+        return service.is_running(caller_instance, vmid)
+
+    def _refresh(self, service: 'DynamicService', entry: _ProviderStates, now: float) -> None:
+        # Forget machines not checked for a long time (user service removed while operating, for example)
+        for vmid, registration in list(entry.registrations.items()):
+            if now - registration.last_seen > consts.services.STATE_POLL_FORGET_AFTER:
+                del entry.registrations[vmid]
+
+        StatePollerStats.manager().batch_requests += 1
+        logger.debug('Requesting states of %s machines of %s', len(entry.registrations), service.provider())
+        # Any error will propagate to the checker, as if the machine had been asked directly
+        states = service.get_running_states(list(entry.registrations))
+        entry.states = {vmid: states[vmid] for vmid in entry.registrations if vmid in states}
+        entry.stamp = now
@@ -59,6 +59,8 @@ class DynamicService(services.Service, abc.ABC):  # pylint: disable=too-many-pub
     needs_osmanager = False  # If the service needs a s.o. manager (managers are related to agents provided by services, i.e. virtual machines with agent)
 
     must_stop_before_deletion = True  # If the service must be stopped before deletion    
+    # If the running state of the machines of the provider can be obtained at once (see get_running_states)
+    batch_state_polling: typing.ClassVar[bool] = False
 
     # Gui remplates, to be "incorporated" by inherited classes if needed
     base_machine = gui.ChoiceField(
@@ -176,6 +178,20 @@ class DynamicService(services.Service, abc.ABC):  # pylint: disable=too-many-pub
         """
         ...
 
+    def get_running_states(self, vmids: list[str]) -> collections.abc.Mapping[str, bool]:
+        """
+        Returns the running state of the machines of the provider, using a single request if possible.
+        Used by state checks only if batch_state_polling is True.
+
+        Args:
+            vmids: Machines with pending operations of any service of the provider
+
+        Returns:
+            Mapping of vmid to running state. Can contain more machines than requested, and machines not
+            present will be checked using is_running
+        """
+        raise NotImplementedError(f'{self.__class__}: get_running_states must be implemented if batch_state_polling is used!')
+
     @abc.abstractmethod
     def start(self, caller_instance: typing.Optional['DynamicUserService | DynamicPublication'], vmid: str) -> None:
         """
@@ -41,6 +41,7 @@ from uds.core.util import autoserializable, log
 from uds.core.util.model import sql_stamp_seconds
 
 from .. import exceptions
+from . import poller
 
 # Not imported at runtime, just for type checking
 if typing.TYPE_CHECKING:
@@ -221,6 +222,7 @@ class DynamicUserService(services.UserService, autoserializable.AutoSerializable
         """
         self._error_debug_info = self._debug(repr(reason))
         reason = str(reason)
+        poller.StatePoller.manager().unregister(self.service(), self._vmid)
         logger.debug('Setting error state, reason: %s (%s)', reason, self._queue, stack_info=True, stacklevel=3)
         self.do_log(types.log.LogLevel.ERROR, reason)
 
@@ -251,10 +253,11 @@ class DynamicUserService(services.UserService, autoserializable.AutoSerializable
         self._debug('execute_queue')
         op = self._current_op()
 
-        if op == types.services.Operation.ERROR:
-            return types.states.TaskState.ERROR
-
-        if op == types.services.Operation.FINISH:
+        if op in (types.services.Operation.ERROR, types.services.Operation.FINISH):
+            # No more operations pending, no need to keep polling the machine state
+            poller.StatePoller.manager().unregister(self.service(), self._vmid)
+            if op == types.services.Operation.ERROR:
+                return types.states.TaskState.ERROR
             return types.states.TaskState.FINISHED
 
         try:
@@ -270,6 +273,8 @@ class DynamicUserService(services.UserService, autoserializable.AutoSerializable
                 # and we want to use the overrided ones
                 getattr(self, operation_runner.__name__)()
 
+            # States requested before this are no longer valid for checking this operation
+            poller.StatePoller.manager().register(self.service(), self._vmid)
             return types.states.TaskState.RUNNING
         except exceptions.RetryableError as e:
             # This is a retryable error, so we will retry later
@@ -297,6 +302,17 @@ class DynamicUserService(services.UserService, autoserializable.AutoSerializable
     def service(self) -> 'service.DynamicService':
         return typing.cast('service.DynamicService', super().service())
 
+    @typing.final
+    def is_running_polled(self) -> typing.Optional[bool]:
+        """
+        Returns if the machine is running, for state checkers.
+        If the service supports it, state is obtained from the batch of states of the provider.
+
+        Returns:
+            None if the state is not known yet, so the check must be retried later
+        """
+        return poller.StatePoller.manager().is_running(self.service(), self, self._vmid)
+
     def get_vmname(self) -> str:
         """
         Accesory method to calc the VM name.
@@ -701,7 +717,7 @@ class DynamicUserService(services.UserService, autoserializable.AutoSerializable
         """
         This method is called to check if the service is started
         """
-        if self.service().is_running(self, self._vmid):
+        if self.is_running_polled():
             return types.states.TaskState.FINISHED
 
         return types.states.TaskState.RUNNING
@@ -716,7 +732,7 @@ class DynamicUserService(services.UserService, autoserializable.AutoSerializable
         """
         This method is called to check if the service is stopped
         """
-        if self.service().is_running(self, self._vmid) is False:
+        if self.is_running_polled() is False:
             return types.states.TaskState.FINISHED
         return types.states.TaskState.RUNNING
 
@@ -742,7 +758,7 @@ class DynamicUserService(services.UserService, autoserializable.AutoSerializable
 
         logger.debug('Checking State')
         # Check if machine is already stopped  (As soon as it is not running, we will consider it stopped)
-        if self.service().is_running(self, self._vmid) is False:
+        if self.is_running_polled() is False:
             return types.states.TaskState.FINISHED
 
         logger.debug('State is running')
@@ -113,14 +113,11 @@ class LogObjectType(enum.IntEnum):
         return GlobalConfig.INDIVIDIAL_LOG_MAX_ELEMENTS.as_int()
 
     @staticmethod
-    def get_type_from_model(model: 'Model') -> 'LogObjectType|None':
-        """
-        Returns the type of log object from the model
-        """
+    def _model_to_type() -> collections.abc.Mapping[type['Model'], 'LogObjectType']:
         from uds import models
 
         # Dict for translations
-        _MODEL_TO_TYPE: typing.Final[collections.abc.Mapping[type['Model'], 'LogObjectType']] = {
+        return {
             models.UserService: LogObjectType.USERSERVICE,
             models.ServicePoolPublication: LogObjectType.PUBLICATION,
             models.ServicePool: LogObjectType.SERVICEPOOL,
@@ -133,4 +130,15 @@ class LogObjectType(enum.IntEnum):
             models.MetaPool: LogObjectType.METAPOOL,
         }
 
-        return _MODEL_TO_TYPE.get(type(model), None)
+    @staticmethod
+    def get_type_from_model(model: 'Model') -> 'LogObjectType|None':
+        """
+        Returns the type of log object from the model
+        """
+        return LogObjectType._model_to_type().get(type(model), None)
+
+    def get_model(self) -> 'type[Model]|None':
+        """
+        Returns the model of the owners of this type of log (None if it is not owned by a model, as SYSLOG)
+        """
+        return next((model for model, owner_type in LogObjectType._model_to_type().items() if owner_type == self), None)
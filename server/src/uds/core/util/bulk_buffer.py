@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+import atexit
+import collections
+import collections.abc
+import enum
+import logging
+import threading
+import time
+import typing
+import weakref
+
+from django.db import connections, models, transaction, InterfaceError, OperationalError
+
+from uds.core.util.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+ModelT = typing.TypeVar('ModelT', bound=models.Model)
+
+
+class OverflowPolicy(enum.StrEnum):
+    """
+    What to do when a buffer reaches its max pending rows (i.e. database is not accepting writes)
+    """
+
+    DROP = 'drop'  # Discard the new row
+    BLOCK = 'block'  # Caller flushes synchronously (backpressure), row is discarded only if this also fails
+    # Note: Callers inside a transaction never flush, they wake up the background thread instead
+
+
+class BulkBufferStats:
+    __slots__ = ('added', 'flushed', 'flushes', 'failed_flushes', 'dropped', 'flush_time')
+
+    added: int
+    flushed: int  # Rows written to database
+    flushes: int
+    failed_flushes: int
+    dropped: int
+    flush_time: Histogram
+
+    def __init__(self) -> None:
+        self.added = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self.flush_time = Histogram()
+
+    def as_dict(self) -> dict[str, typing.Any]:
+        return {
+            'added': self.added,
+            'flushed': self.flushed,
+            'flushes': self.flushes,
+            'failed_flushes': self.failed_flushes,
+            'dropped': self.dropped,
+            'flush_time': self.flush_time.as_dict(),
+        }
+
+
+class BulkBuffer(typing.Generic[ModelT]):
+    """
+    In-process buffer of model instances pending to be inserted, written using bulk_create.
+
+    Rows are flushed when "flush_size" rows are pending (by the caller that adds the last one, or by
+    the background thread if "asynchronous" or the caller is inside a transaction), every "flush_interval"
+    seconds (by a background thread, started on first use) and at process exit.
+    A buffer with flush_size <= 0 (or with buffering globally disabled) inserts every row directly.
+
+    If a flush fails because of bad data, rows are written one by one, and the failing ones are discarded.
+    If database is not available, rows are kept for next flush (up to "max_pending").
+
+    If provided, "on_flush" is invoked with the rows written after every successful flush.
+
+    Note: Rows are written in the order they are added, but are only visible to other processes once flushed.
+    """
+
+    # Global switch, mainly for tests, where rows must be visible as soon as they are added
+    enabled: typing.ClassVar[bool] = True
+
+    _buffers: typing.ClassVar['weakref.WeakSet[BulkBuffer[typing.Any]]'] = weakref.WeakSet()
+
+    name: str
+    model: type[ModelT]
+    flush_size: int
+    flush_interval: float
+    max_pending: int
+    policy: OverflowPolicy
+    asynchronous: bool
+    on_flush: typing.Optional[collections.abc.Callable[[list[ModelT]], None]]
+    stats: BulkBufferStats
+
+    _pending: collections.deque[ModelT]
+    _lock: threading.Lock
+    _flush_lock: threading.Lock  # Serializes flushes, so rows are written in order
+    _wakeup: threading.Event
+    _thread: typing.Optional[threading.Thread]
+
+    def __init__(
+        self,
+        model: type[ModelT],
+        *,
+        name: str = '',
+        flush_size: int,
+        flush_interval: float,
+        max_pending: int,
+        policy: OverflowPolicy = OverflowPolicy.DROP,
+        asynchronous: bool = False,
+        on_flush: typing.Optional[collections.abc.Callable[[list[ModelT]], None]] = None,
+    ) -> None:
+        self.name = name or model.__name__
+        self.model = model
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_pending = max(max_pending, flush_size)
+        self.policy = policy
+        self.asynchronous = asynchronous
+        self.on_flush = on_flush
+        self.stats = BulkBufferStats()
+        self._pending = collections.deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        BulkBuffer._buffers.add(self)
+
+    @property
+    def buffered(self) -> bool:
+        return BulkBuffer.enabled and self.flush_size > 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def add(self, obj: ModelT) -> bool:
+        """
+        Adds a row to the buffer.
+
+        Returns:
+            False if the row has been discarded (or, if not buffered, could not be inserted)
+        """
+        self.stats.added += 1
+        if not self.buffered:
+            try:
+                obj.save(force_insert=True)
+                self.stats.flushed += 1
+            except Exception as e:
+                self.stats.dropped += 1
+                logger.error('Error inserting %s: %s', self.name, e)
+                return False
+            if self.on_flush:
+                try:
+                    self.on_flush([obj])
+                except Exception:
+                    logger.exception('Post insert of %s', self.name)
+            return True
+
+        self._ensure_thread()
+        if len(self._pending) >= self.max_pending:
+            if self.policy == OverflowPolicy.BLOCK:
+                self._flush_or_wakeup()
+            if len(self._pending) >= self.max_pending:
+                self.stats.dropped += 1
+                logger.warning('%s buffer is full (%s rows), discarding row', self.name, self.max_pending)
+                return False
+
+        with self._lock:
+            self._pending.append(obj)
+            full = len(self._pending) >= self.flush_size
+        if full:
+            if self.asynchronous:
+                self._wakeup.set()
+            else:
+                self._flush_or_wakeup()
+        return True
+
+    def _flush_or_wakeup(self) -> None:
+        # Flushing inside the caller transaction would write the pending rows of all threads on it,
+        # and they would be lost if it is rolled back. So the background thread flushes them instead
+        if transaction.get_connection().in_atomic_block:
+            self._wakeup.set()
+        else:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Writes all pending rows to database
+
+        Returns:
+            Number of rows written
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                rows = list(self._pending)
+                self._pending.clear()
+
+            started = time.monotonic()
+            try:
+                # Savepoint, so a failure does not break the caller transaction (if any)
+                with transaction.atomic():
+                    self.model.objects.bulk_create(rows, batch_size=self.flush_size or None)
+                written = rows
+            except (OperationalError, InterfaceError) as e:
+                self.stats.failed_flushes += 1
+                logger.error('Error writing %s rows of %s, will retry: %s', len(rows), self.name, e)
+                self._requeue(rows)
+                return 0
+            except Exception as e:
+                self.stats.failed_flushes += 1
+                logger.error('Error writing %s rows of %s, writing them one by one: %s', len(rows), self.name, e)
+                written = self._write_one_by_one(rows)
+                if not written:
+                    return 0
+            self.stats.flush_time.observe(time.monotonic() - started)
+            self.stats.flushes += 1
+            self.stats.flushed += len(written)
+            if self.on_flush:
+                try:
+                    self.on_flush(written)
+                except Exception:
+                    logger.exception('Post flush of %s', self.name)
+            return len(written)
+
+    def _write_one_by_one(self, rows: list[ModelT]) -> list[ModelT]:
+        """
+        Writes rows one by one, discarding the ones that fail.
+        If database is not available, not written rows are kept for next flush.
+
+        Returns:
+            Rows written
+        """
+        written: list[ModelT] = []
+        for pos, row in enumerate(rows):
+            try:
+                with transaction.atomic():
+                    self.model.objects.bulk_create([row])
+            except (OperationalError, InterfaceError) as e:
+                logger.error('Error writing %s rows of %s, will retry: %s', len(rows) - pos, self.name, e)
+                self._requeue(rows[pos:])
+                break
+            except Exception as e:
+                self.stats.dropped += 1
+                logger.error('Discarding row of %s: %s', self.name, e)
+            else:
+                written.append(row)
+        return written
+
+    def _requeue(self, rows: list[ModelT]) -> None:
+        with self._lock:
+            # Put them back, in order, keeping at most max_pending (newest are discarded)
+            self._pending.extendleft(reversed(rows))
+            while len(self._pending) > self.max_pending:
+                self._pending.pop()
+                self.stats.dropped += 1
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=BulkBuffer._flusher, args=(weakref.ref(self),), name=f'BulkBuffer-{self.name}', daemon=True
+                )
+                self._thread.start()
+
+    def _stop_thread(self) -> None:
+        # Detached thread ends on next wake up (pending rows are kept, for next flush)
+        with self._lock:
+            self._thread = None
+        self._wakeup.set()
+
+    @staticmethod
+    def _flusher(ref: 'weakref.ref[BulkBuffer[typing.Any]]') -> None:
+        current = threading.current_thread()
+        # Keeps only a weak reference to the buffer while waiting, so it can be released
+        while (buffer := ref()) is not None and buffer._thread is current:
+            interval, wakeup = buffer.flush_interval, buffer._wakeup
+            del buffer
+            wakeup.wait(interval)
+            wakeup.clear()
+            if (buffer := ref()) is None or buffer._thread is not current:
+                break
+            try:
+                if buffer.pending:
+                    buffer.flush()
+            except Exception:
+                logger.exception('Flushing %s', buffer.name)
+            finally:
+                del buffer
+                # This is run on its own thread, so we ensure the connection is released
+                connections['default'].close()
+
+    @staticmethod
+    def flush_all() -> None:
+        """
+        Flushes all buffers (invoked at process exit, and on task manager shutdown)
+        """
+        for buffer in list(BulkBuffer._buffers):
+            try:
+                buffer.flush()
+            except Exception:
+                logger.exception('Flushing %s at shutdown', buffer.name)
+
+
+atexit.register(BulkBuffer.flush_all)
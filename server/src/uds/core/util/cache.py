@@ -29,38 +29,45 @@
 """
 Author: Adolfo Gómez, dkmaster at dkmon dot com
 """
-import datetime
-import codecs
+import base64
 import typing
 import collections.abc
 import logging
 
 
-from django.db import transaction
-from uds.models.cache import Cache as DBCache
 from uds.core.util.model import sql_now
 from uds.core.util import serializer
 from uds.core import consts
 
+from .cache_backends import CacheEntry, TieredCacheStore
 from .hash import hash_key
 
 logger = logging.getLogger(__name__)
 
 
 class Cache:
+    """
+    Owner namespaced cache. Values are stored on a local (in-process) tier in front of a shared one
+    (database by default), see uds.core.util.cache_backends
+    """
+
     # Simple hits vs missses counters
     hits = 0
     misses = 0
 
     _owner: str
 
+    # Tiers store, common to all Cache instances of this process. Created on first use
+    _store: typing.ClassVar[typing.Optional[TieredCacheStore]] = None
+
     @staticmethod
     def _basic_serialize(value: typing.Any) -> str:
-        return codecs.encode(serializer.serialize(value), 'base64').decode()
+        return base64.b64encode(serializer.serialize(value)).decode()
 
     @staticmethod
     def _basic_deserialize(value: str) -> typing.Any:
-        return serializer.deserialize(codecs.decode(value.encode(), 'base64'))
+        # b64decode discards the new lines that previous codecs based encoding inserted
+        return serializer.deserialize(base64.b64decode(value.encode()))
 
     _serializer: typing.ClassVar[collections.abc.Callable[[typing.Any], str]] = _basic_serialize
     _deserializer: typing.ClassVar[collections.abc.Callable[[str], typing.Any]] = _basic_deserialize
@@ -68,36 +75,46 @@ class Cache:
     def __init__(self, owner: typing.Union[str, bytes]):
         self._owner = owner.decode('utf-8') if isinstance(owner, bytes) else owner
 
+    @property
+    def owner(self) -> str:
+        return self._owner
+
+    @staticmethod
+    def store() -> TieredCacheStore:
+        if Cache._store is None:
+            Cache._store = TieredCacheStore.from_settings()
+        return Cache._store
+
     def _get_key(self, key: typing.Union[str, bytes]) -> str:
         if isinstance(key, str):
             key = key.encode('utf8')
         return hash_key(self._owner.encode() + key)
 
     def get(self, skey: typing.Union[str, bytes], default: typing.Any = None) -> typing.Any:
-        now = sql_now()
         # logger.debug('Requesting key "%s" for cache "%s"', skey, self._owner)
         try:
             key = self._get_key(skey)
             # logger.debug('Key: %s', key)
-            c: DBCache = DBCache.objects.get(owner=self._owner, pk=key)
+            store = Cache.store()
+            entry = store.get(self._owner, key)
+            if entry is None:
+                Cache.misses += 1
+                # logger.debug('key not found: %s', skey)
+                return default
             # If expired
-            if now > c.created + datetime.timedelta(seconds=c.validity):
+            if entry.is_expired(sql_now()):
                 return default
 
             try:
                 # logger.debug('value: %s', c.value)
-                val = Cache._deserializer(c.value)
+                val = Cache._deserializer(entry.value)
             except Exception:  # If invalid, simple do not use it
                 # logger.exception('Invalid deserialization value from cache. Removing it.')
-                c.delete()
+                store.remove(self._owner, key)
                 return default
 
             Cache.hits += 1
             return val
-        except DBCache.DoesNotExist:  # @UndefinedVariable
-            Cache.misses += 1
-            # logger.debug('key not found: %s', skey)
-            return default
         # except OperationalError:
         # If database is not ready, just return default value
         # This is not a big issue, since cache is not critical
@@ -130,13 +147,10 @@ class Cache:
         If cached item does not exists, nothing happens (no exception thrown)
         """
         # logger.debug('Removing key "%s" for uService "%s"' % (skey, self._owner))
-        try:
-            key = self._get_key(skey)
-            DBCache.objects.get(pk=key).delete()  # @UndefinedVariable
-            return True
-        except DBCache.DoesNotExist:  # @UndefinedVariable
+        if not Cache.store().remove(self._owner, self._get_key(skey)):
             logger.debug('key not found')
             return False
+        return True
 
     def __delitem__(self, key: typing.Union[str, bytes]) -> None:
         """
@@ -145,8 +159,7 @@ class Cache:
         self.remove(key)
 
     def clear(self) -> None:
-        with transaction.atomic():
-            Cache.delete(self._owner)
+        Cache.delete(self._owner)
 
     def put(
         self,
@@ -159,35 +172,28 @@ class Cache:
             validity = consts.cache.DEFAULT_CACHE_TIMEOUT
         key = self._get_key(skey)
         strValue = Cache._serializer(value)
-        now = sql_now()
-        # Remove existing if any and create a new one
-        with transaction.atomic():
-            try:
-                DBCache.objects.update_or_create(
-                    pk=key,
-                    owner=self._owner,
-                    defaults={
-                        'owner': self._owner,
-                        'key': key,
-                        'value': strValue,
-                        'created': now,
-                        'validity': validity,
-                    },
-                )
-
-                # # Remove if existing
-                # DBCache.objects.filter(pk=key).delete()
-                # # And create a new one
-                # DBCache.objects.create(
-                #     owner=self._owner,
-                #     key=key,
-                #     value=strValue,
-                #     created=now,
-                #     validity=validity,
-                # )  # @UndefinedVariable
-                return  # And return
-            except Exception as e:
-                logger.debug('Transaction in course, cannot store value: %s', e)
+        Cache.store().put(self._owner, key, CacheEntry(value=strValue, created=sql_now(), validity=validity))
+
+    def add(
+        self,
+        skey: typing.Union[str, bytes],
+        value: typing.Any,
+        validity: typing.Optional[int] = None,
+    ) -> bool:
+        """
+        Stores the value only if the key is not already cached (or has expired).
+        This is atomic, so can be used as a simple lock between processes.
+
+        Returns:
+            True if the value has been stored
+        """
+        if validity is None:
+            validity = consts.cache.DEFAULT_CACHE_TIMEOUT
+        return Cache.store().add(
+            self._owner,
+            self._get_key(skey),
+            CacheEntry(value=Cache._serializer(value), created=sql_now(), validity=validity),
+        )
 
     def __setitem__(self, key: typing.Union[str, bytes], value: typing.Any) -> None:
         """
@@ -197,31 +203,24 @@ class Cache:
 
     def refresh(self, skey: typing.Union[str, bytes]) -> None:
         # logger.debug('Refreshing key "%s" for cache "%s"' % (skey, self._owner,))
-        try:
-            key = self._get_key(skey)
-            c = DBCache.objects.get(pk=key)
-            c.created = sql_now()
-            c.save()
-        except DBCache.DoesNotExist:
-            logger.debug('Can\'t refresh cache key %s because it doesn\'t exists', skey)
-            return
+        Cache.store().refresh(self._owner, self._get_key(skey))
 
     @staticmethod
     def purge() -> None:
-        with transaction.atomic():
-            DBCache.objects.all().delete()
+        Cache.store().clear(None)
 
     @staticmethod
     def purge_outdated() -> None:
-        # purge_outdated has a transaction.atomic() inside
-        DBCache.purge_outdated()
+        Cache.store().purge_outdated()
 
     @staticmethod
     def delete(owner: typing.Optional[str] = None) -> None:
-        with transaction.atomic():
-            # logger.info("Deleting cache items")
-            if owner is None:
-                objects = DBCache.objects.all()
-            else:
-                objects = DBCache.objects.filter(owner=owner)
-            objects.delete()
+        # logger.info("Deleting cache items")
+        Cache.store().clear(owner)
+
+    @staticmethod
+    def stats() -> dict[str, dict[str, int]]:
+        """
+        Returns the hits/misses counters of every cache tier
+        """
+        return Cache.store().stats()
@@ -0,0 +1,618 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+import abc
+import collections
+import collections.abc
+import dataclasses
+import datetime
+import logging
+import threading
+import time
+import typing
+import uuid
+
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+
+from uds.core import consts
+from uds.core.util.model import sql_now
+from uds.models.cache import Cache as DBCache
+
+from .hash import hash_key
+
+if typing.TYPE_CHECKING:
+    from django.core.cache.backends.base import BaseCache
+
+logger = logging.getLogger(__name__)
+
+# Invalidations are (owner, key) pairs.
+# An empty key means "whole owner", and both empty means "everything"
+Invalidation: typing.TypeAlias = tuple[str, str]
+
+# Overlap used when reading invalidations, to allow for not yet commited notices
+INVALIDATION_OVERLAP: typing.Final[datetime.timedelta] = datetime.timedelta(seconds=2)
+# Max number of invalidations a process will read in a check. If more, local tier is flushed
+MAX_INVALIDATIONS_BATCH: typing.Final[int] = 1000
+
+
+@dataclasses.dataclass(frozen=True)
+class CacheEntry:
+    """
+    Serialized cache value, as stored on any of the tiers
+    """
+
+    value: str
+    created: datetime.datetime
+    validity: int  # In seconds
+
+    def is_expired(self, now: datetime.datetime) -> bool:
+        return now > self.created + datetime.timedelta(seconds=self.validity)
+
+
+@dataclasses.dataclass
+class TierStats:
+    hits: int = 0
+    misses: int = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+class CacheBackend(abc.ABC):
+    """
+    Shared cache tier. All UDS server processes (and nodes) must see the same data
+    through this tier.
+
+    Keys received here are already hashed, and include the owner on the hash, so they are unique.
+    """
+
+    name: typing.ClassVar[str]
+
+    stats: TierStats
+    origin: str  # Identifies this process on the invalidation notices
+
+    def __init__(self) -> None:
+        self.stats = TierStats()
+        self.origin = uuid.uuid4().hex
+
+    @abc.abstractmethod
+    def get(self, owner: str, key: str) -> typing.Optional[CacheEntry]:
+        """
+        Returns the stored entry, even if it is expired (caller will check that)
+        """
+        ...
+
+    @abc.abstractmethod
+    def put(self, owner: str, key: str, entry: CacheEntry) -> bool:
+        """
+        Stores the entry, replacing the existing one if any
+
+        Returns:
+            True if an entry was (or could have been) replaced, so other processes may have it
+        """
+        ...
+
+    @abc.abstractmethod
+    def add(self, owner: str, key: str, entry: CacheEntry) -> bool:
+        """
+        Stores the entry only if there is no valid (non expired) entry for that key.
+        Must be atomic, so it can be used as a lock between processes.
+
+        Returns:
+            True if the entry has been stored
+        """
+        ...
+
+    @abc.abstractmethod
+    def remove(self, owner: str, key: str) -> bool: ...
+
+    @abc.abstractmethod
+    def refresh(self, owner: str, key: str, now: datetime.datetime) -> None: ...
+
+    @abc.abstractmethod
+    def clear(self, owner: typing.Optional[str]) -> None:
+        """
+        Removes all entries of an owner, or all entries if owner is None
+        """
+        ...
+
+    @abc.abstractmethod
+    def purge_outdated(self, now: datetime.datetime) -> None: ...
+
+    @abc.abstractmethod
+    def publish_invalidation(self, owner: str, key: str) -> None:
+        """
+        Notifies other processes that an (owner, key) has been changed or removed.
+        Failures are logged, and never break the transaction of the caller
+        """
+        ...
+
+    @abc.abstractmethod
+    def fetch_invalidations(self) -> typing.Optional[list[Invalidation]]:
+        """
+        Returns the invalidations published by other processes since last call.
+        If the returned value is None, the invalidations can't be trusted (i.e. too many of them
+        or too much time since last check), and whole local tier must be flushed.
+        """
+        ...
+
+
+class DBCacheBackend(CacheBackend):
+    """
+    Shared tier stored on database (uds_utility_cache table). This is the default one.
+
+    Invalidation notices are also stored on this table, under its own owner, with a key derived
+    from the invalidated (owner, key) so repeated invalidations of the same key updates the same row.
+    """
+
+    name = 'db'
+
+    _last_check: typing.Optional[datetime.datetime]
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._last_check = None
+
+    def get(self, owner: str, key: str) -> typing.Optional[CacheEntry]:
+        try:
+            c: DBCache = DBCache.objects.get(owner=owner, pk=key)
+            return CacheEntry(value=c.value, created=c.created, validity=c.validity)
+        except DBCache.DoesNotExist:
+            return None
+
+    def put(self, owner: str, key: str, entry: CacheEntry) -> bool:
+        try:
+            with transaction.atomic():  # Savepoint, so a failure does not break the caller transaction
+                current: typing.Optional[DBCache] = DBCache.objects.select_for_update().filter(pk=key).first()
+                if current is None:
+                    DBCache.objects.create(
+                        owner=owner, key=key, value=entry.value, created=entry.created, validity=entry.validity
+                    )
+                    return False
+                # An expired entry can't be on the local tier of other processes, so it is not a replacement
+                replaced = not CacheEntry(
+                    value=current.value, created=current.created, validity=current.validity
+                ).is_expired(entry.created)
+                current.owner, current.value = owner, entry.value
+                current.created, current.validity = entry.created, entry.validity
+                current.save(update_fields=['owner', 'value', 'created', 'validity'])
+                return replaced
+        except Exception as e:
+            logger.debug('Transaction in course, cannot store value: %s', e)
+            return True
+
+    def add(self, owner: str, key: str, entry: CacheEntry) -> bool:
+        try:
+            with transaction.atomic():
+                DBCache.objects.create(
+                    owner=owner, key=key, value=entry.value, created=entry.created, validity=entry.validity
+                )
+            return True
+        except IntegrityError:
+            pass
+        # Already exists, replace it only if expired (and nobody has replaced it meanwhile)
+        current = self.get(owner, key)
+        if current is None or not current.is_expired(entry.created):
+            return False
+        return (
+            DBCache.objects.filter(pk=key, created=current.created).update(
+                owner=owner, value=entry.value, created=entry.created, validity=entry.validity
+            )
+            == 1
+        )
+
+    def remove(self, owner: str, key: str) -> bool:
+        return DBCache.objects.filter(pk=key).delete()[0] > 0
+
+    def refresh(self, owner: str, key: str, now: datetime.datetime) -> None:
+        DBCache.objects.filter(pk=key).update(created=now)
+
+    def clear(self, owner: typing.Optional[str]) -> None:
+        with transaction.atomic():
+            if owner is None:
+                DBCache.objects.all().delete()
+            else:
+                DBCache.objects.filter(owner=owner).delete()
+
+    def purge_outdated(self, now: datetime.datetime) -> None:
+        # purge_outdated has a transaction.atomic() inside
+        DBCache.purge_outdated()
+
+    def publish_invalidation(self, owner: str, key: str) -> None:
+        try:
+            with transaction.atomic():  # Savepoint, so a failure does not break the caller transaction
+                DBCache.objects.update_or_create(
+                    pk=hash_key(consts.cache.CACHE_INVALIDATION_OWNER + owner + '\t' + key),
+                    defaults={
+                        'owner': consts.cache.CACHE_INVALIDATION_OWNER,
+                        'value': '\t'.join((self.origin, owner, key)),
+                        'created': sql_now(),
+                        'validity': consts.cache.CACHE_INVALIDATION_RETENTION,
+                    },
+                )
+        except Exception as e:  # Not critical, at most other processes will keep stale data until expired
+            logger.warning('Could not publish cache invalidation for %s: %s', owner, e)
+
+    def fetch_invalidations(self) -> typing.Optional[list[Invalidation]]:
+        now = sql_now()
+        last_check, self._last_check = self._last_check, now
+        if last_check is None:
+            return []
+        if now - last_check > datetime.timedelta(seconds=consts.cache.CACHE_INVALIDATION_RETENTION):
+            return None
+
+        invalidations: list[Invalidation] = []
+        for value in DBCache.objects.filter(
+            owner=consts.cache.CACHE_INVALIDATION_OWNER, created__gte=last_check - INVALIDATION_OVERLAP
+        ).values_list('value', flat=True)[:MAX_INVALIDATIONS_BATCH + 1]:
+            origin, owner, key = value.split('\t', 2)
+            if origin != self.origin:
+                invalidations.append((owner, key))
+        if len(invalidations) > MAX_INVALIDATIONS_BATCH:
+            return None
+        return invalidations
+
+
+class DjangoCacheBackend(CacheBackend):
+    """
+    Shared tier stored on a django cache (memcached, for example, also on a local unix socket).
+
+    Django caches can not be enumerated, so owner (and global) clears are done increasing a generation
+    counter, that is stored with every entry. Invalidation notices are a journal of sequential keys.
+    """
+
+    name = 'django'
+
+    ALL_GENERATION_KEY: typing.Final[str] = 'uds:cache:gen'
+    JOURNAL_SEQ_KEY: typing.Final[str] = 'uds:cache:journal'
+
+    _alias: str
+    _last_seq: typing.Optional[int]
+
+    def __init__(self, alias: typing.Optional[str] = None) -> None:
+        super().__init__()
+        self._alias = alias or consts.cache.CACHE_DJANGO_ALIAS
+        self._last_seq = None
+
+    @property
+    def _cache(self) -> 'BaseCache':
+        return caches[self._alias]
+
+    @staticmethod
+    def _entry_key(key: str) -> str:
+        return 'uds:cache:e:' + key
+
+    @staticmethod
+    def _generation_key(owner: str) -> str:
+        return 'uds:cache:g:' + hash_key(owner)
+
+    def _generations(self, owner: str) -> tuple[int, int]:
+        gens = self._cache.get_many([DjangoCacheBackend.ALL_GENERATION_KEY, self._generation_key(owner)])
+        return gens.get(DjangoCacheBackend.ALL_GENERATION_KEY, 0), gens.get(self._generation_key(owner), 0)
+
+    def _incr(self, key: str) -> int:
+        self._cache.add(key, 0, None)
+        return self._cache.incr(key)
+
+    def get(self, owner: str, key: str) -> typing.Optional[CacheEntry]:
+        entry_key = self._entry_key(key)
+        data = self._cache.get_many(
+            [entry_key, DjangoCacheBackend.ALL_GENERATION_KEY, self._generation_key(owner)]
+        )
+        stored = data.get(entry_key)
+        if stored is None:
+            return None
+        all_gen, owner_gen, value, created, validity = stored
+        if (all_gen, owner_gen) != (
+            data.get(DjangoCacheBackend.ALL_GENERATION_KEY, 0),
+            data.get(self._generation_key(owner), 0),
+        ):
+            return None  # Cleared
+        return CacheEntry(value=value, created=created, validity=validity)
+
+    def put(self, owner: str, key: str, entry: CacheEntry) -> bool:
+        all_gen, owner_gen = self._generations(owner)
+        stored = (all_gen, owner_gen, entry.value, entry.created, entry.validity)
+        if self._cache.add(self._entry_key(key), stored, entry.validity):
+            return False
+        self._cache.set(self._entry_key(key), stored, entry.validity)
+        return True
+
+    def add(self, owner: str, key: str, entry: CacheEntry) -> bool:
+        all_gen, owner_gen = self._generations(owner)
+        if self._cache.add(
+            self._entry_key(key),
+            (all_gen, owner_gen, entry.value, entry.created, entry.validity),
+            entry.validity,
+        ):
+            return True
+        # Existing entry could be from a cleared generation
+        if self.get(owner, key) is None:
+            self.put(owner, key, entry)
+            return True
+        return False
+
+    def remove(self, owner: str, key: str) -> bool:
+        return bool(self._cache.delete(self._entry_key(key)))
+
+    def refresh(self, owner: str, key: str, now: datetime.datetime) -> None:
+        # Note: Entries already evicted by the django cache can't be refreshed
+        entry = self.get(owner, key)
+        if entry:
+            self.put(owner, key, dataclasses.replace(entry, created=now))
+
+    def clear(self, owner: typing.Optional[str]) -> None:
+        self._incr(DjangoCacheBackend.ALL_GENERATION_KEY if owner is None else self._generation_key(owner))
+
+    def purge_outdated(self, now: datetime.datetime) -> None:
+        pass  # Django caches expires entries by themselves
+
+    def publish_invalidation(self, owner: str, key: str) -> None:
+        try:
+            with transaction.atomic():  # Django cache could be stored on database
+                seq = self._incr(DjangoCacheBackend.JOURNAL_SEQ_KEY)
+                self._cache.set(
+                    f'{DjangoCacheBackend.JOURNAL_SEQ_KEY}:{seq}',
+                    (self.origin, owner, key),
+                    consts.cache.CACHE_INVALIDATION_RETENTION,
+                )
+        except Exception as e:
+            logger.warning('Could not publish cache invalidation for %s: %s', owner, e)
+
+    def fetch_invalidations(self) -> typing.Optional[list[Invalidation]]:
+        seq: int = self._cache.get(DjangoCacheBackend.JOURNAL_SEQ_KEY, 0)
+        last_seq, self._last_seq = self._last_seq, seq
+        if last_seq is None or seq == last_seq:
+            return []
+        if seq < last_seq or seq - last_seq > MAX_INVALIDATIONS_BATCH:
+            return None  # Journal has been reset or we are too far behind
+
+        keys = [f'{DjangoCacheBackend.JOURNAL_SEQ_KEY}:{i}' for i in range(last_seq + 1, seq + 1)]
+        notices = self._cache.get_many(keys)
+        if len(notices) != len(keys):
+            return None  # Some notices are lost (or still not stored), so we can't trust them
+        return [(owner, key) for origin, owner, key in notices.values() if origin != self.origin]
+
+
+class LocalCacheTier:
+    """
+    In-process LRU cache, in front of the shared tier.
+    Entries keeps the validity they have on shared tier, so they expire at the same time.
+    """
+
+    max_entries: int
+    stats: TierStats
+
+    _entries: 'collections.OrderedDict[str, tuple[str, CacheEntry]]'
+    _lock: threading.Lock
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self.stats = TierStats()
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str, now: datetime.datetime) -> typing.Optional[CacheEntry]:
+        with self._lock:
+            stored = self._entries.get(key)
+            if stored is not None:
+                if not stored[1].is_expired(now):
+                    self._entries.move_to_end(key)
+                    self.stats.hits += 1
+                    return stored[1]
+                del self._entries[key]
+            self.stats.misses += 1
+            return None
+
+    def put(self, owner: str, key: str, entry: CacheEntry) -> None:
+        if entry.validity <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (owner, entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self, owner: typing.Optional[str]) -> None:
+        with self._lock:
+            if owner is None:
+                self._entries.clear()
+                return
+            for key in [k for k, (o, _) in self._entries.items() if o == owner]:
+                del self._entries[key]
+
+    def purge_outdated(self, now: datetime.datetime) -> None:
+        with self._lock:
+            for key in [k for k, (_, e) in self._entries.items() if e.is_expired(now)]:
+                del self._entries[key]
+
+    def invalidate(self, invalidations: collections.abc.Iterable[Invalidation]) -> None:
+        for owner, key in invalidations:
+            if key:
+                self.remove(key)
+            else:
+                self.clear(owner or None)
+
+
+BACKENDS: typing.Final[collections.abc.Mapping[str, type[CacheBackend]]] = {
+    DBCacheBackend.name: DBCacheBackend,
+    DjangoCacheBackend.name: DjangoCacheBackend,
+}
+
+
+class TieredCacheStore:
+    """
+    Combines the local (in-process) tier and the shared one, keeping local tiers of all processes
+    coherent through the invalidation notices published on the shared tier.
+    """
+
+    shared: CacheBackend
+    local: typing.Optional[LocalCacheTier]
+    invalidation_interval: float
+
+    _next_check: float
+    _check_lock: threading.Lock
+
+    def __init__(
+        self,
+        shared: CacheBackend,
+        local: typing.Optional[LocalCacheTier] = None,
+        invalidation_interval: float = consts.cache.CACHE_INVALIDATION_INTERVAL,
+    ) -> None:
+        self.shared = shared
+        self.local = local
+        self.invalidation_interval = invalidation_interval
+        self._next_check = 0.0
+        self._check_lock = threading.Lock()
+
+    @staticmethod
+    def from_settings() -> 'TieredCacheStore':
+        try:
+            shared = BACKENDS[consts.cache.CACHE_SHARED_BACKEND]()
+        except KeyError:
+            logger.error('Invalid cache backend %s, using db', consts.cache.CACHE_SHARED_BACKEND)
+            shared = DBCacheBackend()
+        local = (
+            LocalCacheTier(consts.cache.CACHE_LOCAL_MAX_ENTRIES)
+            if consts.cache.CACHE_LOCAL_MAX_ENTRIES > 0
+            else None
+        )
+        return TieredCacheStore(shared, local)
+
+    def check_invalidations(self, force: bool = False) -> None:
+        """
+        Applies the invalidations published by other processes to local tier.
+        Done at most once every invalidation_interval seconds (unless forced), and never blocks
+        """
+        if self.local is None:
+            return
+        now = time.monotonic()
+        if (not force and now < self._next_check) or not self._check_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_check = now + self.invalidation_interval
+            invalidations = self.shared.fetch_invalidations()
+            if invalidations is None:
+                self.local.clear(None)
+            else:
+                self.local.invalidate(invalidations)
+        except Exception as e:
+            logger.warning('Error checking cache invalidations, flushing local cache: %s', e)
+            self.local.clear(None)
+        finally:
+            self._check_lock.release()
+
+    def get(self, owner: str, key: str) -> typing.Optional[CacheEntry]:
+        now = sql_now()
+        if self.local is not None:
+            self.check_invalidations()
+            entry = self.local.get(key, now)
+            if entry is not None:
+                return entry
+
+        entry = self.shared.get(owner, key)
+        if entry is None or entry.is_expired(now):
+            self.shared.stats.misses += 1
+            return entry
+
+        self.shared.stats.hits += 1
+        if self.local is not None:
+            self.local.put(owner, key, entry)
+        return entry
+
+    # Other processes can only have on its local tier entries they have read (or stored) while valid on shared
+    # tier, so invalidations are only published when one of those could have been replaced or removed.
+    # New entries, added ones (replacing, at most, expired ones) and refreshed ones (other processes
+    # copies will expire sooner, and read again) do not need them.
+    def put(self, owner: str, key: str, entry: CacheEntry) -> None:
+        replaced = self.shared.put(owner, key, entry)
+        if self.local is not None:
+            self.local.put(owner, key, entry)
+            if replaced:
+                self.shared.publish_invalidation(owner, key)
+
+    def add(self, owner: str, key: str, entry: CacheEntry) -> bool:
+        if not self.shared.add(owner, key, entry):
+            return False
+        if self.local is not None:
+            self.local.remove(key)
+        return True
+
+    def remove(self, owner: str, key: str) -> bool:
+        removed = self.shared.remove(owner, key)
+        if self.local is not None:
+            self.local.remove(key)
+            if removed:
+                self.shared.publish_invalidation(owner, key)
+        return removed
+
+    def refresh(self, owner: str, key: str) -> None:
+        self.shared.refresh(owner, key, sql_now())
+        if self.local is not None:
+            # Simply remove it, so next get will retrieve the refreshed one
+            self.local.remove(key)
+
+    def clear(self, owner: typing.Optional[str]) -> None:
+        self.shared.clear(owner)
+        if self.local is not None:
+            self.local.clear(owner)
+            self.shared.publish_invalidation(owner or '', '')
+
+    def flush_local(self) -> None:
+        """
+        Empties the local tier of this process, without touching the shared one
+        """
+        if self.local is not None:
+            self.local.clear(None)
+
+    def purge_outdated(self) -> None:
+        now = sql_now()
+        self.shared.purge_outdated(now)
+        if self.local is not None:
+            self.local.purge_outdated(now)
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        """
+        Returns hits/misses counters of every tier
+        """
+        stats = {self.shared.name: self.shared.stats.as_dict()}
+        if self.local is not None:
+            stats['local'] = self.local.stats.as_dict() | {'entries': len(self.local)}
+        return stats
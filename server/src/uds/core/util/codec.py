@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+
+Versioned binary codec for values stored on cache, storage and serializer.
+
+Encoded data is composed of:
+  1 byte  -> Header, selecting the format (and if data is compressed)
+  n bytes -> Encoded data
+
+Plain data (dicts, lists, str, int, ... with no subclasses) uses marshal, that is a lot faster than pickle.
+Any other value uses pickle. Data is only compressed (using zlib, faster than lzma) if it is big enough.
+
+Headers never collide with pickled data (that starts with 0x80) nor lzma compressed data (0xfd),
+so legacy formats can be detected and read transparently by the users of this module.
+"""
+import marshal
+import pickle  # nosec: Used only for our own data
+import typing
+import zlib
+
+# Headers
+MARSHAL: typing.Final[int] = 0x01
+PICKLE: typing.Final[int] = 0x02
+# Compressed flag
+COMPRESSED: typing.Final[int] = 0x10
+
+HEADERS: typing.Final[frozenset[int]] = frozenset(
+    (MARSHAL, PICKLE, MARSHAL | COMPRESSED, PICKLE | COMPRESSED)
+)
+
+# Data smaller than this is never compressed
+COMPRESS_THRESHOLD: typing.Final[int] = 1024
+COMPRESS_LEVEL: typing.Final[int] = 1
+# marshal version 4 is readable by every python 3 version we support
+MARSHAL_VERSION: typing.Final[int] = 4
+
+
+def encode(obj: typing.Any) -> bytes:
+    """
+    Encodes an object, selecting the fastest available format for it
+    """
+    try:
+        header, data = MARSHAL, marshal.dumps(obj, MARSHAL_VERSION)
+    except ValueError:  # Not plain data, use pickle
+        header, data = PICKLE, pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+
+    if len(data) >= COMPRESS_THRESHOLD:
+        header, data = header | COMPRESSED, zlib.compress(data, COMPRESS_LEVEL)
+
+    return bytes((header,)) + data
+
+
+def is_encoded(data: bytes) -> bool:
+    """
+    Returns True if data has been generated by this codec
+    """
+    return bool(data) and data[0] in HEADERS
+
+
+def decode(data: bytes) -> typing.Any:
+    """
+    Decodes data generated by encode
+
+    Raises:
+        ValueError: If data is not generated by this codec
+    """
+    if not is_encoded(data):
+        raise ValueError('Data is not encoded by codec')
+
+    header, payload = data[0], data[1:]
+    if header & COMPRESSED:
+        payload = zlib.decompress(payload)
+    if header & ~COMPRESSED == MARSHAL:
+        return marshal.loads(payload)  # nosec: Our own data
+    return pickle.loads(payload)  # nosec: Our own data
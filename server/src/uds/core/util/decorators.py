@@ -37,6 +37,8 @@ import time
 import typing
 import collections.abc
 
+from django.db import connections
+
 from uds.core import consts, types, exceptions
 from uds.core.util import singleton
 
@@ -51,13 +53,15 @@ P = typing.ParamSpec('P')
 
 # Caching statistics
 class CacheStats(metaclass=singleton.Singleton):
-    __slots__ = ('hits', 'misses', 'total', 'start_time', 'saving_time')
+    __slots__ = ('hits', 'misses', 'total', 'start_time', 'saving_time', 'coalesced', 'stale')
 
     hits: int
     misses: int
     total: int
     start_time: float
     saving_time: int  # in nano seconds
+    coalesced: int  # Calls that waited for other caller result instead of executing the function
+    stale: int  # Calls served with an stale value while refreshing it
 
     def __init__(self) -> None:
         self.hits = 0
@@ -65,6 +69,8 @@ class CacheStats(metaclass=singleton.Singleton):
         self.total = 0
         self.start_time = time.time()
         self.saving_time = 0
+        self.coalesced = 0
+        self.stale = 0
 
     def add_hit(self, saving_time: int = 0) -> None:
         self.hits += 1
@@ -75,6 +81,14 @@ class CacheStats(metaclass=singleton.Singleton):
         self.misses += 1
         self.total += 1
 
+    def add_coalesced(self) -> None:
+        self.coalesced += 1
+        self.total += 1
+
+    def add_stale(self) -> None:
+        self.stale += 1
+        self.total += 1
+
     @property
     def uptime(self) -> float:
         return time.time() - self.start_time
@@ -90,6 +104,7 @@ class CacheStats(metaclass=singleton.Singleton):
     def __str__(self) -> str:
         return (
             f'CacheStats: {self.hits}/{self.misses} on {self.total}, '
+            f'coalesced={self.coalesced}, stale={self.stale}, '
             f'uptime={self.uptime}, hit_rate={self.hit_rate:.2f}, '
             f'saving_time={self.saving_time/1000000:.2f}'
         )
@@ -210,6 +225,91 @@ def ensure_connected(func: collections.abc.Callable[P, T]) -> collections.abc.Ca
     return new_func
 
 
+class _Flight:
+    """
+    A call of a cached function in progress, so concurrent callers can wait for its result
+    """
+
+    __slots__ = ('event', 'result', 'error')
+
+    event: threading.Event
+    result: typing.Any
+    error: typing.Optional[Exception]
+
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+# In progress calls of cached functions in single flight mode, by cache key
+_flights: dict[str, _Flight] = {}
+_flights_lock = threading.Lock()
+
+
+def _join_flight(key: str) -> tuple[_Flight, bool]:
+    """
+    Returns the flight in progress for key, creating it if needed, and if the caller
+    is the one that must execute it (the "leader")
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        if flight is not None:
+            return flight, False
+        flight = _flights[key] = _Flight()
+        return flight, True
+
+
+def _run_flight(key: str, flight: _Flight, fnc: collections.abc.Callable[[], T]) -> T:
+    try:
+        flight.result = fnc()
+        return flight.result
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.event.set()
+
+
+def _single_flight(key: str, fnc: collections.abc.Callable[[], T]) -> T:
+    """
+    Executes fnc only once for all concurrent calls with the same key on this process.
+    Other callers waits for the result of the first one (or executes fnc by themselves if it takes too long)
+    """
+    flight, leader = _join_flight(key)
+    if leader:
+        return _run_flight(key, flight, fnc)
+
+    CacheStats.manager().add_coalesced()
+    if not flight.event.wait(consts.cache.SINGLE_FLIGHT_WAIT_TIMEOUT):
+        logger.debug('Timeout waiting for %s, executing it', key)
+        return fnc()
+    if flight.error is not None:
+        raise flight.error
+    return typing.cast(T, flight.result)
+
+
+def _background_flight(key: str, fnc: collections.abc.Callable[[], typing.Any]) -> None:
+    """
+    Executes fnc on a background thread, unless it is already being executed
+    """
+
+    def runner(flight: _Flight) -> None:
+        try:
+            _run_flight(key, flight, fnc)
+        except Exception as e:
+            logger.warning('Error refreshing cached value %s: %s', key, e)
+        finally:
+            # Own thread, so its own db connection, that must be closed
+            connections['default'].close()
+
+    flight, leader = _join_flight(key)
+    if leader:
+        threading.Thread(target=runner, args=(flight,), daemon=True).start()
+
+
 # Decorator for caching
 # This decorator will cache the result of the function for a given time, and given parameters
 def cached(
@@ -218,6 +318,9 @@ def cached(
     args: typing.Optional[typing.Union[collections.abc.Iterable[int], int]] = None,
     kwargs: typing.Optional[typing.Union[collections.abc.Iterable[str], str]] = None,
     key_helper: typing.Optional[collections.abc.Callable[[typing.Any], str]] = None,
+    single_flight: bool = False,
+    cluster_wide: bool = False,
+    stale_while_revalidate: int = 0,
 ) -> collections.abc.Callable[[collections.abc.Callable[P, T]], collections.abc.Callable[P, T]]:
     """
     Decorator that gives us a "quick & clean" caching feature on the database.
@@ -228,6 +331,12 @@ def cached(
         args (Optional[Union[Iterable[int], int]], optional): List of arguments to use for the cache key. If an integer is provided, it will be treated as a single argument. Defaults to None.
         kwargs (Optional[Union[Iterable[str], str]], optional): List of keyword arguments to use for the cache key. If a string is provided, it will be treated as a single keyword argument. Defaults to None.
         key_helper (Optional[Callable[[Any], str]], optional): Function to use for improving the calculated cache key. Defaults to None.
+        single_flight (bool, optional): If True, concurrent misses of the same key on this process are coalesced,
+            so only one caller executes the function and the rest wait for its result. Defaults to False.
+        cluster_wide (bool, optional): Implies single_flight, and also coalesces misses between processes/nodes,
+            using a short lived lock on the cache. Defaults to False.
+        stale_while_revalidate (int, optional): If greater than 0, once the value has expired, it can still be served
+            during this number of seconds while it is refreshed on background. Defaults to 0.
 
     Note:
         If `args` and `kwargs` are not provided, all parameters (except `*args` and `**kwargs`) will be used for building the cache key.
@@ -237,6 +346,7 @@ def cached(
         * Also the cached decorator, if no args provided, must be the last decorator unless all underlying decorators uses functools.wraps
           This is because the decorator will try to infer the parameters from the function signature, 
           and if the function signature is not available, it will cache the result no matter the parameters.
+        * On single flight mode, the result is shared by all coalesced callers, so it must not be modified.
     """
     from uds.core.util.cache import Cache  # To avoid circular references
 
@@ -298,45 +408,96 @@ def cached(
             
             # Get cache from object if present, or use the global 'functionCache' (generic, common to all objects)
             cache = inner_cache or Cache('functionCache')
+            # Key for coalescing calls, must include the cache owner
+            flight_key = cache.owner + ':' + cache_key
 
             # if timeout is a function, call it
             effective_timeout = timeout() if callable(timeout) else timeout
 
+            # Remove force key, if present
+            force = kwargs.pop('force', False)
+
+            def execute() -> T:
+                nonlocal misses, exec_time
+                with lock:
+                    misses += 1
+                    CacheStats.manager().add_miss()
+
+                # Execute the function outside the DB transaction
+                t = time.thread_time_ns()
+                data = fnc(*args, **kwargs)   # pyright: ignore  # For some reason, pyright does not like this line
+                exec_time += time.thread_time_ns() - t
+
+                try:
+                    # Maybe returned data is not serializable. In that case, cache will fail but no harm is done with this
+                    if stale_while_revalidate:
+                        cache.put(
+                            cache_key,
+                            (time.time() + effective_timeout, data),
+                            effective_timeout + stale_while_revalidate,
+                        )
+                    else:
+                        cache.put(cache_key, data, effective_timeout)
+                except Exception as e:
+                    logger.debug(
+                        'Data for %s is not serializable on call to %s, not cached. %s (%s)',
+                        cache_key,
+                        fnc.__name__,
+                        data,
+                        e,
+                    )
+                return data
+
+            def execute_cluster_wide() -> T:
+                # Short lived lock, so if a node dies executing, others will not wait too long
+                locks = Cache('uds:cached:lock')
+                if locks.add(flight_key, True, consts.cache.SINGLE_FLIGHT_WAIT_TIMEOUT):
+                    try:
+                        return execute()
+                    finally:
+                        locks.remove(flight_key)
+
+                # Other node is executing it, wait for its result
+                deadline = time.monotonic() + consts.cache.SINGLE_FLIGHT_WAIT_TIMEOUT
+                while time.monotonic() < deadline:
+                    time.sleep(consts.cache.SINGLE_FLIGHT_POLL_INTERVAL)
+                    data = cache.get(cache_key, default=consts.cache.CACHE_NOT_FOUND)
+                    if data is not consts.cache.CACHE_NOT_FOUND:
+                        CacheStats.manager().add_coalesced()
+                        return data[1] if stale_while_revalidate else data
+                logger.debug('Timeout waiting for %s on other node, executing it', flight_key)
+                return execute()
+
             data: typing.Any = None
             # If misses is 0, we are starting, so we will not try to get from cache
-            if not kwargs.get('force', False) and effective_timeout > 0 and misses > 0:
+            if not force and effective_timeout > 0 and misses > 0:
                 data = cache.get(cache_key, default=consts.cache.CACHE_NOT_FOUND)
+                if data is not consts.cache.CACHE_NOT_FOUND and stale_while_revalidate:
+                    # Stored as (fresh until, data). If not, it is from a previous version, ignore it
+                    if isinstance(data, tuple) and len(typing.cast(tuple[typing.Any, ...], data)) == 2:
+                        fresh_until, data = typing.cast(tuple[float, typing.Any], data)
+                    else:
+                        fresh_until, data = 0.0, consts.cache.CACHE_NOT_FOUND
+                    if data is not consts.cache.CACHE_NOT_FOUND and time.time() > fresh_until:
+                        # Serve stale data, and refresh it on background (only once)
+                        with lock:
+                            CacheStats.manager().add_stale()
+                        _background_flight(flight_key, execute)
+                        return data
                 if data is not consts.cache.CACHE_NOT_FOUND:
                     with lock:
                         hits += 1
                         CacheStats.manager().add_hit(exec_time // hits)  # Use mean execution time
                     return data
 
-            with lock:
-                misses += 1
-                CacheStats.manager().add_miss()
-
-            if 'force' in kwargs:
-                # Remove force key
-                del kwargs['force']
-
-            # Execute the function outside the DB transaction
-            t = time.thread_time_ns()
-            data = fnc(*args, **kwargs)   # pyright: ignore  # For some reason, pyright does not like this line
-            exec_time += time.thread_time_ns() - t
-
-            try:
-                # Maybe returned data is not serializable. In that case, cache will fail but no harm is done with this
-                cache.put(cache_key, data, effective_timeout)
-            except Exception as e:
-                logger.debug(
-                    'Data for %s is not serializable on call to %s, not cached. %s (%s)',
-                    cache_key,
-                    fnc.__name__,
-                    data,
-                    e,
-                )
-            return data
+            # Forced calls want a fresh value, so they never join a call already in progress
+            if force:
+                return execute()
+            if cluster_wide:
+                return _single_flight(flight_key, execute_cluster_wide)
+            if single_flight:
+                return _single_flight(flight_key, execute)
+            return execute()
 
         # Add a couple of methods to the wrapper to allow cache statistics access and cache clearing
         def cache_info() -> CacheInfo:
@@ -431,7 +592,7 @@ def blocker(
                 raise
 
             # If we are here, it means that the call was successfull, so we reset the counter
-            mycache.delete(ip)
+            mycache.remove(ip)
 
             return result
 
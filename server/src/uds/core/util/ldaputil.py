@@ -30,7 +30,10 @@
 """
 Author: Adolfo Gómez, dkmaster at dkmon dot com
 """
+import hashlib
 import logging
+import threading
+import time
 import typing
 import collections.abc
 import tempfile
@@ -64,11 +67,14 @@ from ldap.ldapobject import LDAPObject as S_LDAPObject  # pyright: ignore
 # This allows us to replace this in a future with another ldap library if needed
 LDAPObject: typing.TypeAlias = S_LDAPObject
 
+from uds.core import consts
 from uds.core.util import utils
 
 
 logger = logging.getLogger(__name__)
 
+T = typing.TypeVar('T')
+
 LDAPResultType = collections.abc.MutableMapping[str, typing.Any]
 LDAPSearchResultType = typing.Optional[list[tuple[typing.Optional[str], dict[str, typing.Any]]]]
 
@@ -325,3 +331,234 @@ def get_root_dse(con: 'LDAPObject') -> typing.Optional[LDAPResultType]:
             scope=SCOPE_BASE,
         )
     )
+
+
+class ConnectionPool:
+    """
+    Bounded pool of connections to an ldap server, so operations (searchs, credentials checks, ...) do not
+    connect and bind to the server every time.
+
+    Searchs are done on connections bound with pool credentials (execute), and users credentials are
+    checked rebinding other connections, kept apart for this (bind).
+
+    Connections idle for more than consts.auth.LDAP_POOL_CHECK_INTERVAL seconds are checked before being
+    reused, and operations failed because its connection broke are retried once on a new connection.
+    """
+
+    _connect: collections.abc.Callable[[str, typing.Union[str, bytes]], 'LDAPObject']
+    _username: str
+    _password: typing.Union[str, bytes]
+    _max_size: int
+    _timeout: int
+    _idle: dict[bool, list[tuple['LDAPObject', float]]]  # Idle connections (and since when), by "for binds"
+    _size: int  # Connections opened, idle or in use
+    _closed: bool
+    _condition: threading.Condition
+
+    # Counters
+    connections: int  # New connections (each one, a bind)
+    binds: int  # Binds on reused connections
+    reused: int
+    discarded: int  # Connections closed (broken ones, or when pool is closed)
+
+    def __init__(
+        self,
+        connect: collections.abc.Callable[[str, typing.Union[str, bytes]], 'LDAPObject'],
+        username: str,
+        password: typing.Union[str, bytes],
+        *,
+        max_size: int = consts.auth.LDAP_POOL_SIZE,
+        timeout: int = 3,
+    ) -> None:
+        """
+        Args:
+            connect: Creates a new connection, bound with the credentials provided (see connection)
+            username: Username of connections used for searchs
+            password: Password of connections used for searchs
+            max_size: Max connections opened at once
+            timeout: Seconds to wait for a connection if all are in use
+        """
+        self._connect = connect
+        self._username = username
+        self._password = password
+        self._max_size = max(max_size, 1)
+        self._timeout = timeout
+        self._idle = {False: [], True: []}
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self.connections = self.binds = self.reused = self.discarded = 0
+
+    @staticmethod
+    def _is_alive(con: 'LDAPObject') -> bool:
+        try:
+            con.whoami_s()  # pyright: ignore reportGeneralTypeIssues
+            return True
+        except Exception:
+            return False
+
+    def _acquire(
+        self, for_binds: bool, username: str, password: typing.Union[str, bytes]
+    ) -> tuple['LDAPObject', bool]:
+        """
+        Returns an idle connection (checked if needed), or a new one bound with the credentials provided.
+        Second value is True if the connection is a new one
+        """
+        deadline = time.monotonic() + self._timeout
+        with self._condition:
+            while True:
+                idle = self._idle[for_binds]
+                if idle:
+                    con, since = idle.pop()
+                    if time.monotonic() - since < consts.auth.LDAP_POOL_CHECK_INTERVAL or self._is_alive(con):
+                        self.reused += 1
+                        return con, False
+                    self._close(con)
+                    continue
+                if self._size < self._max_size:
+                    self._size += 1
+                    break
+                # Connections of the other kind are idle, close one of them to make room
+                if self._idle[not for_binds]:
+                    self._close(self._idle[not for_binds].pop(0)[0])
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise LDAPError(_('Too many concurrent ldap connections'))
+                self._condition.wait(remaining)
+
+        # Connect outside the lock, it can take a while
+        try:
+            con = self._connect(username, password)
+            self.connections += 1
+            return con, True
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+    def _release(self, con: 'LDAPObject', for_binds: bool) -> None:
+        with self._condition:
+            if self._closed:
+                self._close(con)
+                return
+            self._idle[for_binds].append((con, time.monotonic()))
+            self._condition.notify()
+
+    def _close(self, con: 'LDAPObject') -> None:
+        """
+        Closes a connection. Must be called with the lock held
+        """
+        self._size -= 1
+        self.discarded += 1
+        try:
+            con.unbind_s()  # pyright: ignore reportGeneralTypeIssues
+        except Exception:  # nosec: Already broken, nothing to do
+            pass
+        self._condition.notify()
+
+    def _discard(self, con: 'LDAPObject') -> None:
+        with self._condition:
+            self._close(con)
+
+    def execute(self, operation: collections.abc.Callable[['LDAPObject'], T]) -> T:
+        """
+        Executes operation using a connection of the pool, bound with pool credentials.
+        Note that operation must consume any result (as_dict is a generator) before returning.
+        """
+        for retry in (False, True):
+            con, is_new = self._acquire(False, self._username, self._password)
+            try:
+                result = operation(con)
+            except Exception:
+                if retry or is_new or self._is_alive(con):
+                    self._release(con, False)
+                    raise
+                # Broken connection, retry on a new one
+                self._discard(con)
+                continue
+            self._release(con, False)
+            return result
+        raise LDAPError(_('Unknown error'))  # Not reachable
+
+    def bind(self, username: str, password: typing.Union[str, bytes]) -> None:
+        """
+        Checks credentials of an user, binding as it on a connection of the pool.
+        Raises LDAPError if credentials are not valid (or server can't be contacted)
+        """
+        password = password.encode('utf-8') if isinstance(password, str) else password
+        for retry in (False, True):
+            con, is_new = self._acquire(True, username, password)
+            if is_new:  # Connections are bound on creation
+                self._release(con, True)
+                return
+            try:
+                self.binds += 1
+                con.simple_bind_s(who=username, cred=password)  # pyright: ignore reportGeneralTypeIssues
+            except ldap.INVALID_CREDENTIALS as e:  # pyright: ignore
+                self._release(con, True)
+                LDAPError.reraise(e)
+            except Exception as e:
+                self._discard(con)
+                if retry:
+                    raise LDAPError(str(e)) from e
+                continue
+            self._release(con, True)
+            return
+
+    def close(self) -> None:
+        """
+        Closes idle connections. Connections in use are closed when released
+        """
+        with self._condition:
+            self._closed = True
+            for idle in self._idle.values():
+                while idle:
+                    self._close(idle.pop()[0])
+
+    def as_dict(self) -> dict[str, int]:
+        return {
+            'size': self._size,
+            'idle': sum(len(i) for i in self._idle.values()),
+            'connections': self.connections,
+            'binds': self.binds,
+            'reused': self.reused,
+            'discarded': self.discarded,
+        }
+
+
+_pools: dict[str, tuple[str, ConnectionPool]] = {}  # owner -> (connection parameters signature, pool)
+_pools_lock = threading.Lock()
+
+
+def connection_pool(
+    owner: str,
+    username: str,
+    passwd: typing.Union[str, bytes],
+    host: str,
+    **kwargs: typing.Any,
+) -> ConnectionPool:
+    """
+    Returns the connections pool of owner (an authenticator uuid, for example) for this connection parameters
+    (same as connection). If parameters are not the same as the ones of the existing pool, that pool is closed
+    and replaced with a new one.
+    """
+
+    def connect(user: str, password: typing.Union[str, bytes]) -> 'LDAPObject':
+        return connection(user, password, host, **kwargs)
+
+    pool_args = {'max_size': consts.auth.LDAP_POOL_SIZE, 'timeout': int(kwargs.get('timeout', 3))}
+    if not owner:  # Not shared
+        return ConnectionPool(connect, username, passwd, **pool_args)
+
+    signature = hashlib.sha256(repr((username, passwd, host, sorted(kwargs.items()))).encode()).hexdigest()
+    with _pools_lock:
+        current = _pools.get(owner)
+        if current is not None and current[0] == signature:
+            return current[1]
+        if current is not None:
+            current[1].close()
+        pool = ConnectionPool(connect, username, passwd, **pool_args)
+        _pools[owner] = (signature, pool)
+        return pool
@@ -30,13 +30,14 @@
 """
 Author: Adolfo Gómez, dkmaster at dkmon dot com
 """
+import collections.abc
 import typing
 import logging
 from threading import Lock
 import datetime
 from time import mktime
 
-from django.db import connection
+from django.db import connection, transaction
 
 from uds.core import consts
 from uds.core.managers.crypto import CryptoManager
@@ -138,3 +139,32 @@ def process_uuid(uuid: str) -> str:
     if isinstance(uuid, bytes):
         uuid = uuid.decode('utf8')
     return uuid.lower()
+
+
+class _PendingOnCommit:
+    # Callback registered by on_commit_once, so it knows if it is still pending
+    func: collections.abc.Callable[[], None]
+    done: bool
+
+    def __init__(self, func: collections.abc.Callable[[], None]) -> None:
+        self.func = func
+        self.done = False
+
+    def __call__(self) -> None:
+        self.done = True
+        self.func()
+
+
+def on_commit_once(func: collections.abc.Callable[[], None]) -> None:
+    """
+    Executes func once current transaction is commited (at once if not in a transaction), unless it is
+    already pending for it, so a lot of changes on the same transaction executes it just once.
+    If the transaction (or the savepoint it was registered on) is rolled back, it is discarded as usual.
+    """
+    conn = transaction.get_connection()
+    if conn.in_atomic_block and any(
+        isinstance(pending[1], _PendingOnCommit) and not pending[1].done and pending[1].func == func
+        for pending in conn.run_on_commit
+    ):
+        return
+    transaction.on_commit(_PendingOnCommit(func))
@@ -34,6 +34,7 @@ import logging
 import typing
 
 # from django.utils.translation import gettext as _
+from django.db.models import Q
 
 from uds import models
 from uds.core.types.permissions import PermissionType
@@ -43,7 +44,9 @@ from uds.core.util import objtype
 
 # Not imported at runtime, just for type checking
 if typing.TYPE_CHECKING:
-    from django.db.models import Model
+    from django.db.models import Model, QuerySet
+
+T = typing.TypeVar('T', bound='Model')
 
 logger = logging.getLogger(__name__)
 
@@ -63,27 +66,7 @@ def getPermissions(obj: 'Model') -> list[models.Permissions]:
 def effective_permissions(
     user: 'models.User', obj: 'Model', for_type: bool = False
 ) -> PermissionType:
-    try:
-        if user.is_admin:
-            return PermissionType.ALL
-
-        # Just check permissions for staff members
-        # root means for "object type" not for an object
-        if for_type is False:
-            return models.Permissions.get_permissions(
-                object_type=objtype.ObjectType.from_model(obj),
-                user=user,
-                object_id=obj.pk,
-                groups=user.groups.all(),
-            )
-
-        return models.Permissions.get_permissions(
-            object_type=objtype.ObjectType.from_model(obj),
-            user=user,
-            groups=user.groups.all(),
-        )
-    except Exception:
-        return PermissionType.NONE
+    return PermissionsResolver(user).effective_permissions(obj, for_type)
 
 
 def add_user_permission(
@@ -134,3 +117,75 @@ def revoke_permission_by_id(permUUID: str) -> None:
     except Exception:
         # no pemission found, log it
         logger.warning('Permission %s not found', permUUID)
+
+
+class PermissionsResolver:
+    """
+    Effective permissions of an user. All permissions of the user (and its groups) over an object type
+    are loaded with a single query, and used for every object of that type.
+
+    Loaded permissions are not refreshed, so use it on short lived contexts (i.e. a REST request)
+    """
+
+    _user: 'models.User'
+    # Object type -> (permission over the whole type, permissions per object id)
+    _loaded: dict[int, tuple[PermissionType, dict[int, PermissionType]]]
+
+    def __init__(self, user: 'models.User') -> None:
+        self._user = user
+        self._loaded = {}
+
+    def _load(self, object_type: objtype.ObjectType) -> tuple[PermissionType, dict[int, PermissionType]]:
+        if object_type.type not in self._loaded:
+            # Groups as subquery, so a single query is done
+            q = Q(user=self._user) | Q(group__in=self._user.groups.all())
+            for_type = PermissionType.NONE
+            for_objects: dict[int, PermissionType] = {}
+            for object_id, permission in models.Permissions.objects.filter(
+                q, object_type=object_type.type
+            ).values_list('object_id', 'permission'):
+                if object_id is None:
+                    for_type = max(for_type, PermissionType(permission))
+                else:
+                    for_objects[object_id] = max(
+                        for_objects.get(object_id, PermissionType.NONE), PermissionType(permission)
+                    )
+            self._loaded[object_type.type] = (for_type, for_objects)
+        return self._loaded[object_type.type]
+
+    def effective_permissions(self, obj: 'Model', for_type: bool = False) -> PermissionType:
+        try:
+            if self._user.is_admin:
+                return PermissionType.ALL
+
+            # root means for "object type" not for an object
+            type_permission, objects_permissions = self._load(objtype.ObjectType.from_model(obj))
+            if for_type:
+                return type_permission
+            return max(type_permission, objects_permissions.get(obj.pk, PermissionType.NONE))
+        except Exception:
+            return PermissionType.NONE
+
+    def has_access(
+        self,
+        obj: 'Model',
+        permission: PermissionType = PermissionType.ALL,
+        for_type: bool = False,
+    ) -> bool:
+        return self.effective_permissions(obj, for_type).contains(permission)
+
+    def filter_queryset(
+        self, query: 'QuerySet[T]', permission: PermissionType = PermissionType.READ
+    ) -> 'QuerySet[T]':
+        """
+        Restricts a query to the objects the user has, at least, the given permission on
+        """
+        if self._user.is_admin:
+            return query
+        try:
+            type_permission, objects_permissions = self._load(objtype.ObjectType.from_model(query.model()))
+        except Exception:
+            return query.none()
+        if type_permission.contains(permission):
+            return query
+        return query.filter(pk__in=[pk for pk, p in objects_permissions.items() if p.contains(permission)])
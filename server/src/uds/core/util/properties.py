@@ -30,11 +30,14 @@
 """
 Author: Adolfo Gómez, dkmaster at dkmon dot com
 """
+import collections
+import collections.abc
+import contextlib
 import typing
 import logging
 
 from django.db.models import signals
-from django.db import transaction
+from django.db import connection, transaction
 
 from uds.models.properties import Properties
 
@@ -43,51 +46,169 @@ if typing.TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+T = typing.TypeVar('T', bound='PropertiesMixin')
+
+# Max owners per prefetch query, below the bound parameters limits of databases (i.e. 1000 items IN on Oracle)
+PREFETCH_CHUNK_SIZE: typing.Final[int] = 500
+
 
 class PropertyAccessor:
     """
     Property accessor, used to access properties of an object
+
+    By default, every key read or write is a query. Once loaded (see load, PropertiesMixin.prefetch_properties,
+    or iterating over it, that needs all properties), reads are served from a local snapshot of all properties
+    of the owner, and writes are done on database and snapshot. Inside buffered(), writes are kept on the
+    accessor and flushed on exit with a single upsert (and a single delete for removed keys).
     """
 
     transaction: 'typing.Optional[transaction.Atomic]'
     owner_id: str
     owner_type: str
 
-    def __init__(self, owner_id: str, owner_type: str):
+    _snapshot: typing.Optional[dict[str, typing.Any]]
+    _buffering: bool
+    _updated: dict[str, typing.Any]  # Buffered writes, pending to flush
+    _deleted: set[str]  # Buffered deletions, pending to flush
+
+    def __init__(
+        self, owner_id: str, owner_type: str, snapshot: typing.Optional[dict[str, typing.Any]] = None
+    ):
         self.owner_id = owner_id
         self.owner_type = owner_type
+        self._snapshot = snapshot
+        self._buffering = False
+        self._updated = {}
+        self._deleted = set()
 
     def _filter(self) -> 'models.QuerySet[Properties]':
         return Properties.objects.filter(owner_id=self.owner_id, owner_type=self.owner_type)
 
+    def _local(self) -> dict[str, typing.Any]:
+        # Iterating needs all properties, so they are loaded at once (instead of a query per key later)
+        if self._snapshot is None:
+            self.load()
+        return typing.cast(dict[str, typing.Any], self._snapshot)
+
+    def load(self) -> 'PropertyAccessor':
+        """
+        Loads all properties of the owner, with a single query, so next reads are served locally
+        Pending buffered writes, if any, are kept over the loaded values
+        """
+        values = dict(self._filter().values_list('key', 'value'))
+        values.update(self._updated)
+        for key in self._deleted:
+            values.pop(key, None)
+        if self._snapshot is None:
+            self._snapshot = values
+        else:  # Snapshot may be shared with owner (prefetched), keep it updated
+            self._snapshot.clear()
+            self._snapshot.update(values)
+        return self
+
+    def flush(self) -> None:
+        """
+        Writes buffered changes to database
+        """
+        if not self._updated and not self._deleted:
+            return
+        # Transaction only needed if both deletions and updates are pending
+        with transaction.atomic() if self._deleted and self._updated else contextlib.nullcontext():
+            if self._deleted:
+                self._filter().filter(key__in=self._deleted).delete()
+            if self._updated:
+                Properties.objects.bulk_create(
+                    [
+                        Properties(owner_id=self.owner_id, owner_type=self.owner_type, key=key, value=value)
+                        for key, value in self._updated.items()
+                    ],
+                    update_conflicts=True,
+                    # MySQL upserts on any unique constraint, and does not accept the fields
+                    unique_fields=(
+                        ['owner_id', 'owner_type', 'key']
+                        if connection.features.supports_update_conflicts_with_target
+                        else None
+                    ),
+                    update_fields=['value'],
+                )
+        self._updated = {}
+        self._deleted = set()
+
+    @contextlib.contextmanager
+    def buffered(self) -> typing.Iterator['PropertyAccessor']:
+        """
+        Buffers writes until exit, where they are flushed (if no exception is raised)
+
+        Example:
+            with userservice.properties.buffered() as p:
+                p['cert'] = cert
+                p['priv'] = private_key
+        """
+        self._buffering = True
+        try:
+            yield self
+            self.flush()
+        except Exception:
+            self._updated = {}
+            self._deleted = set()
+            if self._snapshot is not None:
+                self.load()  # Discard buffered values
+            raise
+        finally:
+            self._buffering = False
+
     def __getitem__(self, key: str) -> typing.Any:
+        if key in self._updated:
+            return self._updated[key]
+        if key in self._deleted:
+            raise KeyError(key)
+        if self._snapshot is not None:
+            return self._snapshot[key]
         try:
             return self._filter().get(key=key).value
         except Properties.DoesNotExist:
             raise KeyError(key)
 
     def __setitem__(self, key: str, value: typing.Any) -> None:
-        try:
-            p = self._filter().get(key=key)
-            p.value = value
-            p.save()
-        except Properties.DoesNotExist:
-            Properties.objects.create(owner_id=self.owner_id, owner_type=self.owner_type, key=key, value=value)
+        if self._buffering:
+            self._updated[key] = value
+            self._deleted.discard(key)
+        else:
+            try:
+                p = self._filter().get(key=key)
+                p.value = value
+                p.save()
+            except Properties.DoesNotExist:
+                Properties.objects.create(owner_id=self.owner_id, owner_type=self.owner_type, key=key, value=value)
+        if self._snapshot is not None:
+            self._snapshot[key] = value
 
     def __delitem__(self, key: str) -> None:
-        try:
-            self._filter().get(key=key).delete()
-        except Properties.DoesNotExist:
-            pass  # Ignore if not exists
+        if self._buffering:
+            self._updated.pop(key, None)
+            self._deleted.add(key)
+        else:
+            try:
+                self._filter().get(key=key).delete()
+            except Properties.DoesNotExist:
+                pass  # Ignore if not exists
+        if self._snapshot is not None:
+            self._snapshot.pop(key, None)
 
     def __contains__(self, key: str) -> bool:
+        if key in self._updated:
+            return True
+        if key in self._deleted:
+            return False
+        if self._snapshot is not None:
+            return key in self._snapshot
         return bool(self._filter().filter(key=key).exists())
 
     def __iter__(self) -> typing.Iterator[str]:
-        return iter(self._filter().values_list('key', flat=True))
+        return self.keys()
 
     def __len__(self) -> int:
-        return int(self._filter().count())
+        return len(self._local())
 
     def get(self, key: str, default: typing.Any = None) -> typing.Any:
         try:
@@ -103,16 +224,20 @@ class PropertyAccessor:
             return default
 
     def keys(self) -> typing.Iterator[str]:
-        return iter(self._filter().values_list('key', flat=True))
+        return iter(list(self._local().keys()))
 
     def values(self) -> typing.Iterator[typing.Any]:
-        return iter(self._filter().values_list('value', flat=True))
+        return iter(list(self._local().values()))
 
     def items(self) -> typing.Iterator[tuple[str, typing.Any]]:
-        return iter(self._filter().values_list('key', 'value'))
+        return iter(list(self._local().items()))
 
     def clear(self) -> None:
         self._filter().delete()
+        self._updated = {}
+        self._deleted = set()
+        if self._snapshot is not None:
+            self._snapshot.clear()
 
     def pop(self, key: str, default: typing.Any = None) -> typing.Any:
         try:
@@ -125,6 +250,8 @@ class PropertyAccessor:
     def __enter__(self) -> 'PropertyAccessor':
         self.transaction = transaction.atomic()
         self.transaction.__enter__()
+        if self._snapshot is not None:
+            self.load()  # Values read inside the transaction must be current ones
         return self
 
     def __exit__(self, exc_type: typing.Any, exc_value: typing.Any, traceback: typing.Any) -> None:
@@ -135,6 +262,9 @@ class PropertyAccessor:
 class PropertiesMixin:
     """Mixin to add properties to a model"""
 
+    # Properties loaded by prefetch_properties, if any
+    _properties_snapshot: typing.Optional[dict[str, typing.Any]] = None
+
     def get_owner_id_and_type(self) -> tuple[str, str]:
         """Returns the owner id and type of this object
         The owner id and type is used to identify the owner in the properties table
@@ -148,7 +278,35 @@ class PropertiesMixin:
     @property
     def properties(self) -> PropertyAccessor:
         owner_id, owner_type = self.get_owner_id_and_type()
-        return PropertyAccessor(owner_id=owner_id, owner_type=owner_type)
+        return PropertyAccessor(owner_id=owner_id, owner_type=owner_type, snapshot=self._properties_snapshot)
+
+    @staticmethod
+    def prefetch_properties(objects: collections.abc.Iterable[T]) -> list[T]:
+        """Loads the properties of all objects with a single query (per owner type and PREFETCH_CHUNK_SIZE
+        objects), so reading them later does not touch the database (i.e. when converting a list of user
+        services or servers for REST)
+
+        Args:
+            objects (collections.abc.Iterable[T]): Objects (or queryset) to prefetch properties for
+
+        Returns:
+            list[T]: The objects, with its properties loaded
+        """
+        items = list(objects)
+        owners: dict[str, dict[str, T]] = collections.defaultdict(dict)
+        for item in items:
+            owner_id, owner_type = item.get_owner_id_and_type()
+            owners[owner_type][owner_id] = item
+            item._properties_snapshot = {}
+
+        for owner_type, by_id in owners.items():
+            owner_ids = list(by_id)
+            for pos in range(0, len(owner_ids), PREFETCH_CHUNK_SIZE):
+                for owner_id, key, value in Properties.objects.filter(
+                    owner_type=owner_type, owner_id__in=owner_ids[pos : pos + PREFETCH_CHUNK_SIZE]
+                ).values_list('owner_id', 'key', 'value'):
+                    typing.cast(dict[str, typing.Any], by_id[owner_id]._properties_snapshot)[key] = value
+        return items
 
     @staticmethod
     def _pre_delete_properties_signal(sender: typing.Any, **kwargs: typing.Any) -> None:  # pylint: disable=unused-argument
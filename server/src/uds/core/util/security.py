@@ -30,13 +30,17 @@
 """
 Author: Adolfo Gómez, dkmaster at dkmon dot com
 """
+import collections
 import ipaddress
 import logging
 import random
 import secrets
 import ssl
+import threading
+import time
 import typing
 import datetime
+import urllib.parse
 
 import certifi
 import requests
@@ -51,6 +55,7 @@ from cryptography.x509.oid import NameOID
 from django.conf import settings
 
 from uds.core import consts
+from uds.core.util import singleton
 
 logger = logging.getLogger(__name__)
 
@@ -63,7 +68,7 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 try:
     # Ensure that we do not get warnings about self signed certificates and so
-    import requests.packages.urllib3  # type: ignore
+    import requests.packages.urllib3
 
     requests.packages.urllib3.disable_warnings()  # pyright: ignore
 except Exception:  # nosec: simple check for disabling warnings,
@@ -116,19 +121,22 @@ def create_self_signed_cert(ip: str) -> tuple[str, str, str]:
     )
 
 
-def create_client_sslcontext(verify: bool = True) -> ssl.SSLContext:
+def create_client_sslcontext(verify: bool = True, cadata: typing.Optional[str] = None) -> ssl.SSLContext:
     """
     Creates a SSLContext for client connections.
 
     Args:
         verify: If True, the server certificate will be verified. (Default: True)
+        cadata: If provided, certificates (PEM) to trust instead of the default CAs.
 
     Returns:
         A SSLContext object.
     """
-    ssl_context = ssl.create_default_context(
-        purpose=ssl.Purpose.SERVER_AUTH, cafile=certifi.where()
-    )
+    if cadata:
+        # Only the given certificates are trusted, not any other issued by a public CA for that host
+        ssl_context = ssl.create_default_context(purpose=ssl.Purpose.SERVER_AUTH, cadata=cadata)
+    else:
+        ssl_context = ssl.create_default_context(purpose=ssl.Purpose.SERVER_AUTH, cafile=certifi.where())
     if not verify:
         ssl_context.check_hostname = False
         ssl_context.verify_mode = ssl.VerifyMode.CERT_NONE
@@ -183,55 +191,315 @@ def check_certificate_matches_private_key(*, cert: str, key: str) -> bool:
         return False
 
 
+# Contexts shared by all connections (see shared_client_sslcontext), by (verify, trusted certificates)
+# Least recently used ones are discarded when consts.net.SSL_CONTEXTS_CACHE_SIZE is reached
+_ssl_contexts: 'collections.OrderedDict[tuple[bool, str], ssl.SSLContext]' = collections.OrderedDict()
+_ssl_contexts_lock = threading.Lock()
+
+
+def shared_client_sslcontext(verify: bool = True, cadata: typing.Optional[str] = None) -> ssl.SSLContext:
+    """
+    Returns a SSLContext for client connections, shared by the whole process.
+    Creating a context (loading the CAs mainly) is expensive, so it is created only once for
+    each combination of parameters. Must not be modified by callers.
+
+    Args:
+        verify: If True, the server certificate will be verified. (Default: True)
+        cadata: Certificates (PEM) to trust instead of the default CAs. If provided, verify is forced
+
+    Returns:
+        A SSLContext object.
+    """
+    key = (verify or bool(cadata), cadata or '')
+    with _ssl_contexts_lock:
+        if key in _ssl_contexts:
+            _ssl_contexts.move_to_end(key)
+            return _ssl_contexts[key]
+        ssl_context = create_client_sslcontext(verify=key[0], cadata=cadata)
+        _ssl_contexts[key] = ssl_context
+        while len(_ssl_contexts) > max(1, consts.net.SSL_CONTEXTS_CACHE_SIZE):
+            _ssl_contexts.popitem(last=False)  # Connections using it keep their reference
+        return ssl_context
+
+
+class HTTPConnectionsStats(metaclass=singleton.Singleton):
+    """
+    Counters of the outbound HTTP connections pool of this process, updated with the pool lock held
+    """
+
+    requests: int
+    new_connections: int
+    evicted: int  # Host pools closed because of inactivity
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.new_connections = 0
+        self.evicted = 0
+
+    @property
+    def reused_connections(self) -> int:
+        return max(0, self.requests - self.new_connections)
+
+    def as_dict(self) -> dict[str, int]:
+        return {
+            'requests': self.requests,
+            'new_connections': self.new_connections,
+            'reused_connections': self.reused_connections,
+            'evicted': self.evicted,
+            'pools': len(HTTPConnectionsPool.manager()),
+        }
+
+    def __str__(self) -> str:
+        return (
+            f'HTTPConnectionsStats: requests={self.requests}, new={self.new_connections}, '
+            f'reused={self.reused_connections}, evicted={self.evicted}'
+        )
+
+    @staticmethod
+    def manager() -> 'HTTPConnectionsStats':
+        return HTTPConnectionsStats()
+
+
+class _CountingHTTPConnectionPool(urllib3.HTTPConnectionPool):
+    def _new_conn(self) -> typing.Any:
+        HTTPConnectionsPool.manager().connection_created()
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+    def _new_conn(self) -> typing.Any:
+        HTTPConnectionsPool.manager().connection_created()
+        return super()._new_conn()
+
+
+class PooledHTTPAdapter(requests.adapters.HTTPAdapter):
+    """
+    Adapter shared by all sessions requesting the same host with the same security settings.
+    Trusted CAs are already loaded on its (shared) SSLContext, so they are not reloaded on every new connection.
+    Sessions cannot close it, it is closed by HTTPConnectionsPool once idle.
+    """
+
+    verify: bool
+    last_used: float
+    active: int  # Requests in progress
+
+    def __init__(self, verify: bool, cadata: typing.Optional[str] = None) -> None:
+        self.verify = verify or bool(cadata)
+        self._ssl_context = shared_client_sslcontext(verify=verify, cadata=cadata)
+        self.last_used = time.monotonic()
+        self.active = 0
+        super().__init__(pool_connections=2, pool_maxsize=consts.net.HTTP_POOL_MAXSIZE)
+
+    def init_poolmanager(self, *args: typing.Any, **kwargs: typing.Any) -> None:
+        kwargs['ssl_context'] = self._ssl_context
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool,
+            'https': _CountingHTTPSConnectionPool,
+        }
+
+    def cert_verify(self, conn: typing.Any, url: typing.Any, verify: 'str|bool', cert: typing.Any) -> None:
+        # Clears CAs locations (and sets client cert, if any). Verification depends only on the context
+        super().cert_verify(conn, url, False, cert)
+        if self.verify and url.lower().startswith('https'):
+            conn.cert_reqs = 'CERT_REQUIRED'
+
+    def send(
+        self,
+        request: 'requests.PreparedRequest',
+        stream: bool = False,
+        timeout: typing.Union[None, float, tuple[float, float], tuple[float, None]] = None,
+        verify: typing.Union[bool, str] = True,
+        cert: typing.Union[None, bytes, str, tuple[typing.Union[bytes, str], typing.Union[bytes, str]]] = None,
+        proxies: typing.Optional[typing.Mapping[str, str]] = None,
+    ) -> 'requests.Response':
+        return super().send(request, stream, timeout, self.verify, cert, proxies)
+
+    def close(self) -> None:
+        pass  # Shared, see dispose
+
+    def dispose(self) -> None:
+        super().close()
+
+
+class HTTPConnectionsPool(metaclass=singleton.Singleton):
+    """
+    Process wide pool of outbound HTTP connections, used by the sessions returned by secure_requests_session.
+    Connections are kept (at most consts.net.HTTP_POOL_MAXSIZE alive) by host, security settings and
+    client certificate, and closed once the host has not been requested for consts.net.HTTP_POOL_IDLE_TIMEOUT seconds.
+
+    Thread safe.
+    """
+
+    _adapters: dict[tuple[str, bool, str, typing.Any], PooledHTTPAdapter]
+    _lock: threading.Lock
+    _last_eviction: float
+
+    def __init__(self) -> None:
+        self._adapters = {}
+        self._lock = threading.Lock()
+        self._last_eviction = time.monotonic()
+
+    @staticmethod
+    def manager() -> 'HTTPConnectionsPool':
+        return HTTPConnectionsPool()
+
+    def __len__(self) -> int:
+        return len(self._adapters)
+
+    def _evict_idle(self) -> None:
+        # Lock must be held
+        now = time.monotonic()
+        if now - self._last_eviction < consts.net.HTTP_POOL_IDLE_TIMEOUT / 4:
+            return
+        self._last_eviction = now
+        for key, adapter in list(self._adapters.items()):
+            if adapter.active == 0 and now - adapter.last_used > consts.net.HTTP_POOL_IDLE_TIMEOUT:
+                del self._adapters[key]
+                adapter.dispose()
+                HTTPConnectionsStats.manager().evicted += 1
+
+    def send(
+        self,
+        request: 'requests.PreparedRequest',
+        *,
+        verify_server: bool,
+        cadata: typing.Optional[str],
+        **kwargs: typing.Any,
+    ) -> 'requests.Response':
+        url = urllib.parse.urlsplit(request.url or '')
+        cert = kwargs.get('cert')
+        key = (
+            f'{url.scheme}://{url.netloc}'.lower(),
+            verify_server,
+            cadata or '',
+            tuple(cert) if isinstance(cert, (list, tuple)) else cert,
+        )
+        with self._lock:
+            self._evict_idle()
+            adapter = self._adapters.get(key)
+            if adapter is None:
+                adapter = self._adapters[key] = PooledHTTPAdapter(verify_server, cadata)
+            adapter.active += 1
+            HTTPConnectionsStats.manager().requests += 1
+        try:
+            return adapter.send(request, **kwargs)
+        finally:
+            with self._lock:
+                adapter.active -= 1
+                adapter.last_used = time.monotonic()
+
+    def connection_created(self) -> None:
+        """
+        Invoked by the pooled adapters every time a new connection is opened
+        """
+        with self._lock:
+            HTTPConnectionsStats.manager().new_connections += 1
+
+    def clear(self) -> None:
+        """
+        Closes all pooled connections
+        """
+        with self._lock:
+            for adapter in self._adapters.values():
+                adapter.dispose()
+            self._adapters.clear()
+
+
+class _PooledRequestsAdapter(requests.adapters.BaseAdapter):
+    # Mounted on sessions, routes requests to the HTTPConnectionsPool
+    def __init__(self, verify: bool, cadata: typing.Optional[str]) -> None:
+        super().__init__()
+        self._verify = verify
+        self._cadata = cadata
+
+    def send(
+        self,
+        request: 'requests.PreparedRequest',
+        stream: bool = False,
+        timeout: typing.Union[None, float, tuple[float, float], tuple[float, None]] = None,
+        verify: typing.Union[bool, str] = True,
+        cert: typing.Union[None, bytes, str, tuple[typing.Union[bytes, str], typing.Union[bytes, str]]] = None,
+        proxies: typing.Optional[typing.Mapping[str, str]] = None,
+    ) -> 'requests.Response':
+        # Verification is set by the session (requests may have set verify with the environment CA bundle)
+        return HTTPConnectionsPool.manager().send(
+            request,
+            verify_server=self._verify,
+            cadata=self._cadata,
+            stream=stream,
+            timeout=timeout,
+            cert=cert,
+            proxies=proxies,
+        )
+
+    def close(self) -> None:
+        pass  # Connections are kept on pool
+
+
+class UDSHTTPAdapter(requests.adapters.HTTPAdapter):
+    """
+    Adapter for sessions that verify the server certificate against a CA bundle file. Not pooled.
+    """
+
+    def __init__(self, verify: str) -> None:
+        self._verify = verify
+        super().__init__()
+
+    def init_poolmanager(self, *args: typing.Any, **kwargs: typing.Any) -> None:
+        kwargs["ssl_context"] = create_client_sslcontext(verify=False)
+
+        # See urllib3.poolmanager.SSL_KEYWORDS for all available keys.
+        return super().init_poolmanager(*args, **kwargs)
+
+    def cert_verify(self, conn: typing.Any, url: typing.Any, verify: 'str|bool', cert: typing.Any) -> None:
+        """Verify a SSL certificate. This method should not be called from user
+        code, and is only exposed for use when subclassing the HTTPAdapter class
+        """
+
+        # If verify is an string, use it even if self._verify
+        # if not, use self._verify value
+        if not isinstance(verify, str):
+            verify = self._verify
+
+        super().cert_verify(conn, url, verify, cert)
+
+
 def secure_requests_session(
-    *, verify: typing.Union[str, bool] = True
+    *, verify: typing.Union[str, bool] = True, cadata: typing.Optional[str] = None
 ) -> 'requests.Session':
     '''
     Generates a requests.Session object with a custom adapter that uses a custom SSLContext.
     This is intended to be used for requests that need to be secure, but not necessarily verified.
     Removes the support for TLS1.0 and TLS1.1, and disables SSLv2 and SSLv3. (done in @createClientSslContext)
 
+    Sessions are cheap: unless verify is a CA bundle file, connections and SSLContexts are shared by
+    all sessions of the process (see HTTPConnectionsPool), so keep-alive connections are reused
+    across sessions.
+
     Args:
         verify: If True, the server certificate will be verified. (Default: True)
+                If an string, path to the CA bundle file to verify the server certificate with.
+        cadata: Certificates (PEM) to verify the server certificate with, the only ones trusted.
 
     Returns:
         A requests.Session object.
     '''
-
-    # Copy verify value
-    lverify = verify
-    
-    class UDSHTTPAdapter(requests.adapters.HTTPAdapter):
-        def init_poolmanager(self, *args: typing.Any, **kwargs: typing.Any) -> None:
-            kwargs["ssl_context"] = create_client_sslcontext(verify=verify is True)
-
-            # See urllib3.poolmanager.SSL_KEYWORDS for all available keys.
-            return super().init_poolmanager(*args, **kwargs)  # type: ignore
-
-        def cert_verify(self, conn: typing.Any, url: typing.Any, verify: 'str|bool', cert: typing.Any) -> None:
-            """Verify a SSL certificate. This method should not be called from user
-            code, and is only exposed for use when subclassing the HTTPAdapter class
-            """
-
-            # If lverify is an string, use it even if verify is False
-            # if not, use verify value
-            if not isinstance(verify, str):
-                verify = lverify
-
-            # logger.info('Connection info: %s', conn)
-            # for k, v in conn.__dict__.items():
-            #     logger.info('Connection info: %s = %s', k, v)
-
-            super().cert_verify(conn, url, verify, cert)  # type: ignore
-
     session = requests.Session()
-    session.mount("https://", UDSHTTPAdapter())
+    adapter: requests.adapters.BaseAdapter
+    if isinstance(verify, str):
+        adapter = UDSHTTPAdapter(verify)
+    else:
+        adapter = _PooledRequestsAdapter(verify, cadata)
+        session.mount("http://", adapter)
+    session.mount("https://", adapter)
 
     # Add user agent header to session
     session.headers.update({"User-Agent": consts.system.USER_AGENT})
 
     return session
 
+
 def is_server_certificate_valid(cert: str) -> bool:
     """
     Checks if a certificate is valid.
@@ -39,6 +39,7 @@ import logging
 from django.conf import settings
 
 from uds.core.managers.crypto import CryptoManager
+from uds.core.util import codec
 
 logger = logging.getLogger(__name__)
 
@@ -57,29 +58,26 @@ DESERIALIZERS: typing.Final[collections.abc.Mapping[bytes, collections.abc.Calla
 
 def serialize(obj: typing.Any) -> bytes:
     """
-    Serializes an object to a json string
+    Serializes an object to bytes
     """
-    # generate pickle dump and encrypt it to keep it safe
-    # Compress data using lzma first
-
-    data = SERIALIZERS[CURRENT_SERIALIZER_VERSION](
-        lzma.compress(pickle.dumps(obj))
-    )  # Pickle with latest available protocol
-    return CURRENT_SERIALIZER_VERSION + data
+    # encode using fast codec (that only compresses if needed) and encrypt it to keep it safe
+    return CURRENT_SERIALIZER_VERSION + SERIALIZERS[CURRENT_SERIALIZER_VERSION](codec.encode(obj))
 
 
 def deserialize(data: typing.Optional[bytes]) -> typing.Any:
     """
-    Deserializes an object from a json string
+    Deserializes an object serialized with serialize
     """
     if not data or len(data) < 2:
         return None
 
     try:
         if data[0:2] in DESERIALIZERS:
-            return pickle.loads(
-                lzma.decompress(DESERIALIZERS[data[0:2]](data[2:]))
-            )  # nosec:  Secured by encryption
+            payload = DESERIALIZERS[data[0:2]](data[2:])
+            if codec.is_encoded(payload):
+                return codec.decode(payload)
+            # Previous format, lzma compressed pickle
+            return pickle.loads(lzma.decompress(payload))  # nosec:  Secured by encryption
         # Old version, try to unpickle it
         return pickle.loads(data)  # nosec:  Backward compatibility
     except Exception:  # If error deserialize, return None
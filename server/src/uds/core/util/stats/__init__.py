@@ -32,3 +32,4 @@ Auhor: Adolfo Gómez, dkmaster at dkmon dot com
 # pyright: reportUnusedImport=false
 from . import counters
 from . import events
+from . import aggregation
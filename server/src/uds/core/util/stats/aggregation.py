@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+
+Database side aggregation of stats for reports.
+
+All sampling intervals (buckets) of a report, for all requested owners, are computed with a
+single grouped query, bucketing the stamps on the database, instead of issuing one query
+per interval and owner.
+"""
+import collections.abc
+import dataclasses
+import math
+import logging
+import typing
+
+from django.db import models
+from django.db.models.functions import Floor, Least
+
+from uds.core import types
+from uds.models import StatsCounters, StatsEvents
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass(frozen=True)
+class Buckets:
+    """
+    Consecutive intervals of same width, from start (included) to end (included on last interval).
+    Use "split" or "every" to create them.
+    """
+
+    start: int
+    end: int
+    count: int
+    width: float
+
+    @staticmethod
+    def split(start: int, end: int, count: int) -> 'Buckets':
+        """
+        Splits start-end in "count" intervals (i.e. sampling points of a report)
+        """
+        count = max(count, 1)
+        return Buckets(start, end, count, max(end - start, 1) / count)
+
+    @staticmethod
+    def every(start: int, end: int, seconds: int) -> 'Buckets':
+        """
+        Splits start-end in intervals of "seconds" length (last one can be shorter)
+        """
+        return Buckets(start, end, max(math.ceil((end - start) / seconds), 1), seconds)
+
+    def intervals(self) -> list[tuple[int, int]]:
+        return [
+            (int(self.start + i * self.width), int(min(self.start + (i + 1) * self.width, self.end)))
+            for i in range(self.count)
+        ]
+
+    def keys(self) -> list[int]:
+        """
+        Middle point of every interval, used as x axis values on charts
+        """
+        return [(begin + end) // 2 for begin, end in self.intervals()]
+
+    def expression(self) -> Least:
+        """
+        Database expression that returns the interval index of the "stamp" field
+        (stamps equal to end belongs to last interval, so distinct values are counted once on it)
+        """
+        return Least(
+            Floor((models.F('stamp') - self.start) / models.Value(float(self.width))),
+            models.Value(float(self.count - 1)),
+            output_field=models.FloatField(),
+        )
+
+    def index(self, value: typing.Any) -> int:
+        # Stamps equal to end belongs to last interval
+        return min(int(value), self.count - 1)
+
+
+@dataclasses.dataclass
+class EventsSeries:
+    """
+    Number of events, and number of distinct values of a field (if requested), on every interval
+    """
+
+    counts: list[int]
+    distinct: list[int]
+
+    @staticmethod
+    def empty(buckets: Buckets) -> 'EventsSeries':
+        return EventsSeries([0] * buckets.count, [0] * buckets.count)
+
+
+def _as_list(value: typing.Union[int, collections.abc.Iterable[int]]) -> list[int]:
+    return [value] if isinstance(value, int) else list(value)
+
+
+def _events_query(
+    owner_type: typing.Union[types.stats.EventOwnerType, collections.abc.Iterable[types.stats.EventOwnerType]],
+    event_type: typing.Union[types.stats.EventType, collections.abc.Iterable[types.stats.EventType]],
+    buckets: Buckets,
+    group_by: list[str],
+    distinct_field: typing.Optional[str],
+    owner_ids: typing.Optional[collections.abc.Iterable[int]],
+) -> 'models.QuerySet[typing.Any]':
+    q = StatsEvents.objects.filter(
+        owner_type__in=_as_list(owner_type),
+        event_type__in=_as_list(event_type),
+        stamp__gte=buckets.start,
+        stamp__lte=buckets.end,
+    )
+    if owner_ids is not None:
+        q = q.filter(owner_id__in=list(owner_ids))
+    aggregates: dict[str, typing.Any] = {'events': models.Count('id')}
+    if distinct_field:
+        aggregates['distinct'] = models.Count(distinct_field, distinct=True)
+    return (
+        q.annotate(bucket=buckets.expression())
+        .values(*group_by, 'bucket')
+        .annotate(**aggregates)
+        .order_by()  # Remove default ordering, so it is not used on grouping
+    )
+
+
+def events_series(
+    owner_type: typing.Union[types.stats.EventOwnerType, collections.abc.Iterable[types.stats.EventOwnerType]],
+    event_type: typing.Union[types.stats.EventType, collections.abc.Iterable[types.stats.EventType]],
+    buckets: Buckets,
+    owner_ids: collections.abc.Iterable[int],
+    *,
+    distinct_field: typing.Optional[str] = None,
+) -> dict[int, EventsSeries]:
+    """
+    Counts events on every interval for every owner, with a single query
+
+    Args:
+        owner_type: Owner type (or types) of the events
+        event_type: Event type (or types) to count
+        buckets: Intervals to compute
+        owner_ids: Owners to compute. All of them are returned, even if they have no events
+        distinct_field: If present, also counts distinct values of this field (i.e. 'fld4' for usernames)
+
+    Returns:
+        A dict, keyed by owner_id, with the series of every owner
+    """
+    owner_ids = _as_list(owner_ids)
+    result = {owner_id: EventsSeries.empty(buckets) for owner_id in owner_ids}
+    for row in _events_query(owner_type, event_type, buckets, ['owner_id'], distinct_field, owner_ids):
+        series = result[row['owner_id']]
+        index = buckets.index(row['bucket'])
+        series.counts[index] = row['events']
+        series.distinct[index] = row.get('distinct', 0)
+    return result
+
+
+def total_events_series(
+    owner_type: typing.Union[types.stats.EventOwnerType, collections.abc.Iterable[types.stats.EventOwnerType]],
+    event_type: typing.Union[types.stats.EventType, collections.abc.Iterable[types.stats.EventType]],
+    buckets: Buckets,
+    *,
+    distinct_field: typing.Optional[str] = None,
+) -> EventsSeries:
+    """
+    Counts events on every interval, of all owners together, with a single query
+
+    Args:
+        owner_type: Owner type (or types) of the events
+        event_type: Event type (or types) to count
+        buckets: Intervals to compute
+        distinct_field: If present, also counts distinct values of this field
+
+    Returns:
+        The series of counts
+    """
+    series = EventsSeries.empty(buckets)
+    for row in _events_query(owner_type, event_type, buckets, [], distinct_field, None):
+        index = buckets.index(row['bucket'])
+        series.counts[index] = row['events']
+        series.distinct[index] = row.get('distinct', 0)
+    return series
+
+
+def counters_series(
+    owner_type: types.stats.CounterOwnerType,
+    counter_type: types.stats.CounterType,
+    buckets: Buckets,
+    owner_ids: collections.abc.Iterable[int],
+    *,
+    use_max: bool = False,
+) -> dict[int, list[int]]:
+    """
+    Computes the average (or max) of a counter on every interval for every owner, with a single query
+
+    Args:
+        owner_type: Owner type of the counters
+        counter_type: Counter type
+        buckets: Intervals to compute
+        owner_ids: Owners to compute. All of them are returned, even if they have no counters
+        use_max: If True, max value of interval is used instead of average
+
+    Returns:
+        A dict, keyed by owner_id, with the values of every owner (0 for intervals without data)
+    """
+    owner_ids = _as_list(owner_ids)
+    result = {owner_id: [0] * buckets.count for owner_id in owner_ids}
+    q = (
+        StatsCounters.objects.filter(
+            owner_type=owner_type,
+            counter_type=counter_type,
+            owner_id__in=owner_ids,
+            stamp__gte=buckets.start,
+            stamp__lte=buckets.end,
+        )
+        .annotate(bucket=buckets.expression())
+        .values('owner_id', 'bucket')
+        .annotate(value=models.Max('value') if use_max else models.Avg('value'))
+        .order_by()
+    )
+    for row in q:
+        values = result[row['owner_id']]
+        index = buckets.index(row['bucket'])
+        values[index] = int(row['value'])
+    return result
@@ -39,6 +39,7 @@ import logging
 
 from django.db import transaction, models
 from uds.models.storage import Storage as DBStorage
+from uds.core.util import codec
 
 logger = logging.getLogger(__name__)
 
@@ -60,13 +61,17 @@ def _calculate_key(owner: bytes, key: bytes) -> str:
 
 
 def _encode_value(key: str, value: typing.Any) -> str:
-    return base64.b64encode(pickle.dumps((MARK, key, value))).decode()
+    return base64.b64encode(codec.encode((MARK, key, value))).decode()
 
 
 def _decode_value(dbk: str, value: typing.Optional[str]) -> tuple[str, typing.Any]:
     if value:
         try:
-            v = pickle.loads(base64.b64decode(value.encode()))  # nosec: This is e controled pickle loading
+            data = base64.b64decode(value.encode())
+            if codec.is_encoded(data):
+                v = codec.decode(data)
+            else:  # Previous format, plain pickle
+                v = pickle.loads(data)  # nosec: This is e controled pickle loading
             if isinstance(v, tuple) and v[0] == MARK:
                 return typing.cast(tuple[str, typing.Any], v[1:])
             # Fix value so it contains also the "key" (in this case, the original key is lost, we have only the hash value...)
@@ -273,7 +278,9 @@ class Storage:
         data_encoded = base64.b64encode(data).decode()
         attr1 = attr1 or ''
         try:
-            DBStorage.objects.create(owner=self._owner, key=key, data=data_encoded, attr1=attr1)
+            # Savepoint, so a duplicated key does not break an enclosing transaction
+            with transaction.atomic():
+                DBStorage.objects.create(owner=self._owner, key=key, data=data_encoded, attr1=attr1)
         except Exception:
             with transaction.atomic():
                 DBStorage.objects.filter(key=key).select_for_update().update(
@@ -30,15 +30,23 @@
 Author: Adolfo Gómez, dkmaster at dkmon dot com
 """
 import dataclasses
+import collections
 import collections.abc
+import contextlib
 import datetime
+import threading
+import time
 import typing
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.db import connections
 
 from uds.models import Service
+from uds.core import consts
 from uds.core.util.model import sql_now
 from uds.core.jobs import Job
-from uds.core.util import storage
+from uds.core.util import singleton, storage
 
 from uds.core.services.generics import exceptions as gen_exceptions
 
@@ -53,12 +61,17 @@ MAX_TOTAL_RETRIES: typing.Final[int] = 1024
 RETRIES_TO_RETRY: typing.Final[int] = (
     16  # Retries to stop again or to shutdown again in STOPPING_GROUP or DELETING_GROUP
 )
-MAX_DELETIONS_AT_ONCE: typing.Final[int] = 16
+MAX_DELETIONS_AT_ONCE: typing.Final[int] = 64
 MAX_DELETIONS_CHECKED_AT_ONCE: typing.Final[int] = MAX_DELETIONS_AT_ONCE * 2
+# Max entries of a single provider processed on each run, so a provider with a big queue
+# does not take the place of the entries of the others
+MAX_DELETIONS_PER_PROVIDER: typing.Final[int] = 16
 
 # This interval is how long will take to check again for deletion, stopping, etc...
 # That is, once a machine is deleted, every 32 seconds will be check that it has been deleted
 CHECK_INTERVAL: typing.Final[int] = 32  # Check interval, in seconds
+# Entries failing are checked again with exponential backoff, doubling CHECK_INTERVAL on every consecutive error
+MAX_CHECK_INTERVAL: typing.Final[int] = 1800  # Max check interval, in seconds
 
 TO_STOP_GROUP: typing.Final[str] = 'to_stop'
 STOPPING_GROUP: typing.Final[str] = 'stopping'
@@ -75,6 +88,14 @@ class DeletionInfo:
     fatal_retries: int = 0  # Fatal error retries
     total_retries: int = 0  # Total retries
     retries: int = 0  # Retries to stop again or to delete again in STOPPING_GROUP or DELETING_GROUP
+    errors: int = 0  # Consecutive errors, for backoff
+
+    def next_check(self) -> datetime.datetime:
+        """
+        Returns when this entry should be processed again
+        """
+        interval = min(CHECK_INTERVAL * 2 ** min(max(self.errors - 1, 0), 16), MAX_CHECK_INTERVAL)
+        return self.last_check + datetime.timedelta(seconds=interval)
 
     def sync_to_storage(self, group: str) -> None:
         """
@@ -112,6 +133,7 @@ class DeletionInfo:
         infos: list[tuple[str, DeletionInfo]] = []
 
         services: dict[str, 'DynamicService'] = {}
+        per_provider: collections.Counter[str] = collections.Counter()
 
         # First, get ownership of to_delete objects to be processed
         # We do this way to release db locks as soon as possible
@@ -130,7 +152,7 @@ class DeletionInfo:
                     del storage_dict[key]
                     continue
 
-                if info.last_check + datetime.timedelta(seconds=CHECK_INTERVAL) > sql_now():
+                if info.next_check() > sql_now():
                     continue
                 try:
                     if info.service_uuid not in services:
@@ -142,9 +164,14 @@ class DeletionInfo:
                     del storage_dict[key]
                     continue
 
+                provider_uuid = services[info.service_uuid].provider().get_uuid()
+                if per_provider[provider_uuid] >= MAX_DELETIONS_PER_PROVIDER:
+                    continue  # Keep it for next run, but let other providers entries in
+
                 if (count := count + 1) > MAX_DELETIONS_AT_ONCE:
                     break
 
+                per_provider[provider_uuid] += 1
                 del storage_dict[key]  # Remove from storage, being processed
 
                 # Only add if not too many retries already
@@ -152,12 +179,105 @@ class DeletionInfo:
         return services, infos
 
 
+@dataclasses.dataclass
+class ProviderDeletionCounters:
+    operations: int = 0  # Operations executed (stop, delete, checks, ...)
+    errors: int = 0
+    completed: int = 0  # Machines whose deletion has finished
+    busy_time: float = 0.0  # Seconds spent on operations
+
+    def as_dict(self, uptime: float) -> dict[str, typing.Any]:
+        return {
+            'operations': self.operations,
+            'errors': self.errors,
+            'completed': self.completed,
+            'completed_per_minute': self.completed * 60 / uptime if uptime > 0 else 0.0,
+            'avg_operation_time': self.busy_time / self.operations if self.operations else 0.0,
+        }
+
+
+class DeferredDeletionStats(metaclass=singleton.Singleton):
+    """
+    Counters of the deferred deletion worker of this process, per provider
+    """
+
+    start_time: float
+    providers: dict[str, ProviderDeletionCounters]
+    _lock: threading.Lock
+
+    def __init__(self) -> None:
+        self.start_time = time.monotonic()
+        self.providers = {}
+        self._lock = threading.Lock()
+
+    def record(
+        self, provider_uuid: str, elapsed: float, *, error: bool = False, completed: bool = False
+    ) -> None:
+        with self._lock:
+            counters = self.providers.setdefault(provider_uuid, ProviderDeletionCounters())
+            counters.operations += 1
+            counters.busy_time += elapsed
+            counters.errors += int(error)
+            counters.completed += int(completed)
+
+    def as_dict(self) -> dict[str, dict[str, typing.Any]]:
+        uptime = time.monotonic() - self.start_time
+        with self._lock:
+            return {uuid: counters.as_dict(uptime) for uuid, counters in self.providers.items()}
+
+    def __str__(self) -> str:
+        with self._lock:
+            providers = dict(self.providers)
+        return 'DeferredDeletionStats: ' + ', '.join(
+            f'{uuid}=(operations={c.operations}, errors={c.errors}, completed={c.completed})'
+            for uuid, c in providers.items()
+        )
+
+    @staticmethod
+    def manager() -> 'DeferredDeletionStats':
+        return DeferredDeletionStats()
+
+
+class ProviderLimiter:
+    """
+    Limits the operations executed at once, and per second, on a provider
+    """
+
+    _semaphore: threading.BoundedSemaphore
+    _lock: threading.Lock
+    _next_slot: float
+
+    def __init__(self) -> None:
+        self._semaphore = threading.BoundedSemaphore(max(1, consts.system.DEFERRED_DELETION_CONCURRENCY))
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    @contextlib.contextmanager
+    def slot(self) -> typing.Iterator[None]:
+        with self._semaphore:
+            if consts.system.DEFERRED_DELETION_RATE > 0:
+                with self._lock:
+                    now = time.monotonic()
+                    wait = self._next_slot - now
+                    self._next_slot = max(now, self._next_slot) + 1 / consts.system.DEFERRED_DELETION_RATE
+                if wait > 0:
+                    time.sleep(wait)
+            yield
+
+
+# Processors of an entry return the group where the entry must be stored, or None if it is done
+ProcessorType: typing.TypeAlias = collections.abc.Callable[['DynamicService', DeletionInfo], typing.Optional[str]]
+
+
 class DeferredDeletionWorker(Job):
     frecuency = 19  # Frequency for this job, in seconds
     friendly_name = 'Deferred deletion runner'
 
     deferred_storage: typing.ClassVar[storage.Storage] = storage.Storage('deferdel_worker')
 
+    _limiters: typing.ClassVar[dict[str, ProviderLimiter]] = {}
+    _limiters_lock: typing.ClassVar[threading.Lock] = threading.Lock()
+
     @staticmethod
     def add(service: 'DynamicService', vmid: str, execute_later: bool = False) -> None:
         # If sync, execute now
@@ -191,6 +311,38 @@ class DeferredDeletionWorker(Job):
         # Has not been deleted, so we will defer deletion
         DeletionInfo.create_on_storage(DELETING_GROUP, vmid, service.db_obj().uuid)
 
+    @staticmethod
+    def limiter(provider_uuid: str) -> ProviderLimiter:
+        with DeferredDeletionWorker._limiters_lock:
+            if provider_uuid not in DeferredDeletionWorker._limiters:
+                DeferredDeletionWorker._limiters[provider_uuid] = ProviderLimiter()
+            return DeferredDeletionWorker._limiters[provider_uuid]
+
+    @staticmethod
+    def report() -> dict[str, dict[str, typing.Any]]:
+        """
+        Returns, per provider, the entries queued on every group and the counters of this process
+        """
+        queued: dict[str, collections.Counter[str]] = collections.defaultdict(collections.Counter)
+        for group in (TO_STOP_GROUP, STOPPING_GROUP, TO_DELETE_GROUP, DELETING_GROUP):
+            with DeferredDeletionWorker.deferred_storage.as_dict(group) as storage_dict:
+                for info in typing.cast(collections.abc.Iterable[DeletionInfo], storage_dict.values()):
+                    queued[info.service_uuid][group] += 1
+
+        result: dict[str, dict[str, typing.Any]] = {}
+        for service_uuid, provider_uuid, provider_name in Service.objects.filter(
+            uuid__in=list(queued)
+        ).values_list('uuid', 'provider__uuid', 'provider__name'):
+            provider = result.setdefault(provider_uuid, {'name': provider_name, 'queued': collections.Counter()})
+            provider['queued'].update(queued[service_uuid])
+
+        for provider_uuid, counters in DeferredDeletionStats.manager().as_dict().items():
+            result.setdefault(provider_uuid, {'name': '', 'queued': collections.Counter()}).update(counters)
+
+        for provider in result.values():
+            provider['queued'] = dict(provider['queued'])
+        return result
+
     def _process_exception(
         self,
         key: str,
@@ -211,6 +363,7 @@ class DeferredDeletionWorker(Job):
             ' (will retry)' if is_retryable else '',
         )
         info.last_check = sql_now()
+        info.errors += 1
         if not is_retryable:
             info.fatal_retries += 1
             if info.fatal_retries >= MAX_FATAL_ERROR_RETRIES:
@@ -230,73 +383,163 @@ class DeferredDeletionWorker(Job):
             return  # Do not readd it
         info.sync_to_storage(to_group)
 
-    def process_to_stop(self) -> None:
-        services, to_stop = DeletionInfo.get_from_storage(TO_STOP_GROUP)
+    def _process_partition(
+        self,
+        provider_uuid: str,
+        entries: 'collections.deque[tuple[str, DeletionInfo]]',
+        services: dict[str, 'DynamicService'],
+        processor: ProcessorType,
+        own_instances: bool = False,
+    ) -> list[tuple[str, DeletionInfo, typing.Union[None, str, Exception]]]:
+        """
+        Executes the processor for the entries of a provider, until no more entries are left
+        The entries deque is shared by all the workers of the provider.
 
-        # Now process waiting stops
-        for key, info in to_stop:
+        Service instances (and so, its provider API client) are not thread safe, so if "own_instances",
+        the worker uses its own instances instead of the ones in "services"
+        """
+        limiter = DeferredDeletionWorker.limiter(provider_uuid)
+        stats = DeferredDeletionStats.manager()
+        results: list[tuple[str, DeletionInfo, typing.Union[None, str, Exception]]] = []
+        instances: dict[str, 'DynamicService'] = {} if own_instances else services
+        while True:
             try:
-                service = services[info.service_uuid]
-                if service.is_running(None, info.vmid):
-                    # if info.retries < RETRIES_TO_RETRY, means this is the first time we try to stop it
-                    if info.retries < RETRIES_TO_RETRY:
-                        if service.should_try_soft_shutdown():
-                            service.shutdown(None, info.vmid)
-                        else:
-                            service.stop(None, info.vmid)
-                        info.fatal_retries = info.total_retries = 0
-                    else:
-                        info.total_retries += 1  # Count this as a general retry
-                        info.retries = 0  # Reset retries
-                        service.stop(None, info.vmid)  # Always try to stop it if we have tried before
-
-                    info.last_check = sql_now()
-                    info.sync_to_storage(STOPPING_GROUP)
-                else:
-                    # Do not update last_check to shutdown it asap, was not running after all
-                    info.sync_to_storage(TO_DELETE_GROUP)
-            except Exception as e:
-                self._process_exception(key, info, TO_STOP_GROUP, services, e)
+                key, info = entries.popleft()
+            except IndexError:
+                return results
 
-    def process_stopping(self) -> None:
-        services, stopping = DeletionInfo.get_from_storage(STOPPING_GROUP)
+            result: typing.Union[None, str, Exception]
+            with limiter.slot():
+                start = time.monotonic()
+                try:
+                    if info.service_uuid not in instances:
+                        instances[info.service_uuid] = typing.cast(
+                            'DynamicService', Service.objects.get(uuid=info.service_uuid).get_instance()
+                        )
+                    result = processor(instances[info.service_uuid], info)
+                except Exception as e:
+                    result = e
+                stats.record(
+                    provider_uuid,
+                    time.monotonic() - start,
+                    error=isinstance(result, Exception) and not isinstance(result, gen_exceptions.NotFoundError),
+                    completed=result is None or isinstance(result, gen_exceptions.NotFoundError),
+                )
+            results.append((key, info, result))
+
+    def _process_group(self, group: str, processor: ProcessorType) -> None:
+        """
+        Processes the entries of a group, concurrently for every provider, so a slow or failing
+        provider does not delay the others. Results are stored as soon as its provider is done
+        """
+        services, infos = DeletionInfo.get_from_storage(group)
+
+        partitions: dict[str, collections.deque[tuple[str, DeletionInfo]]] = {}
+        for key, info in infos:
+            provider_uuid = services[info.service_uuid].provider().get_uuid()
+            partitions.setdefault(provider_uuid, collections.deque()).append((key, info))
 
-        # Now process waiting for finishing stops
-        for key, info in stopping:
+        def _store(results: list[tuple[str, DeletionInfo, typing.Union[None, str, Exception]]]) -> None:
+            for key, info, result in results:
+                if isinstance(result, Exception):
+                    self._process_exception(key, info, group, services, result)
+                else:
+                    info.errors = 0
+                    if result is not None:
+                        info.sync_to_storage(result)
+
+        def _worker(
+            provider_uuid: str, entries: 'collections.deque[tuple[str, DeletionInfo]]', own_instances: bool
+        ) -> list[tuple[str, DeletionInfo, typing.Union[None, str, Exception]]]:
             try:
-                info.retries += 1
-                if info.retries > RETRIES_TO_RETRY:
-                    # If we have tried to stop it, and it has not stopped, add to stop again
-                    info.last_check = sql_now()
-                    info.total_retries += 1
-                    info.sync_to_storage(TO_STOP_GROUP)
-                    continue
+                return self._process_partition(provider_uuid, entries, services, processor, own_instances)
+            finally:
+                # Ensures DB connection of this thread is released
+                connections['default'].close()
+
+        # (provider, entries, own_instances). First worker of a provider uses the already loaded instances
+        workers = [
+            (provider_uuid, entries, worker > 0)
+            for provider_uuid, entries in partitions.items()
+            for worker in range(min(len(entries), max(1, consts.system.DEFERRED_DELETION_CONCURRENCY)))
+        ]
+        if len(workers) <= 1:  # Nothing to parallelize
+            for provider_uuid, entries, _ in workers:
+                _store(self._process_partition(provider_uuid, entries, services, processor))
+            return
 
-                if services[info.service_uuid].is_running(None, info.vmid):
-                    info.last_check = sql_now()
-                    info.total_retries += 1
-                    info.sync_to_storage(STOPPING_GROUP)
+        with ThreadPoolExecutor(max_workers=len(workers), thread_name_prefix='uds-deferred-deletion') as executor:
+            futures = [executor.submit(_worker, *worker) for worker in workers]
+            for future in as_completed(futures):
+                _store(future.result())
+
+    def _to_stop(self, service: 'DynamicService', info: DeletionInfo) -> typing.Optional[str]:
+        if service.is_running(None, info.vmid):
+            # if info.retries < RETRIES_TO_RETRY, means this is the first time we try to stop it
+            if info.retries < RETRIES_TO_RETRY:
+                if service.should_try_soft_shutdown():
+                    service.shutdown(None, info.vmid)
                 else:
-                    info.last_check = sql_now()
-                    info.fatal_retries = info.total_retries = 0
-                    info.sync_to_storage(TO_DELETE_GROUP)
-            except Exception as e:
-                self._process_exception(key, info, STOPPING_GROUP, services, e)
+                    service.stop(None, info.vmid)
+                info.fatal_retries = info.total_retries = 0
+            else:
+                info.total_retries += 1  # Count this as a general retry
+                info.retries = 0  # Reset retries
+                service.stop(None, info.vmid)  # Always try to stop it if we have tried before
 
-    def process_to_delete(self) -> None:
-        services, to_delete = DeletionInfo.get_from_storage(TO_DELETE_GROUP)
+            info.last_check = sql_now()
+            return STOPPING_GROUP
 
-        # Now process waiting deletions
-        for key, info in to_delete:
-            try:
-                services[info.service_uuid].execute_delete(info.vmid)
-                # And store it for checking later if it has been deleted, reseting counters
-                info.last_check = sql_now()
-                info.retries = 0
-                info.total_retries += 1
-                info.sync_to_storage(DELETING_GROUP)
-            except Exception as e:
-                self._process_exception(key, info, TO_DELETE_GROUP, services, e)
+        # Do not update last_check to shutdown it asap, was not running after all
+        return TO_DELETE_GROUP
+
+    def _stopping(self, service: 'DynamicService', info: DeletionInfo) -> typing.Optional[str]:
+        info.retries += 1
+        if info.retries > RETRIES_TO_RETRY:
+            # If we have tried to stop it, and it has not stopped, add to stop again
+            info.last_check = sql_now()
+            info.total_retries += 1
+            return TO_STOP_GROUP
+
+        info.last_check = sql_now()
+        if service.is_running(None, info.vmid):
+            info.total_retries += 1
+            return STOPPING_GROUP
+
+        info.fatal_retries = info.total_retries = 0
+        return TO_DELETE_GROUP
+
+    def _to_delete(self, service: 'DynamicService', info: DeletionInfo) -> typing.Optional[str]:
+        service.execute_delete(info.vmid)
+        # And store it for checking later if it has been deleted, reseting counters
+        info.last_check = sql_now()
+        info.retries = 0
+        info.total_retries += 1
+        return DELETING_GROUP
+
+    def _deleting(self, service: 'DynamicService', info: DeletionInfo) -> typing.Optional[str]:
+        info.retries += 1
+        if info.retries > RETRIES_TO_RETRY:
+            # If we have tried to delete it, and it has not been deleted, add to delete again
+            info.last_check = sql_now()
+            info.total_retries += 1
+            return TO_DELETE_GROUP
+
+        # If not finished, readd it for later check
+        if not service.is_deleted(info.vmid):
+            info.last_check = sql_now()
+            info.total_retries += 1
+            return DELETING_GROUP
+        return None  # Done
+
+    def process_to_stop(self) -> None:
+        self._process_group(TO_STOP_GROUP, self._to_stop)
+
+    def process_stopping(self) -> None:
+        self._process_group(STOPPING_GROUP, self._stopping)
+
+    def process_to_delete(self) -> None:
+        self._process_group(TO_DELETE_GROUP, self._to_delete)
 
     def process_deleting(self) -> None:
         """
@@ -304,26 +547,7 @@ class DeferredDeletionWorker(Job):
 
         Note: Very similar to process_to_delete, but this one is for objects that are already being deleted
         """
-        services, deleting = DeletionInfo.get_from_storage(DELETING_GROUP)
-
-        # Now process waiting for finishing deletions
-        for key, info in deleting:
-            try:
-                info.retries += 1
-                if info.retries > RETRIES_TO_RETRY:
-                    # If we have tried to delete it, and it has not been deleted, add to delete again
-                    info.last_check = sql_now()
-                    info.total_retries += 1
-                    info.sync_to_storage(TO_DELETE_GROUP)
-                    continue
-
-                # If not finished, readd it for later check
-                if not services[info.service_uuid].is_deleted(info.vmid):
-                    info.last_check = sql_now()
-                    info.total_retries += 1
-                    info.sync_to_storage(DELETING_GROUP)
-            except Exception as e:
-                self._process_exception(key, info, DELETING_GROUP, services, e)
+        self._process_group(DELETING_GROUP, self._deleting)
 
     def run(self) -> None:
         self.process_to_stop()
@@ -34,6 +34,7 @@ import logging
 from django.db.models import Count
 
 from uds.core.jobs import Job
+from uds.core.managers.log import LogManager
 from uds import models
 from uds.core.types import log
 
@@ -51,23 +52,19 @@ class LogMaintenance(Job):
     def run(self) -> None:
         # Select all disctinct owner_id and owner_type and count of each
         # For each one, check if it has more than max_elements, and if so, delete the oldest ones
+        manager = LogManager.manager()
         for owner_id, owner_type, count in (
             models.Log.objects.values_list('owner_id', 'owner_type')
             .annotate(count=Count('owner_id'))
             .order_by('owner_id')
         ):
-            # First, ensure we do not have more than requested logs, and we can put one more log item
             try:
-                ownerType = log.LogObjectType(owner_type)
+                max_elements = log.LogObjectType(owner_type).get_max_elements()
             except ValueError:
-                # If we do not know the owner type, we will delete all logs for this owner
-                models.Log.objects.filter(owner_id=owner_id, owner_type=owner_type).delete()
-                continue
+                max_elements = None  # Unknown owner type, trim will delete all logs for this owner
+            if max_elements is None or 0 < max_elements < count:  # Negative max elements means "unlimited"
+                # Single ranged delete of the oldest ones
+                manager.trim(owner_type, owner_id, max_elements)
 
-            max_elements = ownerType.get_max_elements()
-            if 0 < max_elements < count:  # Negative max elements means "unlimited"
-                # We will delete the oldest ones
-                for record in models.Log.objects.filter(owner_id=owner_id, owner_type=owner_type).order_by(
-                    'created', 'id'
-                )[: count - max_elements + 1]:
-                    record.delete()
+        # Entries of removed owners, queued by other processes when they were cleared
+        manager.clear_orphans()
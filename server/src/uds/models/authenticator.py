@@ -36,11 +36,11 @@ import collections.abc
 from django.db import models
 
 from uds.core import auths, environment, consts, ui
-from uds.core.util import log, net
+from uds.core.util import log
 from uds.core.types.states import State
 
 from .managed_object_model import ManagedObjectModel
-from .network import Network
+from .network import NetworksIndex
 from .tag import TaggingMixin
 
 # Not imported at runtime, just for type checking
@@ -226,11 +226,8 @@ class Authenticator(ManagedObjectModel, TaggingMixin):
         """
         if self.net_filtering == consts.auth.NO_FILTERING:
             return True
-        ip_number, version = net.ip_to_long(ip_string)
         # Allow
-        exists = self.networks.filter(
-            start__lte=Network.hexlify(ip_number), end__gte=Network.hexlify(ip_number), version=version
-        ).exists()
+        exists = NetworksIndex.manager().authenticator_contains(self.id, ip_string)
         if self.net_filtering == consts.auth.ALLOW:
             return exists
         # Deny, must not be in any network
@@ -33,7 +33,8 @@ Author: Adolfo Gómez, dkmaster at dkmon dot com
 import logging
 import typing
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import signals
 
 from uds.core.types.states import State
 from uds.core.util import log
@@ -136,5 +137,16 @@ class Group(UUIDModel):
 
         logger.debug('Deleted group %s', to_delete)
 
+    @staticmethod
+    def _invalidate_matcher_signal(**kwargs: typing.Any) -> None:
+        from uds.core.auths.groups_manager import GroupMatchers  # pylint: disable=import-outside-toplevel
+
+        authenticator_id: int = kwargs['instance'].manager_id
+        # Once commited, so groups compiled from now on will see the changes
+        transaction.on_commit(lambda: GroupMatchers.manager().invalidate(authenticator_id))
+
 
 models.signals.pre_delete.connect(Group.pre_delete, sender=Group)
+# Compiled groups of the authenticator are rebuilt when its groups change
+signals.post_save.connect(Group._invalidate_matcher_signal, sender=Group)
+signals.post_delete.connect(Group._invalidate_matcher_signal, sender=Group)
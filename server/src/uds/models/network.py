@@ -30,13 +30,21 @@
 """
 Author: Adolfo Gómez, dkmaster at dkmon dot com
 """
+import bisect
+import collections
+import collections.abc
+import dataclasses
 import logging
+import threading
+import time
 import typing
-import collections.abc
 
 from django.db import models
+from django.db.models import signals
 
-from uds.core.util import net
+from uds.core import consts
+from uds.core.util import net, singleton
+from uds.core.util.model import on_commit_once
 
 from .uuid_model import UUIDModel
 from .tag import TaggingMixin
@@ -47,7 +55,186 @@ logger = logging.getLogger(__name__)
 if typing.TYPE_CHECKING:
     from .transport import Transport
     from .authenticator import Authenticator
-    
+    from uds.core.util.cache import Cache
+
+
+@dataclasses.dataclass(frozen=True)
+class _RangesIndex:
+    """
+    Networks ranges of an ip version, compiled as the sorted bounds of non overlapping segments
+    and the networks that contains each segment (from its bound to next one)
+    """
+
+    bounds: list[int]
+    networks: list[frozenset[int]]
+
+    @staticmethod
+    def build(ranges: collections.abc.Iterable[tuple[int, int, int]]) -> '_RangesIndex':
+        """
+        Builds the index from (start, end, network id) ranges
+        """
+        events: collections.defaultdict[int, list[tuple[int, bool]]] = collections.defaultdict(list)
+        for start, end, network_id in ranges:
+            if end >= start:
+                events[start].append((network_id, True))
+                events[end + 1].append((network_id, False))
+
+        bounds: list[int] = []
+        networks: list[frozenset[int]] = []
+        shared: dict[frozenset[int], frozenset[int]] = {}  # Same sets of networks are stored only once
+        active: set[int] = set()
+        for bound in sorted(events):
+            for network_id, is_start in events[bound]:
+                if is_start:
+                    active.add(network_id)
+                else:
+                    active.discard(network_id)
+            current = frozenset(active)
+            bounds.append(bound)
+            networks.append(shared.setdefault(current, current))
+        return _RangesIndex(bounds, networks)
+
+    def lookup(self, ip: int) -> frozenset[int]:
+        pos = bisect.bisect_right(self.bounds, ip) - 1
+        return self.networks[pos] if pos >= 0 else frozenset()
+
+
+@dataclasses.dataclass(frozen=True)
+class _CompiledNetworks:
+    generation: str
+    count: int  # Number of networks
+    ranges: dict[int, _RangesIndex]  # By ip version
+    transports: dict[int, frozenset[int]]  # Transport id -> networks ids
+    authenticators: dict[int, frozenset[int]]  # Authenticator id -> networks ids
+
+
+class NetworksIndex(metaclass=singleton.Singleton):
+    """
+    Compiled, immutable index of networks of this process, so the networks that contains an ip (and so, the
+    transports and authenticators allowed for it) are found with a binary search, without database lookups.
+
+    Built on first use, and rebuilt when networks or its assignments change on any process (a new generation
+    is stored on cache, checked by other processes as often as the cache itself checks for invalidations).
+    """
+
+    _compiled: typing.Optional[_CompiledNetworks]
+    _next_check: float  # Generation is checked at most once every consts.cache.CACHE_INVALIDATION_INTERVAL
+    _lock: threading.Lock
+
+    builds: int
+    lookups: int
+
+    def __init__(self) -> None:
+        self._compiled = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.lookups = 0
+
+    @staticmethod
+    def manager() -> 'NetworksIndex':
+        return NetworksIndex()
+
+    @staticmethod
+    def _generation() -> 'Cache':
+        from uds.core.util.cache import Cache  # Avoid circular import
+
+        return Cache('uds:networks:generation')
+
+    def _build(self, generation: str) -> _CompiledNetworks:
+        ranges: collections.defaultdict[int, list[tuple[int, int, int]]] = collections.defaultdict(list)
+        count = 0
+        for network_id, version, start, end in Network.objects.values_list('id', 'version', 'start', 'end'):
+            ranges[version].append((Network.unhexlify(start), Network.unhexlify(end), network_id))
+            count += 1
+
+        def assignments(through: typing.Any, field: str) -> dict[int, frozenset[int]]:
+            result: collections.defaultdict[int, set[int]] = collections.defaultdict(set)
+            for related_id, network_id in through.objects.values_list(field, 'network_id'):
+                result[related_id].add(network_id)
+            return {k: frozenset(v) for k, v in result.items()}
+
+        self.builds += 1
+        return _CompiledNetworks(
+            generation=generation,
+            count=count,
+            ranges={version: _RangesIndex.build(r) for version, r in ranges.items()},
+            transports=assignments(Network.transports.through, 'transport_id'),
+            authenticators=assignments(Network.authenticators.through, 'authenticator_id'),
+        )
+
+    def _current(self) -> _CompiledNetworks:
+        self.lookups += 1
+        compiled = self._compiled
+        now = time.monotonic()
+        if compiled is not None and now < self._next_check:
+            return compiled
+
+        cache = NetworksIndex._generation()
+        generation = cache.get('current')
+        if generation is None:
+            generation = str(time.time_ns())
+            cache.put('current', generation, consts.cache.EXTREME_CACHE_TIMEOUT)
+
+        if compiled is None or compiled.generation != generation:
+            with self._lock:
+                compiled = self._compiled
+                if compiled is None or compiled.generation != generation:
+                    compiled = self._compiled = self._build(generation)
+        self._next_check = now + consts.cache.CACHE_INVALIDATION_INTERVAL
+        return compiled
+
+    @staticmethod
+    def _lookup(compiled: _CompiledNetworks, ip: str) -> frozenset[int]:
+        ip_number, version = net.ip_to_long(ip)
+        ranges = compiled.ranges.get(version)
+        return ranges.lookup(ip_number) if ranges else frozenset()
+
+    def networks_for_ip(self, ip: str) -> frozenset[int]:
+        """
+        Returns the ids of the networks that contains the ip
+        """
+        return NetworksIndex._lookup(self._current(), ip)
+
+    def transport_contains(self, transport_id: int, ip: str) -> bool:
+        """
+        True if ip is in any of the networks of the transport
+        """
+        compiled = self._current()
+        return not NetworksIndex._lookup(compiled, ip).isdisjoint(compiled.transports.get(transport_id, ()))
+
+    def authenticator_contains(self, authenticator_id: int, ip: str) -> bool:
+        """
+        True if ip is in any of the networks of the authenticator
+        """
+        compiled = self._current()
+        return not NetworksIndex._lookup(compiled, ip).isdisjoint(
+            compiled.authenticators.get(authenticator_id, ())
+        )
+
+    def invalidate(self) -> None:
+        """
+        Makes every process rebuild its index on next lookup
+        """
+        NetworksIndex._generation().put('current', str(time.time_ns()), consts.cache.EXTREME_CACHE_TIMEOUT)
+        self._next_check = 0.0  # This process sees it at once
+
+    def clear(self) -> None:
+        self._compiled = None
+        self._next_check = 0.0
+
+    def as_dict(self) -> dict[str, int]:
+        compiled = self._compiled
+        return {
+            'builds': self.builds,
+            'lookups': self.lookups,
+            'networks': compiled.count if compiled else 0,
+            'segments': sum(len(r.bounds) for r in compiled.ranges.values()) if compiled else 0,
+        }
+
+    def __str__(self) -> str:
+        return f'NetworksIndex: {self.as_dict()}'
+
 
 class Network(UUIDModel, TaggingMixin):
     """
@@ -99,18 +286,11 @@ class Network(UUIDModel, TaggingMixin):
         return int(number, 16)
 
     @staticmethod
-    def get_networks_for_ip(ip: str) -> collections.abc.Iterable['Network']:
+    def get_networks_for_ip(ip: str) -> 'models.QuerySet[Network]':
         """
         Returns the networks that are valid for specified ip in dotted quad (xxx.xxx.xxx.xxx)
         """
-        ipInt, version = net.ip_to_long(ip)
-        hex_value = Network.hexlify(ipInt)
-        # hexlify is used to convert to hex, and then decode to convert to string
-        return Network.objects.filter(
-            version=version,
-            start__lte=hex_value,
-            end__gte=hex_value,
-        )
+        return Network.objects.filter(id__in=NetworksIndex.manager().networks_for_ip(ip))
 
     @staticmethod
     def create(name: str, netRange: str) -> 'Network':
@@ -222,6 +402,22 @@ class Network(UUIDModel, TaggingMixin):
         # Clears related permissions
         clean(to_delete)
 
+    @staticmethod
+    def _invalidate_index_signal(**kwargs: typing.Any) -> None:
+        # Relations are changed on post_* signals only (pre_* ones are also sent for them)
+        if not kwargs.get('action', 'post_').startswith('post_'):
+            return
+        # Once commited (just once per transaction), so index built from now on will see the changes
+        on_commit_once(NetworksIndex.manager().invalidate)
+
 
 # Connects a pre deletion signal to Authenticator
 models.signals.pre_delete.connect(Network.pre_delete, sender=Network)
+# Networks index is rebuilt when networks, or its assignments to transports and authenticators, change
+signals.post_save.connect(Network._invalidate_index_signal, sender=Network)
+signals.post_delete.connect(Network._invalidate_index_signal, sender=Network)
+signals.m2m_changed.connect(Network._invalidate_index_signal, sender=Network.transports.through)
+signals.m2m_changed.connect(Network._invalidate_index_signal, sender=Network.authenticators.through)
+# Deleting transports or authenticators removes its assignments without m2m signals
+signals.post_delete.connect(Network._invalidate_index_signal, sender='uds.Transport')
+signals.post_delete.connect(Network._invalidate_index_signal, sender='uds.Authenticator')
@@ -28,24 +28,28 @@
 '''
 Author: Adolfo Gómez, dkmaster at dkmon dot com
 '''
+import dataclasses
 import datetime
 import secrets
+import threading
+import time
 import typing
 import collections.abc
 
 from django.db import models
-from django.db.models import Q
+from django.db.models import Q, signals
 
 from uds.core import consts, types
 from uds.core.consts import MAC_UNKNOWN
 from uds.core.types.requests import ExtendedHttpRequest
-from uds.core.util import net, properties, resolver
+from uds.core.util import net, properties, resolver, singleton
 from uds.core.util.model import sql_stamp, sql_now
 
 from .tag import TaggingMixin
 from .uuid_model import UUIDModel
 
 if typing.TYPE_CHECKING:
+    from uds.core.util.cache import Cache
     from uds.models.transport import Transport
     from uds.models.user_service import UserService
 
@@ -150,6 +154,119 @@ class ServerGroup(UUIDModel, TaggingMixin, properties.PropertiesMixin):
 
 
 
+@dataclasses.dataclass(frozen=True)
+class _TokenInfo:
+    server_uuid: str
+    type: int
+    ip: str
+    expires: float
+
+
+class TokenValidationStats(metaclass=singleton.Singleton):
+    """
+    Counters of the server tokens validations of this process
+    """
+
+    hits: int  # Validations served from index
+    misses: int  # Validations that needed a database lookup
+    invalid: int  # Validations failed (token not found, wrong type or ip)
+    invalidations: int  # Entries removed because its server was changed or deleted
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.invalid = 0
+        self.invalidations = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalid': self.invalid,
+            'invalidations': self.invalidations,
+            'size': ServerTokenIndex.manager().size(),
+        }
+
+    def __str__(self) -> str:
+        return (
+            f'TokenValidationStats: hits={self.hits}, misses={self.misses}, '
+            f'invalid={self.invalid}, invalidations={self.invalidations}'
+        )
+
+    @staticmethod
+    def manager() -> 'TokenValidationStats':
+        return TokenValidationStats()
+
+
+class ServerTokenIndex(metaclass=singleton.Singleton):
+    """
+    In memory index of valid server tokens of this process, so tokens of tunnels and actors, that
+    call in on every connection, are validated without a database lookup.
+
+    Entries expire after consts.system.SERVER_TOKEN_INDEX_TTL seconds, and are removed as soon as its server
+    is saved or deleted on this process. Only valid tokens are indexed, so new servers are found at once.
+    """
+
+    _tokens: dict[str, _TokenInfo]
+    _by_server: dict[str, str]  # Server uuid -> token
+    _lock: threading.Lock
+
+    def __init__(self) -> None:
+        self._tokens = {}
+        self._by_server = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def manager() -> 'ServerTokenIndex':
+        return ServerTokenIndex()
+
+    def get(self, token: str) -> typing.Optional[_TokenInfo]:
+        with self._lock:
+            info = self._tokens.get(token)
+            if info and info.expires < time.monotonic():
+                self._remove(token)
+                return None
+            return info
+
+    def put(self, token: str, server_uuid: str, type: int, ip: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if len(self._tokens) >= consts.system.SERVER_TOKEN_INDEX_MAX_SIZE:
+                for expired in [k for k, v in self._tokens.items() if v.expires < now]:
+                    self._remove(expired)
+                if len(self._tokens) >= consts.system.SERVER_TOKEN_INDEX_MAX_SIZE:
+                    self._tokens.clear()
+                    self._by_server.clear()
+            self._remove_server(server_uuid)
+            self._tokens[token] = _TokenInfo(server_uuid, type, ip, now + consts.system.SERVER_TOKEN_INDEX_TTL)
+            self._by_server[server_uuid] = token
+
+    def invalidate_server(self, server_uuid: str) -> None:
+        with self._lock:
+            if self._remove_server(server_uuid):
+                TokenValidationStats.manager().invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tokens.clear()
+            self._by_server.clear()
+
+    def size(self) -> int:
+        return len(self._tokens)
+
+    def _remove(self, token: str) -> None:
+        info = self._tokens.pop(token, None)
+        if info and self._by_server.get(info.server_uuid) == token:
+            del self._by_server[info.server_uuid]
+
+    def _remove_server(self, server_uuid: str) -> bool:
+        token = self._by_server.pop(server_uuid, None)
+        if token is None:
+            return False
+        self._tokens.pop(token, None)
+        return True
+
+
 def _create_token() -> str:
     return secrets.token_urlsafe(36)
 
@@ -271,10 +388,21 @@ class Server(UUIDModel, TaggingMixin, properties.PropertiesMixin):
         """Returns the ip version of this server"""
         return 6 if ':' in self.ip else 4
 
+    @staticmethod
+    def stats_cache() -> 'Cache':
+        """Returns the cache where the stats of the servers are kept
+
+        Stats are pushed by servers on every ping (or polled if too old), and read on every assignation,
+        so they are kept on cache (local tier + shared one) instead of on properties table
+        """
+        from uds.core.util.cache import Cache  # Avoid circular import
+
+        return Cache('uds:servers:stats')
+
     @property
     def stats(self) -> typing.Optional[types.servers.ServerStats]:
         """Returns the current stats of this server, or None if not available"""
-        statsDct = self.properties.get('stats', None)
+        statsDct = Server.stats_cache().get(self.uuid)
         if statsDct:
             return types.servers.ServerStats.from_dict(statsDct)
         return None
@@ -283,12 +411,16 @@ class Server(UUIDModel, TaggingMixin, properties.PropertiesMixin):
     def stats(self, value: typing.Optional[types.servers.ServerStats]) -> None:
         """Sets the current stats of this server"""
         if value is None:
-            del self.properties['stats']
+            Server.stats_cache().remove(self.uuid)
         else:
             # Set stamp to current time and save it, overwriting existing stamp if any
             statsDict = value.as_dict()
             statsDict['stamp'] = sql_stamp()
-            self.properties['stats'] = statsDict
+            self._store_stats(statsDict)
+
+    def _store_stats(self, stats: dict[str, typing.Any]) -> None:
+        # Kept longer than its validity, so outdated stats can be used as "last known" ones
+        Server.stats_cache().put(self.uuid, stats, consts.cache.LONG_CACHE_TIMEOUT)
 
     def lock(self, duration: typing.Optional[datetime.timedelta]) -> None:
         """Locks this server for a duration"""
@@ -303,14 +435,14 @@ class Server(UUIDModel, TaggingMixin, properties.PropertiesMixin):
         stats = self.stats
         if stats and stats.is_valid:  # If rae invalid, do not waste time recalculating
             # Avoid replacing current "stamp" value, this is just a "simulation"
-            self.properties['stats'] = stats.adjust(users_increment=1).as_dict()
+            self._store_stats(stats.adjust(users_increment=1).as_dict())
 
     def interpolate_new_release(self) -> None:
         """Interpolates, with current stats, the release of a user"""
         stats = self.stats
         if stats and stats.is_valid:
             # Avoid replacing current "stamp" value, this is just a "simulation"
-            self.properties['stats'] = stats.adjust(users_increment=-1).as_dict()
+            self._store_stats(stats.adjust(users_increment=-1).as_dict())
 
     def is_restrained(self) -> bool:
         """Returns if this server is restrained or not
@@ -321,6 +453,23 @@ class Server(UUIDModel, TaggingMixin, properties.PropertiesMixin):
         restrainedUntil = datetime.datetime.fromtimestamp(self.properties.get('available', consts.NEVER_UNIX))
         return restrainedUntil > sql_now()
 
+    @staticmethod
+    def restrained_uuids(uuids: collections.abc.Iterable[str]) -> set[str]:
+        """Returns which of the servers (by uuid) are restrained right now, with a single query
+
+        Same as is_restrained, but for a bunch of servers
+        """
+        from uds.models.properties import Properties  # Avoid circular import
+
+        now = sql_now().timestamp()
+        return {
+            owner_id
+            for owner_id, available in Properties.objects.filter(
+                owner_type='server', key='available', owner_id__in=list(uuids)
+            ).values_list('owner_id', 'value')
+            if available > now
+        }
+
     def set_restrained_until(self, value: typing.Optional[datetime.datetime] = None) -> None:
         """Sets the availability of this server
         If value is None, it will be available right now
@@ -364,21 +513,38 @@ class Server(UUIDModel, TaggingMixin, properties.PropertiesMixin):
         Note:
             This allows to keep Tunnels, Servers, Actors.. etc on same table, and validate tokens for each kind
         """
+        stats = TokenValidationStats.manager()
+        valid_types = (
+            {serverType.value}
+            if isinstance(serverType, types.servers.ServerType)
+            else {st.value for st in serverType}
+        )
+        index = ServerTokenIndex.manager()
+        info = index.get(token)
+        if info is None:
+            stats.misses += 1
+            # Token is unique, so type is checked locally, and the token indexed for any kind
+            server = Server.objects.filter(token=token).values_list('uuid', 'type', 'ip').first()
+            if server is not None:
+                index.put(token, *server)
+                info = index.get(token)
+        else:
+            stats.hits += 1
+
         # Ensure token is valid for a kind
-        try:
-            if isinstance(serverType, types.servers.ServerType):
-                tt = Server.objects.get(token=token, type=serverType.value)
-            else:
-                tt = Server.objects.get(token=token, type__in=[st.value for st in serverType])
-            # We could check the request ip here
-            if request and request.ip != tt.ip:
-                raise Exception('Invalid ip')
-            return True
-        except Server.DoesNotExist:
-            pass
-        except Server.MultipleObjectsReturned:
-            raise Exception('Multiple objects returned for token')
-        return False
+        if info is None or info.type not in valid_types:
+            stats.invalid += 1
+            return False
+        # We could check the request ip here
+        if request and request.ip != info.ip:
+            stats.invalid += 1
+            raise Exception('Invalid ip')
+        return True
+
+    @staticmethod
+    def _invalidate_token_signal(sender: typing.Any, **kwargs: typing.Any) -> None:
+        # Token, type or ip may have changed, next validation will read it again
+        ServerTokenIndex.manager().invalidate_server(kwargs['instance'].uuid)
 
     def set_actor_version(self, userService: 'UserService') -> None:
         """Sets the actor version of this server to the userService"""
@@ -417,4 +583,6 @@ class Server(UUIDModel, TaggingMixin, properties.PropertiesMixin):
 
 
 properties.PropertiesMixin.setup_signals(Server)
+signals.post_save.connect(Server._invalidate_token_signal, sender=Server)
+signals.post_delete.connect(Server._invalidate_token_signal, sender=Server)
 properties.PropertiesMixin.setup_signals(ServerGroup)
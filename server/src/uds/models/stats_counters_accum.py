@@ -109,7 +109,7 @@ class StatsCountersAccum(models.Model):
         app_label = 'uds'
 
     @staticmethod
-    def _adjust_to_interval(
+    def adjust_to_interval(
         value: int = -1,
         interval_type: 'StatsCountersAccum.IntervalType' = IntervalType.HOUR,
     ) -> int:
@@ -119,16 +119,19 @@ class StatsCountersAccum(models.Model):
         return value - (value % interval_type.seconds())
 
     @staticmethod
-    def acummulate(interval_type: 'IntervalType', max_days: int = 7) -> None:
+    def acummulate_range(interval_type: 'IntervalType', start_stamp: int, end_stamp: int) -> int:
         """
-        Compresses data in the table, generating "compressed" version of the data (mean values)
-        """
-        logger.debug(
-            'Optimizing stats counters table for %s (max chunk days=%s)',
-            interval_type,
-            max_days,
-        )
+        Accumulates the data of the intervals of the range [start_stamp, end_stamp) (both adjusted to interval).
+
+        HOUR intervals are computed from raw StatsCounters, and DAY intervals are rolled up from
+        HOUR accumulated data (so they must be already present for the range).
 
+        Note: Does not check if the range has already been accumulated. The watermarks of the
+        accumulated ranges are kept by uds.core.managers.stats.StatsManager
+
+        Returns:
+            Number of accumulated records created
+        """
         # Assign values depending on interval type
         model: typing.Union[
             type['StatsCountersAccum'],
@@ -139,45 +142,11 @@ class StatsCountersAccum(models.Model):
         else:
             model = StatsCountersAccum
 
-        # Accumulate HOURS from StatsCounters
         interval = interval_type.seconds()
 
-        # Get last stamp in table for this interval_type
-        start_record: 'StatsCounters|StatsCountersAccum|None' = (
-            StatsCountersAccum.objects.filter(interval_type=interval_type)
-            .order_by('stamp')
-            .last()
-        )
-
-        if start_record is None:
-            # No last stamp record, start from first StatsCounters record
-            start_record = model.objects.order_by('stamp').first()
-
-        if start_record is None:  # Empty table
-            return
-
-        start_stamp = StatsCountersAccum._adjust_to_interval(
-            start_record.stamp, interval_type=interval_type
-        )  # Adjust to hour
-
-        # End date is now, adjusted to interval so we dont have "leftovers"
-        end_stamp = StatsCountersAccum._adjust_to_interval(interval_type=interval_type)
-
-        # If time lapse is greater that max_days days, we will optimize in 30 days chunks
-        # This is to avoid having a huge query that will take a lot of time
-        if end_stamp - start_stamp > (max_days * 24 * 3600):
-            logger.info(
-                'Accumulating stats counters table in chunks, because of large time lapse'
-            )
-            end_stamp = start_stamp + (max_days * 24 * 3600)
-
-        # Fix end_stamp to interval, using base_end_stamp
-        end_stamp = StatsCountersAccum._adjust_to_interval(
-            end_stamp, interval_type=interval_type
-        )
-
         logger.debug(
-            'Accumulating stats counters table from %s to %s',
+            'Accumulating stats counters table for %s from %s to %s',
+            interval_type,
             datetime.datetime.fromtimestamp(start_stamp),
             datetime.datetime.fromtimestamp(end_stamp),
         )
@@ -235,9 +204,8 @@ class StatsCountersAccum(models.Model):
 
         logger.debug('Inserting %s records', len(accumulated))
         # Insert in chunks of 2500 records
-        while accumulated:
-            StatsCountersAccum.objects.bulk_create(accumulated[:2500])
-            accumulated = accumulated[2500:]
+        StatsCountersAccum.objects.bulk_create(accumulated, batch_size=2500)
+        return len(accumulated)
 
     def __str__(self) -> str:
         return f'{datetime.datetime.fromtimestamp(self.stamp)} - {self.owner_type}:{self.owner_id}:{self.counter_type} {StatsCountersAccum.IntervalType(self.interval_type)} {self.v_count},{self.v_sum},{self.v_min},{self.v_max}'
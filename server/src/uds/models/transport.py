@@ -37,9 +37,8 @@ from django.db import models
 
 from uds.core import transports, types, consts
 
-from uds.core.util import net
-
 from .managed_object_model import ManagedObjectModel
+from .network import NetworksIndex
 from .tag import TaggingMixin
 
 # Not imported at runtime, just for type checking
@@ -126,16 +125,10 @@ class Transport(ManagedObjectModel, TaggingMixin):
 
         :note: Ip addresses has been only tested with IPv4 addresses
         """
-        # Avoid circular import
-        from uds.models import Network  # pylint: disable=import-outside-toplevel
-
         if self.net_filtering == consts.auth.NO_FILTERING:
             return True
-        ip, version = net.ip_to_long(ipStr)
         # Allow
-        exists = self.networks.filter(
-            start__lte=Network.hexlify(ip), end__gte=Network.hexlify(ip), version=version
-        ).exists()
+        exists = NetworksIndex.manager().transport_contains(self.id, ipStr)
         if self.net_filtering == consts.auth.ALLOW:
             return exists
         # Deny, must not be in any network
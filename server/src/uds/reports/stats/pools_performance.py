@@ -38,7 +38,6 @@ import typing
 import collections.abc
 
 import django.template.defaultfilters as filters
-from django.db.models import Count
 from django.utils.translation import gettext
 from django.utils.translation import gettext_lazy as _
 
@@ -46,7 +45,7 @@ from uds.core.managers.stats import StatsManager
 from uds.core.reports import graphs
 from uds.core.ui import gui
 from uds.core.util import utils
-from uds.core.util.stats import events
+from uds.core.util.stats import aggregation, events
 from uds.models import ServicePool
 
 from .base import StatsReport
@@ -100,41 +99,30 @@ class PoolPerformanceReport(StatsReport):
         else:
             xLabelFormat = 'SHORT_DATETIME_FORMAT'
 
-        samplingIntervals: list[tuple[int, int]] = []
-        samplingIntervalSeconds = (end - start) / samplingPoints
-        for i in range(samplingPoints):
-            samplingIntervals.append(
-                (int(start + i * samplingIntervalSeconds), int(start + (i + 1) * samplingIntervalSeconds))
-            )
-
-        # Store dataUsers for all pools
-        poolsData: list[dict[str, typing.Any]] = []
+        buckets = aggregation.Buckets.split(start, end, samplingPoints)
+        pools = list(self.list_pools())
 
+        # All intervals of all pools on a single query
         fld = StatsManager.manager().get_event_field_for('username')
+        series = aggregation.events_series(
+            events.types.stats.EventOwnerType.SERVICEPOOL,
+            events.types.stats.EventType.ACCESS,
+            buckets,
+            [int(p[0]) for p in pools],
+            distinct_field=fld,
+        )
 
+        # Store dataUsers for all pools
+        poolsData: list[dict[str, typing.Any]] = []
         reportData: list[dict[str, typing.Any]] = []
-        for p in self.list_pools():
+        for p in pools:
+            poolSeries = series[int(p[0])]
             dataUsers: list[tuple[int, int]] = []
             dataAccesses: list[tuple[int, int]] = []
-            for interval in samplingIntervals:
-                key = (interval[0] + interval[1]) // 2
-                q = (
-                    StatsManager.manager()
-                    .enumerate_events(
-                        events.types.stats.EventOwnerType.SERVICEPOOL,
-                        events.types.stats.EventType.ACCESS,
-                        since=interval[0],
-                        to=interval[1],
-                        owner_id=p[0],
-                    )
-                    .values(fld)
-                    .annotate(cnt=Count(fld))
-                )
-                accesses = 0
-                for v in q:
-                    accesses += v['cnt']
-
-                dataUsers.append((key, len(q)))  # @UndefinedVariable
+            for interval, key, users, accesses in zip(
+                buckets.intervals(), buckets.keys(), poolSeries.distinct, poolSeries.counts
+            ):
+                dataUsers.append((key, users))
                 dataAccesses.append((key, accesses))
                 reportData.append(
                     {
@@ -142,7 +130,7 @@ class PoolPerformanceReport(StatsReport):
                         'date': utils.timestamp_as_str(interval[0], 'SHORT_DATETIME_FORMAT')
                         + ' - '
                         + utils.timestamp_as_str(interval[1], 'SHORT_DATETIME_FORMAT'),
-                        'users': len(q),
+                        'users': users,
                         'accesses': accesses,
                     }
                 )
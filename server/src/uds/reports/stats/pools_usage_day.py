@@ -33,12 +33,13 @@ import csv
 import io
 import datetime
 import logging
+import time
 import typing
 
 from django.utils.translation import gettext, gettext_lazy as _
 
 from uds.core.ui import gui
-from uds.core.util.stats import counters
+from uds.core.util.stats import aggregation, counters
 from uds.core.reports import graphs
 from uds.models import ServicePool
 
@@ -69,30 +70,34 @@ class CountersPoolAssigned(StatsReport):
 
     def get_data(self) -> list[dict[str, typing.Any]]:
         # Generate the sampling intervals and get dataUsers from db
-        start = self.start_date.as_date()
+        start = self.start_date.as_datetime()
 
         data: list[dict[str, typing.Any]] = []
 
-        pool: ServicePool
+        pools = list(ServicePool.objects.filter(uuid__in=self.pools.value))
+        # Start is a local midnight, so hourly intervals are aligned to local hours
+        buckets = aggregation.Buckets.every(
+            int(time.mktime(start.timetuple())),
+            int(time.mktime((start + datetime.timedelta(days=1)).timetuple())),
+            3600,
+        )
+        series = aggregation.counters_series(
+            counters.types.stats.CounterOwnerType.SERVICEPOOL,
+            counters.types.stats.CounterType.ASSIGNED,
+            buckets,
+            [pool.id for pool in pools],
+            use_max=True,
+        )
+
+        pools_by_uuid = {pool.uuid: pool for pool in pools}
         for poolUuid in self.pools.value:
-            try:
-                pool = ServicePool.objects.get(uuid=poolUuid)
-            except Exception:  # nosec:  If not found, simple ignore it and go for next
+            pool = pools_by_uuid.get(poolUuid)
+            if not pool:  # If not found, simple ignore it and go for next
                 continue
 
             hours = [0] * 24
-
-            for x in counters.enumerate_counters(
-                pool,
-                counters.types.stats.CounterType.ASSIGNED,
-                since=start,
-                to=start + datetime.timedelta(days=1),
-                intervals=3600,
-                use_max=True,
-                all=False,
-            ):
-                hour = x[0].hour
-                val = int(x[1])
+            for interval, val in zip(buckets.intervals(), series[pool.id]):
+                hour = datetime.datetime.fromtimestamp(interval[0]).hour
                 hours[hour] = max(hours[hour], val)
 
             data.append({'uuid': pool.uuid, 'name': pool.name, 'hours': hours})
@@ -74,45 +74,47 @@ class UsageByPool(StatsReport):
         end = self.end_date.as_timestamp()
         logger.debug(self.pool.value)
         if '0-0-0-0' in self.pool.value:
-            pools = ServicePool.objects.all()
+            pools = list(ServicePool.objects.all())
         else:
-            pools = ServicePool.objects.filter(uuid__in=self.pool.value)
-        data: list[dict[str, typing.Any]] = []
-        for pool in pools:
-            items = (
-                StatsManager.manager()
-                .enumerate_events(
-                    stats.events.types.stats.EventOwnerType.SERVICEPOOL,
-                    (stats.events.types.stats.EventType.LOGIN, stats.events.types.stats.EventType.LOGOUT),
-                    owner_id=pool.id,
-                    since=start,
-                    to=end,
-                )
-                .order_by('stamp')
+            pools = list(ServicePool.objects.filter(uuid__in=self.pool.value))
+        # All pools on a single query, sessions are paired by pool and user
+        items = (
+            StatsManager.manager()
+            .enumerate_events(
+                stats.events.types.stats.EventOwnerType.SERVICEPOOL,
+                (stats.events.types.stats.EventType.LOGIN, stats.events.types.stats.EventType.LOGOUT),
+                owner_id=[pool.id for pool in pools],
+                since=start,
+                to=end,
             )
+            .order_by('stamp', 'id')
+        )
 
-            logins = {}
-            for i in items:
-                # if '\\' in i.fld1:
-                #    continue
-
-                if i.event_type == stats.events.types.stats.EventType.LOGIN:
-                    logins[i.fld4] = i.stamp
-                else:
-                    if i.fld4 in logins:
-                        stamp = typing.cast(int, logins[i.fld4])
-                        del logins[i.fld4]
-                        total = i.stamp - stamp
-                        data.append(
-                            {
-                                'name': i.fld4,
-                                'origin': i.fld2.split(':')[0],
-                                'date': datetime.datetime.fromtimestamp(stamp),
-                                'time': total,
-                                'pool': pool.uuid,
-                                'pool_name': pool.name,
-                            }
-                        )
+        sessions: dict[int, list[dict[str, typing.Any]]] = {pool.id: [] for pool in pools}
+        logins: dict[tuple[int, str], int] = {}
+        for i in items:
+            # if '\\' in i.fld1:
+            #    continue
+            key = (i.owner_id, i.fld4)
+            if i.event_type == stats.events.types.stats.EventType.LOGIN:
+                logins[key] = i.stamp
+            else:
+                if key in logins:
+                    stamp = logins.pop(key)
+                    total = i.stamp - stamp
+                    sessions[i.owner_id].append(
+                        {
+                            'name': i.fld4,
+                            'origin': i.fld2.split(':')[0],
+                            'date': datetime.datetime.fromtimestamp(stamp),
+                            'time': total,
+                        }
+                    )
+
+        data: list[dict[str, typing.Any]] = []
+        for pool in pools:
+            for session in sessions[pool.id]:
+                data.append(session | {'pool': pool.uuid, 'pool_name': pool.name})
 
         return data, ','.join([p.name for p in pools])
 
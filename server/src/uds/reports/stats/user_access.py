@@ -39,7 +39,6 @@ import django.template.defaultfilters as filters
 from django.utils.translation import gettext
 from django.utils.translation import gettext_lazy as _
 
-from uds.core.managers.stats import StatsManager
 from uds.core.reports import graphs
 from uds.core.ui import gui
 from uds.core.util import stats, utils
@@ -90,27 +89,16 @@ class StatsReportLogin(StatsReport):
         else:
             xLabelFormat = 'SHORT_DATETIME_FORMAT'
 
-        samplingIntervals: list[tuple[int, int]] = []
-        samplingIntervalSeconds = (end - start) / samplingPoints
-        for i in range(samplingPoints):
-            samplingIntervals.append(
-                (int(start + i * samplingIntervalSeconds), int(start + (i + 1) * samplingIntervalSeconds))
-            )
+        buckets = stats.aggregation.Buckets.split(start, end, samplingPoints)
+        series = stats.aggregation.total_events_series(
+            stats.events.types.stats.EventOwnerType.AUTHENTICATOR,
+            stats.events.types.stats.EventType.LOGIN,
+            buckets,
+        )
 
         data: list[tuple[int, int]] = []
         reportData: list[dict[str, typing.Any]] = []
-        for interval in samplingIntervals:
-            key = (interval[0] + interval[1]) // 2
-            val = (
-                StatsManager.manager()
-                .enumerate_events(
-                    stats.events.types.stats.EventOwnerType.AUTHENTICATOR,
-                    stats.events.types.stats.EventType.LOGIN,
-                    since=interval[0],
-                    to=interval[1],
-                )
-                .count()
-            )
+        for interval, key, val in zip(buckets.intervals(), buckets.keys(), series.counts):
             data.append((key, val))
             reportData.append(
                 {
@@ -130,14 +118,18 @@ class StatsReportLogin(StatsReport):
         dataWeek = [0] * 7
         dataHour = [0] * 24
         dataWeekHour = [[0] * 24 for _ in range(7)]
-        for val in StatsManager.manager().enumerate_events(
-            stats.events.types.stats.EventOwnerType.AUTHENTICATOR, stats.events.types.stats.EventType.LOGIN, since=start, to=end
-        ):
-            s = datetime.datetime.fromtimestamp(val.stamp)
-            dataWeek[s.weekday()] += 1
-            dataHour[s.hour] += 1
-            dataWeekHour[s.weekday()][s.hour] += 1
-            logger.debug('Data: %s %s', s.weekday(), s.hour)
+        # Start is a local midnight, so hourly intervals are aligned to local hours
+        buckets = stats.aggregation.Buckets.every(start, end, 3600)
+        series = stats.aggregation.total_events_series(
+            stats.events.types.stats.EventOwnerType.AUTHENTICATOR,
+            stats.events.types.stats.EventType.LOGIN,
+            buckets,
+        )
+        for interval, val in zip(buckets.intervals(), series.counts):
+            s = datetime.datetime.fromtimestamp(interval[0])
+            dataWeek[s.weekday()] += val
+            dataHour[s.hour] += val
+            dataWeekHour[s.weekday()][s.hour] += val
 
         return dataWeek, dataHour, dataWeekHour
 
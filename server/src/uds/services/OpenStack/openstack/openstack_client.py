@@ -401,7 +401,15 @@ class OpenstackClient:  # pylint: disable=too-many-public-methods
             )
         ]
 
-    @decorators.cached(prefix='svrs', timeout=consts.cache.DEFAULT_CACHE_TIMEOUT, key_helper=cache_key_helper)
+    # Used to fill choices, so a stale list can be served while refreshed, and only one
+    # server of the cluster lists them at once
+    @decorators.cached(
+        prefix='svrs',
+        timeout=consts.cache.DEFAULT_CACHE_TIMEOUT,
+        key_helper=cache_key_helper,
+        cluster_wide=True,
+        stale_while_revalidate=consts.cache.DEFAULT_CACHE_TIMEOUT,
+    )
     def list_servers(
         self,
         detail: bool = False,
@@ -569,7 +577,12 @@ class OpenstackClient:  # pylint: disable=too-many-public-methods
     # Very small timeout, so repeated operations will use same data
     # Any cache time less than 5 seconds will be fine, beceuse checks on 
     # openstack are done every 5 seconds
-    @decorators.cached(prefix='svr', timeout=consts.cache.SHORTEST_CACHE_TIMEOUT, key_helper=cache_key_helper)
+    @decorators.cached(
+        prefix='svr',
+        timeout=consts.cache.SHORTEST_CACHE_TIMEOUT,
+        key_helper=cache_key_helper,
+        single_flight=True,
+    )
     def get_server(self, server_id: str) -> openstack_types.ServerInfo:
         r = self._request_from_endpoint(
             'get',
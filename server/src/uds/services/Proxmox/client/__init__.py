@@ -97,6 +97,7 @@ class ProxmoxClient:
     _url: str
     _validate_cert: bool
     _timeout: int
+    _session: 'requests.Session'
 
     _ticket: str
     _csrf: str
@@ -119,6 +120,8 @@ class ProxmoxClient:
         self._validate_cert = validate_certificate
         self._timeout = timeout
         self._url = 'https://{}:{}/api2/json/'.format(self._host, self._port)
+        # Connections are pooled by secure_requests_session, shared by all clients of the same host
+        self._session = security.secure_requests_session(verify=self._validate_cert)
 
         self.cache = cache
 
@@ -170,7 +173,7 @@ class ProxmoxClient:
 
     def _get(self, path: str, *, node: typing.Optional[str] = None) -> typing.Any:
         try:
-            result = security.secure_requests_session(verify=self._validate_cert).get(
+            result = self._session.get(
                 self._compose_url_for(path),
                 headers=self.headers,
                 cookies={'PVEAuthCookie': self._ticket},
@@ -191,7 +194,7 @@ class ProxmoxClient:
         node: typing.Optional[str] = None,
     ) -> typing.Any:
         try:
-            result = security.secure_requests_session(verify=self._validate_cert).post(
+            result = self._session.post(
                 self._compose_url_for(path),
                 data=data,  # type: ignore
                 headers=self.headers,
@@ -213,7 +216,7 @@ class ProxmoxClient:
         node: typing.Optional[str] = None,
     ) -> typing.Any:
         try:
-            result = security.secure_requests_session(verify=self._validate_cert).delete(
+            result = self._session.delete(
                 self._compose_url_for(path),
                 data=data,  # type: ignore
                 headers=self.headers,
@@ -245,7 +248,7 @@ class ProxmoxClient:
                 return
 
         try:
-            result = security.secure_requests_session(verify=self._validate_cert).post(
+            result = self._session.post(
                 url=self._compose_url_for('access/ticket'),
                 data=self._credentials,
                 headers=self.headers,
@@ -567,7 +570,15 @@ class ProxmoxClient:
             self._get(f'nodes/{node}/tasks/{urllib.parse.quote(upid)}/status', node=node)
         )
 
-    @cached('vms', CACHE_DURATION, key_helper=caching_key_helper)
+    # Listing all machines is expensive, and used mostly to fill choices, so a stale list can be served
+    # while refreshed, and only one server of the cluster lists them at once
+    @cached(
+        'vms',
+        CACHE_DURATION,
+        key_helper=caching_key_helper,
+        cluster_wide=True,
+        stale_while_revalidate=CACHE_DURATION,
+    )
     @ensure_connected
     def list_machines(
         self, node: typing.Union[None, str, collections.abc.Iterable[str]] = None, **kwargs: typing.Any
@@ -610,7 +621,7 @@ class ProxmoxClient:
         return self.get_machine_info(vmid, node, **kwargs)
 
     @ensure_connected
-    @cached('vmin', CACHE_INFO_DURATION, key_helper=caching_key_helper)
+    @cached('vmin', CACHE_INFO_DURATION, key_helper=caching_key_helper, single_flight=True)
     def get_machine_info(
         self, vmid: int, node: typing.Optional[str] = None, **kwargs: typing.Any
     ) -> types.VMInfo:
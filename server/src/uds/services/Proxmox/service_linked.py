@@ -107,6 +107,9 @@ class ProxmoxServiceLinked(DynamicService):
     allowed_protocols = types.transports.Protocol.generic_vdi(types.transports.Protocol.SPICE)
     services_type_provided = types.services.ServiceType.VDI
 
+    # Running state of machines with pending operations are obtained listing all machines of the cluster
+    batch_state_polling = True
+
     pool = gui.ChoiceField(
         label=_("Pool"),
         order=1,
@@ -324,6 +327,10 @@ class ProxmoxServiceLinked(DynamicService):
 
         return vminfo.status != 'stopped'
 
+    def get_running_states(self, vmids: list[str]) -> dict[str, bool]:
+        # One request per cluster node, for all the machines of the provider
+        return {str(vminfo.vmid): vminfo.status != 'stopped' for vminfo in self.provider().list_machines(force=True)}
+
     def execute_delete(self, vmid: str) -> None:
         # All removals are deferred, so we can do it async
         # Try to stop it if already running... Hard stop
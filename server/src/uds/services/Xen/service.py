@@ -99,6 +99,9 @@ class XenLinkedService(DynamicService):  # pylint: disable=too-many-public-metho
     # : Types of deploys (services in cache and/or assigned to users)
     user_service_type = XenLinkedUserService
 
+    # Running state of machines with pending operations are obtained listing all machines of the pool
+    batch_state_polling = True
+
     services_type_provided = types.services.ServiceType.VDI
 
     # Now the form part
@@ -336,6 +339,13 @@ class XenLinkedService(DynamicService):  # pylint: disable=too-many-public-metho
                 return True
             return False
 
+    def get_running_states(self, vmids: list[str]) -> dict[str, bool]:
+        """
+        Returns the running state of all the usable machines of the pool, with a single request
+        """
+        with self.provider().get_connection() as api:
+            return {vminfo.opaque_ref: vminfo.power_state.is_running() for vminfo in api.list_vms(force=True)}
+
     def start(self, caller_instance: typing.Optional['DynamicUserService | DynamicPublication'], vmid: str) -> None:
         """
         Starts the machine
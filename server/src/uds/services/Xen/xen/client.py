@@ -195,7 +195,7 @@ class XenClient:  # pylint: disable=too-many-public-methods
             transport = None
 
             if self._use_ssl:
-                context = security.create_client_sslcontext(verify=self._verify_ssl)
+                context = security.shared_client_sslcontext(verify=self._verify_ssl)
                 transport = SafeTimeoutTransport(context=context)
                 transport.set_timeout(self._timeout)
                 logger.debug('Transport: %s', transport)
@@ -295,7 +295,7 @@ class XenClient:  # pylint: disable=too-many-public-methods
 
     @cached(prefix='xen_vms', timeout=consts.cache.DEFAULT_CACHE_TIMEOUT, key_helper=cache_key_helper)
     @exceptions.catched
-    def list_vms(self) -> list[xen_types.VMInfo]:
+    def list_vms(self, **kwargs: typing.Any) -> list[xen_types.VMInfo]:
         return_list: list[xen_types.VMInfo] = []
 
         try:
@@ -30,6 +30,7 @@ Author: Adolfo Gómez, dkmaster at dkmon dot com
 '''
 import collections.abc
 import logging
+import time
 import typing
 from functools import reduce
 
@@ -49,12 +50,14 @@ from uds.core.services.exceptions import (
 from uds.core.util import html
 from uds.core.util.config import GlobalConfig
 from uds.core.util.model import sql_now
-from uds.models import MetaPool, Network, ServicePool, ServicePoolGroup, TicketStore, Transport
+from uds.models import MetaPool, Network, ServicePool, ServicePoolGroup, TicketStore, Transport, UserService
+
+from . import services_cache
 
 # Not imported at runtime, just for type checking
 if typing.TYPE_CHECKING:
     from uds.core.types.requests import ExtendedHttpRequestWithUser
-    from uds.models import Image, MetaPoolMember
+    from uds.models import Group, Image, MetaPoolMember
 
 
 logger = logging.getLogger(__name__)
@@ -69,7 +72,7 @@ def _service_info(
     description: str,
     group: collections.abc.Mapping[str, typing.Any],
     transports: list[collections.abc.Mapping[str, typing.Any]],
-    image: typing.Optional['Image'],
+    image_id: str,
     show_transports: bool,
     allow_users_remove: bool,
     allow_users_reset: bool,
@@ -89,7 +92,7 @@ def _service_info(
         'description': description,
         'group': group,
         'transports': transports,
-        'imageId': image and image.uuid or 'x',
+        'imageId': image_id,
         'show_transports': show_transports,
         'allow_users_remove': allow_users_remove,
         'allow_users_reset': allow_users_reset,
@@ -103,37 +106,28 @@ def _service_info(
     }
 
 
+def _image_id(image: typing.Optional['Image']) -> str:
+    return image and image.uuid or 'x'
+
+
 # pylint: disable=too-many-locals, too-many-branches, too-many-statements
-def get_services_info_dict(
-    request: 'ExtendedHttpRequestWithUser',
-) -> dict[str, typing.Any]:  # pylint: disable=too-many-locals, too-many-branches, too-many-statements
-    """Obtains the service data dictionary will all available services for this request
+def _build_skeleton(
+    request: 'ExtendedHttpRequestWithUser', groups: list['Group']
+) -> list[services_cache.ServiceSkeleton]:
+    """Obtains the part of the services list that only depends on the groups, os and ip of the request
+    (so it can be shared by all users with same groups, os and networks)
 
     Arguments:
-        request {ExtendedHttpRequest} -- request from where to xtract credentials
+        request {ExtendedHttpRequest} -- request from where to extract os and ip
+        groups {list[Group]} -- groups of the user
 
     Returns:
-        dict[str, typing.Any] --  Keys has this:
-            'services': services,
-            'ip': request.ip,
-            'nets': nets,
-            'transports': validTrans,
-            'autorun': autorun
-
+        list[ServiceSkeleton] -- Services (meta pools and pools) with at least one valid transport
     """
     # We look for services for this authenticator groups. User is logged in in just 1 authenticator, so his groups must coincide with those assigned to ds
-    groups = list(request.user.get_groups())
-    available_service_pools = list(
-        ServicePool.get_pools_for_groups(groups, request.user)
-    )  # Pass in user to get "number_assigned" to optimize
-    available_metapools = list(
-        MetaPool.metapools_for_groups(groups, request.user)
-    )  # Pass in user to get "number_assigned" to optimize
-    now = sql_now()
-
-    # Information for administrators
-    nets = ''
-    valid_transports = ''
+    available_service_pools = list(ServicePool.get_pools_for_groups(groups))
+    # Distinct, as no user annotation (that groups results) is done
+    available_metapools = list(MetaPool.metapools_for_groups(groups).distinct())
 
     os_type: 'types.os.KnownOS' = request.os.os
     logger.debug('OS: %s', os_type)
@@ -173,21 +167,13 @@ def get_services_info_dict(
             for i in sorted(transports, key=lambda x: x.priority)  # Sorted by priority
         ]
 
-    if request.user.is_staff():
-        nets = ','.join([n.name for n in Network.get_networks_for_ip(request.ip)])
-        valid_transports = ','.join(
-            t.name for t in Transport.objects.all().prefetch_related('networks') if t.is_ip_allowed(request.ip)
-        )
-
     logger.debug('Checking meta pools: %s', available_metapools)
-    services: list[collections.abc.Mapping[str, typing.Any]] = []
+    skeleton: list[services_cache.ServiceSkeleton] = []
 
-    # Preload all assigned user services for this user
     # Add meta pools data first
     for meta in available_metapools:
         # Check that we have access to at least one transport on some of its children
         transports_in_meta: list[collections.abc.Mapping[str, typing.Any]] = []
-        in_use: bool = typing.cast(typing.Any, meta).number_in_use > 0  # Anotated value
         custom_message: typing.Optional[str] = None
 
         # Fist member of the pool that has a custom message, and is enabled, will be used
@@ -200,16 +186,6 @@ def get_services_info_dict(
                 custom_message = member.pool.custom_message
                 break
 
-        # Calculate info variable macros content if needed
-        info_vars = (
-            types.pools.UsageInfoVars(meta.usage())
-            if (
-                types.pools.UsageInfoVars.has_macros(meta.name)
-                or types.pools.UsageInfoVars.has_macros(meta.visual_name)
-            )
-            else types.pools.UsageInfoVars()
-        )
-
         if meta.transport_grouping == types.pools.TransportSelectionPolicy.COMMON:
             # Keep only transports that are in all pools
             # This will be done by getting all transports from all pools and then intersecting them
@@ -273,24 +249,26 @@ def get_services_info_dict(
                 meta.servicesPoolGroup.as_dict if meta.servicesPoolGroup else ServicePoolGroup.default().as_dict
             )
 
-            services.append(
-                _service_info(
+            skeleton.append(
+                services_cache.ServiceSkeleton(
                     uuid=meta.uuid,
                     is_meta=True,
-                    name=info_vars.replace(meta.name),
-                    visual_name=info_vars.replace(meta.visual_name),
+                    pool_ids=[member.pool.id for member in sorted_members],
+                    name=meta.name,
+                    visual_name=meta.visual_name,
+                    has_macros=types.pools.UsageInfoVars.has_macros(meta.name)
+                    or types.pools.UsageInfoVars.has_macros(meta.visual_name),
                     description=meta.comments,
                     group=group,
                     transports=transports_in_meta,
-                    image=meta.image,
+                    image_id=_image_id(meta.image),
                     show_transports=len(transports_in_meta) > 1,
                     allow_users_remove=meta.allow_users_remove,
                     allow_users_reset=meta.allow_users_remove,
                     maintenance=meta.is_in_maintenance(),
-                    not_accesible=not meta.is_access_allowed(now),
-                    in_use=in_use,
-                    to_be_replaced=None,
-                    to_be_replaced_text='',
+                    replaceable=False,
+                    fallback_access=meta.fallbackAccess,
+                    calendar_access=services_cache.ServiceSkeleton.calendar_access_of(meta.calendarAccess.all()),
                     custom_calendar_text=meta.calendar_message,
                     custom_message_text=custom_message,
                 )
@@ -302,30 +280,6 @@ def get_services_info_dict(
         if service_pool.owned_by_meta:
             continue
 
-        # If no macro on names, skip calculation
-        if '{' in service_pool.name or '{' in service_pool.visual_name:
-            pool_usage_info = service_pool.usage(
-                typing.cast(typing.Any, service_pool).usage_count,  # anotated value
-            )
-            use_percent = str(pool_usage_info.percent) + '%'
-            use_count = str(pool_usage_info.used)
-            left_count = str(pool_usage_info.total - pool_usage_info.used)
-            max_srvs = str(pool_usage_info.total)
-        else:
-            max_srvs = ''
-            use_percent = ''
-            use_count = ''
-            left_count = ''
-
-        # pylint: disable=cell-var-from-loop
-        def _replace_macro_vars(x: str) -> str:
-            return (
-                x.replace('{use}', use_percent)
-                .replace('{total}', max_srvs)
-                .replace('{usec}', use_count)
-                .replace('{left}', left_count)
-            )
-
         trans: list[collections.abc.Mapping[str, typing.Any]] = []
         for t in sorted(
             service_pool.transports.all(), key=lambda x: x.priority
@@ -342,56 +296,169 @@ def get_services_info_dict(
         if not trans:
             continue
 
-        # Locate if user service has any already assigned user service for this. Use "pre cached" number of assignations in this pool to optimize
-        in_use = typing.cast(typing.Any, service_pool).number_in_use > 0  # number_in_use is anotated value
-
         group = (
             service_pool.servicesPoolGroup.as_dict
             if service_pool.servicesPoolGroup
             else ServicePoolGroup.default().as_dict
         )
 
-        # Only add toBeReplaced info in case we allow it. This will generate some "overload" on the services
-        when_will_be_replaced = (
-            service_pool.when_will_be_replaced(request.user)
-            if typing.cast(typing.Any, service_pool).pubs_active > 0
-            and GlobalConfig.NOTIFY_REMOVAL_BY_PUB.as_bool(False)
-            else None
-        )
-        # tbr = False
-        if when_will_be_replaced:
-            replace_date_as_str = formats.date_format(when_will_be_replaced, 'SHORT_DATETIME_FORMAT')
-            replace_date_info_text = gettext(
-                'This service is about to be replaced by a new version. Please, close the session before {} and save all your work to avoid loosing it.'
-            ).format(when_will_be_replaced)
-        else:
-            replace_date_as_str = None
-            replace_date_info_text = ''
-
-        services.append(
-            _service_info(
+        skeleton.append(
+            services_cache.ServiceSkeleton(
                 uuid=service_pool.uuid,
                 is_meta=False,
-                name=_replace_macro_vars(service_pool.name),
-                visual_name=_replace_macro_vars(service_pool.visual_name),
+                pool_ids=[service_pool.id],
+                name=service_pool.name,
+                visual_name=service_pool.visual_name,
+                has_macros='{' in service_pool.name or '{' in service_pool.visual_name,
                 description=service_pool.comments,
                 group=group,
                 transports=trans,
-                image=service_pool.image,
+                image_id=_image_id(service_pool.image),
                 show_transports=service_pool.show_transports,
                 allow_users_remove=service_pool.allow_users_remove,
                 allow_users_reset=service_pool.allow_users_reset,
                 maintenance=service_pool.is_in_maintenance(),
-                not_accesible=not service_pool.is_access_allowed(now),
-                in_use=in_use,
-                to_be_replaced=replace_date_as_str,
-                to_be_replaced_text=replace_date_info_text,
+                replaceable=typing.cast(typing.Any, service_pool).pubs_active > 0,
+                fallback_access=service_pool.fallbackAccess,
+                calendar_access=services_cache.ServiceSkeleton.calendar_access_of(
+                    service_pool.calendarAccess.all()
+                ),
                 custom_calendar_text=service_pool.calendar_message,
                 # Only add custom message if it's enabled and has a message
                 custom_message_text=service_pool.custom_message if service_pool.display_custom_message and service_pool.custom_message.strip() else None,
             )
         )
 
+    return skeleton
+
+
+def _replace_usage_macros(service: services_cache.ServiceSkeleton) -> tuple[str, str]:
+    """
+    Returns name and visual name of the service, with usage macros replaced
+    """
+    try:
+        if service.is_meta:
+            info_vars = types.pools.UsageInfoVars(MetaPool.objects.get(uuid=service.uuid).usage())
+            return info_vars.replace(service.name), info_vars.replace(service.visual_name)
+
+        pool_usage_info = ServicePool.objects.get(uuid=service.uuid).usage()
+    except Exception:  # Removed after skeleton was computed
+        return service.name, service.visual_name
+
+    use_percent = str(pool_usage_info.percent) + '%'
+    use_count = str(pool_usage_info.used)
+    left_count = str(pool_usage_info.total - pool_usage_info.used)
+    max_srvs = str(pool_usage_info.total)
+
+    def _replace_macro_vars(x: str) -> str:
+        return (
+            x.replace('{use}', use_percent)
+            .replace('{total}', max_srvs)
+            .replace('{usec}', use_count)
+            .replace('{left}', left_count)
+        )
+
+    return _replace_macro_vars(service.name), _replace_macro_vars(service.visual_name)
+
+
+def _when_will_be_replaced(request: 'ExtendedHttpRequestWithUser', service: services_cache.ServiceSkeleton) -> tuple[typing.Optional[str], str]:
+    """
+    Returns the replacement date (as string) and info text, if the user service of this service
+    is going to be replaced by a new publication
+    """
+    try:
+        when_will_be_replaced = ServicePool.objects.get(uuid=service.uuid).when_will_be_replaced(request.user)
+    except Exception:  # Removed after skeleton was computed
+        when_will_be_replaced = None
+
+    if not when_will_be_replaced:
+        return None, ''
+
+    return formats.date_format(when_will_be_replaced, 'SHORT_DATETIME_FORMAT'), gettext(
+        'This service is about to be replaced by a new version. Please, close the session before {} and save all your work to avoid loosing it.'
+    ).format(when_will_be_replaced)
+
+
+def get_services_info_dict(
+    request: 'ExtendedHttpRequestWithUser',
+) -> dict[str, typing.Any]:  # pylint: disable=too-many-locals, too-many-branches, too-many-statements
+    """Obtains the service data dictionary will all available services for this request
+
+    Arguments:
+        request {ExtendedHttpRequest} -- request from where to xtract credentials
+
+    Returns:
+        dict[str, typing.Any] --  Keys has this:
+            'services': services,
+            'ip': request.ip,
+            'nets': nets,
+            'transports': validTrans,
+            'autorun': autorun
+
+    """
+    started = time.perf_counter()
+    groups = list(request.user.get_groups())
+    skeleton = services_cache.get_skeleton(
+        services_cache.cache_key(groups, request.os.os, request.ip),
+        lambda: _build_skeleton(request, groups),
+    )
+    now = sql_now()
+
+    # Information for administrators
+    nets = ''
+    valid_transports = ''
+
+    if request.user.is_staff():
+        nets = ','.join([n.name for n in Network.get_networks_for_ip(request.ip)])
+        valid_transports = ','.join(
+            t.name for t in Transport.objects.all().prefetch_related('networks') if t.is_ip_allowed(request.ip)
+        )
+
+    # Pools with user services in use by this user, all of them with a single query
+    in_use_pools = set(
+        UserService.objects.filter(
+            user=request.user,
+            in_use=True,
+            state__in=types.states.State.USABLE,
+            deployed_service_id__in={pool_id for service in skeleton for pool_id in service.pool_ids},
+        ).values_list('deployed_service_id', flat=True)
+    )
+    # Only add toBeReplaced info in case we allow it. This will generate some "overload" on the services
+    notify_replacement = GlobalConfig.NOTIFY_REMOVAL_BY_PUB.as_bool(False)
+
+    services: list[collections.abc.Mapping[str, typing.Any]] = []
+    for service in skeleton:
+        # If no macro on names, skip calculation
+        name, visual_name = (
+            _replace_usage_macros(service) if service.has_macros else (service.name, service.visual_name)
+        )
+        replace_date_as_str, replace_date_info_text = (
+            _when_will_be_replaced(request, service) if service.replaceable and notify_replacement else (None, '')
+        )
+
+        services.append(
+            _service_info(
+                uuid=service.uuid,
+                is_meta=service.is_meta,
+                name=name,
+                visual_name=visual_name,
+                description=service.description,
+                group=service.group,
+                transports=service.transports,
+                image_id=service.image_id,
+                show_transports=service.show_transports,
+                allow_users_remove=service.allow_users_remove,
+                allow_users_reset=service.allow_users_reset,
+                maintenance=service.maintenance,
+                not_accesible=not service.is_access_allowed(now),
+                in_use=any(pool_id in in_use_pools for pool_id in service.pool_ids),
+                to_be_replaced=replace_date_as_str,
+                to_be_replaced_text=replace_date_info_text,
+                custom_calendar_text=service.custom_calendar_text,
+                custom_message_text=service.custom_message_text,
+            )
+        )
+
     # logger.debug('Services: %s', services)
 
     # Sort services and remove services with no transports...
@@ -408,6 +475,8 @@ def get_services_info_dict(
             request.session['autorunDone'] = '1'
             autorun = True
 
+    services_cache.ServicesCacheStats.manager().render_time.observe(time.perf_counter() - started)
+
     return {
         'services': services,
         'ip': request.ip,
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2024 Virtual Cable S.L.U.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L.U. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+'''
+Author: Adolfo Gómez, dkmaster at dkmon dot com
+
+Cache of the portal services list "skeleton": the part of the list that only depends on the groups,
+os and networks of the user (pools, transports, links, groups, images, ...). Only per user parts
+(in use flags, replacement info, usage macros) and calendar access are computed on every request.
+
+Skeletons are invalidated whenever any model they depend on changes, on any node.
+'''
+import collections.abc
+import dataclasses
+import datetime
+import logging
+import operator
+import time
+import typing
+
+from django.db.models import signals
+
+from uds import models
+from uds.core import consts, types
+from uds.core.util import singleton
+from uds.core.util.cache import Cache
+from uds.core.util.calendar import CalendarChecker
+from uds.core.util.metrics import Histogram
+from uds.core.util.model import on_commit_once
+from uds.models.network import NetworksIndex
+
+logger = logging.getLogger(__name__)
+
+
+class ServicesCacheStats(metaclass=singleton.Singleton):
+    """
+    Services list cache counters and times (in seconds) of this process
+    """
+
+    hits: int
+    misses: int
+    invalidations: int
+    build_time: Histogram  # Time to compute a skeleton (on misses)
+    render_time: Histogram  # Time to compute the whole services list of a request
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.build_time = Histogram()
+        self.render_time = Histogram()
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self) -> dict[str, typing.Any]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hit_ratio,
+            'invalidations': self.invalidations,
+            'build_time': self.build_time.as_dict(),
+            'render_time': self.render_time.as_dict(),
+        }
+
+    def __str__(self) -> str:
+        return (
+            f'ServicesCacheStats: hits={self.hits}, misses={self.misses}, hit_ratio={self.hit_ratio:.2f}, '
+            f'invalidations={self.invalidations}, build_time={self.build_time}, render_time={self.render_time}'
+        )
+
+    @staticmethod
+    def manager() -> 'ServicesCacheStats':
+        return ServicesCacheStats()
+
+
+@dataclasses.dataclass
+class ServiceSkeleton:
+    """
+    Cacheable part of a service (pool or meta pool) of the services list
+    """
+
+    uuid: str
+    is_meta: bool
+    pool_ids: list[int]  # Pools whose user services mark this service as "in use"
+    name: str  # Names are stored without replacing macros
+    visual_name: str
+    has_macros: bool
+    description: str
+    group: collections.abc.Mapping[str, typing.Any]
+    transports: list[collections.abc.Mapping[str, typing.Any]]
+    image_id: str
+    show_transports: bool
+    allow_users_remove: bool
+    allow_users_reset: bool
+    maintenance: bool
+    replaceable: bool  # Has active publications, so user service can be replaced by a new version
+    fallback_access: str
+    calendar_access: list[tuple['models.Calendar', str]]  # (calendar, access), sorted by priority
+    custom_calendar_text: str
+    custom_message_text: typing.Optional[str]
+
+    @staticmethod
+    def calendar_access_of(
+        accesses: collections.abc.Iterable[typing.Union['models.CalendarAccess', 'models.CalendarAccessMeta']]
+    ) -> list[tuple['models.Calendar', str]]:
+        return [(ac.calendar, ac.access) for ac in sorted(accesses, key=operator.attrgetter('priority'))]
+
+    def is_access_allowed(self, check_datetime: datetime.datetime) -> bool:
+        """
+        Same as ServicePool/MetaPool is_access_allowed, but using cached calendars
+        """
+        access = self.fallback_access
+        for calendar, calendar_access in self.calendar_access:
+            if CalendarChecker(calendar).check(check_datetime):
+                access = calendar_access
+                break  # Stops on first rule match found
+        return access == types.states.State.ALLOW
+
+
+_skeletons: typing.Final[Cache] = Cache('uds:services:skeleton')
+# Current generation of skeletons, changed on invalidations. Being part of the key, a skeleton being computed
+# while an invalidation happens will never be used
+_generation: typing.Final[Cache] = Cache('uds:services:generation')
+
+
+def cache_key(groups: collections.abc.Iterable['models.Group'], os_type: types.os.KnownOS, ip: str) -> str:
+    """
+    Key of the skeleton for this groups, os and ip. Transports are filtered by network, so ip is
+    replaced with the networks it belongs to
+    """
+    networks = sorted(NetworksIndex.manager().networks_for_ip(ip))
+    return f'{sorted(g.id for g in groups)}:{os_type.name}:{networks}'
+
+
+def get_skeleton(
+    key: str, builder: collections.abc.Callable[[], list[ServiceSkeleton]]
+) -> list[ServiceSkeleton]:
+    """
+    Returns the cached skeleton for key, building and storing it (using builder) if not found
+    """
+    stats = ServicesCacheStats.manager()
+    timeout = consts.cache.SERVICES_INFO_CACHE_TIMEOUT
+    if timeout <= 0:
+        return builder()
+
+    generation = _generation.get('current')
+    if generation is None:
+        generation = str(time.time_ns())
+        _generation.put('current', generation, consts.cache.EXTREME_CACHE_TIMEOUT)
+    key = f'{generation}:{key}'
+
+    skeleton: typing.Optional[list[ServiceSkeleton]] = _skeletons.get(key)
+    if skeleton is not None:
+        stats.hits += 1
+        return skeleton
+
+    stats.misses += 1
+    started = time.perf_counter()
+    skeleton = builder()
+    stats.build_time.observe(time.perf_counter() - started)
+    _skeletons.put(key, skeleton, timeout)
+    return skeleton
+
+
+def invalidate() -> None:
+    """
+    Invalidates all cached skeletons (on all nodes). Skeletons of previous generations are not
+    used anymore, and just expire
+    """
+    ServicesCacheStats.manager().invalidations += 1
+    _generation.put('current', str(time.time_ns()), consts.cache.EXTREME_CACHE_TIMEOUT)
+
+
+# Fields updated at runtime (i.e. on every publication check) that skeletons do not depend on
+# (uuid is always added to update_fields by UUIDModel)
+IGNORED_FIELDS: typing.Final[frozenset[str]] = frozenset({'data', 'state_date', 'uuid'})
+
+def _invalidate_signal(**kwargs: typing.Any) -> None:
+    # Only changes done, and not runtime updates of fields that are not part of skeletons
+    if not kwargs.get('action', 'post_').startswith('post_'):
+        return
+    update_fields = kwargs.get('update_fields')
+    if update_fields and set(update_fields) <= IGNORED_FIELDS:
+        return
+    # Once commited (just once per transaction), so skeletons computed from now on will see the changes
+    on_commit_once(invalidate)
+
+
+# Models that skeletons depends on
+for _model in (
+    models.ServicePool,
+    models.ServicePoolPublication,
+    models.ServicePoolGroup,
+    models.MetaPool,
+    models.MetaPoolMember,
+    models.Transport,
+    models.Network,
+    models.Calendar,
+    models.CalendarRule,
+    models.CalendarAccess,
+    models.CalendarAccessMeta,
+    models.Service,
+    models.Provider,
+    models.Group,
+    models.Image,
+):
+    signals.post_save.connect(_invalidate_signal, sender=_model, dispatch_uid=f'services_cache_{_model.__name__}')
+    signals.post_delete.connect(_invalidate_signal, sender=_model, dispatch_uid=f'services_cache_{_model.__name__}')
+
+for _relation in (
+    models.ServicePool.transports.through,
+    models.ServicePool.assignedGroups.through,
+    models.MetaPool.assignedGroups.through,
+    models.Network.transports.through,
+):
+    signals.m2m_changed.connect(_invalidate_signal, sender=_relation, dispatch_uid=f'services_cache_{_relation.__name__}')